@@ -0,0 +1,129 @@
+"""
+Compares the sentence-boundary, token-aware chunker of vector_database.create_document_chunks with the original path,
+langchain's DirectoryLoader and a 1000-character RecursiveCharacterTextSplitter: the time to load and chunk the bundled
+data/raw/engl*.zip transcripts, the number of chunks, their size in tokens of the embedding model, and how many start
+or end mid-sentence.
+
+Token counts use tiktoken's encoding of the embedding model, or an estimate of 4 characters per token when it cannot
+be loaded (the benchmark reports which).
+
+Run from the api/ directory:
+
+    python -m benchmarks.chunking --repeats 5
+"""
+
+import argparse
+import re
+import shutil
+import statistics
+import tempfile
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import DirectoryLoader, TextLoader
+
+from verse import data_processing
+from verse.embeddings import EMBEDDING_MODEL
+from verse.history import estimate_tokens, get_token_counter
+from verse.vector_database import create_document_chunks, get_lecture_metadata
+
+from benchmarks.suite import get_bundled_courses
+
+SENTENCE_END_PATTERN = re.compile(r"[.!?][\"'”’)\]]*$")
+
+
+def create_document_chunks_character_splitter(processed_data_path):
+    """
+    create_document_chunks_character_splitter is the original create_document_chunks of vector_database.py, kept as the
+    reference.
+    """
+
+    loader = DirectoryLoader(
+        processed_data_path,
+        glob="*.txt",
+        recursive=True,
+        loader_cls=TextLoader,
+        loader_kwargs={"encoding": "utf-8"},
+    )
+    documents = loader.load()
+
+    for document in documents:
+        document.metadata.update(get_lecture_metadata(document.metadata["source"]))
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    return text_splitter.split_documents(documents)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(chunk, processed_path, repeats, count_tokens):
+    """
+    measure loads and chunks the processed transcripts repeats times, and describes the chunks of the last run.
+
+    Returns:
+    dict: The median seconds of a run, and the number, token sizes and sentence alignment of the chunks
+    """
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = chunk(processed_path)
+        seconds.append(time.perf_counter() - start)
+
+    tokens = sorted(count_tokens(chunk.page_content) for chunk in chunks)
+    return {
+        "seconds": statistics.median(seconds),
+        "chunks": len(chunks),
+        "tokens": tokens,
+        "mid_sentence_ends": sum(not SENTENCE_END_PATTERN.search(chunk.page_content) for chunk in chunks),
+        "mid_sentence_starts": sum(not chunk.page_content[:1].isupper() for chunk in chunks),
+        "lectures": len({(chunk.metadata.get("course"), chunk.metadata.get("lecture")) for chunk in chunks}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    count_tokens = get_token_counter(EMBEDDING_MODEL)
+    workspace = tempfile.mkdtemp(prefix="verse-chunking-")
+    try:
+        processed_path = f"{workspace}/processed"
+        data_processing.process_courses(get_bundled_courses(), processed_data_path=processed_path)
+        # the first read of each file is not measured
+        create_document_chunks(processed_path)
+
+        results = {
+            "character splitter": measure(
+                create_document_chunks_character_splitter, processed_path, args.repeats, count_tokens
+            ),
+            "token chunker": measure(create_document_chunks, processed_path, args.repeats, count_tokens),
+        }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"token counts: {'estimated' if count_tokens is estimate_tokens else 'tiktoken'}")
+    print(
+        f"{'chunker':<20} {'time (s)':>9} {'lectures':>9} {'chunks':>7} {'tokens':>8} {'min':>5} {'p5':>5} {'p50':>5} "
+        f"{'p95':>5} {'max':>5} {'stdev':>6} {'mid-sentence start/end':>23}"
+    )
+    for name, result in results.items():
+        tokens = result["tokens"]
+        print(
+            f"{name:<20} {result['seconds']:>9.3f} {result['lectures']:>9} {result['chunks']:>7} {sum(tokens):>8} "
+            f"{tokens[0]:>5} {percentile(tokens, 0.05):>5} {percentile(tokens, 0.5):>5} {percentile(tokens, 0.95):>5} "
+            f"{tokens[-1]:>5} {statistics.pstdev(tokens):>6.1f} "
+            f"{result['mid_sentence_starts']:>11}/{result['mid_sentence_ends']:<11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
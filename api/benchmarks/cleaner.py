@@ -0,0 +1,106 @@
+"""
+Checks that the single-pass transcript cleaner produces exactly the output of the original multi-pass cleaner on the
+bundled transcripts, and compares their speed.
+
+Run from the api/ directory:
+
+    python -m benchmarks.cleaner --repeats 20
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+from verse.courses import COURSES
+from verse.data_processing import (
+    BASEDIR,
+    convert_html_content_to_text,
+    iter_transcript_members,
+)
+from verse.transcript_cleaner import DEFAULT_CLEANER
+
+
+def get_cleaned_transcript_text_multi_pass(transcript_text):
+    """
+    get_cleaned_transcript_text_multi_pass is the original cleaner of data_processing.py, kept as the reference output.
+    """
+
+    # Remove dates and references to HTML
+    date_pattern = re.compile(
+        r"January|February|March|April|May|June|July|August|September|October|November|December"
+    )
+    transcript_text = re.sub(date_pattern, "", transcript_text)
+    transcript_text = (
+        transcript_text.replace("<< back", "")
+        .replace("[end of transcript]", "")
+        .replace("back to top", "")
+    )
+    transcript_text = re.sub(r"Lecture \d+ Transcript", "", transcript_text)
+
+    # Remove course titles and professor names
+    courses_to_professors = {
+        "The American Novel Since 1945": "Professor Amy Hungerford",
+        "Introduction to Theory of Literature": "Professor Paul Fry",
+        "Modern Poetry": "Professor Langdon Hammer",
+        "Milton": "Professor John Rogers",
+    }
+
+    for course in courses_to_professors:
+        transcript_text = transcript_text.replace(course, "")
+        transcript_text = transcript_text.replace(courses_to_professors[course], "")
+
+    # Remove all non-alphabetized text before and after the lecture contents
+    transcript_text = re.sub(r"^[^a-zA-Z]+", "", transcript_text)
+    transcript_text = transcript_text.strip()
+
+    return transcript_text
+
+
+def load_bundled_transcripts():
+    transcripts = []
+    for course_num, course_info in COURSES.items():
+        zipfile_path = os.path.join(BASEDIR, f"data/raw/engl{course_num}.zip")
+        if not os.path.exists(zipfile_path):
+            continue
+        for _, html_content in iter_transcript_members(zipfile_path, course_info["transcripts_path"]):
+            transcripts.append(convert_html_content_to_text(html_content))
+    return transcripts
+
+
+def best_time(clean, transcripts, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for transcript in transcripts:
+            clean(transcript)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    transcripts = load_bundled_transcripts()
+    megabytes = sum(len(transcript) for transcript in transcripts) / 1e6
+
+    mismatches = sum(
+        get_cleaned_transcript_text_multi_pass(transcript) != DEFAULT_CLEANER.clean(transcript)
+        for transcript in transcripts
+    )
+    print(f"{len(transcripts)} transcripts ({megabytes:.2f} MB of text), {mismatches} mismatches")
+
+    multi_pass_seconds = best_time(get_cleaned_transcript_text_multi_pass, transcripts, args.repeats)
+    single_pass_seconds = best_time(DEFAULT_CLEANER.clean, transcripts, args.repeats)
+    print(f"multi-pass   {multi_pass_seconds * 1000:8.1f} ms  {megabytes / multi_pass_seconds:8.1f} MB/s")
+    print(f"single-pass  {single_pass_seconds * 1000:8.1f} ms  {megabytes / single_pass_seconds:8.1f} MB/s")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
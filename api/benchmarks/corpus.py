@@ -0,0 +1,94 @@
+"""
+Compares the two processed-data formats of data_processing.py on the bundled data/raw/engl*.zip transcripts: one .txt
+file per lecture, which vector_database.create_document_chunks reads and chunks, and the Arrow corpus file, from which it
+reads the stored chunk boundaries. Reports the time and size of writing each format (writing the corpus file includes
+chunking the transcripts), the time to load the chunks from it, and the time to open the corpus file and read a column
+for analysis.
+
+Run from the api/ directory:
+
+    python -m benchmarks.corpus --repeats 5
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import pyarrow.compute as pc
+
+from verse import data_processing
+from verse.corpus import CORPUS_FILENAME, open_corpus
+from verse.vector_database import create_document_chunks
+
+from benchmarks.suite import get_bundled_courses
+
+
+def median_seconds(function, repeats):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), result
+
+
+def get_size(path):
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for directory, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def count_files(path):
+    return sum(len(filenames) for _, _, filenames in os.walk(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    courses = get_bundled_courses()
+    workspace = tempfile.mkdtemp(prefix="verse-corpus-")
+    results = {}
+    try:
+        for output_format in data_processing.OUTPUT_FORMATS:
+            path = os.path.join(workspace, output_format)
+            stats = data_processing.process_courses(courses, processed_data_path=path, output_format=output_format)
+            # the first load is not measured
+            create_document_chunks(path)
+            seconds, chunks = median_seconds(lambda: create_document_chunks(path), args.repeats)
+            results[output_format] = {
+                "write_seconds": stats["write"]["seconds"],
+                "files": count_files(path),
+                "bytes": get_size(path),
+                "load_seconds": seconds,
+                "chunks": len(chunks),
+            }
+
+        corpus_path = os.path.join(workspace, "arrow", CORPUS_FILENAME)
+        open_seconds, table = median_seconds(lambda: open_corpus(corpus_path), args.repeats)
+        scan_seconds, _ = median_seconds(
+            lambda: pc.sum(pc.list_value_length(open_corpus(corpus_path).column("chunk_starts"))), args.repeats
+        )
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"{'format':<8} {'files':>6} {'MB':>7} {'write (s)':>10} {'load chunks (s)':>16} {'chunks':>7}")
+    for output_format, result in results.items():
+        print(
+            f"{output_format:<8} {result['files']:>6} {result['bytes'] / 1e6:>7.2f} {result['write_seconds']:>10.3f} "
+            f"{result['load_seconds']:>16.3f} {result['chunks']:>7}"
+        )
+    print(
+        f"open corpus ({table.num_rows} lectures): {open_seconds * 1000:.2f} ms; "
+        f"open and count the chunks of every lecture: {scan_seconds * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
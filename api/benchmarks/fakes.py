@@ -0,0 +1,463 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+import numpy as np
+import openai
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2, trace_service_pb2_grpc
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+TOKEN_PATTERN = re.compile(r"\S+\s*")
+
+DEFAULT_ANSWER = (
+    "Toni Morrison returns again and again to the problem of memory. In Beloved, the past is not past at all; "
+    "it walks into the house at 124 and sits down at the table. Sethe's act is unspeakable, and yet the novel "
+    "insists that we speak of it. Morrison asks us to hold judgment and sympathy together. That tension is where "
+    "the novel does its most important work."
+)
+DEFAULT_SEGUE = '"What do you make of the way Beloved herself resists a single interpretation?"'
+WORD_PATTERN = re.compile(r"\w+")
+
+DEFAULT_RECOMMENDATION = (
+    "I would recommend Song of Solomon, since you were drawn to how Morrison treats inheritance and memory."
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    FakeChatModel is a local stand-in for ChatOpenAI. It answers each of Verse's prompts (answer, segue, recommendation)
+    with a fixed response and simulates the latency of a real model: a delay before the first token, then a fixed
+    number of tokens per second. The async methods wait on the event loop, like a real async client.
+    """
+
+    answer: str = DEFAULT_ANSWER
+    segue: str = DEFAULT_SEGUE
+    recommendation: str = DEFAULT_RECOMMENDATION
+    first_token_latency: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "verse-fake-chat-model"
+
+    def respond(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "segue the discussion" in prompt:
+            return self.segue
+        if "recommend they read" in prompt:
+            return self.recommendation
+        return self.answer
+
+    def _token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages)
+        time.sleep(
+            self.first_token_latency
+            + len(TOKEN_PATTERN.findall(text)) * self._token_delay()
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        for token in TOKEN_PATTERN.findall(self.respond(messages)):
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages)
+        await asyncio.sleep(
+            self.first_token_latency
+            + len(TOKEN_PATTERN.findall(text)) * self._token_delay()
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        for token in TOKEN_PATTERN.findall(self.respond(messages)):
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+@lru_cache(maxsize=65536)
+def _hash_word(word, size):
+    # python's hash() is salted per process, so words are hashed with blake2b to embed the same way in every run
+    digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+    return digest % size, 1.0 if digest >> 63 else -1.0
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    FakeEmbeddings is a local stand-in for OpenAIEmbeddings. Each text is embedded as a normalized bag of its lowercase
+    words, hashed into size dimensions, so texts sharing words are close and the same text always gets the same vector.
+    It simulates the latency of the embeddings API: a delay per request, then a fixed number of tokens per second.
+
+    Args:
+    size (int): Number of dimensions of the vectors
+    request_latency (float): Seconds each request waits before its tokens are counted
+    tokens_per_second (float): Tokens embedded per second, or 0 for no delay
+
+    """
+
+    def __init__(self, size=256, request_latency=0.0, tokens_per_second=0.0):
+        self.size = size
+        self.request_latency = request_latency
+        self.tokens_per_second = tokens_per_second
+        self.model = f"verse-fake-embedding-{size}"
+
+    def _delay(self, texts):
+        tokens = sum(len(TOKEN_PATTERN.findall(text)) for text in texts)
+        return self.request_latency + (tokens / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in WORD_PATTERN.findall(text.lower()):
+            index, sign = _hash_word(word, self.size)
+            vector[index] += sign
+
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        time.sleep(self._delay(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self._delay(texts))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeOpenAIServer:
+    """
+    FakeOpenAIServer is a local stand-in for OpenAI's API. Its embeddings endpoint (POST /v1/embeddings) serves the
+    vectors of FakeEmbeddings, and its chat completions endpoint (POST /v1/chat/completions) answers Verse's prompts
+    like FakeChatModel, in one piece or streamed token by token. It keeps connections alive between requests, like the
+    real API, and counts the connections it accepts. It throttles like the real API: a request that comes sooner than
+    1 / requests_per_second after the last one it answered gets a 429 with Retry-After headers. Once error_after
+    requests have been answered, every request fails with a 500, until error_after is reset.
+
+    Args:
+    size (int): Number of dimensions of the vectors
+    requests_per_second (float): Requests answered per second, or 0 for no limit
+    error_after (int): Number of requests answered before the server fails, or None to never fail
+    first_token_latency (float): Seconds a chat completion waits before its first token
+    ssl_context (ssl.SSLContext): Context to serve HTTPS with, or None to serve HTTP
+
+    """
+
+    def __init__(self, size=32, requests_per_second=0.0, error_after=None, first_token_latency=0.0, ssl_context=None):
+        self.embeddings = FakeEmbeddings(size=size)
+        self.chat_model = FakeChatModel()
+        self.requests_per_second = requests_per_second
+        self.error_after = error_after
+        self.first_token_latency = first_token_latency
+        self.ssl_context = ssl_context
+        self.stats = {
+            "connections": 0,
+            "requests": 0,
+            "throttled": 0,
+            "errors": 0,
+            "embedded_texts": 0,
+            "completions": 0,
+        }
+        self.url = None
+
+        self._lock = threading.Lock()
+        self._last_answered = float("-inf")
+        self._server = None
+
+    def admit(self):
+        # returns the status, headers and JSON body of the error response to a request, or None to answer it
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.error_after is not None and self.stats["requests"] - self.stats["throttled"] > self.error_after:
+                self.stats["errors"] += 1
+                return 500, {}, {"error": {"message": "The server had an error.", "type": "server_error"}}
+
+            if self.requests_per_second:
+                wait = self._last_answered + 1 / self.requests_per_second - now
+                if wait > 0:
+                    self.stats["throttled"] += 1
+                    headers = {"retry-after-ms": str(int(wait * 1000) + 1), "retry-after": str(math.ceil(wait))}
+                    return 429, headers, {"error": {"message": "Rate limit reached.", "type": "requests"}}
+            self._last_answered = now
+        return None
+
+    def handle_embeddings(self, body):
+        # returns the status, headers and JSON body of the response to an embeddings request
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with self._lock:
+            self.stats["embedded_texts"] += len(texts)
+        data = [
+            {"object": "embedding", "index": index, "embedding": self.embeddings._embed(text)}
+            for index, text in enumerate(texts)
+        ]
+        tokens = sum(len(TOKEN_PATTERN.findall(text)) for text in texts)
+        return 200, {}, {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def handle_chat(self, body):
+        # returns the text of the completion of a chat request
+        with self._lock:
+            self.stats["completions"] += 1
+        time.sleep(self.first_token_latency)
+        return self.chat_model.respond([HumanMessage(content=message["content"]) for message in body["messages"]])
+
+    def start(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with fake_server._lock:
+                    fake_server.stats["connections"] += 1
+
+            def send_json(self, status, headers, response):
+                content = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def send_stream(self, body, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [
+                    {"choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]}
+                    for token in TOKEN_PATTERN.findall(text)
+                ]
+                events.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                for event in events:
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"]}
+                    data = f"data: {json.dumps({**chunk, **event})}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                data = b"data: [DONE]\n\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n0\r\n\r\n")
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                path = self.path.rstrip("/")
+                if not path.endswith(("/v1/embeddings", "/v1/chat/completions")):
+                    return self.send_json(404, {}, {"error": {"message": "Not found.", "type": "invalid_request_error"}})
+
+                error = fake_server.admit()
+                if error:
+                    return self.send_json(*error)
+                if path.endswith("/v1/embeddings"):
+                    return self.send_json(*fake_server.handle_embeddings(body))
+
+                text = fake_server.handle_chat(body)
+                if body.get("stream"):
+                    return self.send_stream(body, text)
+                tokens = len(TOKEN_PATTERN.findall(text))
+                self.send_json(200, {}, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+                })
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        if self.ssl_context:
+            self._server.socket = self.ssl_context.wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        scheme = "https" if self.ssl_context else "http"
+        self.url = f"{scheme}://127.0.0.1:{self._server.server_address[1]}/v1"
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class OpenAIClientEmbeddings(Embeddings):
+    """
+    OpenAIClientEmbeddings embeds texts with the OpenAI client, like OpenAIEmbeddings, but sends the texts as they are
+    instead of tokenizing them with tiktoken (which downloads its encodings), so that it can run offline against
+    FakeOpenAIServer. The client does not retry, so that failed requests reach the caller.
+
+    Args:
+    base_url (str): URL of the API
+    model (str): Name of the embedding model
+
+    """
+
+    def __init__(self, base_url, model="text-embedding-3-large"):
+        self.model = model
+        self.client = openai.OpenAI(base_url=base_url, api_key="fake", max_retries=0)
+
+    def embed_documents(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model, encoding_format="float")
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeCollector(trace_service_pb2_grpc.TraceServiceServicer):
+    """
+    FakeCollector is a local stand-in for an OpenTelemetry collector. It receives spans exported over OTLP/gRPC on a free
+    local port and keeps them, so that traces can be checked without running a collector.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.endpoint = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    def Export(self, request, context):
+        with self._lock:
+            for resource_spans in request.resource_spans:
+                for scope_spans in resource_spans.scope_spans:
+                    self.spans.extend(scope_spans.spans)
+        return trace_service_pb2.ExportTraceServiceResponse()
+
+    def start(self):
+        self._server = grpc.server(ThreadPoolExecutor(max_workers=2))
+        trace_service_pb2_grpc.add_TraceServiceServicer_to_server(self, self._server)
+        port = self._server.add_insecure_port("127.0.0.1:0")
+        self._server.start()
+        self.endpoint = f"http://127.0.0.1:{port}"
+        return self
+
+    def stop(self):
+        self._server.stop(grace=None)
+
+
+def _encode_varint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _encode_field(number, value):
+    # protobuf wire format: integers as varints, strings and messages length-delimited
+    if isinstance(value, int):
+        return _encode_varint(number << 3) + _encode_varint(value)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return _encode_varint(number << 3 | 2) + _encode_varint(len(value)) + value
+
+
+def _encode_value_info(name, elem_type, dims):
+    # ValueInfoProto { name, type: TypeProto { tensor_type { elem_type, shape { dim { dim_param | dim_value } } } } }
+    shape = b"".join(
+        _encode_field(1, _encode_field(2, dim) if isinstance(dim, str) else _encode_field(1, dim)) for dim in dims
+    )
+    tensor_type = _encode_field(1, elem_type) + _encode_field(2, shape)
+    return _encode_field(1, name) + _encode_field(2, _encode_field(1, tensor_type))
+
+
+def write_onnx_embedding_model(path, vocabulary, size=32, seed=0):
+    """
+    write_onnx_embedding_model writes a small local stand-in for an ONNX sentence-embedding model to path: a tokenizer
+    that splits lowercase words from vocabulary, and a model that looks up a random embedding per token, with the same
+    inputs (input_ids, attention_mask) and output (token embeddings) as an exported transformer. The ONNX file is
+    encoded by hand, so that no ONNX tooling is needed.
+
+    Args:
+    path (str): Directory to write model.onnx and tokenizer.json to
+    vocabulary (Iterable[str]): Words the tokenizer knows; other words are unknown tokens
+    size (int): Number of dimensions of the embeddings
+    seed (int): Seed of the random embeddings
+
+    Returns:
+    str: path
+
+    Raises:
+    None
+
+    """
+
+    from tokenizers import Tokenizer, normalizers, pre_tokenizers
+    from tokenizers.models import WordLevel
+
+    words = sorted({word.lower() for word in vocabulary})
+    vocab = {"[PAD]": 0, "[UNK]": 1, **{word: index + 2 for index, word in enumerate(words)}}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+
+    table = np.random.default_rng(seed).normal(size=(len(vocab), size)).astype(np.float32)
+    table[0] = 0.0
+
+    # TensorProto { dims, data_type (1 = float), name, raw_data }
+    initializer = (
+        _encode_field(1, len(vocab))
+        + _encode_field(1, size)
+        + _encode_field(2, 1)
+        + _encode_field(8, "embeddings")
+        + _encode_field(9, table.tobytes())
+    )
+    # NodeProto { input, output, name, op_type }
+    node = (
+        _encode_field(1, "embeddings")
+        + _encode_field(1, "input_ids")
+        + _encode_field(2, "last_hidden_state")
+        + _encode_field(3, "lookup")
+        + _encode_field(4, "Gather")
+    )
+    # GraphProto { node, name, initializer, input, output }, with int64 (7) inputs and a float (1) output
+    graph = (
+        _encode_field(1, node)
+        + _encode_field(2, "verse-fake-embedding")
+        + _encode_field(5, initializer)
+        + _encode_field(11, _encode_value_info("input_ids", 7, ["batch", "sequence"]))
+        + _encode_field(11, _encode_value_info("attention_mask", 7, ["batch", "sequence"]))
+        + _encode_field(12, _encode_value_info("last_hidden_state", 1, ["batch", "sequence", size]))
+    )
+    # ModelProto { ir_version, graph, opset_import { domain, version } }
+    model = _encode_field(1, 8) + _encode_field(7, graph) + _encode_field(8, _encode_field(1, "") + _encode_field(2, 13))
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "model.onnx"), "wb") as file:
+        file.write(model)
+    tokenizer.save(os.path.join(path, "tokenizer.json"))
+    return path
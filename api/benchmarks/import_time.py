@@ -0,0 +1,100 @@
+"""
+Reports the import time of the verse package: for each entry point (importing verse, creating the application,
+importing the data processing CLI, and warming up the application), the wall time of a fresh interpreter running it,
+the modules that took longest to import (from python -X importtime), and which of the heavy packages of the RAG stack
+it loaded. Creating the application and the data processing CLI should load none of them; they are loaded by the
+warm-up, or by the first request that needs them.
+
+Run from the api/ directory:
+
+    python -m benchmarks.import_time --top 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_PACKAGES = (
+    "langchain",
+    "langchain_core",
+    "langchain_community",
+    "langchain_openai",
+    "openai",
+    "chromadb",
+    "tiktoken",
+    "onnxruntime",
+)
+
+ENTRY_POINTS = {
+    "import verse": "import verse",
+    "create_app": "from verse import create_app; create_app({'TESTING': True, 'OPENAI_API_KEY': 'profile'})",
+    "data_processing": "import verse.data_processing",
+    "warm-up": (
+        "from verse import create_app; "
+        "create_app({'OPENAI_API_KEY': 'profile', 'RETRIEVER_WARM_UP': True, 'WARM_UP_BACKGROUND': False})"
+    ),
+}
+
+API_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(code):
+    """
+    profile_imports runs code in a fresh interpreter with python -X importtime.
+
+    Returns:
+    dict: The wall time of the interpreter in seconds, the cumulative import time of each module in seconds, and the
+    heavy packages the code loaded
+    """
+
+    report = (
+        "import json, sys; "
+        f"print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & set({list(HEAVY_PACKAGES)!r}))))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{code}\n{report}"],
+        cwd=API_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds = time.perf_counter() - start
+
+    # python -X importtime prints a module once its own imports are done, with the time they took included in its
+    # cumulative time; the row of a top-level package therefore covers everything importing it loaded
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        if "." not in name:
+            packages[name] = int(cumulative) / 1e6
+
+    return {
+        "seconds": seconds,
+        "packages": packages,
+        "heavy_packages": json.loads(result.stdout.splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    for entry_point, code in ENTRY_POINTS.items():
+        profile = profile_imports(code)
+        print(f"{entry_point}: {profile['seconds']:.2f}s")
+        print(f"  heavy packages loaded: {', '.join(profile['heavy_packages']) or 'none'}")
+        top = sorted(profile["packages"].items(), key=lambda package: package[1], reverse=True)[: args.top]
+        for name, seconds in top:
+            print(f"  {name:<24} {seconds * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
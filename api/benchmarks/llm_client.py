@@ -0,0 +1,140 @@
+"""
+Compares the per-request overhead of /rag/professorResponse with a new LLM client and new chains for every request (as
+when the client lived on Flask's g) and with the process-lifetime client and chains, against a local fake
+OpenAI-compatible server.
+
+The fake server answers at once, so each request's latency is the overhead of the LLM calls (building the client and
+chains, connecting, and sending the answer and segue requests). With --tls, the server serves HTTPS with a self-signed
+certificate made with openssl, so that new connections also pay for a TLS handshake, as they do with OpenAI's API.
+Retrieval is replaced by fixed context.
+
+Run from the api/ directory:
+
+    python -m benchmarks.llm_client --requests 200 --concurrency 4 --tls
+"""
+
+import argparse
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import certifi
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.llm import create_llm
+
+from benchmarks.fakes import FakeOpenAIServer
+
+REQUEST = {
+    "course": "The American Novel Since 1945",
+    "query": "Tell me about Toni Morrison.",
+    "previous_responses": (),
+}
+
+MODES = ("per request", "shared")
+
+
+def make_certificate(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", keyfile, "-out", certfile,
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def measure_mode(mode, server, args):
+    """
+    measure_mode sends args.requests requests to /rag/professorResponse from args.concurrency threads, creating the LLM
+    client for every request in the "per request" mode.
+
+    Returns:
+    dict: The latency of each request in seconds, the requests per second, and the connections the server accepted
+    """
+
+    app = create_app({"TESTING": True, "OPENAI_API_KEY": "benchmark", "OPENAI_API_BASE": server.url})
+    connections = server.stats["connections"]
+
+    def send(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post("/rag/professorResponse", json=REQUEST)
+        assert response.status_code == 200
+        return time.perf_counter() - start
+
+    if mode == "per request":
+        # a new client is a new ChatOpenAI, so get_chains builds new chains for it too
+        get_global_llm = lambda: create_llm(app.config)
+    else:
+        get_global_llm = rag.get_global_llm
+
+    with mock.patch.object(rag, "get_global_llm", get_global_llm), mock.patch.object(
+        rag, "retrieve_context", return_value="Morrison lecture context."
+    ):
+        # the first request of each mode is not measured
+        send(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(send, range(args.requests)))
+        seconds = time.perf_counter() - start
+
+    return {
+        "latencies": sorted(latencies),
+        "requests_per_second": args.requests / seconds,
+        "connections": server.stats["connections"] - connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="verse-llm-client-") as directory:
+        ssl_context = None
+        if args.tls:
+            certfile, keyfile = make_certificate(directory)
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(certfile, keyfile)
+            # httpx trusts the certificates in SSL_CERT_FILE: the usual bundle, so that loading it costs what it does
+            # in production, and the server's certificate
+            bundle = os.path.join(directory, "bundle.pem")
+            with open(bundle, "w") as file, open(certifi.where()) as cafile, open(certfile) as server_certfile:
+                file.write(cafile.read() + server_certfile.read())
+            os.environ["SSL_CERT_FILE"] = bundle
+
+        server = FakeOpenAIServer(ssl_context=ssl_context).start()
+        try:
+            results = {mode: measure_mode(mode, server, args) for mode in MODES}
+        finally:
+            server.stop()
+
+    print(f"{args.requests} requests from {args.concurrency} threads over {'HTTPS' if args.tls else 'HTTP'}")
+    print(
+        f"{'mode':<12} {'mean (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'requests/s':>11} {'connections':>12}"
+    )
+    for mode, result in results.items():
+        latencies = result["latencies"]
+        print(
+            f"{mode:<12} {statistics.mean(latencies) * 1000:>10.1f} {statistics.median(latencies) * 1000:>10.1f} "
+            f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.1f} {result['requests_per_second']:>11.1f} "
+            f"{result['connections']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
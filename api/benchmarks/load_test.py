@@ -0,0 +1,167 @@
+"""
+Load tests /rag/professorResponse on the Flask application and on the async server (verse.asgi), using a local fake
+LLM with configurable delays instead of OpenAI.
+
+The Flask application is driven by a pool of threads, one per concurrent request, as a threaded WSGI server would run
+it. The async server is driven by concurrent requests on one event loop, and is also sent a burst larger than its
+queue to show requests beyond capacity being answered with 503 instead of waiting.
+
+Run from the api/ directory:
+
+    python -m benchmarks.load_test --requests 200 --concurrency 50 --first-token-latency 0.4 --tokens-per-second 60
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import httpx
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.asgi import create_asgi_app
+
+from benchmarks.fakes import FakeChatModel
+
+REQUEST = {
+    "course": "The American Novel Since 1945",
+    "query": "Tell me about Toni Morrison.",
+    "previous_responses": (),
+}
+
+CONTEXT = "Morrison lecture context."
+
+
+def get_config(**config):
+    return {"TESTING": True, "OPENAI_API_KEY": "benchmark", **config}
+
+
+def summarize(latencies, statuses, seconds):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(statuses),
+        "ok": statuses.count(200),
+        "rejected": statuses.count(503),
+        "requests_per_second": len(statuses) / seconds,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+    }
+
+
+def run_flask(llm, num_requests, concurrency):
+    """
+    run_flask sends num_requests requests to the Flask application from concurrency threads.
+
+    Returns:
+    dict: Throughput and latency percentiles
+    """
+
+    app = create_app(get_config())
+
+    def send():
+        client = app.test_client()
+        start = time.perf_counter()
+        status = client.post("/rag/professorResponse", json=REQUEST).status_code
+        return status, time.perf_counter() - start
+
+    with mock.patch.object(rag, "get_global_llm", return_value=llm), mock.patch.object(
+        rag, "retrieve_context", return_value=CONTEXT
+    ):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: send(), range(num_requests)))
+        seconds = time.perf_counter() - start
+
+    statuses = [status for status, _ in results]
+    return summarize([latency for _, latency in results], statuses, seconds)
+
+
+async def send_async_requests(app, num_requests, concurrency):
+    # concurrency bounds the number of clients sending at once; each client sends its requests one after the other
+    transport = httpx.ASGITransport(app=app)
+    results = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://verse", timeout=None) as client:
+        queue = asyncio.Queue()
+        for _ in range(num_requests):
+            queue.put_nowait(None)
+
+        async def client_loop():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/rag/professorResponse", json=REQUEST)
+                results.append((response.status_code, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+
+    statuses = [status for status, _ in results]
+    return summarize([latency for _, latency in results], statuses, seconds)
+
+
+def run_async(llm, num_requests, concurrency, **config):
+    """
+    run_async sends num_requests requests to the async server from concurrency clients.
+
+    Returns:
+    dict: Throughput, latency percentiles, and the number of requests answered with 503
+    """
+
+    app = create_asgi_app(get_config(**config))
+
+    async def aretrieve_context(course, query, global_search=False):
+        return CONTEXT
+
+    with mock.patch.object(rag, "get_global_llm", return_value=llm), mock.patch.object(
+        rag, "aretrieve_context", side_effect=aretrieve_context
+    ):
+        return asyncio.run(send_async_requests(app, num_requests, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    args = parser.parse_args()
+
+    llm = FakeChatModel(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+    )
+
+    results = {
+        "flask (threads)": run_flask(llm, args.requests, args.concurrency),
+        "asgi": run_async(
+            llm, args.requests, args.concurrency, ASYNC_MAX_IN_FLIGHT=args.concurrency
+        ),
+        # a burst of twice the capacity: half is served, the rest is turned away right away
+        "asgi (overloaded)": run_async(
+            llm,
+            args.concurrency * 2,
+            args.concurrency * 2,
+            ASYNC_MAX_IN_FLIGHT=args.concurrency // 2,
+            ASYNC_MAX_QUEUED=args.concurrency // 2,
+        ),
+    }
+
+    print(
+        f"{'server':<18} {'requests':>8} {'ok':>6} {'503':>6} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8}"
+    )
+    for server, result in results.items():
+        print(
+            f"{server:<18} {result['requests']:>8} {result['ok']:>6} {result['rejected']:>6} "
+            f"{result['requests_per_second']:>8.1f} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
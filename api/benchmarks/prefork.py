@@ -0,0 +1,183 @@
+"""
+Compares the startup time, time to first response, and per-worker memory of the pre-forked server (verse.prefork) with
+and without preloading the application in the master process.
+
+The bundled data/raw/engl*.zip transcripts are indexed with local fake embeddings, and the server answers with the fake
+LLM. For each mode, the server is started in a fresh process; the startup time is the time until it answers /pulse,
+and the time to first response the time until it answers /rag/professorResponse. Each worker then answers a few
+requests before its memory is read from /proc: its RSS counts the pages it shares with the master and the other
+workers, its PSS counts them divided by the number of processes sharing them, and its private memory excludes them.
+
+Run from the api/ directory:
+
+    python -m benchmarks.prefork --workers 4 --requests 40
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from verse import data_processing, vector_database
+from verse.prefork import get_process_memory
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.suite import get_bundled_courses
+
+REQUEST = {
+    "course": "The American Novel Since 1945",
+    "query": "What does the professor say about memory?",
+    "previous_responses": (),
+}
+
+MODES = {"preload": [], "no preload": ["--no-preload"]}
+
+
+def create_benchmark_app():
+    """
+    create_benchmark_app is the application factory of the benchmarked server: the Flask application over the
+    benchmark's index, with the fake embeddings and LLM.
+    """
+
+    import verse.retrieval_augmented_generation as rag
+    from verse import create_app
+
+    app = create_app(
+        {
+            "OPENAI_API_KEY": "benchmark",
+            "CHROMA_PATH": os.environ["VERSE_BENCHMARK_CHROMA_PATH"],
+            # preload_app warms the application once the fakes are in place
+            "RETRIEVER_WARM_UP": False,
+        }
+    )
+    app.extensions["retriever_pool"].embedding_function = FakeEmbeddings(
+        size=int(os.environ["VERSE_BENCHMARK_EMBEDDING_SIZE"])
+    )
+    llm = FakeChatModel()
+    rag.get_global_llm = lambda: llm
+    return app
+
+
+def get_worker_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def wait_for(client, method, path, timeout, **kwargs):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.request(method, path, **kwargs).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{method} {path} did not succeed within {timeout} seconds")
+
+
+def run_mode(flags, args, env):
+    """
+    run_mode starts the server with flags, measures its startup time and time to first response, sends it args.requests
+    requests, and reads the memory of its processes.
+    """
+
+    command = [
+        sys.executable,
+        "-m",
+        "verse.prefork",
+        "--factory",
+        "benchmarks.prefork:create_benchmark_app",
+        "--workers",
+        str(args.workers),
+        "--port",
+        str(args.port),
+        *flags,
+    ]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+            wait_for(client, "GET", "/pulse", args.timeout)
+            startup_seconds = time.perf_counter() - start
+            wait_for(client, "POST", "/rag/professorResponse", args.timeout, json=REQUEST)
+            first_response_seconds = time.perf_counter() - start
+
+        def send(_):
+            with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+                return client.post("/rag/professorResponse", json=REQUEST).status_code
+
+        with ThreadPoolExecutor(max_workers=args.workers * 2) as executor:
+            statuses = list(executor.map(send, range(args.requests)))
+
+        workers = [get_process_memory(pid) for pid in get_worker_pids(server.pid)]
+        master = get_process_memory(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    return {
+        "startup_seconds": startup_seconds,
+        "first_response_seconds": first_response_seconds,
+        "ok": statuses.count(200),
+        "master": master,
+        "workers": workers,
+    }
+
+
+def print_results(results, args):
+    print(f"{args.workers} workers, {args.requests} requests after the first response")
+    print(
+        f"{'mode':<12} {'startup (s)':>12} {'first response (s)':>19} {'worker RSS (MB)':>16} "
+        f"{'worker PSS (MB)':>16} {'worker private (MB)':>20} {'total PSS (MB)':>15}"
+    )
+    for mode, result in results.items():
+        workers = result["workers"]
+        average = {key: sum(worker[key] for worker in workers) / len(workers) for key in workers[0]}
+        total_pss = result["master"]["pss_mb"] + sum(worker["pss_mb"] for worker in workers)
+        print(
+            f"{mode:<12} {result['startup_seconds']:>12.2f} {result['first_response_seconds']:>19.2f} "
+            f"{average['rss_mb']:>16.1f} {average['pss_mb']:>16.1f} {average['private_mb']:>20.1f} {total_pss:>15.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--port", type=int, default=5123)
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="verse-prefork-")
+    try:
+        processed_path = os.path.join(workspace, "processed")
+        chroma_path = os.path.join(workspace, "index", "chroma")
+        data_processing.process_courses(get_bundled_courses(), processed_data_path=processed_path)
+        vector_database.generate_vector_db_from_processed_data(
+            processed_data_path=processed_path,
+            chroma_path=chroma_path,
+            embedding_function=FakeEmbeddings(size=args.embedding_size),
+        )
+
+        env = {
+            **os.environ,
+            "VERSE_BENCHMARK_CHROMA_PATH": chroma_path,
+            "VERSE_BENCHMARK_EMBEDDING_SIZE": str(args.embedding_size),
+        }
+        results = {mode: run_mode(flags, args, env) for mode, flags in MODES.items()}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print_results(results, args)
+
+
+if __name__ == "__main__":
+    main()
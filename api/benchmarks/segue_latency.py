@@ -0,0 +1,91 @@
+"""
+Compares the end-to-end latency of /rag/professorResponse in the sequential and speculative segue modes, using a local
+fake LLM with configurable delays instead of OpenAI.
+
+Run from the api/ directory:
+
+    python -m benchmarks.segue_latency --requests 10 --first-token-latency 0.4 --tokens-per-second 60
+"""
+
+import argparse
+import statistics
+import time
+from unittest import mock
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+
+from benchmarks.fakes import FakeChatModel
+
+REQUEST = {
+    "course": "The American Novel Since 1945",
+    "query": "Tell me about Toni Morrison.",
+    "previous_responses": (),
+}
+
+
+def measure_segue_mode(segue_mode, llm, num_requests, speculation_chars):
+    """
+    measure_segue_mode sends num_requests requests to /rag/professorResponse in the given segue mode.
+
+    Returns:
+    Tuple[List[float], str]: The latency of each request in seconds and the last response
+    """
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "OPENAI_API_KEY": "benchmark",
+            "SEGUE_MODE": segue_mode,
+            "SEGUE_SPECULATION_CHARS": speculation_chars,
+        }
+    )
+    client = app.test_client()
+
+    latencies = []
+    response = None
+
+    with mock.patch.object(rag, "get_global_llm", return_value=llm), mock.patch.object(
+        rag, "retrieve_context", return_value="Morrison lecture context."
+    ):
+        for _ in range(num_requests):
+            start = time.perf_counter()
+            response = client.post("/rag/professorResponse", json=REQUEST).get_json()
+            latencies.append(time.perf_counter() - start)
+
+    return latencies, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--speculation-chars", type=int, default=150)
+    args = parser.parse_args()
+
+    llm = FakeChatModel(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+    )
+
+    results = {}
+    for segue_mode in rag.SEGUE_MODES:
+        results[segue_mode] = measure_segue_mode(
+            segue_mode, llm, args.requests, args.speculation_chars
+        )
+
+    print(f"{'mode':<12} {'mean (s)':>10} {'p50 (s)':>10} {'max (s)':>10}")
+    for segue_mode, (latencies, _) in results.items():
+        print(
+            f"{segue_mode:<12} {statistics.mean(latencies):>10.3f} "
+            f"{statistics.median(latencies):>10.3f} {max(latencies):>10.3f}"
+        )
+
+    sequential_response = results["sequential"][1]
+    speculative_response = results["speculative"][1]
+    print(f"responses identical: {sequential_response == speculative_response}")
+
+
+if __name__ == "__main__":
+    main()
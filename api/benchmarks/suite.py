@@ -0,0 +1,301 @@
+"""
+Runs Verse's benchmark suite offline: data_processing.process_course, vector_database.generate_vector_db_from_processed_data,
+/rag/professorResponse and /rag/professorRecommendation, against local fakes of ChatOpenAI and OpenAIEmbeddings with
+configurable latency and token rate.
+
+The suite processes the bundled data/raw/engl*.zip transcripts into a temporary directory and indexes them with the fake
+embeddings, so retrieval runs against a real Chroma index. Each benchmark runs in a fresh process, so that its peak RSS
+is its own. Results (p50/p95/p99 latency, operations per second, and peak RSS) are printed and saved as JSON, and two
+result files can be compared.
+
+Run from the api/ directory:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare baseline.json results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from unittest import mock
+
+from verse import data_processing, vector_database
+from verse.courses import COURSES
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+BENCHMARKS = (
+    "process_course",
+    "generate_vector_db_from_processed_data",
+    "professorResponse",
+    "professorRecommendation",
+)
+
+QUERIES = (
+    "What does the professor say about memory?",
+    "How should we read the ending?",
+    "What is the role of the narrator?",
+    "Why does the author break with tradition?",
+    "How does this connect to the earlier lectures?",
+)
+
+
+def get_bundled_courses():
+    return [
+        course_num
+        for course_num in COURSES
+        if os.path.exists(os.path.join(data_processing.BASEDIR, f"data/raw/engl{course_num}.zip"))
+    ]
+
+
+def get_peak_rss_mb():
+    # ru_maxrss carries over the peak of the parent process across exec, so on Linux the peak of this process image is
+    # read from /proc instead
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def summarize(latencies, seconds):
+    """
+    summarize reports the latency percentiles and the throughput of a benchmark.
+
+    Args:
+    latencies (List[float]): Seconds each operation took
+    seconds (float): Wall-clock seconds of the whole benchmark
+
+    Returns:
+    dict: The number of operations, operations per second, and the mean, p50, p95 and p99 latency in seconds
+    """
+
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "operations": len(latencies),
+        "operations_per_second": len(latencies) / seconds if seconds else 0.0,
+        "mean": statistics.fmean(latencies),
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+    }
+
+
+def get_embeddings(args):
+    return FakeEmbeddings(
+        size=args.embedding_size,
+        request_latency=args.embedding_latency,
+        tokens_per_second=args.embedding_tokens_per_second,
+    )
+
+
+def run_process_course(args, workspace):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        for course_num in get_bundled_courses():
+            operation_start = time.perf_counter()
+            data_processing.process_course(course_num)
+            latencies.append(time.perf_counter() - operation_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_generate_vector_db(args, workspace):
+    latencies = []
+    start = time.perf_counter()
+    for repeat in range(args.repeats):
+        build_stats = vector_database.generate_vector_db_from_processed_data(
+            processed_data_path=os.path.join(workspace, "processed"),
+            chroma_path=os.path.join(workspace, f"build{repeat}", "chroma"),
+            embedding_function=get_embeddings(args),
+        )
+        latencies.append(build_stats["seconds"])
+    return {**summarize(latencies, time.perf_counter() - start), "chunks": build_stats["added"]}
+
+
+def run_route(args, workspace, endpoint, make_request):
+    import verse.retrieval_augmented_generation as rag
+    from verse import create_app
+    from verse.history import estimate_tokens
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "OPENAI_API_KEY": "benchmark",
+            "CHROMA_PATH": os.path.join(workspace, "index", "chroma"),
+        }
+    )
+    app.extensions["retriever_pool"].embedding_function = get_embeddings(args)
+
+    llm = FakeChatModel(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+    )
+    courses = [COURSES[course_num]["title"] for course_num in get_bundled_courses()]
+
+    def send(number):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post(endpoint, json=make_request(number, courses))
+        if response.status_code != 200:
+            raise RuntimeError(f"{endpoint} answered {response.status_code}: {response.get_data(as_text=True)}")
+        return time.perf_counter() - start
+
+    # tiktoken downloads its vocabulary on first use, so the suite counts tokens with the offline estimate
+    app.extensions["history_compactor"]._count_tokens = estimate_tokens
+    with mock.patch.object(rag, "get_global_llm", return_value=llm), mock.patch.object(
+        rag, "get_token_counter", return_value=estimate_tokens
+    ):
+        # the first request opens the vector store, which is done once per process at startup
+        send(-1)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(send, range(args.requests)))
+        return summarize(latencies, time.perf_counter() - start)
+
+
+def make_response_request(number, courses):
+    return {
+        "course": courses[number % len(courses)],
+        "query": QUERIES[number % len(QUERIES)],
+        "previous_responses": (),
+    }
+
+
+def make_recommendation_request(number, courses):
+    # every request has its own history, so that none is served from the recommendation store
+    return {
+        "course": courses[number % len(courses)],
+        "messages": (f"Question {number}: {QUERIES[number % len(QUERIES)]}", "A response."),
+    }
+
+
+def run_benchmark(name, args, workspace):
+    """
+    run_benchmark runs one benchmark. It is called in a fresh process, so the peak RSS it reports is the benchmark's.
+
+    Returns:
+    dict: The latency and throughput of the benchmark, and the peak RSS of its process in megabytes
+    """
+
+    if name == "process_course":
+        result = run_process_course(args, workspace)
+    elif name == "generate_vector_db_from_processed_data":
+        result = run_generate_vector_db(args, workspace)
+    elif name == "professorResponse":
+        result = run_route(args, workspace, "/rag/professorResponse", make_response_request)
+    else:
+        result = run_route(args, workspace, "/rag/professorRecommendation", make_recommendation_request)
+
+    return {**result, "peak_rss_mb": get_peak_rss_mb()}
+
+
+def prepare_workspace(args, workspace):
+    # processed transcripts for the index build, and an index for the routes
+    data_processing.process_courses(get_bundled_courses(), processed_data_path=os.path.join(workspace, "processed"))
+    vector_database.generate_vector_db_from_processed_data(
+        processed_data_path=os.path.join(workspace, "processed"),
+        chroma_path=os.path.join(workspace, "index", "chroma"),
+        embedding_function=FakeEmbeddings(size=args.embedding_size),
+    )
+
+
+def run_suite(args):
+    workspace = tempfile.mkdtemp(prefix="verse-benchmarks-")
+    try:
+        prepare_workspace(args, workspace)
+
+        results = {}
+        for name in args.benchmarks:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                results[name] = executor.submit(run_benchmark, name, args, workspace).result()
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+
+
+def print_results(results):
+    print(
+        f"{'benchmark':<40} {'ops':>6} {'ops/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'RSS (MB)':>9}"
+    )
+    for name, result in results["results"].items():
+        print(
+            f"{name:<40} {result['operations']:>6} {result['operations_per_second']:>8.2f} {result['p50']:>8.3f} "
+            f"{result['p95']:>8.3f} {result['p99']:>8.3f} {result['peak_rss_mb']:>9.1f}"
+        )
+
+
+def print_comparison(baseline, results):
+    print(f"{'benchmark':<40} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for metric in ("operations_per_second", "p50", "p95", "p99", "peak_rss_mb"):
+            before, after = baseline["results"][name][metric], result[metric]
+            change = f"{(after - before) / before:+.1%}" if before else "n/a"
+            print(f"{name:<40} {metric:<22} {before:>10.3f} {after:>10.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--requests", type=int, default=100, help="Requests sent to each route")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests sent to a route at once")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of process_course and of the index build")
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings request")
+    parser.add_argument("--embedding-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--output", help="Save the results as JSON to this path")
+    parser.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="RESULTS",
+        help="Compare a baseline results file with a second results file, or with a new run",
+    )
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 1:
+        with open(args.compare[1], "r") as file:
+            results = json.load(file)
+    else:
+        results = run_suite(args)
+        print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare[0], "r") as file:
+            print_comparison(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
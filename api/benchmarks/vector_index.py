@@ -0,0 +1,196 @@
+"""
+Compares the recall and latency of the memory-mapped vector index (float32, int8, and truncated to fewer dimensions)
+with Chroma's HNSW index, on the bundled data/raw/engl*.zip transcripts.
+
+The transcripts are indexed with local fake embeddings of 3072 dimensions, the size of text-embedding-3-large. Queries
+are spans of the transcripts, and recall@k is measured against an exact float32 search. Each index is searched in a
+fresh process, which reports its private (anonymous) RSS: the memory-mapped vectors are page cache, shared by every
+worker, while Chroma's HNSW index is loaded into each worker's own memory.
+
+The fake embeddings hash words into dimensions, so unlike text-embedding-3 models they are not trained to keep their
+meaning in their first dimensions, and the recall of truncated indexes is a lower bound.
+
+Run from the api/ directory:
+
+    python -m benchmarks.vector_index --queries 200 --k 4
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from verse import data_processing, vector_database
+from verse.courses import GLOBAL_COLLECTION_NAME
+from verse.vector_index import VECTOR_INDEX_DIRNAME, VectorIndex, build_vector_index
+
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.suite import get_bundled_courses, summarize
+
+VARIANTS = (
+    ("float32", None),
+    ("int8", None),
+    ("float32", 1024),
+    ("int8", 1024),
+    ("int8", 256),
+)
+
+
+def get_private_rss_mb():
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def make_queries(chroma_path, num_queries, seed=0):
+    # spans of 8 to 20 words from random chunks, like a student's question about a passage
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=chroma_path).get_collection(GLOBAL_COLLECTION_NAME)
+    documents = collection.get(include=["documents"])["documents"]
+
+    generator = random.Random(seed)
+    queries = []
+    for document in generator.sample(documents, min(num_queries, len(documents))):
+        words = document.split()
+        length = generator.randint(8, 20)
+        start = generator.randint(0, max(len(words) - length, 0))
+        queries.append(" ".join(words[start : start + length]))
+    return queries
+
+
+def search_chroma(chroma_path, queries, k):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=chroma_path).get_collection(GLOBAL_COLLECTION_NAME)
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0])
+        latencies.append(time.perf_counter() - start)
+    return results, latencies, None
+
+
+def search_vector_index(path, queries, k, batch_size):
+    vector_index = VectorIndex(path)
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ((chunk_ids, _),) = vector_index.search([query], k=k)
+        results.append(chunk_ids)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for batch_start in range(0, len(queries), batch_size):
+        vector_index.search(queries[batch_start : batch_start + batch_size], k=k)
+    batch_seconds = time.perf_counter() - start
+
+    return results, latencies, len(queries) / batch_seconds
+
+
+def run_search(backend, path, queries, k, batch_size):
+    """
+    run_search searches every query in one index. It is called in a fresh process, so the RSS it reports is the index's.
+    """
+
+    start = time.perf_counter()
+    if backend == "chroma":
+        results, latencies, batched_queries_per_second = search_chroma(path, queries, k)
+    else:
+        results, latencies, batched_queries_per_second = search_vector_index(path, queries, k, batch_size)
+
+    return {
+        "results": results,
+        "latency": summarize(latencies, time.perf_counter() - start),
+        "batched_queries_per_second": batched_queries_per_second,
+        "private_rss_mb": get_private_rss_mb(),
+    }
+
+
+def get_recall(results, exact_results):
+    found = sum(len(set(result) & set(exact)) for result, exact in zip(results, exact_results))
+    return found / sum(len(exact) for exact in exact_results)
+
+
+def run_comparison(args, workspace):
+    processed_path = os.path.join(workspace, "processed")
+    chroma_path = os.path.join(workspace, "index", "chroma")
+    embedding = FakeEmbeddings(size=args.embedding_size)
+
+    data_processing.process_courses(get_bundled_courses(), processed_data_path=processed_path)
+    build_stats = vector_database.generate_vector_db_from_processed_data(
+        processed_data_path=processed_path, chroma_path=chroma_path, embedding_function=embedding
+    )
+
+    # every variant is built from the full float32 index written with the Chroma index
+    full_index = VectorIndex(os.path.join(chroma_path, VECTOR_INDEX_DIRNAME))
+    embeddings = np.asarray(full_index.vectors)
+    courses = np.zeros(len(full_index), dtype=np.int32)
+
+    indexes = {"chroma": ("chroma", chroma_path, build_stats["vector_index"]["bytes"])}
+    for dtype, dimensions in VARIANTS:
+        name = f"numpy {dtype} {dimensions or full_index.dimensions}"
+        path = os.path.join(workspace, name.replace(" ", "-"))
+        stats = build_vector_index(
+            path, full_index.chunk_ids, embeddings, courses, full_index.embedding_model, dtype, dimensions
+        )
+        indexes[name] = ("numpy", path, stats["bytes"])
+
+    queries = embedding.embed_documents(make_queries(chroma_path, args.queries))
+    exact_results = [chunk_ids for chunk_ids, _ in full_index.search(queries, k=args.k)]
+
+    comparison = {}
+    for name, (backend, path, size) in indexes.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_search, backend, path, queries, args.k, args.batch_size).result()
+        comparison[name] = {
+            "recall": get_recall(result.pop("results"), exact_results),
+            "vector_mb": size / 1024 / 1024,
+            **result,
+        }
+
+    return len(full_index), comparison
+
+
+def print_comparison(chunks, comparison, args):
+    print(f"{chunks} chunks, {args.queries} queries, recall@{args.k} against an exact float32 search")
+    print(
+        f"{'index':<22} {'recall':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'batched q/s':>12} {'vectors (MB)':>13} "
+        f"{'private RSS (MB)':>17}"
+    )
+    for name, result in comparison.items():
+        batched = result["batched_queries_per_second"]
+        print(
+            f"{name:<22} {result['recall']:>7.3f} {result['latency']['p50'] * 1000:>9.2f} "
+            f"{result['latency']['p95'] * 1000:>9.2f} {f'{batched:.0f}' if batched else '-':>12} "
+            f"{result['vector_mb']:>13.1f} {result['private_rss_mb']:>17.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per batched search")
+    parser.add_argument("--embedding-size", type=int, default=3072)
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="verse-vector-index-")
+    try:
+        chunks, comparison = run_comparison(args, workspace)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print_comparison(chunks, comparison, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.asgi import create_asgi_app
+
+from benchmarks.fakes import FakeChatModel
+
+CONFIG = {"TESTING": True, "OPENAI_API_KEY": "testkey"}
+
+
+def post(app, *requests):
+    """
+    Sends (path, json) requests to the async server concurrently and returns the responses in order.
+    """
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://verse") as client:
+            return await asyncio.gather(
+                *(client.post(path, json=data) for path, data in requests)
+            )
+
+    return asyncio.run(send())
+
+
+def parse_server_sent_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Replaces the LLM and the retriever with local stand-ins, for both the Flask and the async server.
+    """
+    llm = FakeChatModel(
+        answer="Morrison writes about memory. Beloved is haunted by it. And the",
+        segue='"What do you make of Sethe?"',
+    )
+
+    async def aretrieve_context(*args):
+        return "context"
+
+    monkeypatch.setattr(rag, "get_global_llm", lambda: llm)
+    monkeypatch.setattr(rag, "retrieve_context", lambda *args: "context")
+    monkeypatch.setattr(rag, "aretrieve_context", aretrieve_context)
+    return llm
+
+
+@pytest.mark.parametrize("segue_mode", rag.SEGUE_MODES)
+def test_asgi_professor_response_matches_flask(fake_llm, inputs_response, segue_mode):
+    """
+    Ensures that the async server answers /rag/professorResponse like the Flask application, as JSON and as a stream.
+    """
+    config = {**CONFIG, "SEGUE_MODE": segue_mode, "SEGUE_SPECULATION_CHARS": 10}
+    flask_response = create_app(config).test_client().post(
+        "/rag/professorResponse", json=inputs_response
+    )
+
+    json_response, stream_response = post(
+        create_asgi_app(config),
+        ("/rag/professorResponse", inputs_response),
+        ("/rag/professorResponse", {**inputs_response, "stream": True}),
+    )
+
+    assert json_response.status_code == 200
+    assert json_response.json() == flask_response.get_json()
+    assert "answer" in json_response.headers["Server-Timing"]
+
+    events = parse_server_sent_events(stream_response.text)
+    assert stream_response.headers["content-type"].startswith("text/event-stream")
+    assert events[-1] == ("done", {"response": flask_response.get_json()})
+
+
+@pytest.mark.parametrize(
+    ["endpoint", "field"],
+    [
+        ["/rag/professorResponse", "course"],
+        ["/rag/professorResponse", "query"],
+        ["/rag/professorRecommendation", "course"],
+        ["/rag/professorRecommendation", "messages"],
+    ],
+)
+def test_asgi_missing_field(inputs_response, inputs_recommendation, endpoint, field):
+    """
+    Ensures that the async server answers a request with a missing field with a 400 status code.
+    """
+    data = inputs_response if endpoint == "/rag/professorResponse" else inputs_recommendation
+    del data[field]
+
+    (response,) = post(create_asgi_app(CONFIG), (endpoint, data))
+    assert response.status_code == 400
+    assert response.json()["message"] == f"{field.capitalize()} must be provided."
+
+
+def test_asgi_overloaded(fake_llm, inputs_response):
+    """
+    Ensures that requests beyond the concurrency limit and the queue are turned away with a 503 status code.
+    """
+    fake_llm.first_token_latency = 0.2
+    app = create_asgi_app({**CONFIG, "ASYNC_MAX_IN_FLIGHT": 1, "ASYNC_MAX_QUEUED": 1})
+
+    responses = post(app, *[("/rag/professorResponse", inputs_response)] * 3)
+
+    assert sorted(response.status_code for response in responses) == [200, 200, 503]
+    assert app.state.limiter.get_stats() == {
+        "admitted": 2,
+        "rejected": 1,
+        "timed_out": 0,
+        "in_flight": 0,
+        "queued": 0,
+    }
+
+
+@pytest.mark.parametrize("failing_message", ["http.response.start", "http.response.body"])
+def test_asgi_stream_releases_slot_on_send_failure(failing_message):
+    """
+    Ensures that a streamed response releases its concurrency slot exactly once when sending it fails, whether or not
+    its stream had started.
+    """
+    from verse.asgi import iterate, stream_response_parts
+
+    releases = []
+    response = stream_response_parts(
+        create_app(CONFIG), lambda: iterate([("answer", "Beloved.")]), on_close=lambda: releases.append(1)
+    )
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == failing_message:
+            raise OSError("connection reset")
+
+    # anyio raises the failed send in an exception group
+    with pytest.raises((OSError, ExceptionGroup)):
+        asyncio.run(response({"type": "http"}, receive, send))
+    assert releases == [1]
+
+
+def test_asgi_professor_recommendation_shared(fake_llm, inputs_recommendation):
+    """
+    Ensures that concurrent requests for the same recommendation share one LLM call.
+    """
+    fake_llm.first_token_latency = 0.1
+    calls = []
+    agenerate = FakeChatModel._agenerate
+
+    async def counting_agenerate(self, *args, **kwargs):
+        calls.append(args)
+        return await agenerate(self, *args, **kwargs)
+
+    app = create_asgi_app(CONFIG)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(FakeChatModel, "_agenerate", counting_agenerate)
+        responses = post(app, *[("/rag/professorRecommendation", inputs_recommendation)] * 3)
+
+    assert [response.json() for response in responses] == [fake_llm.recommendation] * 3
+    assert len(calls) == 1
+
+
+def test_asgi_sessions(fake_llm):
+    """
+    Ensures that the async server reads the history from a session and adds each query and response to it.
+    """
+    app = create_asgi_app(CONFIG)
+
+    async def converse():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://verse") as client:
+            session = (await client.post("/sessions", json={"course": "Milton"})).json()
+            for query in ("Who is Satan?", "And Eve?"):
+                await client.post(
+                    "/rag/professorResponse",
+                    json={"query": query, "session_id": session["session_id"]},
+                )
+            return (await client.get(f"/sessions/{session['session_id']}")).json()
+
+    session = asyncio.run(converse())
+    assert session["messages"][::2] == ["Who is Satan?", "And Eve?"]
+    assert session["previous_responses"] == session["messages"][1::2]
+
+
+def test_asgi_sessions_run_off_the_event_loop(fake_llm, tmp_path):
+    """
+    Ensures that the async server calls the SQLite session store from worker threads, so that its disk reads and writes
+    do not block the event loop.
+    """
+    app = create_asgi_app({**CONFIG, "SESSION_STORE": "sqlite", "SESSION_STORE_PATH": str(tmp_path / "sessions.db")})
+    store = app.state.flask_app.extensions["session_store"]
+
+    calls = []
+    for method in ("create", "get", "append", "delete", "get_stats"):
+
+        def record_thread(*args, method=getattr(store, method), name=method, **kwargs):
+            calls.append((name, threading.current_thread()))
+            return method(*args, **kwargs)
+
+        setattr(store, method, record_thread)
+
+    async def converse():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://verse") as client:
+            session_id = (await client.post("/sessions", json={"course": "Milton"})).json()["session_id"]
+            await client.post("/rag/professorResponse", json={"query": "Who is Satan?", "session_id": session_id})
+            await client.post(f"/sessions/{session_id}/messages", json={"messages": ["And Eve?"]})
+            await client.get(f"/sessions/{session_id}")
+            await client.get("/sessions/stats")
+            return (await client.delete(f"/sessions/{session_id}")).status_code
+
+    assert asyncio.run(converse()) == 204
+    assert {name for name, _ in calls} == {"create", "get", "append", "delete", "get_stats"}
+    assert threading.main_thread() not in {thread for _, thread in calls}
+
+
+def test_asgi_metrics(fake_llm, inputs_response):
+    """
+    Ensures that the async server reports request and stage latency and its limiter's counters at /metrics.
+    """
+    app = create_asgi_app(CONFIG)
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://verse") as client:
+            await client.post("/rag/professorResponse", json=inputs_response)
+            return (await client.get("/metrics")).text
+
+    metrics = asyncio.run(send())
+    assert (
+        'verse_request_duration_seconds_count{method="POST",route="/rag/professorResponse",status="200"} 1.0'
+        in metrics
+    )
+    assert 'verse_stage_duration_seconds_count{stage="answer"} 1.0' in metrics
+    assert 'verse_async_requests_total{outcome="admitted"} 1.0' in metrics
@@ -0,0 +1,179 @@
+from langchain_core.documents import Document
+
+from verse.chunking import CHUNK_TOKENS, chunk_spans
+from verse.context_packs import (
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    RETRIEVAL_K,
+    ContextPacks,
+    build_context_packs,
+    find_overlap,
+)
+from verse.corpus import CORPUS_FILENAME, write_corpus
+from verse.history import estimate_tokens
+from verse.summaries import COURSE_SUMMARY_WORDS, LECTURE_SUMMARY_WORDS, load_summaries, summarize_courses
+
+from benchmarks.fakes import FakeChatModel
+
+LECTURE = (
+    "Wallace Stevens wrote The Snow Man in 1921. One must have a mind of winter to regard the frost. "
+    "The listener beholds nothing that is not there and the nothing that is."
+)
+
+
+def make_chunks():
+    # three chunks of one lecture overlapping by 20 characters, and a chunk of another lecture
+    texts = [LECTURE[0:60], LECTURE[40:120], LECTURE[100:]]
+    chunks = {
+        f"310-1-{position}": Document(page_content=text, metadata={"course": 310, "lecture": 1})
+        for position, text in enumerate(texts)
+    }
+    chunks["310-2-0"] = Document(
+        page_content="Ezra Pound wrote In a Station of the Metro.", metadata={"course": 310, "lecture": 2}
+    )
+    return chunks
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_find_overlap():
+    """
+    Ensures that the overlap of consecutive chunks is found, and that short coincidental matches are ignored.
+    """
+    assert find_overlap(LECTURE[0:60], LECTURE[40:120]) == 20
+    assert find_overlap("the snow man", "man of winter") == 0
+    assert find_overlap("", LECTURE) == 0
+
+
+def test_format_deduplicates_adjacent_chunks(tmp_path):
+    """
+    Ensures that retrieved chunks of a lecture are put back in order and joined without the text they repeat.
+    """
+    chunks = make_chunks()
+    stats = build_context_packs(str(tmp_path), chunks)
+    assert stats == {"chunks": 4, "lectures": 2, "overlap_chars": 40, "lecture_summaries": 0, "course_summaries": 0}
+
+    packs = ContextPacks(str(tmp_path))
+    chunk_ids = ["310-1-2", "310-2-0", "310-1-0", "310-1-1"]
+    context = packs.format(chunk_ids, [chunks[chunk_id].page_content for chunk_id in chunk_ids], 1000, count_words)
+    assert context == f"{LECTURE}\n{chunks['310-2-0'].page_content}"
+
+    # chunks that are not adjacent are kept apart
+    context = packs.format(["310-1-0", "310-1-2"], [LECTURE[0:60], LECTURE[100:]], 1000, count_words)
+    assert context == f"{LECTURE[0:60]}\n{LECTURE[100:]}"
+
+
+def test_format_token_budget(tmp_path):
+    """
+    Ensures that chunks and summaries are added best first within the token budget, and that the best chunk is kept.
+    """
+    chunks = make_chunks()
+    summaries = {
+        "lectures": {"310/lecture1": {"hash": "", "summary": "On The Snow Man."}},
+        "courses": {"310": {"hash": "", "summary": "Modernist poetry."}},
+    }
+    stats = build_context_packs(str(tmp_path), chunks, summaries)
+    assert stats["lecture_summaries"] == 1 and stats["course_summaries"] == 1
+
+    packs = ContextPacks(str(tmp_path))
+    chunk_ids = ["310-1-0", "310-2-0", "310-1-2"]
+    texts = [chunks[chunk_id].page_content for chunk_id in chunk_ids]
+
+    context = packs.format(chunk_ids, texts, 1000, count_words)
+    lines = context.split("\n")
+    assert lines[0] == "Modern Poetry: Modernist poetry."
+    assert lines[1] == "Lecture 1 of Modern Poetry: On The Snow Man."
+    assert context.endswith(chunks["310-2-0"].page_content)
+
+    context = packs.format(chunk_ids, texts, count_words(texts[0]) + count_words(texts[1]), count_words)
+    assert context == f"{texts[0]}\n{texts[1]}"
+
+    assert packs.format(chunk_ids, texts, 1, count_words) == texts[0]
+
+
+def test_default_token_budget_fits_retrieved_chunks(tmp_path):
+    """
+    Ensures that the default token budget fits RETRIEVAL_K full-size chunks of different lectures along with the
+    summaries of their lectures and course.
+    """
+    text = " ".join(f"Stevens wrote poem {number} with a mind of winter." for number in range(200))
+    start, end, tokens = chunk_spans(text, estimate_tokens)[0]
+    assert tokens > CHUNK_TOKENS - 16
+
+    chunks = {
+        f"310-{lecture}-0": Document(page_content=text[start:end], metadata={"course": 310, "lecture": lecture})
+        for lecture in range(1, RETRIEVAL_K + 1)
+    }
+    summaries = {
+        "lectures": {
+            f"310/lecture{lecture}": {"hash": "", "summary": " ".join(["winter"] * LECTURE_SUMMARY_WORDS)}
+            for lecture in range(1, RETRIEVAL_K + 1)
+        },
+        "courses": {"310": {"hash": "", "summary": " ".join(["winter"] * COURSE_SUMMARY_WORDS)}},
+    }
+    build_context_packs(str(tmp_path), chunks, summaries)
+
+    chunk_ids = list(chunks)
+    texts = [chunk.page_content for chunk in chunks.values()]
+    context = ContextPacks(str(tmp_path)).format(chunk_ids, texts, DEFAULT_CONTEXT_TOKEN_BUDGET, estimate_tokens)
+    assert len(context.split("\n")) == 2 * RETRIEVAL_K + 1
+
+
+def test_summarize_courses(tmp_path):
+    """
+    Ensures that every lecture and course is summarized, and that only changed lectures and their courses are summarized
+    again.
+    """
+    processed_path = tmp_path / "processed"
+    (processed_path / "310").mkdir(parents=True)
+    (processed_path / "310" / "lecture1.txt").write_text(LECTURE)
+    (processed_path / "310" / "lecture2.txt").write_text("Ezra Pound wrote In a Station of the Metro.")
+    summaries_path = str(tmp_path / "summaries.json")
+
+    def summarize():
+        return summarize_courses(
+            processed_data_path=str(processed_path),
+            summaries_path=summaries_path,
+            llm=FakeChatModel(answer=" A summary. "),
+            section_tokens=20,
+            count_tokens=estimate_tokens,
+        )
+
+    stats = summarize()
+    assert (stats["lectures"], stats["reused_lectures"], stats["courses"]) == (2, 0, 1)
+    summaries = load_summaries(summaries_path)
+    assert summaries["lectures"]["310/lecture1"]["summary"] == "A summary."
+    assert summaries["courses"]["310"]["summary"] == "A summary."
+
+    (processed_path / "310" / "lecture2.txt").write_text("Ezra Pound and imagism.")
+    stats = summarize()
+    assert (stats["lectures"], stats["reused_lectures"], stats["courses"]) == (1, 1, 0)
+    assert stats["reused_courses"] == 1
+
+
+def test_summarize_courses_from_corpus(tmp_path):
+    """
+    Ensures that the lectures of a processed data directory holding only a corpus file are summarized from it.
+    """
+    processed_path = tmp_path / "processed"
+    processed_path.mkdir()
+    write_corpus(
+        str(processed_path / CORPUS_FILENAME),
+        [(310, 1, LECTURE), (310, 2, "Ezra Pound wrote In a Station of the Metro."), (291, 1, "Toni Morrison.")],
+        count_tokens=estimate_tokens,
+    )
+    summaries_path = str(tmp_path / "summaries.json")
+
+    stats = summarize_courses(
+        course_numbers=[310],
+        processed_data_path=str(processed_path),
+        summaries_path=summaries_path,
+        llm=FakeChatModel(answer="A summary."),
+        section_tokens=20,
+        count_tokens=estimate_tokens,
+    )
+    assert (stats["lectures"], stats["courses"]) == (2, 1)
+    summaries = load_summaries(summaries_path)
+    assert set(summaries["lectures"]) == {"310/lecture1", "310/lecture2"}
+    assert set(summaries["courses"]) == {"310"}
@@ -0,0 +1,71 @@
+import os
+
+import pyarrow as pa
+from chromadb.api.client import SharedSystemClient
+
+from verse.corpus import CORPUS_FILENAME, embed_corpus, load_corpus_embeddings, open_corpus, write_corpus
+from verse.data_processing import process_courses
+from verse.vector_database import create_document_chunks, generate_vector_db_from_processed_data
+
+from benchmarks.fakes import FakeEmbeddings
+
+
+def test_corpus_matches_text_files(tmp_path):
+    """
+    Ensures that the corpus file holds the same chunks as the .txt files, is read without copying its columns, and is
+    removed when .txt files are written again.
+    """
+    process_courses([310], processed_data_path=str(tmp_path / "text"), workers=2)
+    stats = process_courses([310], processed_data_path=str(tmp_path / "arrow"), workers=2, output_format="arrow")
+    assert os.listdir(tmp_path / "arrow") == [CORPUS_FILENAME]
+
+    text_chunks = create_document_chunks(str(tmp_path / "text"))
+    corpus_chunks = create_document_chunks(str(tmp_path / "arrow"))
+    assert stats["corpus"]["chunks"] == len(corpus_chunks) == len(text_chunks)
+    for text_chunk, corpus_chunk in zip(text_chunks, corpus_chunks):
+        assert text_chunk.page_content == corpus_chunk.page_content
+        assert corpus_chunk.metadata["source"] == os.path.relpath(text_chunk.metadata["source"], tmp_path / "text")
+        assert {**text_chunk.metadata, "source": None} == {**corpus_chunk.metadata, "source": None}
+
+    allocated_bytes = pa.total_allocated_bytes()
+    table = open_corpus(str(tmp_path / "arrow" / CORPUS_FILENAME))
+    assert table.num_rows == 25 and pa.total_allocated_bytes() == allocated_bytes
+
+    process_courses([310], processed_data_path=str(tmp_path / "arrow"), workers=2)
+    assert not os.path.exists(tmp_path / "arrow" / CORPUS_FILENAME)
+
+
+def test_corpus_embeddings_are_reused(tmp_path):
+    """
+    Ensures that embeddings stored in the corpus file are used by the index build when the embedding function has the
+    same signature, and ignored when the chunks are made with other settings.
+    """
+    SharedSystemClient.clear_system_cache()
+    corpus_path = str(tmp_path / "processed" / CORPUS_FILENAME)
+    os.makedirs(tmp_path / "processed")
+    corpus_stats = write_corpus(
+        corpus_path,
+        [(310, 1, "Wallace Stevens wrote The Snow Man. " * 20), (291, 1, "Toni Morrison wrote Beloved.")],
+        chunk_tokens=64,
+    )
+
+    embedding = FakeEmbeddings(size=16)
+    assert embed_corpus(corpus_path, embedding)["chunks"] == corpus_stats["chunks"] > 2
+    assert load_corpus_embeddings(corpus_path, chunk_tokens=32) is None
+
+    stats = generate_vector_db_from_processed_data(
+        str(tmp_path / "processed"), str(tmp_path / "chroma"), embedding, chunk_tokens=64
+    )
+    assert stats["added"] == stats["corpus_embeddings"] == corpus_stats["chunks"]
+    assert stats["embedding"]["chunks"] == 0
+
+
+def test_empty_corpus_is_not_embedded(tmp_path):
+    """
+    Ensures that a corpus file without chunks is embedded without error and left without embeddings.
+    """
+    corpus_path = str(tmp_path / CORPUS_FILENAME)
+    assert write_corpus(corpus_path, [])["chunks"] == 0
+
+    assert embed_corpus(corpus_path, FakeEmbeddings(size=16))["chunks"] == 0
+    assert "chunk_embeddings" not in open_corpus(corpus_path).schema.names
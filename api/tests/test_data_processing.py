@@ -0,0 +1,83 @@
+import os
+
+from verse.courses import COURSES
+from verse.data_processing import (
+    BASEDIR,
+    get_cleaned_transcript_text,
+    iter_transcript_members,
+    process_courses,
+)
+from verse.transcript_cleaner import TranscriptCleaner
+
+
+def test_iter_transcript_members():
+    """
+    Ensures that only the course's transcripts are read from the zip file.
+    """
+    zipfile_path = os.path.join(BASEDIR, "data/raw/engl310.zip")
+    members = list(iter_transcript_members(zipfile_path, COURSES[310]["transcripts_path"]))
+
+    filenames = [filename for filename, _ in members]
+    assert len(filenames) == len(set(filenames)) == 25
+    assert all(filename.startswith("transcript") for filename in filenames)
+
+
+def test_process_courses(tmp_path):
+    """
+    Ensures that the pipeline writes one cleaned file per lecture, skips missing courses, and gives the same output with
+    either parser.
+    """
+    stats = process_courses([220, 310], processed_data_path=str(tmp_path / "html"), workers=2)
+    lxml_stats = process_courses([310], processed_data_path=str(tmp_path / "lxml"), workers=2, parser="lxml")
+
+    assert stats["skipped_courses"] == [220]
+    assert stats["read"]["transcripts"] == stats["write"]["transcripts"] == lxml_stats["write"]["transcripts"]
+
+    lectures = sorted(os.listdir(tmp_path / "html" / "310"))
+    assert "lecture1.txt" in lectures
+    for lecture in lectures:
+        assert (tmp_path / "html" / "310" / lecture).read_text() == (tmp_path / "lxml" / "310" / lecture).read_text()
+
+
+def test_process_courses_writes_while_reading(tmp_path, monkeypatch):
+    """
+    Ensures that cleaned transcripts are written while later transcripts are still being read, with at most twice as
+    many transcripts as workers in flight.
+    """
+    import verse.data_processing as data_processing
+
+    processed_path = tmp_path / "processed"
+    written_before_read = []
+
+    def iter_members(zipfile_path, transcripts_path):
+        for member in iter_transcript_members(zipfile_path, transcripts_path):
+            written_before_read.append(len(os.listdir(processed_path / "310")))
+            yield member
+
+    monkeypatch.setattr(data_processing, "iter_transcript_members", iter_members)
+    stats = process_courses([310], processed_data_path=str(processed_path), workers=1)
+
+    assert stats["write"]["transcripts"] == 25
+    # with one worker, at most two transcripts are waiting to be written when the next one is read
+    assert all(written >= read - 2 for read, written in enumerate(written_before_read))
+
+
+def test_transcript_cleaner_matches_multi_pass_cleaner():
+    """
+    Ensures that the single-pass cleaner gives the original cleaner's output on the bundled transcripts.
+    """
+    from benchmarks.cleaner import get_cleaned_transcript_text_multi_pass, load_bundled_transcripts
+
+    for transcript in load_bundled_transcripts():
+        assert get_cleaned_transcript_text(transcript) == get_cleaned_transcript_text_multi_pass(transcript)
+
+
+def test_transcript_cleaner_from_courses():
+    """
+    Ensures that a course added to the registry has its title and professor removed.
+    """
+    cleaner = TranscriptCleaner.from_courses(
+        {101: {"title": "Shakespeare", "professor": "Professor Jane Doe", "transcripts_path": ""}}
+    )
+    text = "<< back\n12 May Lecture 3 Transcript Shakespeare Professor Jane Doe\nHamlet hesitates. back to top"
+    assert cleaner.clean(text) == "Hamlet hesitates."
@@ -0,0 +1,95 @@
+import os
+
+import openai
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_core.documents import Document
+
+from verse.embedding_stage import EmbeddingStage
+from verse.history import estimate_tokens
+from verse.vector_database import EMBEDDING_CHECKPOINT_DIRNAME, create_chromaDB
+
+from benchmarks.fakes import FakeOpenAIServer, OpenAIClientEmbeddings
+
+TEXTS = [f"Lecture {number} on the poetry of Wallace Stevens and the imagination." for number in range(20)]
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make_server(**kwargs):
+        servers.append(FakeOpenAIServer(**kwargs).start())
+        return servers[-1]
+
+    yield make_server
+    for server in servers:
+        server.stop()
+
+
+def test_make_batches():
+    """
+    Ensures that batches hold at most batch_size texts and max_batch_tokens tokens, and that a longer text is sent
+    alone.
+    """
+    stage = EmbeddingStage(batch_size=3, max_batch_tokens=10)
+    assert stage.make_batches(["text"] * 7, [1] * 7) == [(0, 3), (3, 6), (6, 7)]
+    assert stage.make_batches(["text"] * 4, [4, 4, 20, 4]) == [(0, 2), (2, 3), (3, 4)]
+    assert stage.make_batches([], []) == []
+
+
+def test_embed_throttled(make_server):
+    """
+    Ensures that requests rate limited by the server are retried after the delay it asks for, and that every text is
+    embedded once and in order.
+    """
+    server = make_server(requests_per_second=20)
+    stage = EmbeddingStage(batch_size=2, workers=4, initial_backoff=0.01, count_tokens=estimate_tokens)
+
+    embeddings = stage.embed(OpenAIClientEmbeddings(server.url), TEXTS)
+    assert embeddings == [server.embeddings._embed(text) for text in TEXTS]
+
+    assert server.stats["throttled"] > 0
+    assert stage.stats["rate_limited"] == server.stats["throttled"]
+    assert stage.stats["requests"] == server.stats["requests"] == 10 + stage.stats["retries"]
+    assert server.stats["embedded_texts"] == stage.stats["chunks"] == 20
+    assert stage.stats["tokens"] == sum(estimate_tokens(text) for text in TEXTS)
+    assert stage.stats["chunks_per_second"] > 0 and stage.stats["tokens_per_second"] > 0
+
+
+def test_embed_not_retryable(make_server):
+    """
+    Ensures that a request that cannot succeed is not retried.
+    """
+    server = make_server()
+    stage = EmbeddingStage(count_tokens=estimate_tokens)
+    with pytest.raises(openai.NotFoundError):
+        stage.embed(OpenAIClientEmbeddings(server.url.replace("/v1", "/missing")), TEXTS)
+    assert stage.stats["retries"] == 0
+
+
+def test_create_chromaDB_resumes_embedding(tmp_path, make_server):
+    """
+    Ensures that an index build that fails halfway through embedding is resumed from its checkpoints by the next build.
+    """
+    SharedSystemClient.clear_system_cache()
+    server = make_server(error_after=3)
+    embedding = OpenAIClientEmbeddings(server.url)
+    chunks = [
+        Document(page_content=text, metadata={"source": f"310/lecture{number}.txt", "course": 310})
+        for number, text in enumerate(TEXTS)
+    ]
+
+    def make_stage():
+        return EmbeddingStage(batch_size=4, workers=1, max_retries=1, initial_backoff=0.01, count_tokens=estimate_tokens)
+
+    with pytest.raises(openai.InternalServerError):
+        create_chromaDB(chunks, str(tmp_path / "chroma"), embedding, embedding_stage=make_stage())
+    assert len(os.listdir(tmp_path / EMBEDDING_CHECKPOINT_DIRNAME)) == 3
+
+    server.error_after = None
+    stats = create_chromaDB(chunks, str(tmp_path / "chroma"), embedding, embedding_stage=make_stage())
+    assert stats["added"] == 20
+    assert stats["embedding"]["resumed_chunks"] == 12
+    assert server.stats["embedded_texts"] == 20
+    assert not os.path.exists(tmp_path / EMBEDDING_CHECKPOINT_DIRNAME)
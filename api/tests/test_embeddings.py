@@ -0,0 +1,200 @@
+import asyncio
+
+import numpy as np
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.chunking import CHUNK_TOKENS
+from verse.embeddings import CachedEmbeddings, OnnxEmbeddings, get_embedding_function
+from verse.vector_database import create_chromaDB, load_manifest
+
+from benchmarks.fakes import FakeEmbeddings, write_onnx_embedding_model
+
+TEXTS = [
+    "Wallace Stevens and the snow man",
+    "Robert Frost and the road not taken",
+    "Ezra Pound in a station of the metro",
+    "Yeats and the second coming",
+    "a mind of winter",
+]
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embedded_texts: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded_texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_cached_embeddings_memory_and_disk(tmp_path):
+    """
+    Ensures that repeated texts are served from memory, and from disk in a new process.
+    """
+    cache_path = str(tmp_path / "embeddings.sqlite3")
+    embedding = CountingEmbedding(size=8)
+
+    cache = CachedEmbeddings(embedding, "fake", cache_path=cache_path)
+    vectors = cache.embed_documents(["Paradise Lost", "Beloved"])
+    assert cache.embed_query("Beloved") == vectors[1]
+    assert cache.stats["misses"] == 2 and cache.stats["memory_hits"] == 1
+
+    restarted_cache = CachedEmbeddings(embedding, "fake", cache_path=cache_path)
+    restarted_cache.embed_documents(["Paradise Lost", "Beloved"])
+    assert restarted_cache.stats["disk_hits"] == 2
+    assert embedding.embedded_texts == 2
+
+
+def test_cached_embeddings_keyed_by_model(tmp_path):
+    """
+    Ensures that vectors from one model are never served for another.
+    """
+    cache_path = str(tmp_path / "embeddings.sqlite3")
+    embedding = CountingEmbedding(size=8)
+
+    CachedEmbeddings(embedding, "small", cache_path=cache_path).embed_query("Milton")
+    CachedEmbeddings(embedding, "large", cache_path=cache_path).embed_query("Milton")
+    assert embedding.embedded_texts == 2
+
+
+def test_cached_embeddings_eviction(tmp_path):
+    """
+    Ensures that the disk store evicts the least recently used vectors once it is full.
+    """
+    cache = CachedEmbeddings(
+        CountingEmbedding(size=8),
+        "fake",
+        cache_path=str(tmp_path / "embeddings.sqlite3"),
+        max_disk_entries=10,
+    )
+    cache.embed_documents([f"lecture {number}" for number in range(15)])
+
+    (count,) = cache._get_connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert count == 9
+    assert cache.stats["evictions"] == 6
+
+
+def test_cached_embeddings_last_used_is_coarse(tmp_path):
+    """
+    Ensures that a disk hit only writes its last-used time back once the stored one is older than the resolution.
+    """
+    cache_path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddings(CountingEmbedding(size=8), "fake", cache_path=cache_path).embed_query("Beloved")
+
+    def read_last_used(cache):
+        return cache._get_connection().execute("SELECT last_used FROM embeddings").fetchone()[0]
+
+    cache = CachedEmbeddings(CountingEmbedding(size=8), "fake", cache_path=cache_path)
+    last_used = read_last_used(cache)
+    cache.embed_query("Beloved")
+    assert read_last_used(cache) == last_used and cache.stats["disk_hits"] == 1
+
+    cache = CachedEmbeddings(CountingEmbedding(size=8), "fake", cache_path=cache_path, last_used_resolution=0)
+    cache.embed_query("Beloved")
+    assert read_last_used(cache) > last_used and cache.stats["disk_hits"] == 1
+
+
+def test_cached_embeddings_async(tmp_path):
+    """
+    Ensures that the async methods share the cache with the sync ones, and read and write sqlite3 off the event loop.
+    """
+    import threading
+
+    embedding = CountingEmbedding(size=8)
+    cache = CachedEmbeddings(embedding, "fake", cache_path=str(tmp_path / "embeddings.sqlite3"))
+
+    vector = cache.embed_query("Beloved")
+    assert asyncio.run(cache.aembed_query("Beloved")) == vector
+
+    disk_threads = []
+    for method in ("_read_disk", "_write_disk"):
+        original = getattr(cache, method)
+
+        def record_thread(vectors, original=original):
+            disk_threads.append(threading.current_thread())
+            return original(vectors)
+
+        setattr(cache, method, record_thread)
+
+    assert asyncio.run(cache.aembed_documents(["Beloved", "Paradise Lost"]))[0] == vector
+    assert embedding.embedded_texts == 2
+    assert len(disk_threads) == 2 and threading.main_thread() not in disk_threads
+
+
+@pytest.fixture
+def onnx_model_path(tmp_path):
+    return write_onnx_embedding_model(str(tmp_path / "model"), " ".join(TEXTS).split(), size=16)
+
+
+def test_onnx_embeddings(onnx_model_path):
+    """
+    Ensures that the local ONNX backend embeds texts in batches into normalized vectors, in the order of the texts, that
+    the padding of a batch does not change a text's vector, and that the model is loaded once per process.
+    """
+    embedding = OnnxEmbeddings(onnx_model_path, batch_size=2)
+    vectors = embedding.embed_documents(TEXTS)
+
+    assert len(vectors) == len(TEXTS) and len(vectors[0]) == 16
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    for text, vector in zip(TEXTS, vectors):
+        assert np.allclose(embedding.embed_query(text), vector, atol=1e-6)
+
+    assert OnnxEmbeddings(onnx_model_path, batch_size=8).session is embedding.session
+
+
+def test_onnx_embeddings_read_whole_chunks(onnx_model_path):
+    """
+    Ensures that the local ONNX backend reads texts of more than CHUNK_TOKENS tokens, as a WordPiece tokenizer makes of
+    a chunk, without truncating them.
+    """
+    text = " ".join(["winter"] * (CHUNK_TOKENS + CHUNK_TOKENS // 2))
+    assert len(OnnxEmbeddings(onnx_model_path).tokenizer.encode(text).ids) == CHUNK_TOKENS + CHUNK_TOKENS // 2
+
+
+def test_embedding_backend_mismatch(tmp_path, onnx_model_path):
+    """
+    Ensures that an index built offline with the local ONNX backend records it, answers queries embedded with it, and
+    refuses queries embedded with another backend.
+    """
+    SharedSystemClient.clear_system_cache()
+    chunks = [
+        Document(page_content=text, metadata={"source": f"310/lecture{number}.txt", "course": 310})
+        for number, text in enumerate(TEXTS)
+    ]
+    create_chromaDB(
+        chunks,
+        str(tmp_path / "chroma"),
+        get_embedding_function(backend="onnx", local_model=onnx_model_path, cache_path=None),
+    )
+    manifest = load_manifest(str(tmp_path / "chroma"))
+    assert (manifest["embedding_backend"], manifest["embedding_model"]) == ("onnx", onnx_model_path)
+
+    def make_app(**config):
+        SharedSystemClient.clear_system_cache()
+        return create_app(
+            {
+                "TESTING": True,
+                "OPENAI_API_KEY": "testkey",
+                "CHROMA_PATH": str(tmp_path / "chroma"),
+                "RETRIEVAL_MODE": "dense",
+                "EMBEDDING_CACHE_PATH": None,
+                **config,
+            }
+        )
+
+    with make_app(EMBEDDING_BACKEND="onnx", EMBEDDING_LOCAL_MODEL=onnx_model_path).app_context():
+        assert rag.retrieve_context("Modern Poetry", "the snow man").startswith("Wallace Stevens")
+
+    app = make_app()
+    app.extensions["retriever_pool"].embedding_function = FakeEmbeddings(size=16)
+    with app.app_context():
+        with pytest.raises(ValueError) as error:
+            rag.retrieve_context("Modern Poetry", "the snow man")
+    assert error.value.args[0]["error"] == "EMBEDDING_MISMATCH"
+
+    with pytest.raises(ValueError):
+        make_app(EMBEDDING_BACKEND="word2vec")
@@ -0,0 +1,83 @@
+from verse import create_app
+from verse.history import HistoryCompactor, format_history
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_history_within_budget_is_unchanged():
+    """
+    Ensures that a history within the budget is kept verbatim, without a summary.
+    """
+    compactor = HistoryCompactor(token_budget=10, count_tokens=count_words)
+
+    def summarize(summary, turns):
+        raise AssertionError("nothing should be summarized")
+
+    compacted = compactor.compact("messages", "Milton", ("one two", "three four"), summarize)
+    assert compacted.summary == ""
+    assert compacted.recent == ("one two", "three four")
+    assert compacted.tokens == compacted.uncompacted_tokens == 4
+
+
+def test_history_rolling_summary():
+    """
+    Ensures that older turns are folded into a summary that later requests of the conversation extend incrementally.
+    """
+    compactor = HistoryCompactor(token_budget=8, count_tokens=count_words)
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append((summary, turns))
+        return f"summary of {len(turns)} more"
+
+    turns = tuple(f"turn {number} words" for number in range(4))
+    compacted = compactor.compact("previous_responses", "Milton", turns, summarize)
+
+    assert calls == [("", turns[:3])]
+    assert compacted.recent == turns[3:]
+    assert compacted.tokens == 3 + 4 and compacted.uncompacted_tokens == 12
+    assert format_history(compacted).startswith("(Summary of the earlier discussion: summary of 3 more)")
+
+    # the next turn fits next to the stored summary, so it is not summarized again
+    turns += ("turn 4 words",)
+    compacted = compactor.compact("previous_responses", "Milton", turns, summarize)
+    assert len(calls) == 1
+    assert compacted.recent == turns[3:]
+
+    # once the recent turns exceed the budget again, only they are folded into the summary so far
+    turns += ("turn 5 words",)
+    compacted = compactor.compact("previous_responses", "Milton", turns, summarize)
+    assert calls[1] == ("summary of 3 more", turns[3:5])
+    assert compacted.recent == turns[5:]
+
+
+def test_prompt_tokens_header(monkeypatch):
+    """
+    Ensures that responses report the prompt tokens of each section, before and after compaction.
+    """
+    import verse.retrieval_augmented_generation as rag
+    from langchain_community.chat_models.fake import FakeListChatModel
+
+    llm = FakeListChatModel(responses=["An earlier summary.", "An answer.", '"A segue?"'])
+    monkeypatch.setattr(rag, "get_global_llm", lambda: llm)
+    monkeypatch.setattr(rag, "retrieve_context", lambda *args: "context")
+
+    app = create_app({"TESTING": True, "OPENAI_API_KEY": "testkey", "HISTORY_TOKEN_BUDGET": 20})
+    app.extensions["history_compactor"]._count_tokens = count_words
+
+    response = app.test_client().post(
+        "/rag/professorResponse",
+        json={
+            "course": "Milton",
+            "query": "What is Satan's role?",
+            "previous_responses": [" ".join(["word"] * 15)] * 4,
+        },
+    )
+
+    assert response.get_json() == "An answer.\n\nA segue?"
+    assert response.headers["X-Prompt-Tokens"] == (
+        "previous_responses=18, previous_responses_uncompacted=60"
+    )
+    assert "summary" in response.headers["Server-Timing"]
@@ -0,0 +1,109 @@
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_core.documents import Document
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.lexical_index import (
+    LexicalIndex,
+    build_lexical_index,
+    extract_entities,
+    reciprocal_rank_fusion,
+)
+from verse.vector_database import create_chromaDB
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+TEXTS = [
+    "In Paradise Lost, Milton's Satan is the most compelling figure of the poem.",
+    "We return to Paradise Lost and the fall of Adam and Eve.",
+    "The invocation of Paradise Lost asks the muse for help.",
+    "Paradise Lost was dictated, since Milton was blind.",
+    "Wallace Stevens writes about the imagination and the snow man.",
+    "The imagination, for Wallace Stevens, orders the world.",
+    "Memory and the imagination in the modern novel.",
+]
+COURSES = [220, 220, 220, 220, 310, 310, 291]
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    chunk_ids = [f"chunk{number}" for number in range(len(TEXTS))]
+    build_lexical_index(str(tmp_path / "lexical"), chunk_ids, TEXTS, COURSES)
+    return LexicalIndex(str(tmp_path / "lexical"))
+
+
+def test_extract_entities():
+    """
+    Ensures that names of works and authors repeated across the corpus are extracted, without the word that starts a
+    sentence.
+    """
+    assert extract_entities(TEXTS) == ["paradise lost"]
+    # the first "Wallace Stevens" starts a sentence, so only the second counts
+    assert extract_entities(TEXTS, min_count=2) == ["paradise lost"]
+    assert extract_entities(TEXTS, min_count=1) == ["paradise lost", "wallace stevens"]
+
+
+def test_search(lexical_index):
+    """
+    Ensures that chunks are ranked by BM25, filtered by course, and that a query naming a work mentioned by enough
+    chunks is a strong match.
+    """
+    matches = lexical_index.search("the imagination of Wallace Stevens")
+    assert matches.chunk_ids[:2] == ["chunk5", "chunk4"] or matches.chunk_ids[:2] == ["chunk4", "chunk5"]
+    assert matches.chunk_ids[2] == "chunk6"
+    assert not matches.strong
+
+    assert lexical_index.search("imagination", course=291).chunk_ids == ["chunk6"]
+
+    matches = lexical_index.search("What is the fall in Paradise Lost?")
+    assert matches.strong
+    assert sorted(matches.chunk_ids) == ["chunk0", "chunk1", "chunk2", "chunk3"]
+    assert matches.chunk_ids[0] == "chunk1"
+
+    assert not lexical_index.search("What is Paradise Lost?", course=310).strong
+    assert lexical_index.search("Shakespeare") == ([], [], False)
+
+
+def test_reciprocal_rank_fusion():
+    """
+    Ensures that items ranked well by both rankings come first.
+    """
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]) == ["b", "a", "d", "c"]
+
+
+@pytest.mark.parametrize(["retrieval_mode", "embedded"], [["hybrid", False], ["dense", True]])
+def test_retrieve_context_strong_match(tmp_path, monkeypatch, retrieval_mode, embedded):
+    """
+    Ensures that hybrid retrieval answers a query naming a work from the lexical index, without embedding it.
+    """
+    SharedSystemClient.clear_system_cache()
+    chunks = [
+        Document(page_content=text, metadata={"source": f"{course}/lecture{number}.txt", "course": course})
+        for number, (text, course) in enumerate(zip(TEXTS, COURSES))
+    ]
+    create_chromaDB(chunks, str(tmp_path / "chroma"), FakeEmbeddings(size=32))
+
+    class CountingEmbeddings(FakeEmbeddings):
+        queries: int = 0
+
+        def embed_query(self, text):
+            self.queries += 1
+            return super().embed_query(text)
+
+    embedding = CountingEmbeddings(size=32)
+    app = create_app(
+        {
+            "TESTING": True,
+            "OPENAI_API_KEY": "testkey",
+            "CHROMA_PATH": str(tmp_path / "chroma"),
+            "RETRIEVAL_MODE": retrieval_mode,
+        }
+    )
+    app.extensions["retriever_pool"].embedding_function = embedding
+    monkeypatch.setattr(rag, "get_token_counter", lambda: lambda text: len(text.split()))
+
+    with app.app_context():
+        context = rag.retrieve_context("Milton", "What is the fall in Paradise Lost?")
+        assert (embedding.queries == 1) == embedded
+        assert "Paradise Lost" in context
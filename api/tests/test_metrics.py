@@ -0,0 +1,116 @@
+import logging
+import threading
+
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_core.documents import Document
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.metrics import LLM_RETRIES
+from verse.tracing import deferred_span_export, start_deferred_span_exports
+from verse.vector_database import create_chromaDB
+
+from benchmarks.fakes import FakeChatModel, FakeCollector, FakeEmbeddings
+
+STAGES = ("retrieval", "open_vectorstore", "embed_query", "vector_search", "answer", "truncation", "segue")
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """
+    Creates applications that answer from a small local index with the fake LLM and embeddings.
+    """
+    SharedSystemClient.clear_system_cache()
+    embedding = FakeEmbeddings(size=32)
+    chunks = [
+        Document(page_content="Toni Morrison and Beloved", metadata={"source": "291/lecture1.txt", "course": 291}),
+        Document(page_content="Wallace Stevens", metadata={"source": "310/lecture1.txt", "course": 310}),
+    ]
+    create_chromaDB(chunks, str(tmp_path / "chroma"), embedding)
+
+    monkeypatch.setattr(rag, "get_global_llm", lambda: FakeChatModel())
+    monkeypatch.setattr(rag, "get_token_counter", lambda: lambda text: len(text.split()))
+
+    def make_app(**config):
+        app = create_app(
+            {"TESTING": True, "OPENAI_API_KEY": "testkey", "CHROMA_PATH": str(tmp_path / "chroma"), **config}
+        )
+        app.extensions["retriever_pool"].embedding_function = embedding
+        return app
+
+    return make_app
+
+
+def test_metrics(make_app, inputs_response):
+    """
+    Ensures that /metrics reports the latency of each request and stage, the tokens of prompts and completions, and the
+    cache and retry counters in the Prometheus text format.
+    """
+    client = make_app().test_client()
+    assert client.post("/rag/professorResponse", json=inputs_response).status_code == 200
+
+    retries = LLM_RETRIES.get()
+    logging.getLogger("openai._base_client").info("Retrying request to %s in %f seconds", "/chat/completions", 0.5)
+    assert LLM_RETRIES.get() == retries + 1
+
+    response = client.get("/metrics")
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    metrics = response.get_data(as_text=True)
+
+    assert (
+        'verse_request_duration_seconds_count{method="POST",route="/rag/professorResponse",status="200"} 1.0'
+        in metrics
+    )
+    for stage in STAGES:
+        assert f'verse_stage_duration_seconds_count{{stage="{stage}"}} 1.0' in metrics
+    assert 'verse_prompt_tokens_total{section="context"}' in metrics
+    assert 'verse_completion_tokens_total{chain="answer"}' in metrics
+    assert 'verse_completion_tokens_total{chain="segue"}' in metrics
+    assert 'verse_cache_lookups_total{cache="recommendation",result="miss"} 0.0' in metrics
+    # the global collection is opened to list the collections, then the course collection is searched
+    assert "verse_retriever_loads_total 2.0" in metrics
+    assert f"verse_openai_retries_total {retries + 1}" in metrics
+
+
+def test_tracing(make_app, inputs_response):
+    """
+    Ensures that each request is exported to an OpenTelemetry collector as a trace with a span per stage.
+    """
+    collector = FakeCollector().start()
+    try:
+        app = make_app(OTEL_ENABLED=True, OTEL_EXPORTER_OTLP_ENDPOINT=collector.endpoint)
+        assert app.test_client().post("/rag/professorResponse", json=inputs_response).status_code == 200
+        app.extensions["tracer_provider"].force_flush()
+    finally:
+        collector.stop()
+
+    spans = {span.name: span for span in collector.spans}
+    assert set(STAGES) | {"POST /rag/professorResponse"} <= set(spans)
+
+    request_span = spans["POST /rag/professorResponse"]
+    assert spans["retrieval"].parent_span_id == request_span.span_id
+    assert spans["embed_query"].parent_span_id == spans["retrieval"].span_id
+    assert {span.trace_id for span in collector.spans} == {request_span.trace_id}
+
+
+def test_tracing_export_is_deferred(make_app, inputs_response):
+    """
+    Ensures that an application created under deferred_span_export starts no export thread, and exports its spans once
+    start_deferred_span_exports is called, as a pre-forked worker does.
+    """
+    threads = set(threading.enumerate())
+    collector = FakeCollector().start()
+    try:
+        with deferred_span_export():
+            app = make_app(OTEL_ENABLED=True, OTEL_EXPORTER_OTLP_ENDPOINT=collector.endpoint)
+        assert not [thread for thread in set(threading.enumerate()) - threads if thread.name == "OtelBatchSpanProcessor"]
+
+        assert start_deferred_span_exports() == 1
+        assert app.test_client().post("/rag/professorResponse", json=inputs_response).status_code == 200
+        app.extensions["tracer_provider"].force_flush()
+    finally:
+        collector.stop()
+        app.extensions["tracer_provider"].shutdown()
+
+    assert "POST /rag/professorResponse" in {span.name for span in collector.spans}
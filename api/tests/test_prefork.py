@@ -0,0 +1,69 @@
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from verse.prefork import get_process_memory
+
+API_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_worker_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as file:
+        return sorted(int(child) for child in file.read().split())
+
+
+def wait_for_workers(pid, workers, excluded=(), timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        worker_pids = get_worker_pids(pid)
+        if len(worker_pids) == workers and not set(worker_pids) & set(excluded):
+            return worker_pids
+        time.sleep(0.05)
+    raise TimeoutError(f"{workers} workers did not start within {timeout} seconds")
+
+
+def test_get_process_memory():
+    """
+    Ensures that the memory of a process is read from /proc.
+    """
+    memory = get_process_memory(os.getpid())
+    assert memory["rss_mb"] > 0
+    assert memory["pss_mb"] <= memory["rss_mb"]
+    assert memory["private_mb"] + memory["shared_mb"] <= memory["rss_mb"] + 1
+
+
+def test_prefork_server():
+    """
+    Ensures that the workers of the pre-forked server answer requests on one socket, that an exited worker is replaced,
+    and that the server stops its workers on SIGTERM.
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "verse.prefork", "--workers", "2", "--port", "0"],
+        cwd=API_PATH,
+        env={**os.environ, "RETRIEVER_WARM_UP": "false", "OPENAI_API_KEY": "testkey"},
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        for line in server.stderr:
+            match = re.search(r"Serving on 127\.0\.0\.1:(\d+) with 2/2 wsgi workers \(preload on\)", line)
+            if match:
+                break
+        else:
+            raise AssertionError("The server did not start")
+
+        worker_pids = wait_for_workers(server.pid, 2)
+        with httpx.Client(base_url=f"http://127.0.0.1:{match.group(1)}") as client:
+            assert all(client.get("/pulse").status_code == 200 for _ in range(10))
+
+            os.kill(worker_pids[0], signal.SIGKILL)
+            assert worker_pids[1] in wait_for_workers(server.pid, 2, excluded=worker_pids[:1])
+            assert client.get("/pulse").status_code == 200
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 
@@ -29,3 +31,167 @@ def test_get_professor_recommendation_missing_field(client, field, inputs_recomm
     del inputs_recommendation[field]
     with pytest.raises(ValueError):
         client.post("/rag/professorRecommendation", json=inputs_recommendation)
+
+
+def parse_server_sent_events(body):
+    events = []
+    for event in body.strip().split("\n\n"):
+        name_line, data_line = event.split("\n")
+        events.append((name_line[len("event: ") :], json.loads(data_line[len("data: ") :])))
+    return events
+
+
+@pytest.fixture
+def fake_professor(monkeypatch):
+    """
+    Replaces the LLM and the retriever with local stand-ins.
+    """
+    import verse.retrieval_augmented_generation as rag
+    from langchain_community.chat_models.fake import FakeListChatModel
+
+    llm = FakeListChatModel(
+        responses=[
+            "Morrison writes about memory. Beloved is haunted by it. And the",
+            '"What do you make of Sethe?"',
+        ]
+    )
+    monkeypatch.setattr(rag, "get_global_llm", lambda: llm)
+    monkeypatch.setattr(rag, "retrieve_context", lambda *args: "context")
+    return llm
+
+
+def test_professor_response_stream_matches_json(client, fake_professor, inputs_response):
+    """
+    Ensures that the streamed response is identical to the JSON response.
+    """
+    json_response = client.post("/rag/professorResponse", json=inputs_response).get_json()
+
+    fake_professor.i = 0
+    stream_response = client.post(
+        "/rag/professorResponse", json={**inputs_response, "stream": True}
+    )
+    assert stream_response.mimetype == "text/event-stream"
+
+    events = parse_server_sent_events(stream_response.get_data(as_text=True))
+    answer = "".join(data["token"] for event, data in events if event == "answer")
+    segue = "".join(data["token"] for event, data in events if event == "segue")
+
+    assert events[-1] == ("done", {"response": json_response})
+    assert answer + "\n\n" + segue == json_response
+    assert segue == "What do you make of Sethe?"
+
+
+def test_professor_response_speculative_segue(app, client, fake_professor, inputs_response):
+    """
+    Ensures that the speculative segue mode returns the same response as the sequential mode.
+    """
+    sequential_response = client.post("/rag/professorResponse", json=inputs_response).get_json()
+
+    fake_professor.i = 0
+    app.config.update(SEGUE_MODE="speculative", SEGUE_SPECULATION_CHARS=10)
+    speculative_response = client.post("/rag/professorResponse", json=inputs_response)
+
+    assert speculative_response.get_json() == sequential_response
+    assert "segue_wait" in speculative_response.headers["Server-Timing"]
+
+
+def test_speculative_segue_is_stopped(app, client, monkeypatch, inputs_response):
+    """
+    Ensures that a speculative segue stops streaming once it is cancelled, is counted as discarded when the answer ends
+    with a question, and is stopped when the client disconnects.
+    """
+    import threading
+
+    import verse.retrieval_augmented_generation as rag
+    from langchain_community.chat_models.fake import FakeListChatModel
+    from verse.metrics import DISCARDED_SEGUES
+
+    llm = FakeListChatModel(responses=["Morrison writes about memory. What haunts Sethe?", '"A segue."'])
+    monkeypatch.setattr(rag, "get_global_llm", lambda: llm)
+    monkeypatch.setattr(rag, "retrieve_context", lambda *args: "context")
+
+    cancelled = threading.Event()
+    cancelled.set()
+    with app.app_context():
+        assert rag.generate_segue(llm, "Milton", "query", "statement", cancelled)[0] is None
+
+    llm.i = 0
+    discarded = DISCARDED_SEGUES.get()
+    app.config.update(SEGUE_MODE="speculative", SEGUE_SPECULATION_CHARS=10)
+    response = client.post("/rag/professorResponse", json=inputs_response)
+
+    assert response.get_json() == "Morrison writes about memory. What haunts Sethe?"
+    assert DISCARDED_SEGUES.get() == discarded + 1
+
+    segues = []
+    submitted = threading.Event()
+    monkeypatch.setattr(
+        rag, "generate_segue", lambda *args: segues.append(args[-1]) or submitted.set() or ("A segue.", 0.0)
+    )
+    llm.responses, llm.i = ["Morrison writes about memory. Sethe is haunted. Beloved returns."], 0
+    with app.test_request_context():
+        stream = rag.stream_professor_response("Milton", "query", ())
+        assert next(stream) == ("answer", "Morrison writes about memory.")
+        assert next(stream) == ("answer", " Sethe is haunted.")
+        stream.close()
+    assert submitted.wait(5) and segues[0].is_set()
+
+
+def test_professor_recommendation_memoized(client, monkeypatch, inputs_recommendation):
+    """
+    Ensures that a recommendation is computed once per message history, including when it is computed in the background.
+    """
+    import verse.retrieval_augmented_generation as rag
+
+    calls = []
+    monkeypatch.setattr(
+        rag,
+        "get_professor_recommendation",
+        lambda course, messages: calls.append(messages) or f"Read {len(messages)} texts.",
+    )
+
+    background = client.post(
+        "/rag/professorRecommendation", json={**inputs_recommendation, "background": True}
+    )
+    assert background.status_code == 202
+
+    first = client.post("/rag/professorRecommendation", json=inputs_recommendation)
+    second = client.post("/rag/professorRecommendation", json=inputs_recommendation)
+    assert first.get_json() == second.get_json() == "Read 2 texts."
+    assert len(calls) == 1
+
+    inputs_recommendation["messages"] += ("Sample query 2",)
+    assert client.post("/rag/professorRecommendation", json=inputs_recommendation).get_json() == "Read 3 texts."
+    assert len(calls) == 2
+
+
+def test_llm_client_is_shared(monkeypatch, inputs_response):
+    """
+    Ensures that requests share one LLM, its chains, and its keep-alive connections to the API.
+    """
+    import verse.retrieval_augmented_generation as rag
+    from verse import create_app
+
+    from benchmarks.fakes import DEFAULT_ANSWER, DEFAULT_SEGUE, FakeOpenAIServer
+
+    server = FakeOpenAIServer().start()
+    try:
+        app = create_app({"TESTING": True, "OPENAI_API_KEY": "testkey", "OPENAI_API_BASE": server.url})
+        monkeypatch.setattr(rag, "retrieve_context", lambda *args: "context")
+        client = app.test_client()
+
+        json_response = client.post("/rag/professorResponse", json=inputs_response).get_json()
+        assert json_response == DEFAULT_ANSWER + "\n\n" + DEFAULT_SEGUE.strip('"')
+
+        stream_response = client.post("/rag/professorResponse", json={**inputs_response, "stream": True})
+        events = parse_server_sent_events(stream_response.get_data(as_text=True))
+        assert events[-1] == ("done", {"response": json_response})
+
+        with app.app_context():
+            llm = rag.get_global_llm()
+            assert rag.get_chains(llm) is rag.get_chains(rag.get_global_llm())
+        assert app.extensions["llm"] is llm
+        assert server.stats["completions"] == 4
+        assert server.stats["connections"] == 1
+    finally:
+        server.stop()
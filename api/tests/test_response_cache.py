@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from verse import create_app
+from verse.response_cache import ResponseCache
+
+# queries about Morrison point the same way; the Milton query is orthogonal to them
+QUERY_VECTORS = {
+    "Tell me about Toni Morrison.": [1.0, 0.0, 0.0],
+    "What should I know about Toni Morrison?": [0.99, 0.1, 0.0],
+    "Tell me about Milton.": [0.0, 0.0, 1.0],
+}
+
+
+class QueryEmbedding(Embeddings):
+    def embed_documents(self, texts):
+        return [QUERY_VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return QUERY_VECTORS[text]
+
+
+def test_response_cache_semantic_lookup():
+    """
+    Ensures that similar queries hit the cache, while different queries, courses, or conversations miss it.
+    """
+    cache = ResponseCache(QueryEmbedding(), similarity_threshold=0.9)
+    cache.store("Modern Poetry", "Tell me about Toni Morrison.", ("Hello!",), "Beloved.", 2.0)
+
+    assert cache.lookup("professorResponse", "Modern Poetry", "tell me about toni morrison", ("Hello!",)) == "Beloved."
+    assert cache.lookup("professorResponse", "Modern Poetry", "What should I know about Toni Morrison?", ("Hello!",)) == "Beloved."
+    assert cache.lookup("professorResponse", "Modern Poetry", "Tell me about Milton.", ("Hello!",)) is None
+    assert cache.lookup("professorResponse", "Milton", "Tell me about Toni Morrison.", ("Hello!",)) is None
+    assert cache.lookup("professorResponse", "Modern Poetry", "Tell me about Toni Morrison.", ()) is None
+
+    stats = cache.get_stats()["professorResponse"]
+    assert (stats["hits"], stats["semantic_hits"], stats["misses"]) == (2, 1, 3)
+    assert stats["hit_rate"] == pytest.approx(0.4)
+    assert stats["latency_saved_seconds"] == pytest.approx(4.0)
+
+
+def test_professor_response_cache_hit(monkeypatch, inputs_response):
+    """
+    Ensures that a repeated question is answered from the cache without calling the chains.
+    """
+    import verse.retrieval_augmented_generation as rag
+
+    app = create_app(
+        {"TESTING": True, "OPENAI_API_KEY": "testkey", "RESPONSE_CACHE_ENABLED": True}
+    )
+    app.extensions["response_cache"].embedding_function = QueryEmbedding()
+    client = app.test_client()
+
+    calls = []
+    monkeypatch.setattr(
+        rag, "get_professor_response", lambda *args: calls.append(args) or "Beloved."
+    )
+
+    first = client.post("/rag/professorResponse", json=inputs_response)
+    second = client.post("/rag/professorResponse", json=inputs_response)
+
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.get_json() == "Beloved." and len(calls) == 1
+    assert client.get("/rag/cacheStats").get_json()["professorResponse"]["hits"] == 1
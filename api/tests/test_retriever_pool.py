@@ -0,0 +1,61 @@
+import shutil
+
+from chromadb.api.client import SharedSystemClient
+from langchain.vectorstores.chroma import Chroma
+from langchain_core.documents import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from verse.retriever_pool import RetrieverPool
+
+
+def build_index(chroma_path, texts, embedding):
+    # vector_database.py rebuilds the index from a separate process, which never shares the server's chromadb client cache
+    SharedSystemClient.clear_system_cache()
+    if chroma_path.exists():
+        shutil.rmtree(chroma_path)
+    Chroma.from_documents(
+        [Document(page_content=text) for text in texts],
+        embedding,
+        collection_name="transcripts",
+        persist_directory=str(chroma_path),
+    ).persist()
+
+
+def test_retriever_pool_reuses_vectorstore(tmp_path):
+    """
+    Ensures that the pool opens the persisted index once and shares it across lookups.
+    """
+    embedding = DeterministicFakeEmbedding(size=8)
+    chroma_path = tmp_path / "chroma"
+    build_index(chroma_path, ["Paradise Lost"], embedding)
+
+    pool = RetrieverPool(str(chroma_path), embedding, reload_interval=0)
+    assert pool.warm_up()
+    assert pool.get_vectorstore() is pool.get_vectorstore()
+    assert pool.stats["loads"] == 1
+
+
+def test_retriever_pool_reloads_rebuilt_index(tmp_path):
+    """
+    Ensures that the pool reopens its vector stores after the chroma/ directory is rebuilt.
+    """
+    embedding = DeterministicFakeEmbedding(size=8)
+    chroma_path = tmp_path / "chroma"
+    build_index(chroma_path, ["Paradise Lost"], embedding)
+
+    pool = RetrieverPool(str(chroma_path), embedding, reload_interval=0)
+    first = pool.get_vectorstore()
+    build_index(chroma_path, ["Beloved", "Song of Solomon"], embedding)
+
+    second = pool.get_vectorstore()
+    assert second is not first
+    assert pool.stats["reloads"] == 1
+    assert second._collection.count() == 2
+
+
+def test_retriever_pool_without_index(tmp_path):
+    """
+    Ensures that warm-up is skipped when no index has been generated.
+    """
+    pool = RetrieverPool(str(tmp_path / "chroma"), DeterministicFakeEmbedding(size=8))
+    assert not pool.warm_up()
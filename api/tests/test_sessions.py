@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+from verse.sessions import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make_store(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite3"), **kwargs)
+
+    return make_store
+
+
+def test_session_store(make_store):
+    """
+    Ensures that each backend keeps the messages and responses of a session, up to max_messages.
+    """
+    store = make_store(max_messages=4)
+    session = store.create("Milton")
+
+    store.append(session.session_id, messages=("Welcome to Milton.",))
+    store.append(session.session_id, messages=("Who is Satan?", "An answer."), responses=("An answer.",))
+    session = store.get(session.session_id)
+    assert session.course == "Milton"
+    assert session.messages == ("Welcome to Milton.", "Who is Satan?", "An answer.")
+    assert session.previous_responses == ("An answer.",)
+
+    session = store.append(session.session_id, messages=("And Eve?", "Another answer."), responses=("Another answer.",))
+    assert session.messages == ("Who is Satan?", "An answer.", "And Eve?", "Another answer.")
+    assert session.previous_responses == ("An answer.", "Another answer.")
+
+    assert store.delete(session.session_id)
+    assert store.get(session.session_id) is None
+    assert store.append(session.session_id, messages=("Hello?",)) is None
+
+
+def test_session_store_tags_responses_by_position(make_store):
+    """
+    Ensures that a message with the same text as an earlier response is not taken for a response.
+    """
+    store = make_store(max_messages=2)
+    session = store.create("Milton")
+
+    session = store.append(
+        session.session_id,
+        messages=("Yes.", "Is Satan the hero?", "Yes."),
+        responses=("Is Satan the hero?", "Yes."),
+    )
+    assert session.messages == ("Is Satan the hero?", "Yes.")
+    assert session.previous_responses == ("Is Satan the hero?", "Yes.")
+
+
+def test_sqlite_session_store_migrates_tagged_messages(tmp_path):
+    """
+    Ensures that sessions written with the earlier layout, which tagged the messages that were responses, are kept.
+    """
+    import sqlite3
+
+    path = str(tmp_path / "sessions.sqlite3")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, course TEXT, last_used REAL NOT NULL)")
+        connection.execute(
+            "CREATE TABLE messages (session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, "
+            "position INTEGER NOT NULL, text TEXT NOT NULL, is_response INTEGER NOT NULL, PRIMARY KEY (session_id, position))"
+        )
+        connection.execute("INSERT INTO sessions VALUES ('old', 'Milton', ?)", (time.time(),))
+        connection.executemany(
+            "INSERT INTO messages VALUES ('old', ?, ?, ?)",
+            [(0, "Who is Satan?", 0), (1, "An answer.", 1), (2, "And Eve?", 0), (3, "Another answer.", 1)],
+        )
+    connection.close()
+
+    store = SQLiteSessionStore(path=path, max_messages=2)
+    assert store.get("old").previous_responses == ("An answer.", "Another answer.")
+
+    session = store.append("old", messages=("And Adam?", "A third answer."), responses=("A third answer.",))
+    assert session.messages == ("And Adam?", "A third answer.")
+    assert session.previous_responses == ("Another answer.", "A third answer.")
+
+
+def test_session_store_expiration(make_store):
+    """
+    Ensures that sessions expire ttl seconds after they were last written.
+    """
+    store = make_store(ttl=0.05)
+    session = store.create("Milton")
+    time.sleep(0.1)
+
+    assert store.get(session.session_id) is None
+    store.create("Milton")
+    assert store.get_stats()["expirations"] == 1
+
+
+def test_memory_session_store_eviction():
+    """
+    Ensures that the memory backend evicts the least recently written sessions beyond its memory cap.
+    """
+    store = MemorySessionStore(max_bytes=2000)
+    sessions = [store.create("Milton") for _ in range(3)]
+    for session in sessions:
+        store.append(session.session_id, messages=("x" * 500,))
+
+    assert store.get(sessions[0].session_id) is None
+    assert store.get(sessions[2].session_id) is not None
+    stats = store.get_stats()
+    assert stats["evictions"] >= 1 and stats["bytes"] <= 2000
+
+
+def test_sqlite_session_store_eviction(tmp_path):
+    """
+    Ensures that the sqlite backend evicts the least recently used sessions beyond max_sessions.
+    """
+    store = SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite3"), max_sessions=10)
+    sessions = [store.create("Milton") for _ in range(12)]
+
+    assert store.get(sessions[0].session_id) is None
+    assert store.get(sessions[-1].session_id) is not None
+    assert store.get_stats()["evictions"] == 2
+
+
+def test_routes_with_session(client, monkeypatch):
+    """
+    Ensures that the RAG routes read the history from a session and add each query and response to it.
+    """
+    import verse.retrieval_augmented_generation as rag
+
+    calls = []
+
+    def get_professor_response(course, query, previous_responses, global_search=False):
+        calls.append((course, previous_responses))
+        return f"Answer {len(calls)}."
+
+    monkeypatch.setattr(rag, "get_professor_response", get_professor_response)
+    monkeypatch.setattr(rag, "get_professor_recommendation", lambda course, messages: f"Read {len(messages)} texts.")
+
+    session_id = client.post("/sessions", json={"course": "Milton"}).get_json()["session_id"]
+    client.post(f"/sessions/{session_id}/messages", json={"messages": ["Let's focus on Milton."]})
+
+    for query in ("Who is Satan?", "And Eve?"):
+        response = client.post("/rag/professorResponse", json={"query": query, "session_id": session_id})
+        assert response.status_code == 200
+
+    assert calls == [("Milton", ()), ("Milton", ("Answer 1.",))]
+    assert client.get(f"/sessions/{session_id}").get_json()["messages"] == [
+        "Let's focus on Milton.",
+        "Who is Satan?",
+        "Answer 1.",
+        "And Eve?",
+        "Answer 2.",
+    ]
+
+    recommendation = client.post("/rag/professorRecommendation", json={"session_id": session_id})
+    assert recommendation.get_json() == "Read 5 texts."
+
+    with pytest.raises(ValueError):
+        client.post("/rag/professorResponse", json={"query": "Hello?", "session_id": "unknown"})
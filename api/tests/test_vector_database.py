@@ -0,0 +1,189 @@
+import os
+
+import chromadb
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+from verse.chunking import chunk_text, split_sentences
+from verse.context_packs import find_overlap
+from verse.courses import get_course_number
+from verse.vector_database import (
+    create_chromaDB,
+    create_document_chunks,
+    generate_vector_db_from_processed_data,
+    get_lecture_metadata,
+    remove_old_builds,
+)
+
+from benchmarks.fakes import FakeEmbeddings
+
+
+@pytest.mark.parametrize(
+    ["course", "course_number"],
+    [
+        ["Milton", 220],
+        ["The American Novel Since 1945", 291],
+        ["Introduction to the Theory of Literature", 300],
+        ["modern poetry", 310],
+        ["Shakespeare", None],
+    ],
+)
+def test_get_course_number(course, course_number):
+    """
+    Ensures that the course titles sent by the clients map to their course numbers.
+    """
+    assert get_course_number(course) == course_number
+
+
+def test_get_lecture_metadata():
+    """
+    Ensures that the course and lecture numbers are read from the processed data layout.
+    """
+    source_path = os.path.join("verse", "data", "processed", "310", "lecture12.txt")
+    assert get_lecture_metadata(source_path) == {
+        "course": 310,
+        "lecture": 12,
+        "course_title": "Modern Poetry",
+    }
+    assert get_lecture_metadata("notes.txt") == {}
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_chunk_text():
+    """
+    Ensures that chunks are cut between sentences within their token budget, that consecutive chunks repeat whole
+    sentences within the overlap, and that a sentence longer than a chunk is cut between words.
+    """
+    text = "Milton wrote Lycidas. It mourns Edward King!\nThe poem is a pastoral elegy.It asks what poetry is for? " * 3
+    sentences = [text[start:end] for start, end in split_sentences(text)]
+    assert sentences[:4] == [
+        "Milton wrote Lycidas.",
+        "It mourns Edward King!",
+        "The poem is a pastoral elegy.",
+        "It asks what poetry is for?",
+    ]
+    assert len(sentences) == 12
+
+    chunks = chunk_text(text, count_words, chunk_tokens=13, overlap_tokens=6)
+    assert all(count_words(chunk) <= tokens <= 13 for chunk, tokens in chunks)
+    assert all(chunk.endswith((".", "!", "?")) for chunk, _ in chunks)
+    assert chunks[0][0] == "Milton wrote Lycidas. It mourns Edward King!\nThe poem is a pastoral elegy."
+    for (previous, _), (chunk, _) in zip(chunks, chunks[1:]):
+        assert find_overlap(previous, chunk) > 0
+        assert previous[: len(previous) - find_overlap(previous, chunk)] not in chunk
+
+    chunks = chunk_text("one two three four five six seven.", count_words, chunk_tokens=3, overlap_tokens=0)
+    assert [chunk for chunk, _ in chunks] == ["one two three", "four five six", "seven."]
+
+
+def test_create_document_chunks(tmp_path):
+    """
+    Ensures that the processed transcripts are chunked in course and lecture order, with their course and lecture.
+    """
+    for course, lecture, text in [(310, 2, "Ezra Pound."), (310, 1, "The Snow Man."), (291, 1, "Beloved.")]:
+        (tmp_path / str(course)).mkdir(exist_ok=True)
+        (tmp_path / str(course) / f"lecture{lecture}.txt").write_text(text, encoding="utf-8")
+
+    chunks = create_document_chunks(str(tmp_path), workers=2)
+    assert [chunk.page_content for chunk in chunks] == ["Beloved.", "The Snow Man.", "Ezra Pound."]
+    assert chunks[1].metadata == {
+        "source": str(tmp_path / "310" / "lecture1.txt"),
+        "course": 310,
+        "lecture": 1,
+        "course_title": "Modern Poetry",
+    }
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embedded_texts: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded_texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def make_chunk(course, lecture, text):
+    return Document(
+        page_content=text,
+        metadata={"source": f"{course}/lecture{lecture}.txt", "course": course, "lecture": lecture},
+    )
+
+
+def test_create_chromaDB_incremental(tmp_path):
+    """
+    Ensures that a rebuild only embeds new or changed chunks, deletes stale ones, and swaps the live index.
+    """
+    SharedSystemClient.clear_system_cache()
+    chroma_path = str(tmp_path / "chroma")
+    embedding = CountingEmbedding(size=8)
+
+    chunks = [make_chunk(310, 1, "Wallace Stevens"), make_chunk(291, 2, "Toni Morrison")]
+    stats = create_chromaDB(chunks, chroma_path, embedding)
+    assert (stats["added"], stats["removed"], stats["reused"]) == (2, 0, 0)
+    first_build = os.path.realpath(chroma_path)
+
+    chunks = [make_chunk(310, 1, "Wallace Stevens"), make_chunk(291, 2, "Beloved")]
+    stats = create_chromaDB(chunks, chroma_path, embedding)
+    assert (stats["added"], stats["removed"], stats["reused"]) == (1, 1, 1)
+    assert embedding.embedded_texts == 3
+    assert os.path.islink(chroma_path) and os.path.realpath(chroma_path) != first_build
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    assert client.get_collection("transcripts").count() == 2
+    assert client.get_collection("transcripts_291").get()["documents"] == ["Beloved"]
+
+
+def test_remove_old_builds(tmp_path):
+    """
+    Ensures that only the newest builds and the live build are kept, and that other entries are left alone.
+    """
+    for name in ["1", "2-legacy", "3", "4", ".DS_Store", "5.partial"]:
+        (tmp_path / name).mkdir()
+
+    remove_old_builds(str(tmp_path), str(tmp_path / "1"))
+    assert sorted(os.listdir(tmp_path)) == [".DS_Store", "1", "3", "4", "5.partial"]
+
+
+def test_generate_vector_db_from_processed_data(tmp_path):
+    """
+    Ensures that an index can be built offline from any processed data directory, and that the fake embeddings used by the
+    benchmark suite retrieve the chunk sharing the query's words.
+    """
+    SharedSystemClient.clear_system_cache()
+    for course, text in [(310, "Wallace Stevens and the snow man"), (291, "Toni Morrison and Beloved")]:
+        (tmp_path / "processed" / str(course)).mkdir(parents=True)
+        (tmp_path / "processed" / str(course) / "lecture1.txt").write_text(text, encoding="utf-8")
+
+    embedding = FakeEmbeddings(size=64)
+    stats = generate_vector_db_from_processed_data(
+        str(tmp_path / "processed"), str(tmp_path / "chroma"), embedding
+    )
+    assert stats["added"] == 2
+
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).get_collection("transcripts")
+    result = collection.query(query_embeddings=[embedding.embed_query("Who is Morrison?")], n_results=1)
+    assert result["metadatas"][0][0]["course"] == 291
+    assert embedding.embed_query("Beloved") == FakeEmbeddings(size=64).embed_query("Beloved")
+
+
+def test_chunk_ids_do_not_depend_on_processed_data_path(tmp_path):
+    """
+    Ensures that moving the processed data directory does not change the chunk ids, so that the next build reuses every
+    chunk.
+    """
+    SharedSystemClient.clear_system_cache()
+    for directory in ("before", "after"):
+        (tmp_path / directory / "310").mkdir(parents=True)
+        (tmp_path / directory / "310" / "lecture1.txt").write_text("Wallace Stevens.", encoding="utf-8")
+
+    embedding = CountingEmbedding(size=8)
+    generate_vector_db_from_processed_data(str(tmp_path / "before"), str(tmp_path / "chroma"), embedding)
+    stats = generate_vector_db_from_processed_data(str(tmp_path / "after"), str(tmp_path / "chroma"), embedding)
+
+    assert (stats["added"], stats["removed"], stats["reused"]) == (0, 0, 1)
+    assert embedding.embedded_texts == 1
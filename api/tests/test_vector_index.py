@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from chromadb.api.client import SharedSystemClient
+from langchain_core.documents import Document
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.vector_database import create_chromaDB
+from verse.vector_index import VectorIndex, build_vector_index
+
+from benchmarks.fakes import FakeEmbeddings
+
+
+@pytest.fixture
+def corpus():
+    generator = np.random.default_rng(0)
+    embeddings = generator.normal(size=(300, 64)).astype(np.float32)
+    courses = [(220, 291, 310)[number % 3] for number in range(300)]
+    chunk_ids = [f"chunk{number}" for number in range(300)]
+    return chunk_ids, embeddings, courses
+
+
+def exact_search(embeddings, query, k, rows=None):
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    scores = embeddings @ (query / np.linalg.norm(query))
+    if rows is not None:
+        scores = np.where(rows, scores, -np.inf)
+    return [f"chunk{number}" for number in np.argsort(-scores)[:k]]
+
+
+@pytest.mark.parametrize(
+    ["dtype", "dimensions", "min_recall"], [["float32", None, 1.0], ["int8", None, 0.9], ["float32", 48, 0.5]]
+)
+def test_search(tmp_path, corpus, dtype, dimensions, min_recall):
+    """
+    Ensures that a batch of queries finds the nearest chunks, exactly in float32 and approximately when quantized or
+    truncated.
+    """
+    chunk_ids, embeddings, courses = corpus
+    stats = build_vector_index(str(tmp_path), chunk_ids, embeddings, courses, "fake", dtype=dtype, dimensions=dimensions)
+    assert stats["dimensions"] == (dimensions or 64)
+    assert stats["bytes"] == 300 * (dimensions or 64) * (1 if dtype == "int8" else 4)
+
+    vector_index = VectorIndex(str(tmp_path))
+    queries = embeddings[:20] + np.random.default_rng(1).normal(scale=0.5, size=(20, 64)).astype(np.float32)
+    results = vector_index.search(queries, k=10)
+    assert len(results) == 20
+
+    found = 0
+    for query, (chunk_ids, scores) in zip(queries, results):
+        assert scores == sorted(scores, reverse=True)
+        found += len(set(chunk_ids) & set(exact_search(embeddings, query, 10)))
+    assert found / 200 >= min_recall
+
+
+def test_search_course(tmp_path, corpus):
+    """
+    Ensures that searching a course only returns the chunks of that course.
+    """
+    chunk_ids, embeddings, courses = corpus
+    build_vector_index(str(tmp_path), chunk_ids, embeddings, courses, "fake")
+    vector_index = VectorIndex(str(tmp_path))
+
+    ((found_ids, _),) = vector_index.search(embeddings[:1], k=5, course=291)
+    assert found_ids == exact_search(embeddings, embeddings[0], 5, rows=np.asarray(courses) == 291)
+    assert vector_index.search(embeddings[:1], k=5, course=300) == [([], [])]
+
+
+def test_retrieve_context_numpy(tmp_path, monkeypatch):
+    """
+    Ensures that the numpy vector backend retrieves the same context as Chroma.
+    """
+    SharedSystemClient.clear_system_cache()
+    embedding = FakeEmbeddings(size=32)
+    chunks = [
+        Document(page_content=text, metadata={"source": f"310/lecture{number}.txt", "course": 310})
+        for number, text in enumerate(
+            ["Wallace Stevens and the snow man", "Robert Frost and the road", "Ezra Pound in the metro", "Yeats"]
+            + [f"Lecture {number} on imagism" for number in range(10)]
+        )
+    ]
+    stats = create_chromaDB(chunks, str(tmp_path / "chroma"), embedding)
+    assert stats["vector_index"]["chunks"] == 14
+
+    monkeypatch.setattr(rag, "get_token_counter", lambda: lambda text: len(text.split()))
+
+    contexts = {}
+    for vector_backend in ("chroma", "numpy"):
+        SharedSystemClient.clear_system_cache()
+        app = create_app(
+            {
+                "TESTING": True,
+                "OPENAI_API_KEY": "testkey",
+                "CHROMA_PATH": str(tmp_path / "chroma"),
+                "RETRIEVAL_MODE": "dense",
+                "VECTOR_BACKEND": vector_backend,
+            }
+        )
+        app.extensions["retriever_pool"].embedding_function = embedding
+        with app.app_context():
+            contexts[vector_backend] = rag.retrieve_context("Modern Poetry", "the snow man of Wallace Stevens")
+
+    assert contexts["numpy"] == contexts["chroma"]
+    assert contexts["numpy"].startswith("Wallace Stevens")
+
+
+def test_vector_backend_config():
+    """
+    Ensures that an unknown vector backend is refused at startup.
+    """
+    with pytest.raises(ValueError):
+        create_app({"TESTING": True, "OPENAI_API_KEY": "testkey", "VECTOR_BACKEND": "faiss"})
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from verse import create_app
+from verse.warm_up import WarmUp
+
+API_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_openai", "openai", "chromadb", "tiktoken", "onnxruntime")
+
+
+@pytest.mark.parametrize("config", [{}, {"RESPONSE_CACHE_ENABLED": True}])
+def test_create_app_does_not_import_the_rag_stack(config):
+    """
+    Ensures that importing verse and creating the application do not import langchain or the OpenAI, Chroma and
+    tokenizer clients, including when the response cache is enabled.
+    """
+    code = (
+        "import json, sys\n"
+        "from verse import create_app\n"
+        f"create_app({{'TESTING': True, 'OPENAI_API_KEY': 'testkey', **{config!r}}})\n"
+        "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=API_PATH, capture_output=True, text=True, check=True)
+    assert not set(HEAVY_PACKAGES) & set(json.loads(result.stdout))
+
+
+def test_warm_up_in_background(tmp_path):
+    """
+    Ensures that the server answers /pulse while the warm-up runs, and that the warm-up creates the LLM and its chains.
+    """
+    app = create_app(
+        {
+            "OPENAI_API_KEY": "testkey",
+            "CHROMA_PATH": str(tmp_path / "chroma"),
+            "EMBEDDING_CACHE_PATH": None,
+            "RETRIEVER_WARM_UP": True,
+        }
+    )
+    warm_up = app.extensions["warm_up"]
+    assert isinstance(warm_up, WarmUp)
+
+    response = app.test_client().get("/pulse")
+    assert response.status_code == 200
+    assert response.headers["X-Warm-Up"] in ("pending", "running", "ready")
+
+    assert warm_up.wait(timeout=60)
+    assert warm_up.state == "ready"
+    assert "llm" in app.extensions
+    assert app.test_client().get("/pulse").headers["X-Warm-Up"] == "ready"
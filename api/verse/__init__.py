@@ -1,7 +1,21 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 
-from verse.routes import rag
+from verse.history import HistoryCompactor
+from verse.metrics import CONTENT_TYPE, init_metrics
+from verse.recommendations import RecommendationStore
+from verse.response_cache import ResponseCache
+from verse.retriever_pool import RetrieverPool
+from verse.routes import rag, sessions
+from verse.sessions import create_session_store
+from verse.timing import (
+    get_prompt_tokens,
+    get_timings,
+    prompt_tokens_header,
+    server_timing_header,
+)
+from verse.tracing import init_tracing
+from verse.warm_up import WarmUp
 
 
 def create_app(test_config=None):
@@ -14,12 +28,81 @@ def create_app(test_config=None):
     else:
         app.config.from_mapping(test_config)
 
+    # open the vector store once per process and share it across requests
+    retriever_pool = RetrieverPool()
+    retriever_pool.init_app(app)
+
+    # load the RAG stack in the background, so that the server answers /pulse at once
+    warm_up = app.extensions["warm_up"] = WarmUp(app)
+    if app.config.get("RETRIEVER_WARM_UP") and not app.config.get("TESTING"):
+        if app.config.get("WARM_UP_BACKGROUND", True):
+            warm_up.start()
+        else:
+            warm_up.wait()
+
+    # cache responses to repeated questions when enabled
+    if app.config.get("RESPONSE_CACHE_ENABLED"):
+        app.extensions["response_cache"] = ResponseCache(
+            ttl=app.config.get("RESPONSE_CACHE_TTL", 3600),
+            max_entries=app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 1024),
+            similarity_threshold=app.config.get(
+                "RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.95
+            ),
+            tail_size=app.config.get("RESPONSE_CACHE_TAIL_SIZE", 1),
+            get_embedding_function=retriever_pool.get_embedding_function,
+        )
+
+    # memoize recommendations by course and message history
+    app.extensions["recommendation_store"] = RecommendationStore(
+        ttl=app.config.get("RECOMMENDATION_CACHE_TTL", 3600),
+        max_entries=app.config.get("RECOMMENDATION_CACHE_MAX_ENTRIES", 1024),
+        max_workers=app.config.get("RECOMMENDATION_WORKERS", 2),
+    )
+
+    # keep the conversation history of long sessions within a token budget
+    app.extensions["history_compactor"] = HistoryCompactor(
+        token_budget=(
+            app.config.get("HISTORY_TOKEN_BUDGET", 1500)
+            if app.config.get("HISTORY_COMPACTION_ENABLED", True)
+            else None
+        ),
+        summary_token_budget=app.config.get("HISTORY_SUMMARY_TOKEN_BUDGET", 300),
+        max_summaries=app.config.get("HISTORY_SUMMARY_CACHE_MAX_ENTRIES", 1024),
+        ttl=app.config.get("HISTORY_SUMMARY_CACHE_TTL", 3600),
+    )
+
+    # keep conversations on the server for clients that send a session ID
+    app.extensions["session_store"] = create_session_store(app.config)
+
+    # record latency histograms, token counts and cache counters, and export traces when enabled
+    metrics = init_metrics(app)
+    if app.config.get("OTEL_ENABLED"):
+        init_tracing(app)
+
     # register pulse route for heartbeats
     @app.route("/pulse")
     def pulse():
-        return ""
+        return "", {"X-Warm-Up": warm_up.state}
+
+    # register metrics route for Prometheus
+    @app.route("/metrics")
+    def metrics_route():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    # report per-stage timings and prompt sizes of each request
+    @app.after_request
+    def add_server_timing(response):
+        timings = get_timings()
+        if timings:
+            response.headers["Server-Timing"] = server_timing_header(timings)
+
+        prompt_tokens = get_prompt_tokens()
+        if prompt_tokens:
+            response.headers["X-Prompt-Tokens"] = prompt_tokens_header(prompt_tokens)
+        return response
 
     # register blueprints
     app.register_blueprint(rag.bp)
+    app.register_blueprint(sessions.bp)
 
     return app
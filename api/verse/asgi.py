@@ -0,0 +1,569 @@
+import asyncio
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match
+
+import verse.retrieval_augmented_generation as rag
+from verse import create_app
+from verse.metrics import CONTENT_TYPE
+from verse.recommendations import get_recommendation_store
+from verse.response_cache import get_response_cache
+from verse.routes.rag import (
+    DANGEROUS_CHARACTERS_PATTERN,
+    format_server_sent_event,
+    record_turn,
+    split_cached_response,
+)
+from verse.routes.sessions import session_to_json
+from verse.sessions import get_session, get_session_store
+from verse.timing import (
+    get_prompt_tokens,
+    get_timings,
+    prompt_tokens_header,
+    server_timing_header,
+    timed,
+)
+
+
+class OverloadedError(Exception):
+    """
+    OverloadedError is raised when a request is turned away because every slot is in use and the queue is full, or
+    because the request waited in the queue for too long.
+    """
+
+
+class ConcurrencyLimiter:
+    """
+    ConcurrencyLimiter bounds the number of requests the async server works on at once. A request that finds every slot
+    in use waits in a bounded queue; once the queue is full, or once a request has waited for queue_timeout seconds, it
+    is turned away with an OverloadedError instead of piling up behind the LLM calls in flight. The limiter is only
+    used from the event loop, so its counters need no lock.
+
+    Args:
+    max_in_flight (int): Number of requests worked on at once
+    max_queued (int): Number of requests waiting for a slot
+    queue_timeout (float): Seconds a request waits for a slot
+
+    """
+
+    def __init__(self, max_in_flight=64, max_queued=256, queue_timeout=10.0):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    async def acquire(self):
+        """
+        acquire waits for a slot.
+
+        Args:
+        None
+
+        Returns:
+        None
+
+        Raises:
+        OverloadedError: If the queue is full or the wait times out
+
+        """
+
+        # requests waiting for a slot count as queued until they hold it
+        if self.in_flight + self.queued >= self.max_in_flight + self.max_queued:
+            self.stats["rejected"] += 1
+            raise OverloadedError()
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise OverloadedError()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def get_stats(self):
+        return {**self.stats, "in_flight": self.in_flight, "queued": self.queued}
+
+
+class RequestMetricsMiddleware:
+    """
+    RequestMetricsMiddleware records the latency of every request to the async server by route and status, like the
+    Flask application's request hooks. A streamed response is recorded once its last event has been sent.
+
+    Args:
+    app (ASGIApp): The application to measure
+    metrics (Metrics): The metrics to record the requests in
+    routes (List[BaseRoute]): The routes of the application, to label requests by route instead of by path
+
+    """
+
+    def __init__(self, app, metrics, routes):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    def get_route(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.observe_request(
+                scope["method"], self.get_route(scope), status, time.perf_counter() - start
+            )
+
+
+def collect_limiter_stats(limiter):
+    stats = limiter.get_stats()
+    return [
+        (
+            "verse_async_requests_total",
+            "counter",
+            "Requests to the async server by outcome (admitted, rejected, timed_out).",
+            [({"outcome": outcome}, stats[outcome]) for outcome in ("admitted", "rejected", "timed_out")],
+        ),
+        ("verse_async_requests_in_flight", "gauge", "Requests being worked on.", [({}, stats["in_flight"])]),
+        ("verse_async_requests_queued", "gauge", "Requests waiting for a slot.", [({}, stats["queued"])]),
+    ]
+
+
+async def get_json_data(request, error):
+    # mirrors request.get_json() of the Flask routes, raising the route's error when the body is not JSON
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        raise ValueError({"error": error, "message": "Request must be JSON formatted."})
+
+    try:
+        return await request.json()
+    except ValueError:
+        raise ValueError({"error": error, "message": "Request must be JSON formatted."})
+
+
+def add_server_timing(response):
+    timings = get_timings()
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+    prompt_tokens = get_prompt_tokens()
+    if prompt_tokens:
+        response.headers["X-Prompt-Tokens"] = prompt_tokens_header(prompt_tokens)
+    return response
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    ClosingStreamingResponse is a StreamingResponse that calls on_close however the response ends. Starlette skips the
+    background task of a response whose stream raised (ex. a failed send or a cancelled task), and the body iterator of a
+    response whose headers could not be sent never runs, so neither can be relied on to release a concurrency slot.
+
+    Args:
+    content (AsyncIterator[str]): The body of the response
+    on_close (Callable[[], None]): Called once the response has been sent, has failed, or was cancelled
+
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+async def iterate(parts):
+    for part in parts:
+        yield part
+
+
+def stream_response_parts(flask_app, parts, on_done=None, on_close=None):
+    """
+    stream_response_parts streams a professor response as Server-Sent Events, with the same events as the Flask route's
+    stream_response_parts.
+
+    Args:
+    flask_app (Flask): The application whose context the response is generated in
+    parts (Callable[[], AsyncIterator[Tuple[str, str]]]): Creates the parts of the response, as yielded by
+    rag.astream_professor_response
+    on_done (Callable[[str], None]): Called with the complete response once it has been streamed
+    on_close (Callable[[], None]): Called exactly once, when the response has been sent, has failed, or the client has
+    gone away
+
+    Returns:
+    ClosingStreamingResponse: The text/event-stream response
+
+    Raises:
+    None
+
+    """
+
+    closed = False
+
+    def close():
+        # called when the stream ends and when the response ends, whichever comes first
+        nonlocal closed
+        if not closed:
+            closed = True
+            if on_close is not None:
+                on_close()
+
+    async def generate():
+        try:
+            with flask_app.app_context():
+                response = ""
+                try:
+                    async for part, text in parts():
+                        response += text
+                        if part != "separator":
+                            yield format_server_sent_event(part, {"token": text})
+                except Exception:
+                    flask_app.logger.exception("Error streaming professor response")
+                    yield format_server_sent_event(
+                        "error",
+                        {"error": "RESPONSE_ERROR", "message": "Error obtaining response."},
+                    )
+                    return
+
+                if on_done is not None:
+                    await asyncio.to_thread(on_done, response)
+                yield format_server_sent_event("done", {"response": response})
+        finally:
+            close()
+
+    return ClosingStreamingResponse(
+        generate(),
+        close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_asgi_app(test_config=None):
+    """
+    create_asgi_app creates the async server for Verse. It serves /pulse, /metrics, /rag/professorResponse,
+    /rag/professorRecommendation, /rag/cacheStats and /sessions with the same requests and responses as the Flask
+    application, but awaits the LLM and embedding calls on an event loop instead of holding a thread per request. The
+    Flask application is still created, and provides the configuration, the retriever pool, the caches and the session
+    store; each request runs inside its application context. Run it with:
+
+        uvicorn --factory verse.asgi:create_asgi_app
+
+    Args:
+    test_config (dict): Configuration to use instead of verse.config.Config
+
+    Returns:
+    FastAPI: The ASGI application
+
+    Raises:
+    None
+
+    """
+
+    flask_app = create_app(test_config)
+
+    limiter = ConcurrencyLimiter(
+        max_in_flight=flask_app.config.get("ASYNC_MAX_IN_FLIGHT", 64),
+        max_queued=flask_app.config.get("ASYNC_MAX_QUEUED", 256),
+        queue_timeout=flask_app.config.get("ASYNC_QUEUE_TIMEOUT", 10.0),
+    )
+
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    app.state.flask_app = flask_app
+    app.state.limiter = limiter
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=flask_app.config.get("CORS_ORIGINS", ["*"]),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # record request latency in the Flask application's metrics, which also hold the stages recorded in its contexts
+    metrics = flask_app.extensions["metrics"]
+    metrics.add_collector(lambda: collect_limiter_stats(limiter))
+    app.add_middleware(RequestMetricsMiddleware, metrics=metrics, routes=app.router.routes)
+
+    if "tracer_provider" in flask_app.extensions:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+        FastAPIInstrumentor.instrument_app(
+            app, tracer_provider=flask_app.extensions["tracer_provider"]
+        )
+
+    @app.exception_handler(ValueError)
+    async def handle_value_error(request, error):
+        return JSONResponse(error.args[0] if error.args else {}, status_code=400)
+
+    @app.exception_handler(OverloadedError)
+    async def handle_overloaded_error(request, error):
+        return JSONResponse(
+            {"error": "OVERLOADED", "message": "Server is at capacity, try again later."},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+
+    @app.get("/pulse")
+    async def pulse():
+        return Response("")
+
+    @app.get("/metrics")
+    async def metrics_route():
+        return Response(metrics.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    @app.post("/rag/professorResponse")
+    async def professor_response(request: Request):
+        data = await get_json_data(request, "RESPONSE_ERROR")
+        course = data.get("course")
+        query = data.get("query")
+        previous_responses = data.get("previous_responses")
+        session_id = data.get("session_id")
+
+        if session_id:
+            with flask_app.app_context():
+                session = await asyncio.to_thread(get_session, session_id, "RESPONSE_ERROR")
+            course = course or session.course
+            previous_responses = session.previous_responses
+
+        global_search = bool(data.get("global_search", False))
+        stream = bool(data.get("stream", False)) or (
+            request.headers.get("accept", "").split(",")[0].strip() == "text/event-stream"
+        )
+
+        if not course:
+            raise ValueError(
+                {"error": "RESPONSE_ERROR", "message": "Course must be provided."}
+            )
+
+        if not query:
+            raise ValueError(
+                {"error": "RESPONSE_ERROR", "message": "Query must be provided."}
+            )
+
+        original_query = query
+        query = re.sub(DANGEROUS_CHARACTERS_PATTERN, "", query)
+
+        await limiter.acquire()
+        # a streamed response keeps its slot until the stream ends
+        release = True
+        try:
+            with flask_app.app_context():
+                response_cache = get_response_cache()
+                cache_course = f"{course} (global search)" if global_search else course
+
+                if response_cache is not None:
+                    with timed("cache_lookup"):
+                        cached_response = await asyncio.to_thread(
+                            response_cache.lookup,
+                            "professorResponse",
+                            cache_course,
+                            query,
+                            previous_responses,
+                        )
+
+                    if cached_response is not None:
+                        await asyncio.to_thread(record_turn, session_id, original_query, cached_response)
+                        if stream:
+                            response = stream_response_parts(
+                                flask_app,
+                                lambda: iterate(split_cached_response(cached_response)),
+                            )
+                        else:
+                            response = JSONResponse(cached_response)
+                        response.headers["X-Cache"] = "HIT"
+                        return add_server_timing(response)
+
+                start = time.perf_counter()
+
+                def finish_response(response):
+                    record_turn(session_id, original_query, response)
+                    if response_cache is not None:
+                        response_cache.store(
+                            cache_course,
+                            query,
+                            previous_responses,
+                            response,
+                            time.perf_counter() - start,
+                        )
+
+                if stream:
+                    response = stream_response_parts(
+                        flask_app,
+                        lambda: rag.astream_professor_response(
+                            course, query, previous_responses, global_search
+                        ),
+                        on_done=finish_response,
+                        on_close=limiter.release,
+                    )
+                    release = False
+                else:
+                    response_text = await rag.aget_professor_response(
+                        course, query, previous_responses, global_search
+                    )
+
+                    if not response_text:
+                        raise ValueError(
+                            {"error": "RESPONSE_ERROR", "message": "Error obtaining response."}
+                        )
+
+                    await asyncio.to_thread(finish_response, response_text)
+                    response = JSONResponse(response_text)
+
+                if response_cache is not None:
+                    response.headers["X-Cache"] = "MISS"
+                return add_server_timing(response)
+        finally:
+            if release:
+                limiter.release()
+
+    @app.post("/rag/professorRecommendation")
+    async def professor_recommendation(request: Request):
+        data = await get_json_data(request, "RECOMMENDATION_ERROR")
+        course = data.get("course")
+        messages = data.get("messages")
+
+        if data.get("session_id"):
+            with flask_app.app_context():
+                session = await asyncio.to_thread(get_session, data["session_id"], "RECOMMENDATION_ERROR")
+            course = course or session.course
+            messages = session.messages
+
+        if not course:
+            raise ValueError(
+                {"error": "RECOMMENDATION_ERROR", "message": "Course must be provided."}
+            )
+
+        if not messages:
+            raise ValueError(
+                {"error": "RECOMMENDATION_ERROR", "message": "Messages must be provided."}
+            )
+
+        messages = tuple(messages)
+
+        with flask_app.app_context():
+            recommendation_store = get_recommendation_store()
+
+        # a background recommendation runs on the store's own workers, so it does not take a slot
+        if data.get("background"):
+
+            def compute_recommendation():
+                with flask_app.app_context():
+                    return rag.get_professor_recommendation(course, messages)
+
+            recommendation_store.schedule(course, messages, compute_recommendation)
+            return JSONResponse({"status": "SCHEDULED"}, status_code=202)
+
+        await limiter.acquire()
+        try:
+            with flask_app.app_context():
+                recommendation = await recommendation_store.aget(
+                    course,
+                    messages,
+                    lambda: rag.aget_professor_recommendation(course, messages),
+                )
+
+                if not recommendation:
+                    raise ValueError(
+                        {
+                            "error": "RECOMMENDATION_ERROR",
+                            "message": "Error obtaining recommendation.",
+                        }
+                    )
+
+                return add_server_timing(JSONResponse(recommendation))
+        finally:
+            limiter.release()
+
+    @app.get("/rag/cacheStats")
+    async def cache_stats():
+        stats = {}
+
+        with flask_app.app_context():
+            response_cache = get_response_cache()
+            if response_cache is not None:
+                stats.update(response_cache.get_stats())
+
+            stats["professorRecommendation"] = get_recommendation_store().get_stats()
+
+        return JSONResponse(stats)
+
+    @app.post("/sessions", status_code=201)
+    async def create_session(request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+
+        with flask_app.app_context():
+            session = await asyncio.to_thread(get_session_store().create, data.get("course"))
+        return JSONResponse(session_to_json(session), status_code=201)
+
+    @app.get("/sessions/stats")
+    async def session_stats():
+        with flask_app.app_context():
+            return JSONResponse(await asyncio.to_thread(get_session_store().get_stats))
+
+    @app.get("/sessions/{session_id}")
+    async def read_session(session_id: str):
+        with flask_app.app_context():
+            session = await asyncio.to_thread(get_session, session_id, "SESSION_ERROR")
+        return JSONResponse(session_to_json(session))
+
+    @app.post("/sessions/{session_id}/messages")
+    async def append_messages(session_id: str, request: Request):
+        data = await get_json_data(request, "SESSION_ERROR")
+        messages = data.get("messages")
+        if not messages:
+            raise ValueError(
+                {"error": "SESSION_ERROR", "message": "Messages must be provided."}
+            )
+
+        with flask_app.app_context():
+            session = await asyncio.to_thread(get_session_store().append, session_id, messages=tuple(messages))
+        if session is None:
+            raise ValueError({"error": "SESSION_ERROR", "message": "Session not found."})
+        return JSONResponse(session_to_json(session))
+
+    @app.delete("/sessions/{session_id}", status_code=204)
+    async def delete_session(session_id: str):
+        with flask_app.app_context():
+            deleted = await asyncio.to_thread(get_session_store().delete, session_id)
+        if not deleted:
+            raise ValueError({"error": "SESSION_ERROR", "message": "Session not found."})
+        return Response(status_code=204)
+
+    return app
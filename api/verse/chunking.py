@@ -0,0 +1,233 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from verse.courses import COURSES
+
+LECTURE_PATH_PATTERN = re.compile(r"(\d+)[\\/]lecture(\d+)\.txt$")
+
+# chunks of about 250 tokens, like the 1000-character chunks they replace, overlapping by up to 32 tokens of whole
+# sentences; text-embedding-3 models read up to 8191 tokens, so chunk size only trades context precision for recall
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 32
+
+# a sentence ends with punctuation (and closing quotes or brackets) followed by whitespace, or directly by a capital
+# letter where the transcript joined two paragraphs ("circulation.I've")
+SENTENCE_END_PATTERN = re.compile(r"[.!?]+[\"'”’)\]]*(?:\s+|(?=[A-Z]))")
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def get_lecture_metadata(source_path):
+    """
+    get_lecture_metadata reads the course and lecture numbers from the path of a processed transcript, which is always in
+    the format of data/processed/<course>/lecture<N>.txt.
+
+    Args:
+    source_path (str): Path of a processed transcript
+
+    Returns:
+    dict: Metadata with the course number, course title, and lecture number, or an empty dict if the path does not
+    follow the processed data layout
+
+    Raises:
+    None
+
+    """
+
+    match = LECTURE_PATH_PATTERN.search(source_path)
+    if not match:
+        return {}
+
+    course_number = int(match.group(1))
+    metadata = {"course": course_number, "lecture": int(match.group(2))}
+    if course_number in COURSES:
+        metadata["course_title"] = COURSES[course_number]["title"]
+
+    return metadata
+
+
+def list_transcripts(processed_data_path):
+    """
+    list_transcripts finds the processed transcripts of a directory, in course and lecture order.
+
+    Args:
+    processed_data_path (str): Directory of the cleaned transcripts
+
+    Returns:
+    List[str]: Paths of the transcripts
+
+    Raises:
+    None
+
+    """
+
+    processed_data_path = os.path.normpath(processed_data_path)
+    paths = []
+    for directory, _, filenames in os.walk(processed_data_path):
+        paths.extend(os.path.join(directory, filename) for filename in filenames if filename.endswith(".txt"))
+
+    def sort_key(path):
+        metadata = get_lecture_metadata(path)
+        return (metadata.get("course", 0), metadata.get("lecture", 0), path)
+
+    return sorted(paths, key=sort_key)
+
+
+def split_sentences(text):
+    """
+    split_sentences finds the sentences of a text.
+
+    Args:
+    text (str): The text
+
+    Returns:
+    List[Tuple[int, int]]: The start and end of each sentence in the text, without the whitespace between sentences
+
+    Raises:
+    None
+
+    """
+
+    spans = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        end = match.start() + len(match.group().rstrip())
+        if end > start:
+            spans.append((start, end))
+        start = match.end()
+
+    if text[start:].strip():
+        spans.append((start, len(text.rstrip())))
+    return spans
+
+
+def _split_long_sentence(text, start, end, chunk_tokens, count_tokens):
+    # a sentence longer than a chunk is cut between words
+    spans = []
+    piece_start, piece_end, piece_tokens = None, None, 0
+    for match in WORD_PATTERN.finditer(text, start, end):
+        tokens = count_tokens(match.group() + " ")
+        if piece_start is not None and piece_tokens + tokens > chunk_tokens:
+            spans.append((piece_start, piece_end, piece_tokens))
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = match.start()
+        piece_end = match.end()
+        piece_tokens += tokens
+
+    if piece_start is not None:
+        spans.append((piece_start, piece_end, piece_tokens))
+    return spans
+
+
+def chunk_spans(text, count_tokens, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    chunk_spans cuts a text into chunks of whole sentences of at most chunk_tokens tokens. Each chunk starts with the
+    last sentences of the chunk before that fit in overlap_tokens tokens, if any do, so that a passage cut between two
+    chunks is found whole in one of them. Sentences longer than a chunk are cut between words.
+
+    Args:
+    text (str): The text
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+
+    Returns:
+    List[Tuple[int, int, int]]: The start, end and number of tokens of each chunk, in order
+
+    Raises:
+    None
+
+    """
+
+    sentences = []
+    spans = split_sentences(text)
+    for index, (start, end) in enumerate(spans):
+        # the whitespace before the next sentence is counted too, so that a chunk has at most the tokens of its sentences
+        tokens = count_tokens(text[start : spans[index + 1][0] if index + 1 < len(spans) else end])
+        if tokens > chunk_tokens:
+            sentences.extend(_split_long_sentence(text, start, end, chunk_tokens, count_tokens))
+        else:
+            sentences.append((start, end, tokens))
+
+    chunks = []
+    first = 0
+    while first < len(sentences):
+        last, tokens = first, 0
+        while last < len(sentences) and (last == first or tokens + sentences[last][2] <= chunk_tokens):
+            tokens += sentences[last][2]
+            last += 1
+
+        chunks.append((sentences[first][0], sentences[last - 1][1], tokens))
+        if last == len(sentences):
+            break
+
+        # the next chunk starts with the sentences that fit in the overlap, and always moves past this chunk's first
+        next_first, overlap = last, 0
+        while next_first - 1 > first and overlap + sentences[next_first - 1][2] <= overlap_tokens:
+            next_first -= 1
+            overlap += sentences[next_first][2]
+        first = next_first
+
+    return chunks
+
+
+def chunk_text(text, count_tokens, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    chunk_text cuts a text into chunks of whole sentences with chunk_spans.
+
+    Args:
+    text (str): The text
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+
+    Returns:
+    List[Tuple[str, int]]: The text and number of tokens of each chunk, in order
+
+    Raises:
+    None
+
+    """
+
+    return [
+        (text[start:end], tokens) for start, end, tokens in chunk_spans(text, count_tokens, chunk_tokens, overlap_tokens)
+    ]
+
+
+def load_document_chunks(
+    processed_data_path, count_tokens, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, workers=None
+):
+    """
+    load_document_chunks reads the processed transcripts of a directory and chunks them with chunk_text, reading and
+    chunking several transcripts at a time on a pool of threads.
+
+    Args:
+    processed_data_path (str): Directory of the cleaned transcripts
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+    workers (int): Number of threads, or None for ThreadPoolExecutor's default
+
+    Returns:
+    List[Document]: The chunks, each lecture's chunks in order, with their source path, course and lecture in their
+    metadata
+
+    Raises:
+    None
+
+    """
+
+    from langchain_core.documents import Document
+
+    def load(path):
+        with open(path, "r", encoding="utf-8") as file:
+            text = file.read()
+        metadata = {"source": path, **get_lecture_metadata(path)}
+        return [
+            Document(page_content=chunk, metadata=dict(metadata))
+            for chunk, _ in chunk_text(text, count_tokens, chunk_tokens, overlap_tokens)
+        ]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [chunk for chunks in executor.map(load, list_transcripts(processed_data_path)) for chunk in chunks]
@@ -2,6 +2,8 @@ from os import environ, path
 
 from dotenv import load_dotenv
 
+from verse.context_packs import DEFAULT_CONTEXT_TOKEN_BUDGET
+
 basedir = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(basedir, ".env"))
 
@@ -10,4 +12,100 @@ class Config:
     OPENAI_API_KEY = environ.get("OPENAI_API_KEY")
     CORS_HEADERS = 'Content-Type, Authorization, Origin, x-csrf-token' 
     CORS_METHODS = 'GET, HEAD, POST, PATCH, DELETE, OPTIONS' 
-    CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:5000']
\ No newline at end of file
+    CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:5000']
+
+    # LLM client: one client per process keeps up to LLM_MAX_CONNECTIONS connections to the API (OPENAI_API_BASE, or
+    # OpenAI's), LLM_MAX_KEEPALIVE_CONNECTIONS of them open for LLM_KEEPALIVE_EXPIRY seconds between requests. A request
+    # fails after LLM_TIMEOUT seconds (LLM_CONNECT_TIMEOUT to connect) and is retried up to LLM_MAX_RETRIES times
+    OPENAI_API_BASE = environ.get("OPENAI_API_BASE") or None
+    LLM_MAX_CONNECTIONS = int(environ.get("LLM_MAX_CONNECTIONS", 100))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+    LLM_KEEPALIVE_EXPIRY = float(environ.get("LLM_KEEPALIVE_EXPIRY", 30.0))
+    LLM_TIMEOUT = float(environ.get("LLM_TIMEOUT", 60.0))
+    LLM_CONNECT_TIMEOUT = float(environ.get("LLM_CONNECT_TIMEOUT", 5.0))
+    LLM_MAX_RETRIES = int(environ.get("LLM_MAX_RETRIES", 2))
+
+    # Retrieval
+    CHROMA_PATH = path.join(basedir, "chroma")
+    RETRIEVER_WARM_UP = environ.get("RETRIEVER_WARM_UP", "true").lower() == "true"
+    # the warm-up (retriever, embedding and LLM clients, tokenizers) runs in the background unless WARM_UP_BACKGROUND is
+    # false, in which case create_app waits for it
+    WARM_UP_BACKGROUND = environ.get("WARM_UP_BACKGROUND", "true").lower() == "true"
+    RETRIEVER_RELOAD_INTERVAL = float(environ.get("RETRIEVER_RELOAD_INTERVAL", 5.0))
+
+    # Retrieval mode ("hybrid" or "dense"): hybrid fuses the BM25 and dense rankings of RETRIEVAL_FETCH_K chunks each,
+    # and answers queries that name a work or author from the BM25 index alone
+    RETRIEVAL_MODE = environ.get("RETRIEVAL_MODE", "hybrid")
+    RETRIEVAL_FETCH_K = int(environ.get("RETRIEVAL_FETCH_K", 20))
+
+    # Vector backend ("chroma" or "numpy"): numpy searches the memory-mapped embeddings that vector_database.py writes
+    # next to the index, shared by every worker through the page cache
+    VECTOR_BACKEND = environ.get("VECTOR_BACKEND", "chroma")
+
+    # Context mode ("packs" or "raw"): packs joins consecutive chunks of a lecture without the text they repeat, and
+    # introduces them with the lecture and course summaries, within CONTEXT_TOKEN_BUDGET tokens (by default, room for
+    # every retrieved chunk and their summaries)
+    CONTEXT_MODE = environ.get("CONTEXT_MODE", "packs")
+    CONTEXT_TOKEN_BUDGET = int(environ.get("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+
+    # Segue generation ("sequential" or "speculative")
+    SEGUE_MODE = environ.get("SEGUE_MODE", "sequential")
+    SEGUE_SPECULATION_CHARS = int(environ.get("SEGUE_SPECULATION_CHARS", 400))
+
+    # Embedding backend ("openai" or "onnx"): onnx embeds on the CPU with the ONNX model in EMBEDDING_LOCAL_MODEL (a
+    # directory or a Hugging Face repository), EMBEDDING_LOCAL_BATCH_SIZE texts and EMBEDDING_LOCAL_THREADS threads (0 for
+    # onnxruntime's default) at a time. The index must be built with the same backend
+    EMBEDDING_BACKEND = environ.get("EMBEDDING_BACKEND", "openai")
+    EMBEDDING_LOCAL_MODEL = environ.get("EMBEDDING_LOCAL_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_LOCAL_BATCH_SIZE = int(environ.get("EMBEDDING_LOCAL_BATCH_SIZE", 32))
+    EMBEDDING_LOCAL_THREADS = int(environ.get("EMBEDDING_LOCAL_THREADS", 0))
+
+    # Embedding cache (set EMBEDDING_CACHE_PATH to an empty string to only cache in memory)
+    EMBEDDING_CACHE_PATH = environ.get(
+        "EMBEDDING_CACHE_PATH", path.join(basedir, "embedding_cache.sqlite3")
+    ) or None
+    EMBEDDING_CACHE_MEMORY_SIZE = int(environ.get("EMBEDDING_CACHE_MEMORY_SIZE", 1024))
+    EMBEDDING_CACHE_MAX_ENTRIES = int(environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 100000))
+
+    # Response cache
+    RESPONSE_CACHE_ENABLED = environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_TTL = float(environ.get("RESPONSE_CACHE_TTL", 3600))
+    RESPONSE_CACHE_MAX_ENTRIES = int(environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(
+        environ.get("RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.95)
+    )
+    RESPONSE_CACHE_TAIL_SIZE = int(environ.get("RESPONSE_CACHE_TAIL_SIZE", 1))
+
+    # Recommendation memoization
+    RECOMMENDATION_CACHE_TTL = float(environ.get("RECOMMENDATION_CACHE_TTL", 3600))
+    RECOMMENDATION_CACHE_MAX_ENTRIES = int(environ.get("RECOMMENDATION_CACHE_MAX_ENTRIES", 1024))
+    RECOMMENDATION_WORKERS = int(environ.get("RECOMMENDATION_WORKERS", 2))
+
+    # Async serving (verse.asgi): requests beyond ASYNC_MAX_IN_FLIGHT wait in a queue of ASYNC_MAX_QUEUED requests for
+    # at most ASYNC_QUEUE_TIMEOUT seconds, and are answered with 503 once the queue is full or the wait times out
+    ASYNC_MAX_IN_FLIGHT = int(environ.get("ASYNC_MAX_IN_FLIGHT", 64))
+    ASYNC_MAX_QUEUED = int(environ.get("ASYNC_MAX_QUEUED", 256))
+    ASYNC_QUEUE_TIMEOUT = float(environ.get("ASYNC_QUEUE_TIMEOUT", 10.0))
+
+    # History compaction: the most recent turns of each history section of a prompt are kept verbatim up to
+    # HISTORY_TOKEN_BUDGET tokens, and older turns are folded into a rolling summary of HISTORY_SUMMARY_TOKEN_BUDGET tokens
+    HISTORY_COMPACTION_ENABLED = environ.get("HISTORY_COMPACTION_ENABLED", "true").lower() == "true"
+    HISTORY_TOKEN_BUDGET = int(environ.get("HISTORY_TOKEN_BUDGET", 1500))
+    HISTORY_SUMMARY_TOKEN_BUDGET = int(environ.get("HISTORY_SUMMARY_TOKEN_BUDGET", 300))
+    HISTORY_SUMMARY_CACHE_TTL = float(environ.get("HISTORY_SUMMARY_CACHE_TTL", 3600))
+    HISTORY_SUMMARY_CACHE_MAX_ENTRIES = int(environ.get("HISTORY_SUMMARY_CACHE_MAX_ENTRIES", 1024))
+
+    # Sessions ("memory" or "sqlite"): the memory store keeps at most SESSION_MAX_BYTES bytes of messages, and the sqlite
+    # store at most SESSION_MAX_SESSIONS sessions; both evict the least recently used sessions beyond that
+    SESSION_STORE = environ.get("SESSION_STORE", "memory")
+    SESSION_STORE_PATH = environ.get("SESSION_STORE_PATH", path.join(basedir, "sessions.sqlite3"))
+    SESSION_TTL = float(environ.get("SESSION_TTL", 86400))
+    SESSION_MAX_BYTES = int(environ.get("SESSION_MAX_BYTES", 64 * 1024 * 1024))
+    SESSION_MAX_SESSIONS = int(environ.get("SESSION_MAX_SESSIONS", 100000))
+    SESSION_MAX_MESSAGES = int(environ.get("SESSION_MAX_MESSAGES", 500))
+
+    # Telemetry: Prometheus metrics are served at /metrics; set OTEL_ENABLED to also export a trace of every request to
+    # the OTLP/gRPC collector at OTEL_EXPORTER_OTLP_ENDPOINT
+    OTEL_ENABLED = environ.get("OTEL_ENABLED", "false").lower() == "true"
+    OTEL_EXPORTER_OTLP_ENDPOINT = environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+    OTEL_SERVICE_NAME = environ.get("OTEL_SERVICE_NAME", "verse")
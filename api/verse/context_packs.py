@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+from collections import defaultdict
+
+from verse.chunking import CHUNK_TOKENS
+from verse.courses import COURSES
+
+CONTEXT_PACKS_DIRNAME = "context"
+
+# number of chunks joined into the context of the answer prompt
+RETRIEVAL_K = 4
+
+# tokens of a lecture (60 words) or course (80 words) summary with its heading, and of the newline after a chunk along
+# with the tokens a chunk can gain when its text is counted with the text around it
+SUMMARY_TOKENS = 128
+CHUNK_SEPARATOR_TOKENS = 8
+
+# the default context budget fits RETRIEVAL_K chunks of CHUNK_TOKENS tokens from different lectures, the summaries of
+# their lectures, and the summary of their course
+DEFAULT_CONTEXT_TOKEN_BUDGET = RETRIEVAL_K * (CHUNK_TOKENS + CHUNK_SEPARATOR_TOKENS) + (RETRIEVAL_K + 1) * SUMMARY_TOKENS
+
+# the chunks of a lecture overlap by up to CHUNK_OVERLAP_TOKENS (32) tokens of whole sentences; shorter matches are
+# coincidences
+MIN_OVERLAP_CHARS = 10
+MAX_OVERLAP_CHARS = 400
+
+
+def find_overlap(previous_text, text, min_overlap=MIN_OVERLAP_CHARS, max_overlap=MAX_OVERLAP_CHARS):
+    """
+    find_overlap finds how much of the start of a chunk repeats the end of the chunk before it in the same lecture.
+
+    Args:
+    previous_text (str): Text of the chunk before
+    text (str): Text of the chunk
+    min_overlap (int): Number of characters an overlap must have
+    max_overlap (int): Number of characters an overlap can have
+
+    Returns:
+    int: Number of characters at the start of text that end previous_text, or 0
+
+    Raises:
+    None
+
+    """
+
+    for size in range(min(max_overlap, len(previous_text), len(text)), min_overlap - 1, -1):
+        if previous_text.endswith(text[:size]):
+            return size
+    return 0
+
+
+def get_lecture_key(metadata):
+    if "course" in metadata and "lecture" in metadata:
+        return f"{metadata['course']}/lecture{metadata['lecture']}"
+    return metadata.get("source", "")
+
+
+def build_context_packs(path, chunks_by_id, summaries=None):
+    """
+    build_context_packs writes what retrieval needs to turn chunks into compact context to a directory: the lecture of
+    each chunk, its position in the lecture, and how many of its characters repeat the chunk before it, along with the
+    lecture and course summaries written by summaries.py.
+
+    Args:
+    path (str): Directory to write the context packs to; existing packs there are replaced
+    chunks_by_id (Dict[str, Document]): The chunks of the index by ID, each lecture's chunks in order
+    summaries (dict): The lecture and course summaries, as returned by summaries.load_summaries
+
+    Returns:
+    dict: The number of chunks and lectures, the number of repeated characters, and the number of lecture and course
+    summaries
+
+    Raises:
+    None
+
+    """
+
+    summaries = summaries or {"lectures": {}, "courses": {}}
+
+    chunks = {}
+    lectures = {}
+    previous_by_lecture = {}
+    overlap_chars = 0
+    for chunk_id, chunk in chunks_by_id.items():
+        lecture_key = get_lecture_key(chunk.metadata)
+        previous = previous_by_lecture.get(lecture_key)
+        overlap = find_overlap(previous[1], chunk.page_content) if previous else 0
+        position = previous[0] + 1 if previous else 0
+
+        chunks[chunk_id] = [lecture_key, position, overlap]
+        previous_by_lecture[lecture_key] = (position, chunk.page_content)
+        overlap_chars += overlap
+
+        if lecture_key not in lectures:
+            lectures[lecture_key] = {
+                "course": chunk.metadata.get("course"),
+                "lecture": chunk.metadata.get("lecture"),
+                "summary": summaries["lectures"].get(lecture_key, {}).get("summary"),
+            }
+
+    course_numbers = {str(lecture["course"]) for lecture in lectures.values()}
+    courses = {
+        course: summary["summary"]
+        for course, summary in summaries["courses"].items()
+        if course in course_numbers
+    }
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    with open(os.path.join(path, "packs.json"), "w") as file:
+        json.dump({"chunks": chunks, "lectures": lectures, "courses": courses}, file)
+
+    return {
+        "chunks": len(chunks),
+        "lectures": len(lectures),
+        "overlap_chars": overlap_chars,
+        "lecture_summaries": sum(lecture["summary"] is not None for lecture in lectures.values()),
+        "course_summaries": len(courses),
+    }
+
+
+class ContextPacks:
+    """
+    ContextPacks turns retrieved chunks into the context of the answer prompt, within a token budget. Chunks are grouped
+    by lecture and put back in lecture order; consecutive chunks are joined without the text they repeat. Each lecture is
+    introduced by its summary, and the context by the summary of its course, as far as the budget allows.
+
+    Args:
+    path (str): Directory of the context packs
+
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "packs.json"), "r") as file:
+            packs = json.load(file)
+
+        self.chunks = packs["chunks"]
+        self.lectures = packs["lectures"]
+        self.courses = packs["courses"]
+
+    def _format(self, chunks, lecture_summaries, course_summaries):
+        # chunks are (chunk_id, text) in rank order; lectures keep the rank of their best chunk
+        chunks_by_lecture = defaultdict(list)
+        for chunk_id, text in chunks:
+            lecture_key, position, overlap = self.chunks.get(chunk_id, (chunk_id, 0, 0))
+            chunks_by_lecture[lecture_key].append((position, overlap, text))
+
+        sections = []
+        for course in course_summaries:
+            sections.append(f"{COURSES.get(int(course), {}).get('title', course)}: {self.courses[course]}")
+
+        for lecture_key, lecture_chunks in chunks_by_lecture.items():
+            lecture = self.lectures.get(lecture_key)
+            if lecture_key in lecture_summaries and lecture and lecture["summary"]:
+                title = COURSES.get(lecture["course"], {}).get("title", "")
+                sections.append(f"Lecture {lecture['lecture']} of {title}: {lecture['summary']}")
+
+            passages = []
+            previous_position = None
+            for position, overlap, text in sorted(lecture_chunks, key=lambda chunk: chunk[0]):
+                if position == previous_position:
+                    continue
+                if previous_position is not None and position == previous_position + 1:
+                    passages[-1] += text[overlap:] if overlap else f" {text}"
+                else:
+                    passages.append(text)
+                previous_position = position
+            sections.extend(passages)
+
+        return "\n".join(sections)
+
+    def format(self, chunk_ids, texts, token_budget, count_tokens):
+        """
+        format builds the context of the answer prompt from retrieved chunks. Chunks are added best first while the
+        context fits in token_budget, then the summaries of their lectures, then the summaries of their courses. The
+        best chunk is always kept.
+
+        Args:
+        chunk_ids (List[str]): IDs of the retrieved chunks, best first
+        texts (List[str]): Text of each chunk
+        token_budget (int): Number of tokens of the context
+        count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+
+        Returns:
+        str: The context
+
+        Raises:
+        None
+
+        """
+
+        chunks = list(zip(chunk_ids, texts))[:1]
+        lecture_summaries, course_summaries = [], []
+
+        def fits(chunks, lecture_summaries, course_summaries):
+            return count_tokens(self._format(chunks, lecture_summaries, course_summaries)) <= token_budget
+
+        for chunk in list(zip(chunk_ids, texts))[1:]:
+            if fits(chunks + [chunk], lecture_summaries, course_summaries):
+                chunks.append(chunk)
+
+        lecture_keys = list(dict.fromkeys(self.chunks[chunk_id][0] for chunk_id, _ in chunks if chunk_id in self.chunks))
+        for lecture_key in lecture_keys:
+            if self.lectures[lecture_key]["summary"] and fits(
+                chunks, lecture_summaries + [lecture_key], course_summaries
+            ):
+                lecture_summaries.append(lecture_key)
+
+        for course in dict.fromkeys(str(self.lectures[lecture_key]["course"]) for lecture_key in lecture_keys):
+            if course in self.courses and fits(chunks, lecture_summaries, course_summaries + [course]):
+                course_summaries.append(course)
+
+        return self._format(chunks, lecture_summaries, course_summaries)
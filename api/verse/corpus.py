@@ -0,0 +1,281 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from verse.chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, chunk_spans
+from verse.courses import COURSES
+from verse.embedding_defaults import EMBEDDING_MODEL
+from verse.history import estimate_tokens, get_token_counter
+
+CORPUS_FILENAME = "corpus.arrow"
+
+# one row per lecture; chunk boundaries are character offsets into the lecture's text
+CORPUS_SCHEMA = pa.schema(
+    [
+        ("course", pa.int32()),
+        ("lecture", pa.int32()),
+        ("course_title", pa.string()),
+        ("text", pa.large_string()),
+        ("chunk_starts", pa.list_(pa.int32())),
+        ("chunk_ends", pa.list_(pa.int32())),
+        ("chunk_tokens", pa.list_(pa.int32())),
+    ]
+)
+
+
+def get_tokenizer_name(count_tokens):
+    return "estimate" if count_tokens is estimate_tokens else EMBEDDING_MODEL
+
+
+def get_lecture_source(course, lecture):
+    # the path of the lecture's .txt file relative to the processed data directory, so that chunks keep their ids
+    # (see vector_database.get_chunk_id) whichever format the transcripts were written in
+    return os.path.join(str(course), f"lecture{lecture}.txt")
+
+
+def write_corpus(
+    corpus_path,
+    transcripts,
+    count_tokens=None,
+    chunk_tokens=CHUNK_TOKENS,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+):
+    """
+    write_corpus writes cleaned transcripts to a single Arrow IPC file, one row per lecture with its course, lecture
+    number, text, and the boundaries and token counts of its chunks (see chunking.chunk_spans). The file is written
+    uncompressed, so that open_corpus memory-maps it and reads its columns without copying them, and is replaced
+    atomically.
+
+    Args:
+    corpus_path (str): Path of the corpus file
+    transcripts (List[Tuple[int, int, str]]): The course number, lecture number, and cleaned text of each lecture
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the tokenizer of the
+    embedding model.
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+
+    Returns:
+    dict: The number of lectures and chunks, and the size of the file in bytes
+
+    Raises:
+    None
+
+    """
+
+    count_tokens = count_tokens or get_token_counter(EMBEDDING_MODEL)
+    transcripts = sorted(transcripts, key=lambda transcript: transcript[:2])
+
+    columns = {name: [] for name in CORPUS_SCHEMA.names}
+    for course, lecture, text in transcripts:
+        spans = chunk_spans(text, count_tokens, chunk_tokens, overlap_tokens)
+        columns["course"].append(course)
+        columns["lecture"].append(lecture)
+        columns["course_title"].append(COURSES[course]["title"] if course in COURSES else None)
+        columns["text"].append(text)
+        columns["chunk_starts"].append([start for start, _, _ in spans])
+        columns["chunk_ends"].append([end for _, end, _ in spans])
+        columns["chunk_tokens"].append([tokens for _, _, tokens in spans])
+
+    metadata = {
+        "chunk_tokens": str(chunk_tokens),
+        "overlap_tokens": str(overlap_tokens),
+        "tokenizer": get_tokenizer_name(count_tokens),
+    }
+    table = pa.Table.from_pydict(columns, schema=CORPUS_SCHEMA.with_metadata(metadata))
+    write_table(corpus_path, table)
+
+    return {
+        "lectures": table.num_rows,
+        "chunks": sum(len(starts) for starts in columns["chunk_starts"]),
+        "bytes": os.path.getsize(corpus_path),
+    }
+
+
+def write_table(corpus_path, table):
+    # written under a temporary name, so that readers that have the file mapped keep reading the previous version
+    temporary_path = f"{corpus_path}.tmp"
+    with pa.OSFile(temporary_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary_path, corpus_path)
+
+
+def open_corpus(corpus_path):
+    """
+    open_corpus memory-maps a corpus file written by write_corpus. Its columns are read from the page cache without
+    being copied, so that analysis tooling can open the whole corpus at the cost of the columns it touches.
+
+    Args:
+    corpus_path (str): Path of the corpus file
+
+    Returns:
+    pa.Table: One row per lecture, with the chunking settings and embedding signature in the schema's metadata
+
+    Raises:
+    None
+
+    """
+
+    with pa.memory_map(corpus_path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def get_corpus_settings(table):
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    return {
+        "chunk_tokens": int(metadata["chunk_tokens"]),
+        "overlap_tokens": int(metadata["overlap_tokens"]),
+        "tokenizer": metadata["tokenizer"],
+        "embedding_backend": metadata.get("embedding_backend"),
+        "embedding_model": metadata.get("embedding_model"),
+    }
+
+
+def has_chunks(table, count_tokens, chunk_tokens, overlap_tokens):
+    settings = get_corpus_settings(table)
+    return (settings["chunk_tokens"], settings["overlap_tokens"], settings["tokenizer"]) == (
+        chunk_tokens,
+        overlap_tokens,
+        get_tokenizer_name(count_tokens),
+    )
+
+
+def load_corpus_chunks(
+    corpus_path, count_tokens=None, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS
+):
+    """
+    load_corpus_chunks reads the chunks of a corpus file. The chunk boundaries stored in the file are used when they
+    were made with the same settings and tokenizer; otherwise the lectures are chunked again.
+
+    Args:
+    corpus_path (str): Path of the corpus file
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the tokenizer of the
+    embedding model.
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+
+    Returns:
+    List[Document]: The chunks, each lecture's chunks in order, with the lecture's path relative to the processed data
+    directory as their source, and their course and lecture in their metadata
+
+    Raises:
+    None
+
+    """
+
+    from langchain_core.documents import Document
+
+    count_tokens = count_tokens or get_token_counter(EMBEDDING_MODEL)
+    table = open_corpus(corpus_path)
+    stored = has_chunks(table, count_tokens, chunk_tokens, overlap_tokens)
+
+    columns = table.select(["course", "lecture", "course_title", "text", "chunk_starts", "chunk_ends"]).to_pydict()
+    chunks = []
+    for course, lecture, course_title, text, starts, ends in zip(*columns.values()):
+        metadata = {"source": get_lecture_source(course, lecture), "course": course, "lecture": lecture}
+        if course_title is not None:
+            metadata["course_title"] = course_title
+
+        if stored:
+            spans = zip(starts, ends)
+        else:
+            spans = [(start, end) for start, end, _ in chunk_spans(text, count_tokens, chunk_tokens, overlap_tokens)]
+        chunks.extend(Document(page_content=text[start:end], metadata=dict(metadata)) for start, end in spans)
+
+    return chunks
+
+
+def load_corpus_embeddings(
+    corpus_path, count_tokens=None, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS
+):
+    """
+    load_corpus_embeddings reads the embeddings stored in a corpus file by embed_corpus, without copying them.
+
+    Args:
+    corpus_path (str): Path of the corpus file
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the tokenizer of the
+    embedding model.
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+
+    Returns:
+    dict: The backend and model of the embedding function that made the embeddings, and the embeddings, one per row in
+    the order of load_corpus_chunks, or None if the file has no embeddings or its chunks were made with other settings
+
+    Raises:
+    None
+
+    """
+
+    count_tokens = count_tokens or get_token_counter(EMBEDDING_MODEL)
+    table = open_corpus(corpus_path)
+    if "chunk_embeddings" not in table.schema.names or not has_chunks(
+        table, count_tokens, chunk_tokens, overlap_tokens
+    ):
+        return None
+
+    vectors = table.column("chunk_embeddings").combine_chunks().flatten()
+    settings = get_corpus_settings(table)
+    return {
+        "backend": settings["embedding_backend"],
+        "model": settings["embedding_model"],
+        "embeddings": vectors.flatten().to_numpy().reshape(len(vectors), vectors.type.list_size),
+    }
+
+
+def embed_corpus(corpus_path, embedding_function, embedding_stage=None, checkpoint_path=None):
+    """
+    embed_corpus embeds the chunks of a corpus file and writes their embeddings into it, along with the signature of the
+    embedding function (see embeddings.get_embedding_signature). The chunks are embedded with the settings they were
+    made with.
+
+    Args:
+    corpus_path (str): Path of the corpus file
+    embedding_function (Embeddings): Embedding function for the chunks
+    embedding_stage (EmbeddingStage): Batching, parallelism and retries of the embeddings requests. Defaults to an
+    EmbeddingStage with its default settings.
+    checkpoint_path (str): Directory of the embedding stage's checkpoints, or None to not checkpoint
+
+    Returns:
+    dict: The throughput of the embedding stage, with no chunks embedded if the corpus has none
+
+    Raises:
+    Exception: The error of an embeddings request that failed after its retries
+
+    """
+
+    from verse.embedding_stage import EmbeddingStage
+    from verse.embeddings import get_embedding_signature
+
+    embedding_stage = embedding_stage or EmbeddingStage()
+    table = open_corpus(corpus_path)
+    if "chunk_embeddings" in table.schema.names:
+        table = table.drop_columns(["chunk_embeddings"])
+
+    columns = table.select(["text", "chunk_starts", "chunk_ends"]).to_pydict()
+    texts = [
+        text[start:end]
+        for text, starts, ends in zip(columns["text"], columns["chunk_starts"], columns["chunk_ends"])
+        for start, end in zip(starts, ends)
+    ]
+    # a corpus without chunks (ex. a course directory without transcripts) is left without embeddings
+    if not texts:
+        return dict(embedding_stage.stats)
+
+    embeddings = np.asarray(embedding_stage.embed(embedding_function, texts, checkpoint_path), dtype=np.float32)
+
+    # a list of fixed-size lists: the embeddings of a lecture's chunks, in the order of its chunk boundaries
+    chunk_counts = [len(starts) for starts in columns["chunk_starts"]]
+    offsets = pa.array(np.concatenate([[0], np.cumsum(chunk_counts)]), type=pa.int32())
+    vectors = pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), embeddings.shape[1])
+    table = table.append_column("chunk_embeddings", pa.ListArray.from_arrays(offsets, vectors))
+
+    signature = get_embedding_signature(embedding_function)
+    metadata = {
+        **table.schema.metadata,
+        b"embedding_backend": signature["backend"].encode(),
+        b"embedding_model": signature["model"].encode(),
+    }
+    write_table(corpus_path, table.replace_schema_metadata(metadata))
+    return dict(embedding_stage.stats)
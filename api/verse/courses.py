@@ -0,0 +1,80 @@
+GLOBAL_COLLECTION_NAME = "transcripts"
+
+# Maps each Yale Open Courses course number to its title, professor, and the location of its transcripts in the raw zip file
+COURSES = {
+    220: {
+        "title": "Milton",
+        "professor": "Professor John Rogers",
+        "transcripts_path": "Milton/content/transcripts",
+    },
+    291: {
+        "title": "The American Novel Since 1945",
+        "professor": "Professor Amy Hungerford",
+        "transcripts_path": "ENGL291 with 2012 Watermark/content/transcripts",
+    },
+    300: {
+        "title": "Introduction to Theory of Literature",
+        "professor": "Professor Paul Fry",
+        "transcripts_path": "ENGL300 with 2012 Watermark/content/transcripts",
+    },
+    310: {
+        "title": "Modern Poetry",
+        "professor": "Professor Langdon Hammer",
+        "transcripts_path": "ENGL310 with 2012 Watermark/content/transcripts",
+    },
+}
+
+# Alternate titles the clients send for a course
+COURSE_ALIASES = {
+    "Introduction to the Theory of Literature": 300,
+    "The Great American Novel Since 1945": 291,
+}
+
+
+def get_course_number(course):
+    """
+    get_course_number maps a course title (as sent by a client) to its course number.
+
+    Args:
+    course (str): Title of the course (ex. Modern Poetry)
+
+    Returns:
+    int: The course number, or None if the course is not known
+
+    Raises:
+    None
+
+    """
+
+    if not course:
+        return None
+
+    normalized_course = course.strip().lower()
+
+    for course_number, course_info in COURSES.items():
+        if course_info["title"].lower() == normalized_course:
+            return course_number
+
+    for alias, course_number in COURSE_ALIASES.items():
+        if alias.lower() == normalized_course:
+            return course_number
+
+    return None
+
+
+def get_course_collection_name(course_number):
+    """
+    get_course_collection_name returns the name of the Chroma collection that holds the chunks of a single course.
+
+    Args:
+    course_number (int): The course number (ex. 310)
+
+    Returns:
+    str: Name of the course's collection (ex. transcripts_310)
+
+    Raises:
+    None
+
+    """
+
+    return f"{GLOBAL_COLLECTION_NAME}_{course_number}"
@@ -1,10 +1,21 @@
-import re
+import argparse
 import os
+import posixpath
+import re
+import time
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from bs4 import BeautifulSoup
 
+from verse.courses import COURSES
+from verse.transcript_cleaner import DEFAULT_CLEANER
+
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
+TRANSCRIPT_PATTERN = re.compile(r"transcript\d+\.html", re.IGNORECASE)
+HTML_PARSERS = ("html.parser", "lxml")
+OUTPUT_FORMATS = ("text", "arrow")
+
 
 def unzip_file(zip_file_path, extracted_path):
     """
@@ -43,7 +54,26 @@ def convert_html_to_text(html_path):
 
     with open(html_path, "r", encoding="utf-8") as file:
         html_content = file.read()
-    soup = BeautifulSoup(html_content, "html.parser")
+    return convert_html_content_to_text(html_content)
+
+
+def convert_html_content_to_text(html_content, parser="html.parser"):
+    """
+    convert_html_content_to_text converts HTML content to plaintext.
+
+    Args:
+    html_content (str): The HTML content
+    parser (str): BeautifulSoup parser backend, either "html.parser" (pure Python) or the faster "lxml"
+
+    Returns:
+    str: Plaintext of the content
+
+    Raises:
+    None
+
+    """
+
+    soup = BeautifulSoup(html_content, parser)
     return soup.get_text()
 
 
@@ -73,7 +103,8 @@ def extract_transcript_number(transcript_filename):
 def get_cleaned_transcript_text(transcript_text):
     """
     get_cleaned_transcript_text takes in the text representation of a lecture and does some basic data cleaning
-    to obtain the text in a processed format.
+    to obtain the text in a processed format. The removal rules (dates, page furniture, lecture headings, and the title
+    and professor of every course in verse.courses.COURSES) are applied in a single precompiled pass.
 
     Args:
     transcript_text (str): The text representation of a lecture (i.e., a transcript)
@@ -86,35 +117,7 @@ def get_cleaned_transcript_text(transcript_text):
 
     """
 
-    # Remove dates and references to HTML
-    date_pattern = re.compile(
-        r"January|February|March|April|May|June|July|August|September|October|November|December"
-    )
-    transcript_text = re.sub(date_pattern, "", transcript_text)
-    transcript_text = (
-        transcript_text.replace("<< back", "")
-        .replace("[end of transcript]", "")
-        .replace("back to top", "")
-    )
-    transcript_text = re.sub(r"Lecture \d+ Transcript", "", transcript_text)
-
-    # Remove course titles and professor names
-    courses_to_professors = {
-        "The American Novel Since 1945": "Professor Amy Hungerford",
-        "Introduction to Theory of Literature": "Professor Paul Fry",
-        "Modern Poetry": "Professor Langdon Hammer",
-        "Milton": "Professor John Rogers",
-    }
-
-    for course in courses_to_professors:
-        transcript_text = transcript_text.replace(course, "")
-        transcript_text = transcript_text.replace(courses_to_professors[course], "")
-
-    # Remove all non-alphabetized text before and after the lecture contents
-    transcript_text = re.sub(r"^[^a-zA-Z]+", "", transcript_text)
-    transcript_text = transcript_text.strip()
-
-    return transcript_text
+    return DEFAULT_CLEANER.clean(transcript_text)
 
 
 def process_course(course_num):
@@ -138,10 +141,7 @@ def process_course(course_num):
     zipfile_path = os.path.join(BASEDIR, f"data/raw/engl{course_num}.zip")
     extracted_path = os.path.join(BASEDIR, f"data/extracted/engl{course_num}")
 
-    if course_num == 220:
-        extracted_transcripts_path = os.path.join(BASEDIR, "data/extracted/engl220/Milton/content/transcripts")
-    else:
-        extracted_transcripts_path = os.path.join(BASEDIR, f"data/extracted/engl{course_num}/ENGL{course_num} with 2012 Watermark/content/transcripts")
+    extracted_transcripts_path = os.path.join(extracted_path, COURSES[course_num]["transcripts_path"])
 
     # Unzip file contents into processed data directory
     unzip_file(zipfile_path, extracted_path)
@@ -151,9 +151,8 @@ def process_course(course_num):
 
     for file in os.listdir(extracted_transcripts_path):
         file_path = os.path.join(extracted_transcripts_path, file)
-        transcript_pattern = re.compile(r"transcript\d+\.html", re.IGNORECASE)
 
-        if os.path.isfile(file_path) and re.search(transcript_pattern, file):
+        if os.path.isfile(file_path) and re.search(TRANSCRIPT_PATTERN, file):
             transcript_number = extract_transcript_number(file)
             transcript_text = convert_html_to_text(file_path)
             cleaned_transcript_text = get_cleaned_transcript_text(transcript_text)
@@ -162,21 +161,240 @@ def process_course(course_num):
     return lecture_transcripts_map
 
 
+def iter_transcript_members(zipfile_path, transcripts_path):
+    """
+    iter_transcript_members reads the transcripts of a course straight from its raw zip file, without extracting the
+    archive to disk.
+
+    Args:
+    zipfile_path (str): Path of the course's raw zip file
+    transcripts_path (str): Directory of the transcripts inside the zip file
+
+    Yields:
+    Tuple[str, str]: The filename of each transcript (ex. transcript01.html) and its HTML content
+
+    Raises:
+    None
+
+    """
+
+    with zipfile.ZipFile(zipfile_path, "r") as zip_ref:
+        for member in zip_ref.infolist():
+            directory, filename = posixpath.split(member.filename)
+            if directory != transcripts_path or not re.search(TRANSCRIPT_PATTERN, filename):
+                continue
+
+            # match the newline translation of reading an extracted file in text mode
+            html_content = zip_ref.read(member).decode("utf-8")
+            yield filename, html_content.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def process_transcript(course_num, filename, html_content, parser="html.parser"):
+    """
+    process_transcript parses and cleans a single transcript. It runs in the worker processes of process_courses.
+
+    Args:
+    course_num (int): The course number the transcript belongs to
+    filename (str): Filename of the transcript (ex. transcript01.html)
+    html_content (str): HTML content of the transcript
+    parser (str): BeautifulSoup parser backend
+
+    Returns:
+    Tuple[int, int, str, float]: The course number, the lecture number, the cleaned transcript, and the seconds spent
+    parsing and cleaning
+
+    Raises:
+    None
+
+    """
+
+    start = time.perf_counter()
+    transcript_text = convert_html_content_to_text(html_content, parser)
+    cleaned_transcript_text = get_cleaned_transcript_text(transcript_text)
+    return (
+        course_num,
+        extract_transcript_number(filename),
+        cleaned_transcript_text,
+        time.perf_counter() - start,
+    )
+
+
+def process_courses(
+    course_numbers, processed_data_path=None, workers=None, parser="html.parser", output_format="text"
+):
+    """
+    process_courses executes the data processing pipeline for several courses at once. Transcripts are read straight
+    from the raw zip files, parsed and cleaned across a pool of worker processes, and each cleaned transcript is written
+    to ./data/processed/<course>/lecture<N>.txt as soon as its worker finishes, in the order they finish. At most twice as
+    many transcripts as workers are in flight, so reading waits for the oldest of them to be written instead of queueing
+    every transcript first. Courses whose zip file is missing are skipped.
+
+    With the "arrow" output format, the cleaned transcripts are instead written together to a single Arrow IPC file,
+    ./data/processed/corpus.arrow, along with their chunk boundaries (see corpus.py), once every worker has finished.
+    vector_database.py reads the corpus file in place of the .txt files when it exists, so writing .txt files removes
+    it.
+
+    Args:
+    course_numbers (List[int]): The course numbers to process
+    processed_data_path (str): Directory the cleaned transcripts are written to. Defaults to ./data/processed.
+    workers (int): Number of worker processes. Defaults to the number of CPUs.
+    parser (str): BeautifulSoup parser backend, either "html.parser" or "lxml"
+    output_format (str): "text" for one .txt file per lecture, or "arrow" for a single corpus file
+
+    Returns:
+    dict: Throughput of each stage (read, parse, write): the number of transcripts, the megabytes handled, the seconds
+    spent, and the transcripts per second, along with the total wall-clock seconds, any skipped courses, and with the
+    "arrow" output format, the number of lectures and chunks and the size of the corpus file
+
+    Raises:
+    ValueError: If the parser or the output format is not supported
+
+    """
+
+    if parser not in HTML_PARSERS:
+        raise ValueError(
+            {"error": "PROCESSING_ERROR", "message": f"Unsupported parser {parser}."}
+        )
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            {"error": "PROCESSING_ERROR", "message": f"Unsupported output format {output_format}."}
+        )
+
+    processed_data_path = processed_data_path or os.path.join(BASEDIR, "data/processed")
+    start = time.perf_counter()
+
+    stats = {
+        stage: {"transcripts": 0, "megabytes": 0.0, "seconds": 0.0}
+        for stage in ("read", "parse", "write")
+    }
+    stats["skipped_courses"] = []
+    transcripts = []
+    os.makedirs(processed_data_path, exist_ok=True)
+
+    def write_transcript(future):
+        course_num, lecture_number, transcript, parse_seconds = future.result()
+        stats["parse"]["transcripts"] += 1
+        stats["parse"]["seconds"] += parse_seconds
+
+        write_start = time.perf_counter()
+        if output_format == "text":
+            transcript_path = os.path.join(processed_data_path, str(course_num), f"lecture{lecture_number}.txt")
+            with open(transcript_path, "w", encoding="utf-8") as file:
+                file.write(transcript)
+        else:
+            transcripts.append((course_num, lecture_number, transcript))
+        stats["write"]["transcripts"] += 1
+        stats["write"]["megabytes"] += len(transcript.encode("utf-8")) / 1e6
+        stats["write"]["seconds"] += time.perf_counter() - write_start
+
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+
+        for course_num in course_numbers:
+            zipfile_path = os.path.join(BASEDIR, f"data/raw/engl{course_num}.zip")
+            if not os.path.exists(zipfile_path):
+                stats["skipped_courses"].append(course_num)
+                continue
+
+            if output_format == "text":
+                os.makedirs(os.path.join(processed_data_path, str(course_num)), exist_ok=True)
+
+            members = iter_transcript_members(zipfile_path, COURSES[course_num]["transcripts_path"])
+            while True:
+                read_start = time.perf_counter()
+                member = next(members, None)
+                stats["read"]["seconds"] += time.perf_counter() - read_start
+                if member is None:
+                    break
+
+                filename, html_content = member
+                stats["read"]["transcripts"] += 1
+                stats["read"]["megabytes"] += len(html_content.encode("utf-8")) / 1e6
+                in_flight.add(executor.submit(process_transcript, course_num, filename, html_content, parser))
+
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write_transcript(future)
+
+        for future in as_completed(in_flight):
+            write_transcript(future)
+
+    from verse.corpus import CORPUS_FILENAME, write_corpus
+
+    write_start = time.perf_counter()
+    corpus_path = os.path.join(processed_data_path, CORPUS_FILENAME)
+    if output_format == "arrow":
+        stats["corpus"] = write_corpus(corpus_path, transcripts)
+    elif os.path.exists(corpus_path):
+        os.remove(corpus_path)
+    stats["write"]["seconds"] += time.perf_counter() - write_start
+
+    stats["parse"]["megabytes"] = stats["read"]["megabytes"]
+    for stage in ("read", "parse", "write"):
+        seconds = stats[stage]["seconds"]
+        stats[stage]["transcripts_per_second"] = stats[stage]["transcripts"] / seconds if seconds else 0.0
+    stats["seconds"] = time.perf_counter() - start
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract and clean the lecture transcripts in ./data/raw into ./data/processed."
+    )
+    parser.add_argument("--courses", type=int, nargs="+", default=list(COURSES))
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--parser", choices=HTML_PARSERS, default="html.parser")
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="text",
+        help="One .txt file per lecture, or a single Arrow corpus file with the chunk boundaries (default: text)",
+    )
+    parser.add_argument(
+        "--embed",
+        action="store_true",
+        help="Store the embeddings of the chunks in the corpus file, with the EMBEDDING_BACKEND embedding function",
+    )
+    args = parser.parse_args()
+    if args.embed and args.format != "arrow":
+        parser.error("--embed requires --format arrow")
+
+    stats = process_courses(args.courses, workers=args.workers, parser=args.parser, output_format=args.format)
+
+    for course_num in stats["skipped_courses"]:
+        print(f"Skipped course {course_num}: data/raw/engl{course_num}.zip not found.")
+    for stage in ("read", "parse", "write"):
+        stage_stats = stats[stage]
+        print(
+            f"{stage:<6} {stage_stats['transcripts']:>4} transcripts  {stage_stats['megabytes']:>7.2f} MB  "
+            f"{stage_stats['seconds']:>7.2f}s  {stage_stats['transcripts_per_second']:>8.1f} transcripts/s"
+        )
+    print(f"Processed {stats['write']['transcripts']} transcripts in {stats['seconds']:.2f}s.")
+    if "corpus" in stats:
+        print(
+            f"Corpus: {stats['corpus']['lectures']} lectures, {stats['corpus']['chunks']} chunks, "
+            f"{stats['corpus']['bytes'] / 1e6:.2f} MB."
+        )
+
+    if args.embed:
+        from verse.corpus import CORPUS_FILENAME, embed_corpus
+        from verse.embeddings import LOCAL_EMBEDDING_MODEL, get_embedding_function
+
+        embedding_stats = embed_corpus(
+            os.path.join(BASEDIR, "data/processed", CORPUS_FILENAME),
+            get_embedding_function(
+                backend=os.environ.get("EMBEDDING_BACKEND", "openai"),
+                local_model=os.environ.get("EMBEDDING_LOCAL_MODEL", LOCAL_EMBEDDING_MODEL),
+            ),
+        )
+        print(
+            f"Embedded {embedding_stats['chunks']} chunks at {embedding_stats['chunks_per_second']:.1f} chunks/s."
+        )
+
+
 if __name__ == "__main__":
-    course_numbers = [220, 291, 300, 310]
-    
-    processed_data_path = os.path.join(BASEDIR, "data/processed")
-    if not os.path.exists(processed_data_path):
-        os.makedirs(processed_data_path)
-
-    for course_number in course_numbers:
-        result = process_course(course_number)
-        
-        processed_course_path = os.path.join(BASEDIR, f"data/processed/{course_number}")
-        if not os.path.exists(processed_course_path):
-            os.makedirs(processed_course_path)
-
-        for lecture_number, transcript in result.items():
-            transcript_path = os.path.join(processed_course_path, f"lecture{lecture_number}.txt")
-            with open(transcript_path, "w") as file:
-                file.write(transcript)
\ No newline at end of file
+    main()
@@ -0,0 +1,9 @@
+import os
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+# kept apart from embeddings.py so that the server can read its settings without importing the embedding clients
+EMBEDDING_BACKENDS = ("openai", "onnx")
+EMBEDDING_MODEL = "text-embedding-3-large"
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.path.join(BASEDIR, "embedding_cache.sqlite3")
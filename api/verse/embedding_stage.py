@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+
+from verse.embeddings import EMBEDDING_MODEL
+from verse.history import get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# status codes of requests worth retrying: timeouts, conflicts, rate limits, and server errors
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def get_status_code(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+
+def is_retryable(error):
+    """
+    is_retryable decides whether a failed embeddings request is worth retrying: rate limits, timeouts, server errors,
+    and lost connections are; invalid requests and authentication errors are not.
+
+    Args:
+    error (Exception): The error the request raised
+
+    Returns:
+    bool: True if the request should be retried
+
+    Raises:
+    None
+
+    """
+
+    if isinstance(error, openai.APIConnectionError):
+        return True
+
+    status_code = get_status_code(error)
+    return status_code is not None and (status_code in RETRYABLE_STATUS_CODES or status_code >= 500)
+
+
+def get_retry_after(error):
+    """
+    get_retry_after reads how long the server asked to wait before retrying, from the Retry-After headers of its
+    response.
+
+    Args:
+    error (Exception): The error the request raised
+
+    Returns:
+    float: Seconds to wait, or None if the response did not say
+
+    Raises:
+    None
+
+    """
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class EmbeddingStage:
+    """
+    EmbeddingStage embeds the chunks of an index build. Texts are sent in batches of at most batch_size texts and
+    max_batch_tokens tokens, by up to workers requests at once. A request that fails with a rate limit, a timeout, or a
+    server error is retried with exponential backoff (or after the delay the server asks for). A rate limit also pauses
+    every worker for that delay and halves the number of requests sent at once, which then grows back by one after as
+    many successful requests as are sent at once. Each embedded batch is checkpointed to disk, so a build that fails
+    halfway resumes from the batches it already embedded.
+
+    Args:
+    batch_size (int): Number of texts per request
+    max_batch_tokens (int): Number of tokens per request
+    workers (int): Number of requests sent at once
+    max_retries (int): Number of times a request is retried before the build fails
+    initial_backoff (float): Seconds to wait before the first retry, doubled for each retry
+    max_backoff (float): Maximum seconds to wait before a retry
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the tokenizer of the
+    embedding model.
+
+    """
+
+    def __init__(
+        self,
+        batch_size=256,
+        max_batch_tokens=100000,
+        workers=4,
+        max_retries=8,
+        initial_backoff=1.0,
+        max_backoff=60.0,
+        count_tokens=None,
+    ):
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.workers = workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.count_tokens = count_tokens
+
+        self._lock = threading.Lock()
+        self._request_slots = threading.Condition(self._lock)
+        self._max_in_flight = workers
+        self._in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+
+        self.stats = {
+            "chunks": 0,
+            "tokens": 0,
+            "batches": 0,
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "resumed_chunks": 0,
+            "seconds": 0.0,
+            "chunks_per_second": 0.0,
+            "tokens_per_second": 0.0,
+        }
+
+    def make_batches(self, texts, token_counts):
+        """
+        make_batches splits texts into consecutive batches of at most batch_size texts and max_batch_tokens tokens. A text
+        longer than max_batch_tokens is sent alone.
+
+        Args:
+        texts (List[str]): The texts to embed
+        token_counts (List[int]): Number of tokens of each text
+
+        Returns:
+        List[Tuple[int, int]]: The start and end index of each batch
+
+        Raises:
+        None
+
+        """
+
+        batches = []
+        start, batch_tokens = 0, 0
+        for index, tokens in enumerate(token_counts):
+            if index > start and (
+                index - start >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append((start, index))
+                start, batch_tokens = index, 0
+            batch_tokens += tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _acquire_request_slot(self):
+        # waits until fewer than _max_in_flight requests are in flight and no rate limit pause is running
+        with self._request_slots:
+            while True:
+                delay = self._resume_at - time.monotonic()
+                if delay <= 0 and self._in_flight < self._max_in_flight:
+                    self._in_flight += 1
+                    self.stats["requests"] += 1
+                    return
+                self._request_slots.wait(delay if delay > 0 else None)
+
+    def _release_request_slot(self, outcome, delay=0.0):
+        # outcome is "success", "rate_limited" (paused for delay seconds), or "error"
+        with self._request_slots:
+            self._in_flight -= 1
+            if outcome == "rate_limited":
+                self._max_in_flight = max(1, self._max_in_flight // 2)
+                self._successes = 0
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            elif outcome == "success":
+                self._successes += 1
+                if self._successes >= self._max_in_flight and self._max_in_flight < self.workers:
+                    self._max_in_flight += 1
+                    self._successes = 0
+            self._request_slots.notify_all()
+
+    def _embed_batch(self, embedding_function, texts):
+        for attempt in range(self.max_retries + 1):
+            self._acquire_request_slot()
+            try:
+                vectors = embedding_function.embed_documents(texts)
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    self._release_request_slot("error")
+                    raise
+
+                backoff = min(self.max_backoff, self.initial_backoff * 2**attempt)
+                # jitter spreads the retries of the workers that failed together
+                delay = max(get_retry_after(error) or 0.0, backoff * random.uniform(0.5, 1.0))
+                rate_limited = get_status_code(error) == 429
+                with self._lock:
+                    self.stats["retries"] += 1
+                    self.stats["rate_limited"] += rate_limited
+                self._release_request_slot("rate_limited" if rate_limited else "error", delay)
+
+                logger.warning("Embeddings request failed (%s), retrying in %.1f seconds", error, delay)
+                time.sleep(delay)
+            else:
+                self._release_request_slot("success")
+                return vectors
+
+    def embed(self, embedding_function, texts, checkpoint_path=None):
+        """
+        embed embeds texts in batches, resuming from the batches checkpointed in checkpoint_path by an earlier attempt.
+
+        Args:
+        embedding_function (Embeddings): The embedding function
+        texts (List[str]): The texts to embed
+        checkpoint_path (str): Directory of the checkpoints, or None to not checkpoint
+
+        Returns:
+        List[List[float]]: One embedding per text
+
+        Raises:
+        Exception: The error of a request that cannot be retried, or that still fails after max_retries retries
+
+        """
+
+        start_time = time.perf_counter()
+        if self.count_tokens is None:
+            self.count_tokens = get_token_counter(EMBEDDING_MODEL)
+
+        token_counts = [self.count_tokens(text) for text in texts]
+        batches = self.make_batches(texts, token_counts)
+        model = getattr(embedding_function, "model", type(embedding_function).__name__)
+        if checkpoint_path:
+            os.makedirs(checkpoint_path, exist_ok=True)
+
+        def embed_batch(batch):
+            start, end = batch
+            batch_texts = texts[start:end]
+
+            checkpoint = None
+            if checkpoint_path:
+                key = hashlib.sha256("\0".join([model, *batch_texts]).encode("utf-8")).hexdigest()
+                checkpoint = os.path.join(checkpoint_path, f"{key}.npy")
+                if os.path.exists(checkpoint):
+                    with self._lock:
+                        self.stats["resumed_chunks"] += len(batch_texts)
+                    return np.load(checkpoint).tolist()
+
+            vectors = self._embed_batch(embedding_function, batch_texts)
+            if checkpoint:
+                # written under a temporary name, so that a crash never leaves a partial checkpoint
+                np.save(f"{checkpoint}.tmp.npy", np.asarray(vectors, dtype=np.float32))
+                os.replace(f"{checkpoint}.tmp.npy", checkpoint)
+
+            with self._lock:
+                self.stats["tokens"] += sum(token_counts[start:end])
+                self.stats["chunks"] += len(batch_texts)
+            return vectors
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            embeddings = [vector for vectors in executor.map(embed_batch, batches) for vector in vectors]
+
+        seconds = time.perf_counter() - start_time
+        with self._lock:
+            self.stats["batches"] += len(batches)
+            self.stats["seconds"] += seconds
+            if self.stats["seconds"]:
+                self.stats["chunks_per_second"] = self.stats["chunks"] / self.stats["seconds"]
+                self.stats["tokens_per_second"] = self.stats["tokens"] / self.stats["seconds"]
+
+        return embeddings
@@ -0,0 +1,455 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from cachetools import LRUCache
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from verse.embedding_defaults import (
+    EMBEDDING_BACKENDS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_MODEL,
+)
+
+# the number of positions of BERT-style sentence-embedding models (ex. all-MiniLM-L6-v2): their WordPiece tokenizers cut
+# a chunk of CHUNK_TOKENS (256) tokens of the OpenAI tokenizer into more tokens than that, which must not be truncated
+ONNX_MAX_LENGTH = 512
+
+# ONNX models and their tokenizers, loaded once per process and shared by every OnnxEmbeddings
+_onnx_models = {}
+_onnx_models_lock = threading.Lock()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    CachedEmbeddings wraps an embedding function with a two-level cache keyed by the model name and a hash of the text: an
+    in-memory LRU in front of a disk-backed sqlite3 store shared by every process. The disk store is bounded; once it holds
+    more than max_disk_entries vectors, the least recently used ones are evicted. A disk hit only writes its new last-used
+    time back if the stored one is more than last_used_resolution seconds old, so that hot vectors are not written on
+    every read. The in-memory LRU has its own lock, so memory hits never wait on sqlite.
+
+    Args:
+    embeddings (Embeddings): The embedding function to cache
+    model (str): Name of the embedding model, part of every cache key
+    cache_path (str): Path of the sqlite3 cache file, or None to only cache in memory
+    memory_cache_size (int): Number of vectors kept in the in-memory LRU
+    max_disk_entries (int): Number of vectors kept on disk
+    backend (str): Embedding backend of the wrapped embedding function, "openai" or "onnx"
+    last_used_resolution (float): Seconds a vector's last-used time on disk may lag behind its last read
+
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        model,
+        cache_path=EMBEDDING_CACHE_PATH,
+        memory_cache_size=1024,
+        max_disk_entries=100000,
+        backend="openai",
+        last_used_resolution=3600,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.backend = backend
+        self.cache_path = cache_path
+        self.max_disk_entries = max_disk_entries
+        self.last_used_resolution = last_used_resolution
+
+        self._memory_cache = LRUCache(maxsize=memory_cache_size)
+        # the memory lock guards the LRU and the stats; the disk lock guards the sqlite3 connection
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._connection = None
+
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _get_connection(self):
+        if self._connection is None and self.cache_path:
+            self._connection = sqlite3.connect(
+                self.cache_path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+        return self._connection
+
+    def get_cache_key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _read_disk(self, keys):
+        if not self.cache_path or not keys:
+            return {}
+
+        vectors = {}
+        stale_keys = []
+        now = time.time()
+        with self._disk_lock:
+            connection = self._get_connection()
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = connection.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector, last_used in rows:
+                    vectors[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+                    if now - last_used > self.last_used_resolution:
+                        stale_keys.append(key)
+
+            # eviction only needs a coarse order, so recently refreshed vectors are not written again
+            if stale_keys:
+                with connection:
+                    connection.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in stale_keys]
+                    )
+        return vectors
+
+    def _write_disk(self, vectors):
+        if not self.cache_path or not vectors:
+            return 0
+
+        now = time.time()
+        evicted = 0
+        with self._disk_lock, self._get_connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in vectors.items()
+                ],
+            )
+
+            # evict a tenth of the store at a time so that eviction is not paid on every write
+            (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_disk_entries:
+                evicted = count - self.max_disk_entries + self.max_disk_entries // 10
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (evicted,),
+                )
+        return evicted
+
+    def embed_documents(self, texts):
+        """
+        embed_documents embeds a list of texts, only calling the wrapped embedding function for texts that are in neither
+        cache.
+
+        Args:
+        texts (List[str]): The texts to embed
+
+        Returns:
+        List[List[float]]: One embedding per text
+
+        Raises:
+        None
+
+        """
+
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            self._store_missing(vectors, missing, self.embeddings.embed_documents(list(missing.values())))
+        return self._remember(keys, vectors)
+
+    async def aembed_documents(self, texts):
+        """
+        aembed_documents embeds a list of texts like embed_documents, awaiting the wrapped embedding function's async
+        client for the texts that are in neither cache. Cache lookups and writes run on a worker thread, so that a slow
+        disk never blocks the event loop.
+
+        Args:
+        texts (List[str]): The texts to embed
+
+        Returns:
+        List[List[float]]: One embedding per text
+
+        Raises:
+        None
+
+        """
+
+        # the caches read and write sqlite3 under locks, so they run on a worker thread instead of the event loop
+        keys, vectors, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            embedded = await self.embeddings.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._store_missing, vectors, missing, embedded)
+        return self._remember(keys, vectors)
+
+    def _lookup(self, texts):
+        # returns the keys of texts, the vectors found in either cache, and the texts found in neither by key
+        keys = [self.get_cache_key(text) for text in texts]
+        vectors = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory_cache:
+                    vectors[key] = self._memory_cache[key]
+            self.stats["memory_hits"] += len(vectors)
+
+        disk_vectors = self._read_disk([key for key in set(keys) if key not in vectors])
+        vectors.update(disk_vectors)
+        with self._lock:
+            self.stats["disk_hits"] += len(disk_vectors)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+        return keys, vectors, missing
+
+    def _store_missing(self, vectors, missing, embedded):
+        new_vectors = dict(zip(missing.keys(), embedded))
+        vectors.update(new_vectors)
+
+        evicted = self._write_disk(new_vectors)
+        with self._lock:
+            self.stats["misses"] += len(missing)
+            self.stats["evictions"] += evicted
+
+    def _remember(self, keys, vectors):
+        with self._lock:
+            for key in set(keys):
+                self._memory_cache[key] = vectors[key]
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        """
+        embed_query embeds a query, sharing the cache with embed_documents.
+
+        Args:
+        text (str): The query to embed
+
+        Returns:
+        List[float]: The embedding of the query
+
+        Raises:
+        None
+
+        """
+
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        """
+        aembed_query embeds a query like embed_query, without blocking the event loop on the embedding API or the cache.
+
+        Args:
+        text (str): The query to embed
+
+        Returns:
+        List[float]: The embedding of the query
+
+        Raises:
+        None
+
+        """
+
+        return (await self.aembed_documents([text]))[0]
+
+
+def load_onnx_model(model, threads=0, max_length=ONNX_MAX_LENGTH):
+    """
+    load_onnx_model loads an ONNX sentence-embedding model and its tokenizer, once per process.
+
+    Args:
+    model (str): Directory holding model.onnx (or onnx/model.onnx) and tokenizer.json, or the Hugging Face repository to
+    download them from
+    threads (int): Number of threads onnxruntime uses for one inference, or 0 for its default
+    max_length (int): Number of tokens of a text the model sees; longer texts are truncated
+
+    Returns:
+    Tuple[InferenceSession, Tokenizer]: The inference session and the tokenizer
+
+    Raises:
+    None
+
+    """
+
+    key = (model, threads, max_length)
+    with _onnx_models_lock:
+        if key not in _onnx_models:
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            if os.path.isdir(model):
+                model_path = os.path.join(model, "model.onnx")
+                if not os.path.exists(model_path):
+                    model_path = os.path.join(model, "onnx", "model.onnx")
+                tokenizer_path = os.path.join(model, "tokenizer.json")
+            else:
+                from huggingface_hub import hf_hub_download
+
+                model_path = hf_hub_download(model, "onnx/model.onnx")
+                tokenizer_path = hf_hub_download(model, "tokenizer.json")
+
+            tokenizer = Tokenizer.from_file(tokenizer_path)
+            tokenizer.enable_truncation(max_length)
+            padding = tokenizer.padding or {}
+            tokenizer.enable_padding(
+                pad_id=padding.get("pad_id", tokenizer.token_to_id("[PAD]") or 0),
+                pad_token=padding.get("pad_token", "[PAD]"),
+            )
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            session = onnxruntime.InferenceSession(
+                model_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            _onnx_models[key] = (session, tokenizer)
+
+        return _onnx_models[key]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    OnnxEmbeddings embeds texts on the CPU with a local sentence-embedding model exported to ONNX, such as
+    sentence-transformers/all-MiniLM-L6-v2, so that neither indexing nor queries call an embeddings API. Texts are sorted
+    by length and embedded in batches, so that little of each batch is padding; the embeddings of their tokens are
+    averaged and normalized.
+
+    Args:
+    model (str): Directory of the ONNX model and its tokenizer, or the Hugging Face repository to download them from
+    batch_size (int): Number of texts per inference
+    threads (int): Number of threads onnxruntime uses for one inference, or 0 for its default
+    max_length (int): Number of tokens of a text the model sees; longer texts are truncated
+
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model=LOCAL_EMBEDDING_MODEL, batch_size=32, threads=0, max_length=ONNX_MAX_LENGTH):
+        self.model = model
+        self.batch_size = batch_size
+        self.session, self.tokenizer = load_onnx_model(model, threads, max_length)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+
+        outputs = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        if outputs.ndim == 3:
+            # mean of the token embeddings, without padding
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            outputs = (outputs * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+
+        norms = np.linalg.norm(outputs, axis=1, keepdims=True)
+        return outputs / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts):
+        """
+        embed_documents embeds a list of texts in batches of batch_size texts.
+
+        Args:
+        texts (List[str]): The texts to embed
+
+        Returns:
+        List[List[float]]: One embedding per text
+
+        Raises:
+        None
+
+        """
+
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            for index, vector in zip(batch, self._embed_batch([texts[index] for index in batch])):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def get_embedding_signature(embedding_function):
+    """
+    get_embedding_signature describes the backend and model of an embedding function. Embeddings are only comparable to
+    embeddings with the same signature. Embedding functions created elsewhere than get_embedding_function have the
+    "custom" backend.
+
+    Args:
+    embedding_function (Embeddings): The embedding function
+
+    Returns:
+    dict: The backend and the model of the embedding function
+
+    Raises:
+    None
+
+    """
+
+    return {
+        "backend": getattr(embedding_function, "backend", "custom"),
+        "model": getattr(embedding_function, "model", type(embedding_function).__name__),
+    }
+
+
+def get_embedding_function(
+    openai_api_key=None,
+    model=EMBEDDING_MODEL,
+    cache_path=EMBEDDING_CACHE_PATH,
+    memory_cache_size=1024,
+    max_disk_entries=100000,
+    backend="openai",
+    local_model=LOCAL_EMBEDDING_MODEL,
+    batch_size=32,
+    threads=0,
+):
+    """
+    get_embedding_function creates the embedding function shared by the indexing (vector_database.py) and query
+    (retriever_pool.py) paths: OpenAI embeddings, or a local ONNX model, behind a persistent embedding cache.
+
+    Args:
+    openai_api_key (str): OpenAI API key. Defaults to the OPENAI_API_KEY environment variable.
+    model (str): Name of the OpenAI embedding model
+    cache_path (str): Path of the sqlite3 cache file, or None to only cache in memory
+    memory_cache_size (int): Number of vectors kept in the in-memory LRU
+    max_disk_entries (int): Number of vectors kept on disk
+    backend (str): "openai" or "onnx"
+    local_model (str): Directory or Hugging Face repository of the ONNX model, for the "onnx" backend
+    batch_size (int): Number of texts per inference, for the "onnx" backend
+    threads (int): Number of threads per inference, or 0 for onnxruntime's default, for the "onnx" backend
+
+    Returns:
+    CachedEmbeddings: The cached embedding function
+
+    Raises:
+    ValueError: If backend is not a known embedding backend
+
+    """
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError({"error": "CONFIG_ERROR", "message": f"Unknown EMBEDDING_BACKEND {backend}."})
+
+    if backend == "onnx":
+        embeddings = OnnxEmbeddings(local_model, batch_size=batch_size, threads=threads)
+        model = local_model
+    else:
+        embeddings = OpenAIEmbeddings(model=model, openai_api_key=openai_api_key)
+
+    return CachedEmbeddings(
+        embeddings,
+        model,
+        cache_path=cache_path,
+        memory_cache_size=memory_cache_size,
+        max_disk_entries=max_disk_entries,
+        backend=backend,
+    )
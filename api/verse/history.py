@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import math
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from cachetools import TTLCache
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_MODEL = "gpt-3.5-turbo-1106"
+
+CompactedHistory = namedtuple(
+    "CompactedHistory", ["summary", "recent", "tokens", "uncompacted_tokens"]
+)
+
+# a compaction plan: the summary of turns[:boundary], and the turns to fold into it, turns[boundary:fold_to]
+_Plan = namedtuple(
+    "_Plan", ["counts", "digests", "boundary", "summary", "fold_to"]
+)
+
+
+def estimate_tokens(text):
+    """
+    estimate_tokens estimates the number of tokens of a text at four characters per token, for when the tokenizer's
+    encoding cannot be loaded.
+
+    Args:
+    text (str): The text
+
+    Returns:
+    int: The estimated number of tokens
+
+    Raises:
+    None
+
+    """
+
+    return math.ceil(len(text) / 4)
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model=TOKENIZER_MODEL):
+    """
+    get_token_counter returns a function that counts the tokens of a text with the tokenizer of a model. tiktoken
+    downloads the encoding on first use; if it cannot be loaded, token counts are estimated instead.
+
+    Args:
+    model (str): Name of the OpenAI model
+
+    Returns:
+    Callable[[str], int]: Function that counts the tokens of a text
+
+    Raises:
+    None
+
+    """
+
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as error:
+        logger.warning(
+            "Could not load the tokenizer of %s, estimating token counts instead: %s",
+            model,
+            error,
+        )
+        return estimate_tokens
+
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def format_history(compacted):
+    """
+    format_history renders a compacted history for a prompt: the summary of the earlier turns, then the recent turns
+    one per line.
+
+    Args:
+    compacted (CompactedHistory): The compacted history
+
+    Returns:
+    str: The history as it appears in the prompt
+
+    Raises:
+    None
+
+    """
+
+    lines = list(compacted.recent)
+    if compacted.summary:
+        lines.insert(0, f"(Summary of the earlier discussion: {compacted.summary})")
+    return "\n".join(lines)
+
+
+class HistoryCompactor:
+    """
+    HistoryCompactor keeps a conversation history within a token budget. The most recent turns are kept verbatim as long
+    as they fit in token_budget; once they do not, the oldest of them are folded into a rolling summary until the rest
+    fits in half the budget, so that the next few turns fit again without another summary. Summaries are stored by a
+    hash of the turns they cover, so that the next request of the same conversation only folds its new turns into the
+    summary it already has, instead of summarizing the whole conversation again.
+
+    Args:
+    token_budget (int): Number of tokens of verbatim turns per prompt section, or None to never compact
+    summary_token_budget (int): Number of tokens of the rolling summary
+    max_summaries (int): Number of summaries kept
+    ttl (float): Seconds a summary is kept
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the LLM's tokenizer.
+
+    """
+
+    def __init__(
+        self,
+        token_budget=1500,
+        summary_token_budget=300,
+        max_summaries=1024,
+        ttl=3600,
+        count_tokens=None,
+    ):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self._count_tokens = count_tokens
+
+        self._summaries = TTLCache(maxsize=max_summaries, ttl=ttl)
+        self._lock = threading.Lock()
+
+        self.stats = {"compactions": 0, "summaries": 0, "summary_hits": 0}
+
+    def count_tokens(self, text):
+        # the tokenizer is loaded on first use, so that creating the application does not download its encoding
+        if self._count_tokens is None:
+            self._count_tokens = get_token_counter()
+        return self._count_tokens(text)
+
+    def _get_prefix_digests(self, section, course, turns):
+        # digests[i] identifies turns[:i] of a conversation's section
+        digest = hashlib.sha256(f"{section}\0{course}\0".encode("utf-8"))
+        digests = [digest.hexdigest()]
+        for turn in turns:
+            digest.update(turn.encode("utf-8"))
+            digest.update(b"\0")
+            digests.append(digest.hexdigest())
+        return digests
+
+    def _plan(self, section, course, turns):
+        counts = [self.count_tokens(turn) for turn in turns]
+        if self.token_budget is None or sum(counts) <= self.token_budget:
+            return _Plan(counts, None, 0, "", 0)
+
+        digests = self._get_prefix_digests(section, course, turns)
+
+        # start from the longest prefix of the conversation that is already summarized
+        boundary, summary = 0, ""
+        with self._lock:
+            for prefix_length in range(len(turns) - 1, 0, -1):
+                if digests[prefix_length] in self._summaries:
+                    boundary = prefix_length
+                    summary = self._summaries[digests[prefix_length]]
+                    self.stats["summary_hits"] += 1
+                    break
+
+        fold_to = boundary
+        recent_tokens = sum(counts[boundary:])
+        if recent_tokens > self.token_budget:
+            # the last turn is always kept verbatim
+            while fold_to < len(turns) - 1 and recent_tokens > self.token_budget // 2:
+                recent_tokens -= counts[fold_to]
+                fold_to += 1
+
+        return _Plan(counts, digests, boundary, summary, fold_to)
+
+    def _truncate_summary(self, summary):
+        tokens = self.count_tokens(summary)
+        if tokens <= self.summary_token_budget:
+            return summary
+
+        # cut at the last sentence that fits, by the proportion of characters
+        summary = summary[: len(summary) * self.summary_token_budget // tokens]
+        last_period = summary.rfind(".")
+        return summary[: last_period + 1] if last_period > 0 else summary
+
+    def _finish(self, turns, plan, summary):
+        if plan.fold_to > plan.boundary:
+            summary = self._truncate_summary(summary.strip())
+            with self._lock:
+                self._summaries[plan.digests[plan.fold_to]] = summary
+                self.stats["summaries"] += 1
+
+        start = max(plan.boundary, plan.fold_to)
+        if start:
+            with self._lock:
+                self.stats["compactions"] += 1
+
+        recent = tuple(turns[start:])
+        tokens = sum(plan.counts[start:]) + (self.count_tokens(summary) if summary else 0)
+        return CompactedHistory(summary, recent, tokens, sum(plan.counts))
+
+    def compact(self, section, course, turns, summarize):
+        """
+        compact compacts the history of one prompt section.
+
+        Args:
+        section (str): Name of the prompt section (ex. previous_responses)
+        course (str): User's selected course
+        turns (Tuple[str]): The history, oldest turn first
+        summarize (Callable[[str, Tuple[str]], str]): Folds turns into a summary, given the summary so far
+
+        Returns:
+        CompactedHistory: The summary of the earlier turns, the recent turns, and the number of tokens of both, before
+        and after compaction
+
+        Raises:
+        Exception: Any error raised by summarize
+
+        """
+
+        turns = tuple(turns)
+        plan = self._plan(section, course, turns)
+
+        summary = plan.summary
+        if plan.fold_to > plan.boundary:
+            summary = summarize(summary, turns[plan.boundary : plan.fold_to])
+        return self._finish(turns, plan, summary)
+
+    async def acompact(self, section, course, turns, summarize):
+        """
+        acompact is the async counterpart of compact: summarize is a coroutine function.
+
+        Args:
+        section (str): Name of the prompt section (ex. previous_responses)
+        course (str): User's selected course
+        turns (Tuple[str]): The history, oldest turn first
+        summarize (Callable[[str, Tuple[str]], Awaitable[str]]): Folds turns into a summary, given the summary so far
+
+        Returns:
+        CompactedHistory: The summary of the earlier turns, the recent turns, and the number of tokens of both, before
+        and after compaction
+
+        Raises:
+        Exception: Any error raised by summarize
+
+        """
+
+        turns = tuple(turns)
+        plan = self._plan(section, course, turns)
+
+        summary = plan.summary
+        if plan.fold_to > plan.boundary:
+            summary = await summarize(summary, turns[plan.boundary : plan.fold_to])
+        return self._finish(turns, plan, summary)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+def get_history_compactor():
+    """
+    get_history_compactor returns the HistoryCompactor of the current Flask application, creating one if the application
+    was built without it.
+
+    Args:
+    None
+
+    Returns:
+    HistoryCompactor: The application's history compactor
+
+    Raises:
+    None
+
+    """
+
+    if "history_compactor" not in current_app.extensions:
+        current_app.extensions["history_compactor"] = HistoryCompactor()
+    return current_app.extensions["history_compactor"]
@@ -0,0 +1,286 @@
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+
+LEXICAL_INDEX_DIRNAME = "lexical"
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+# runs of capitalized words, the candidates for names of works and authors (ex. "Paradise Lost", "Toni Morrison")
+CAPITALIZED_WORD = r"[A-Z][a-z]*[A-Z]?[a-z]+"
+CAPITALIZED_RUN_PATTERN = re.compile(rf"{CAPITALIZED_WORD}(?:[ -]{CAPITALIZED_WORD})+")
+SENTENCE_ENDINGS = '.!?:"'
+
+STOPWORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from further had has have having he her here hers herself him
+    himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+    our ours ourselves out over own s same she should so some such t than that the their theirs them themselves then there
+    these they this those through to too under until up very was we were what when where which while who whom why will
+    with would you your yours yourself yourselves tell talk say said
+    """.split()
+)
+
+LexicalMatches = namedtuple("LexicalMatches", ["chunk_ids", "scores", "strong"])
+
+
+def tokenize(text):
+    """
+    tokenize splits a text into lowercase terms, without stopwords.
+
+    Args:
+    text (str): The text
+
+    Returns:
+    List[str]: The terms of the text, in order
+
+    Raises:
+    None
+
+    """
+
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def _starts_sentence(text, position):
+    position -= 1
+    while position >= 0 and text[position].isspace():
+        position -= 1
+    return position < 0 or text[position] in SENTENCE_ENDINGS
+
+
+def extract_entities(texts, min_count=3):
+    """
+    extract_entities finds the names of works and authors in a corpus: runs of two or three capitalized words (ex.
+    "Paradise Lost", "Wallace Stevens") that occur at least min_count times. A capitalized word that starts a sentence is
+    not counted as part of a name.
+
+    Args:
+    texts (Iterable[str]): The texts of the corpus
+    min_count (int): Number of occurrences for a run to count as a name
+
+    Returns:
+    List[str]: The names, lowercase with their words separated by single spaces
+
+    Raises:
+    None
+
+    """
+
+    counts = Counter()
+    for text in texts:
+        for match in CAPITALIZED_RUN_PATTERN.finditer(text):
+            words = re.split(r"[ -]", match.group())
+            if _starts_sentence(text, match.start()):
+                words = words[1:]
+
+            terms = [word.lower() for word in words]
+            if 2 <= len(terms) <= 3 and terms[0] not in STOPWORDS and terms[-1] not in STOPWORDS:
+                counts[" ".join(terms)] += 1
+
+    return sorted(entity for entity, count in counts.items() if count >= min_count)
+
+
+def build_lexical_index(path, chunk_ids, texts, courses, k1=1.2, b=0.75):
+    """
+    build_lexical_index writes a BM25 inverted index of chunks to a directory. Postings are stored as flat NumPy arrays
+    (the chunks and term frequencies of each term, one term after the other) that LexicalIndex memory-maps, so that
+    loading the index reads no more than the vocabulary.
+
+    Args:
+    path (str): Directory to write the index to; an existing index there is replaced
+    chunk_ids (List[str]): ID of each chunk, as stored in Chroma
+    texts (List[str]): Text of each chunk
+    courses (List[int]): Course number of each chunk, or 0 if it has none
+    k1 (float): BM25 term frequency saturation
+    b (float): BM25 document length normalization
+
+    Returns:
+    dict: The number of chunks, terms, and names of works and authors in the index
+
+    Raises:
+    None
+
+    """
+
+    postings = defaultdict(list)
+    lengths = np.zeros(len(texts), dtype=np.int32)
+
+    for document, text in enumerate(texts):
+        term_counts = Counter(tokenize(text))
+        lengths[document] = sum(term_counts.values())
+        for term, count in term_counts.items():
+            postings[term].append((document, count))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+
+    documents = np.empty(offsets[-1], dtype=np.int32)
+    frequencies = np.empty(offsets[-1], dtype=np.uint16)
+    for term_id, term in enumerate(terms):
+        term_documents, term_frequencies = zip(*postings[term])
+        documents[offsets[term_id] : offsets[term_id + 1]] = term_documents
+        frequencies[offsets[term_id] : offsets[term_id + 1]] = np.minimum(term_frequencies, 65535)
+
+    entities = extract_entities(texts)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "documents.npy"), documents)
+    np.save(os.path.join(path, "frequencies.npy"), frequencies)
+    np.save(os.path.join(path, "lengths.npy"), lengths)
+    np.save(os.path.join(path, "courses.npy"), np.asarray(courses, dtype=np.int32))
+    with open(os.path.join(path, "vocabulary.json"), "w") as file:
+        json.dump(
+            {"k1": k1, "b": b, "terms": terms, "chunk_ids": list(chunk_ids), "entities": entities},
+            file,
+        )
+
+    return {"chunks": len(texts), "terms": len(terms), "entities": len(entities)}
+
+
+class LexicalIndex:
+    """
+    LexicalIndex ranks chunks by BM25 against a query, from an index written by build_lexical_index. A query that names a
+    work or author of the corpus (ex. "Paradise Lost", "Toni Morrison") is a strong match when at least min_strong_chunks
+    chunks mention it; its results are then limited to those chunks, and the retriever can skip the embedding call.
+
+    Args:
+    path (str): Directory of the index
+
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "vocabulary.json"), "r") as file:
+            vocabulary = json.load(file)
+
+        self.k1 = vocabulary["k1"]
+        self.b = vocabulary["b"]
+        self.chunk_ids = vocabulary["chunk_ids"]
+        self.term_ids = {term: term_id for term_id, term in enumerate(vocabulary["terms"])}
+        self.entities = {tuple(entity.split()) for entity in vocabulary["entities"]}
+
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.documents = np.load(os.path.join(path, "documents.npy"), mmap_mode="r")
+        self.frequencies = np.load(os.path.join(path, "frequencies.npy"), mmap_mode="r")
+        self.courses = np.load(os.path.join(path, "courses.npy"), mmap_mode="r")
+
+        lengths = np.load(os.path.join(path, "lengths.npy"))
+        average_length = lengths.mean() if len(lengths) else 1.0
+        self._length_norms = (self.k1 * (1 - self.b + self.b * lengths / average_length)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def _postings(self, term_id):
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.documents[start:end], self.frequencies[start:end]
+
+    def find_entities(self, query):
+        """
+        find_entities returns the names of works and authors a query mentions, longest first.
+        """
+
+        words = TERM_PATTERN.findall(query.lower())
+        found = []
+        for size in (3, 2):
+            for start in range(len(words) - size + 1):
+                candidate = tuple(words[start : start + size])
+                if candidate in self.entities and not any(
+                    " ".join(candidate) in " ".join(entity) for entity in found
+                ):
+                    found.append(candidate)
+        return found
+
+    def _get_entity_mask(self, entity):
+        mask = np.ones(len(self), dtype=bool)
+        for term in entity:
+            term_mask = np.zeros(len(self), dtype=bool)
+            if term in self.term_ids:
+                term_mask[self._postings(self.term_ids[term])[0]] = True
+            mask &= term_mask
+        return mask
+
+    def search(self, query, k=20, course=None, min_strong_chunks=4):
+        """
+        search ranks the chunks of the index by BM25 against a query.
+
+        Args:
+        query (str): The query
+        k (int): Number of chunks to return
+        course (int): Only rank the chunks of this course, or None to rank every chunk
+        min_strong_chunks (int): Number of chunks that must mention a work or author the query names for a strong match
+
+        Returns:
+        LexicalMatches: The IDs and scores of the best chunks, best first, and whether the query is a strong match
+
+        Raises:
+        None
+
+        """
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+
+            documents, frequencies = self._postings(term_id)
+            frequencies = frequencies.astype(np.float32)
+            idf = math.log(1 + (len(self) - len(documents) + 0.5) / (len(documents) + 0.5))
+            scores[documents] += (
+                idf * frequencies * (self.k1 + 1) / (frequencies + self._length_norms[documents])
+            )
+
+        candidates = scores > 0
+        if course is not None:
+            candidates &= self.courses == course
+
+        strong = False
+        for entity in self.find_entities(query):
+            entity_candidates = candidates & self._get_entity_mask(entity)
+            if entity_candidates.sum() >= min_strong_chunks:
+                candidates, strong = entity_candidates, True
+                break
+
+        indices = np.flatnonzero(candidates)
+        if len(indices) > k:
+            indices = indices[np.argpartition(-scores[indices], k - 1)[:k]]
+        indices = indices[np.argsort(-scores[indices], kind="stable")]
+
+        return LexicalMatches(
+            [self.chunk_ids[index] for index in indices], scores[indices].tolist(), strong
+        )
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    reciprocal_rank_fusion merges rankings of the same items (ex. BM25 and dense retrieval) by summing 1 / (k + rank) over
+    the rankings each item appears in. Ranks are used instead of scores, since BM25 scores and embedding distances are
+    not on the same scale.
+
+    Args:
+    rankings (List[List[str]]): The rankings, best item first
+    k (int): Damping of the top ranks
+
+    Returns:
+    List[str]: Every item, best first
+
+    Raises:
+    None
+
+    """
+
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
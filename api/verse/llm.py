@@ -0,0 +1,55 @@
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+LLM_MODEL = "gpt-3.5-turbo-1106"
+LLM_TEMPERATURE = 0.9
+
+
+def create_llm(config):
+    """
+    create_llm creates the ChatOpenAI client that every request of the process shares. Its sync and async OpenAI
+    clients each keep a pool of keep-alive connections to the API, so that requests reuse open (and TLS-established)
+    connections instead of connecting again. The async pool belongs to the event loop of the async server.
+
+    Args:
+    config (dict): The application's configuration: OPENAI_API_KEY and OPENAI_API_BASE, the size of the connection pool
+    (LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY), the timeouts (LLM_TIMEOUT,
+    LLM_CONNECT_TIMEOUT) and LLM_MAX_RETRIES
+
+    Returns:
+    ChatOpenAI: The LLM
+
+    Raises:
+    None
+
+    """
+
+    limits = httpx.Limits(
+        max_connections=config.get("LLM_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=config.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 20),
+        keepalive_expiry=config.get("LLM_KEEPALIVE_EXPIRY", 30.0),
+    )
+    timeout = httpx.Timeout(config.get("LLM_TIMEOUT", 60.0), connect=config.get("LLM_CONNECT_TIMEOUT", 5.0))
+    client_params = {
+        "api_key": config["OPENAI_API_KEY"],
+        "base_url": config.get("OPENAI_API_BASE"),
+        "timeout": timeout,
+        "max_retries": config.get("LLM_MAX_RETRIES", 2),
+    }
+
+    return ChatOpenAI(
+        openai_api_key=config["OPENAI_API_KEY"],
+        openai_api_base=config.get("OPENAI_API_BASE"),
+        model_name=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        request_timeout=timeout,
+        max_retries=client_params["max_retries"],
+        client=openai.OpenAI(
+            http_client=httpx.Client(limits=limits, timeout=timeout), **client_params
+        ).chat.completions,
+        async_client=openai.AsyncOpenAI(
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout), **client_params
+        ).chat.completions,
+    )
+
@@ -0,0 +1,437 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, request
+
+from verse.timing import get_completion_tokens, get_prompt_tokens, get_timings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_metric_family(name, metric_type, documentation, samples):
+    """
+    format_metric_family formats a metric and its samples in the Prometheus text format.
+
+    Args:
+    name (str): Name of the metric (ex. verse_requests_total)
+    metric_type (str): Either "counter", "gauge" or "histogram"
+    documentation (str): Help text of the metric
+    samples (List[Tuple[str, dict, float]]): The name, labels and value of each sample
+
+    Returns:
+    List[str]: The lines of the metric family
+
+    Raises:
+    None
+
+    """
+
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+class Counter:
+    """
+    Counter is a Prometheus counter with labels, safe to increment from any thread.
+
+    Args:
+    name (str): Name of the metric
+    documentation (str): Help text of the metric
+    labelnames (Tuple[str]): Names of the labels of each sample
+
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def collect(self):
+        with self._lock:
+            samples = [
+                (self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in sorted(self._values.items())
+            ]
+        return format_metric_family(self.name, "counter", self.documentation, samples)
+
+
+class Histogram:
+    """
+    Histogram is a Prometheus histogram with labels, safe to observe from any thread.
+
+    Args:
+    name (str): Name of the metric
+    documentation (str): Help text of the metric
+    labelnames (Tuple[str]): Names of the labels of each sample
+    buckets (Tuple[float]): Upper bounds of the buckets, in increasing order
+
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # each label set maps to its count per bucket (the last one is +Inf), its sum, and its count
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            bucket_counts, _, _ = values = self._values[key]
+            bucket_counts[bisect_left(self.buckets, value)] += 1
+            values[1] += value
+            values[2] += 1
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                    cumulative += bucket_count
+                    samples.append(
+                        (f"{self.name}_bucket", {**labels, "le": _format_value(upper_bound)}, cumulative)
+                    )
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return format_metric_family(self.name, "histogram", self.documentation, samples)
+
+
+# the OpenAI client retries failed requests itself and only logs each retry, so retries are counted from its log
+LLM_RETRIES = Counter(
+    "verse_openai_retries_total", "Requests to the OpenAI API that were retried.", ()
+)
+
+# speculative segues whose answer turned out to end with a question; they are stopped, but the tokens already generated
+# are paid for
+DISCARDED_SEGUES = Counter(
+    "verse_discarded_segues_total", "Speculative segues stopped because the answer ended with a question.", ()
+)
+
+
+class _RetryLogHandler(logging.Handler):
+    def emit(self, record):
+        if record.getMessage().startswith("Retrying request"):
+            LLM_RETRIES.inc()
+
+
+_retry_log_handler = None
+_retry_log_handler_lock = threading.Lock()
+
+
+def count_openai_retries():
+    """
+    count_openai_retries counts the retries of the OpenAI client in LLM_RETRIES, once per process.
+    """
+
+    global _retry_log_handler
+
+    with _retry_log_handler_lock:
+        if _retry_log_handler is None:
+            _retry_log_handler = _RetryLogHandler()
+            logger = logging.getLogger("openai._base_client")
+            logger.addHandler(_retry_log_handler)
+            # retries are logged at INFO, which the logger drops unless logging was configured to be more verbose
+            if not logger.isEnabledFor(logging.INFO):
+                logger.setLevel(logging.INFO)
+
+
+class Metrics:
+    """
+    Metrics keeps the latency histograms and token counters of an application, and renders them with the counters of its
+    caches in the Prometheus text format. Request latency is recorded per route and status, stage latency per stage
+    recorded with timing.timed, and tokens per prompt section and per chain. Collectors add metrics read at scrape time
+    (ex. cache hits and misses).
+
+    Args:
+    buckets (Tuple[float]): Upper bounds of the latency histograms' buckets, in seconds
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.request_duration = Histogram(
+            "verse_request_duration_seconds",
+            "Duration of HTTP requests, including streamed responses.",
+            ("method", "route", "status"),
+            buckets,
+        )
+        self.stage_duration = Histogram(
+            "verse_stage_duration_seconds",
+            "Duration of each stage of a request (ex. embed_query, vector_search, answer, segue).",
+            ("stage",),
+            buckets,
+        )
+        self.prompt_tokens = Counter(
+            "verse_prompt_tokens_total", "Tokens of each section of the prompts sent to the LLM.", ("section",)
+        )
+        self.completion_tokens = Counter(
+            "verse_completion_tokens_total", "Tokens generated by each LLM chain.", ("chain",)
+        )
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """
+        add_collector adds metrics that are read when the metrics are rendered.
+
+        Args:
+        collector (Callable[[], List[Tuple[str, str, str, List[Tuple[dict, float]]]]]): Returns the name, type, help
+        text and samples (labels and value) of each metric
+
+        Returns:
+        None
+
+        Raises:
+        None
+
+        """
+
+        self._collectors.append(collector)
+
+    def observe_request(self, method, route, status, seconds):
+        self.request_duration.observe(seconds, method=method, route=route, status=status)
+
+    def observe_stages(self, timings, prompt_tokens, completion_tokens):
+        """
+        observe_stages records the stage timings and token counts of a request.
+
+        Args:
+        timings (dict[str:float]): Maps each stage name to its duration in seconds
+        prompt_tokens (dict[str:int]): Maps each prompt section to its number of tokens
+        completion_tokens (dict[str:int]): Maps each chain to the number of tokens it generated
+
+        Returns:
+        None
+
+        Raises:
+        None
+
+        """
+
+        for stage, seconds in timings.items():
+            self.stage_duration.observe(seconds, stage=stage)
+        for section, tokens in prompt_tokens.items():
+            self.prompt_tokens.inc(tokens, section=section)
+        for chain, tokens in completion_tokens.items():
+            self.completion_tokens.inc(tokens, chain=chain)
+
+    def render(self):
+        """
+        render formats every metric in the Prometheus text format.
+
+        Args:
+        None
+
+        Returns:
+        str: The metrics, as served by /metrics
+
+        Raises:
+        None
+
+        """
+
+        lines = []
+        for metric in (
+            self.request_duration,
+            self.stage_duration,
+            self.prompt_tokens,
+            self.completion_tokens,
+            LLM_RETRIES,
+            DISCARDED_SEGUES,
+        ):
+            lines.extend(metric.collect())
+
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.extend(
+                    format_metric_family(
+                        name,
+                        metric_type,
+                        documentation,
+                        [(name, labels, value) for labels, value in samples],
+                    )
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+def collect_app_stats(app):
+    """
+    collect_app_stats reads the counters of an application's retriever pool, caches and session store as metrics.
+
+    Args:
+    app (Flask): The Flask application
+
+    Returns:
+    List[Tuple[str, str, str, List[Tuple[dict, float]]]]: The name, type, help text and samples of each metric
+
+    Raises:
+    None
+
+    """
+
+    lookups = []
+    evictions = []
+    latency_saved = []
+
+    response_cache = app.extensions.get("response_cache")
+    if response_cache is not None:
+        for route_stats in response_cache.get_stats().values():
+            lookups.append(({"cache": "response", "result": "hit"}, route_stats["hits"]))
+            lookups.append(({"cache": "response", "result": "miss"}, route_stats["misses"]))
+            latency_saved.append(({"cache": "response"}, route_stats["latency_saved_seconds"]))
+
+    recommendation_store = app.extensions.get("recommendation_store")
+    if recommendation_store is not None:
+        stats = recommendation_store.get_stats()
+        lookups.append(({"cache": "recommendation", "result": "hit"}, stats["hits"]))
+        lookups.append(({"cache": "recommendation", "result": "miss"}, stats["misses"]))
+        latency_saved.append(({"cache": "recommendation"}, stats["latency_saved_seconds"]))
+
+    history_compactor = app.extensions.get("history_compactor")
+    if history_compactor is not None:
+        stats = history_compactor.get_stats()
+        lookups.append(({"cache": "history_summary", "result": "hit"}, stats["summary_hits"]))
+        lookups.append(({"cache": "history_summary", "result": "miss"}, stats["summaries"]))
+
+    session_store = app.extensions.get("session_store")
+    if session_store is not None:
+        stats = session_store.get_stats()
+        lookups.append(({"cache": "session", "result": "hit"}, stats["hits"]))
+        lookups.append(({"cache": "session", "result": "miss"}, stats["misses"]))
+        evictions.append(({"cache": "session"}, stats["evictions"] + stats["expirations"]))
+
+    metrics = []
+
+    retriever_pool = app.extensions.get("retriever_pool")
+    if retriever_pool is not None:
+        embedding_stats = getattr(retriever_pool.embedding_function, "stats", None)
+        if isinstance(embedding_stats, dict):
+            for stat, result in (("memory_hits", "memory_hit"), ("disk_hits", "disk_hit"), ("misses", "miss")):
+                lookups.append(({"cache": "embedding", "result": result}, embedding_stats[stat]))
+            evictions.append(({"cache": "embedding"}, embedding_stats["evictions"]))
+
+        metrics.extend(
+            [
+                (
+                    "verse_retriever_loads_total",
+                    "counter",
+                    "Vector stores opened by the retriever pool.",
+                    [({}, retriever_pool.stats["loads"])],
+                ),
+                (
+                    "verse_retriever_reloads_total",
+                    "counter",
+                    "Rebuilds of the index picked up by the retriever pool.",
+                    [({}, retriever_pool.stats["reloads"])],
+                ),
+                (
+                    "verse_retriever_load_seconds_total",
+                    "counter",
+                    "Seconds spent opening vector stores.",
+                    [({}, retriever_pool.stats["load_seconds"])],
+                ),
+            ]
+        )
+
+    metrics.extend(
+        [
+            ("verse_cache_lookups_total", "counter", "Cache lookups by cache and result.", lookups),
+            ("verse_cache_evictions_total", "counter", "Entries evicted or expired by cache.", evictions),
+            (
+                "verse_cache_latency_saved_seconds_total",
+                "counter",
+                "LLM latency saved by cache hits, in seconds.",
+                latency_saved,
+            ),
+        ]
+    )
+    return metrics
+
+
+def init_metrics(app):
+    """
+    init_metrics records the latency of every request and the stage timings and token counts of every application
+    context, and registers the application's Metrics under app.extensions.
+
+    Args:
+    app (Flask): The Flask application
+
+    Returns:
+    Metrics: The application's metrics
+
+    Raises:
+    None
+
+    """
+
+    metrics = Metrics()
+    metrics.add_collector(lambda: collect_app_stats(app))
+    app.extensions["metrics"] = metrics
+    count_openai_retries()
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_response_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # a streamed response is torn down once it has been sent, so its latency covers the whole stream
+    @app.teardown_request
+    def observe_request(error=None):
+        start = g.pop("request_start", None)
+        if start is None:
+            return
+
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = g.get("response_status", 500) if error is None else 500
+        metrics.observe_request(request.method, route, status, time.perf_counter() - start)
+
+    # the async server works in application contexts without a request, so stages are recorded per application context
+    @app.teardown_appcontext
+    def observe_stages(error=None):
+        metrics.observe_stages(get_timings(), get_prompt_tokens(), get_completion_tokens())
+
+    return metrics
+
@@ -0,0 +1,307 @@
+import argparse
+import gc
+import importlib
+import logging
+import os
+import select
+import signal
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORIES = {"wsgi": "verse:create_app", "asgi": "verse.asgi:create_asgi_app"}
+
+
+def get_process_memory(pid):
+    """
+    get_process_memory reads the memory of a process from /proc. Pages a worker shares copy-on-write with the master
+    count fully in its RSS but only in part in its PSS (proportional set size), and not at all in its private memory.
+
+    Args:
+    pid (int): ID of the process
+
+    Returns:
+    dict: RSS, PSS, private, and shared memory of the process in MB
+
+    Raises:
+    None
+
+    """
+
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return {"rss_mb": float("nan"), "pss_mb": float("nan"), "private_mb": float("nan"), "shared_mb": float("nan")}
+
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "private_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+        "shared_mb": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+    }
+
+
+def load_factory(factory):
+    module_name, _, attribute = factory.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "create_app")
+
+
+def preload_app(app):
+    """
+    preload_app loads what every request needs before the workers are forked (see verse.warm_up.WarmUp), waiting for
+    the warm-up create_app may have started in the background, so that no thread is running when the workers fork.
+
+    Args:
+    app (Flask | FastAPI): The application, or the async server wrapping it
+
+    Returns:
+    None
+
+    Raises:
+    None
+
+    """
+
+    # the async server keeps the Flask application that holds the warm-up in its state
+    flask_app = app.state.flask_app if hasattr(app, "state") else app
+    flask_app.extensions["warm_up"].wait()
+
+
+class PreforkServer:
+    """
+    PreforkServer serves Verse from several worker processes that accept connections on one listening socket. With
+    preload, the master process creates and warms the application before forking, so the workers share its imported
+    modules and loaded indexes copy-on-write instead of each loading its own copy. The objects loaded by the master are
+    moved out of the garbage collector's reach (gc.freeze), so that collections in the workers do not write to, and copy,
+    the pages that hold them. Spans are exported from each worker once it is forked (see
+    tracing.deferred_span_export). Workers that exit are replaced until the server is stopped.
+
+    Args:
+    factory (str): The application factory, as "module:function"
+    host (str): Address to listen on
+    port (int): Port to listen on
+    workers (int): Number of worker processes
+    interface (str): "wsgi" to serve the Flask application with a threaded server, or "asgi" to serve the async server
+    with uvicorn
+    preload (bool): Whether to create the application in the master process, or in each worker after the fork
+    backlog (int): Number of connections waiting to be accepted
+
+    """
+
+    def __init__(
+        self, factory=None, host="127.0.0.1", port=5000, workers=None, interface="wsgi", preload=True, backlog=2048
+    ):
+        if interface not in DEFAULT_FACTORIES:
+            raise ValueError({"error": "CONFIG_ERROR", "message": f"Unknown interface {interface}."})
+
+        self.factory = factory or DEFAULT_FACTORIES[interface]
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.interface = interface
+        self.preload = preload
+        self.backlog = backlog
+
+        self.app = None
+        self.socket = None
+        self.worker_pids = set()
+        self._ready_reader, self._ready_writer = None, None
+        self._stopping = False
+
+        self.stats = {"preload_seconds": 0.0, "startup_seconds": 0.0, "respawns": 0}
+
+    def bind(self):
+        address_family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        self.socket = socket.socket(address_family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(self.backlog)
+        self.socket.set_inheritable(True)
+        self.port = self.socket.getsockname()[1]
+
+    def create_app(self):
+        from verse.tracing import deferred_span_export
+
+        # spans are exported from each worker, see spawn_worker
+        with deferred_span_export():
+            app = load_factory(self.factory)()
+        preload_app(app)
+        return app
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.worker_pids.add(pid)
+            return pid
+
+        # worker: the master stops workers with SIGTERM, including on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        status = 0
+        try:
+            from verse.tracing import start_deferred_span_exports
+
+            app = self.app or self.create_app()
+            start_deferred_span_exports()
+            self.serve(app)
+        except BaseException:
+            logger.exception("Worker %s failed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def serve(self, app):
+        """
+        serve answers requests on the listening socket until the worker is stopped. It runs in each worker.
+        """
+
+        if self.interface == "asgi":
+            import uvicorn
+
+            server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+            os.write(self._ready_writer, b".")
+            server.run(sockets=[self.socket])
+        else:
+            from werkzeug.serving import make_server
+
+            server = make_server(self.host, self.port, app, threaded=True, fd=self.socket.fileno())
+            os.write(self._ready_writer, b".")
+            server.serve_forever()
+
+    def wait_until_ready(self, timeout=300.0):
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while ready < self.workers and time.monotonic() < deadline:
+            readable, _, _ = select.select([self._ready_reader], [], [], deadline - time.monotonic())
+            if readable:
+                ready += len(os.read(self._ready_reader, self.workers - ready))
+        return ready
+
+    def report(self):
+        """
+        report returns the startup time of the server and the memory of the master and of each worker.
+
+        Args:
+        None
+
+        Returns:
+        dict: The seconds taken to preload the application and to start every worker, and the memory of each process in
+        MB
+
+        Raises:
+        None
+
+        """
+
+        return {
+            **self.stats,
+            "master": get_process_memory(os.getpid()),
+            "workers": {pid: get_process_memory(pid) for pid in sorted(self.worker_pids)},
+        }
+
+    def stop(self, *args):
+        self._stopping = True
+        for pid in list(self.worker_pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.worker_pids.discard(pid)
+
+    def run(self):
+        """
+        run starts the server and supervises its workers until it receives SIGTERM or SIGINT.
+
+        Args:
+        None
+
+        Returns:
+        None
+
+        Raises:
+        None
+
+        """
+
+        start = time.perf_counter()
+        if self.preload:
+            self.app = self.create_app()
+            gc.collect()
+            gc.freeze()
+        self.stats["preload_seconds"] = time.perf_counter() - start
+
+        self.bind()
+        self._ready_reader, self._ready_writer = os.pipe()
+        for _ in range(self.workers):
+            self.spawn_worker()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        ready = self.wait_until_ready()
+        self.stats["startup_seconds"] = time.perf_counter() - start
+
+        report = self.report()
+        logger.info(
+            "Serving on %s:%s with %s/%s %s workers (preload %s) after %.2fs",
+            self.host,
+            self.port,
+            ready,
+            self.workers,
+            self.interface,
+            "on" if self.preload else "off",
+            self.stats["startup_seconds"],
+        )
+        for pid, memory in report["workers"].items():
+            logger.info(
+                "Worker %s: %.1f MB RSS, %.1f MB PSS, %.1f MB private",
+                pid,
+                memory["rss_mb"],
+                memory["pss_mb"],
+                memory["private_mb"],
+            )
+
+        while self.worker_pids:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.worker_pids.discard(pid)
+            if not self._stopping:
+                logger.warning("Worker %s exited, starting a new one", pid)
+                self.stats["respawns"] += 1
+                self.spawn_worker()
+
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Verse from pre-forked worker processes.")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)) or None, help="Defaults to the CPUs"
+    )
+    parser.add_argument("--interface", choices=tuple(DEFAULT_FACTORIES), default="wsgi")
+    parser.add_argument("--factory", default=None, help="Application factory as module:function")
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(message)s")
+    PreforkServer(
+        factory=args.factory,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        interface=args.interface,
+        preload=args.preload,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
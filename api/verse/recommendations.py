@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cachetools import TTLCache
+from flask import current_app
+
+from verse.response_cache import get_history_digest
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationStore:
+    """
+    RecommendationStore memoizes recommendations by (course, digest of the message history), so a recommendation is only
+    computed again once new messages arrive. Each entry is a Future: a request for a recommendation that is already
+    being computed waits for it instead of starting a second LLM call, and recommendations can be computed in the
+    background right after a response finishes.
+
+    Args:
+    ttl (float): Seconds a recommendation stays in the store
+    max_entries (int): Number of recommendations kept in the store
+    max_workers (int): Number of recommendations computed in the background at once
+
+    """
+
+    def __init__(self, ttl=3600, max_entries=1024, max_workers=2):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="recommendation"
+        )
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "background": 0,
+            "latency_saved_seconds": 0.0,
+        }
+
+    def _get_key(self, course, messages):
+        return (course, get_history_digest(messages))
+
+    def _claim(self, key):
+        # returns the existing future for key, or registers a new one that the caller must resolve
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                return future, False
+
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._entries[key] = future
+            return future, True
+
+    def _resolve(self, key, future, compute):
+        start = time.perf_counter()
+        try:
+            recommendation = compute()
+        except Exception as error:
+            self._fail(key, future, error)
+            raise
+
+        self._succeed(future, recommendation, time.perf_counter() - start)
+        return recommendation
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            if self._entries.get(key) is future:
+                del self._entries[key]
+        future.set_exception(error)
+
+    def _succeed(self, future, recommendation, seconds):
+        future.seconds = seconds
+        future.set_result(recommendation)
+
+    def _count_hit(self, future):
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["latency_saved_seconds"] += getattr(future, "seconds", 0.0)
+
+    def get(self, course, messages, compute):
+        """
+        get returns the recommendation for a message history, computing it with compute only if it is neither stored nor
+        already being computed.
+
+        Args:
+        course (str): User's selected course
+        messages (Tuple[str]): Queries the user has submitted and responses the model has provided
+        compute (Callable[[], str]): Function that generates the recommendation
+
+        Returns:
+        str: The recommendation
+
+        Raises:
+        Exception: Any error raised by compute
+
+        """
+
+        key = self._get_key(course, messages)
+        future, claimed = self._claim(key)
+
+        if claimed:
+            with self._lock:
+                self.stats["misses"] += 1
+            return self._resolve(key, future, compute)
+
+        recommendation = future.result()
+        self._count_hit(future)
+        return recommendation
+
+    async def aget(self, course, messages, compute):
+        """
+        aget is the async counterpart of get: compute is a coroutine function, and a recommendation that is already
+        being computed is awaited without blocking the event loop.
+
+        Args:
+        course (str): User's selected course
+        messages (Tuple[str]): Queries the user has submitted and responses the model has provided
+        compute (Callable[[], Awaitable[str]]): Coroutine function that generates the recommendation
+
+        Returns:
+        str: The recommendation
+
+        Raises:
+        Exception: Any error raised by compute
+
+        """
+
+        key = self._get_key(course, messages)
+        future, claimed = self._claim(key)
+
+        if claimed:
+            with self._lock:
+                self.stats["misses"] += 1
+
+            start = time.perf_counter()
+            try:
+                recommendation = await compute()
+            except BaseException as error:
+                self._fail(key, future, error)
+                raise
+
+            self._succeed(future, recommendation, time.perf_counter() - start)
+            return recommendation
+
+        recommendation = await asyncio.wrap_future(future)
+        self._count_hit(future)
+        return recommendation
+
+    def schedule(self, course, messages, compute):
+        """
+        schedule computes the recommendation for a message history in the background, unless it is already stored or
+        being computed.
+
+        Args:
+        course (str): User's selected course
+        messages (Tuple[str]): Queries the user has submitted and responses the model has provided
+        compute (Callable[[], str]): Function that generates the recommendation
+
+        Returns:
+        bool: True if a background computation was started
+
+        Raises:
+        None
+
+        """
+
+        key = self._get_key(course, messages)
+        future, claimed = self._claim(key)
+        if not claimed:
+            return False
+
+        with self._lock:
+            self.stats["background"] += 1
+
+        def resolve_in_background():
+            try:
+                self._resolve(key, future, compute)
+            except Exception:
+                logger.exception("Error computing recommendation in the background")
+
+        self._executor.submit(resolve_in_background)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hit_rate": self.stats["hits"] / lookups if lookups else 0.0}
+
+
+def get_recommendation_store():
+    """
+    get_recommendation_store returns the RecommendationStore of the current Flask application, creating one if the
+    application was built without it.
+
+    Args:
+    None
+
+    Returns:
+    RecommendationStore: The application's recommendation store
+
+    Raises:
+    None
+
+    """
+
+    if "recommendation_store" not in current_app.extensions:
+        current_app.extensions["recommendation_store"] = RecommendationStore()
+    return current_app.extensions["recommendation_store"]
@@ -0,0 +1,232 @@
+import hashlib
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+from cachetools import TTLCache
+from flask import current_app
+
+
+def normalize_query(query):
+    """
+    normalize_query lowercases a query, collapses its whitespace, and drops trailing punctuation, so that trivially
+    different phrasings of a question share a cache key.
+
+    Args:
+    query (str): The question or comment the user poses in the discussion
+
+    Returns:
+    str: The normalized query
+
+    Raises:
+    None
+
+    """
+
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+def get_history_digest(history):
+    """
+    get_history_digest hashes a sequence of messages.
+
+    Args:
+    history (Tuple[str]): Messages of the conversation
+
+    Returns:
+    str: The SHA-256 hex digest of the messages
+
+    Raises:
+    None
+
+    """
+
+    digest = hashlib.sha256()
+    for message in history or ():
+        digest.update(message.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    ResponseCache caches model responses by (course, normalized query, hash of the conversation tail). A lookup that
+    misses the exact key falls back to a semantic lookup: the query's embedding is compared with the embeddings of the
+    cached queries for the same course and conversation tail, and the most similar one is a hit if its cosine similarity
+    reaches similarity_threshold. Entries expire after ttl seconds, and the least recently used entries are evicted once
+    max_entries is reached. Hits, misses, and the LLM latency saved are counted per route.
+
+    Args:
+    embedding_function (Embeddings): Embedding function for queries, or None to only match exact keys
+    ttl (float): Seconds an entry stays in the cache
+    max_entries (int): Number of entries kept in the cache
+    similarity_threshold (float): Minimum cosine similarity for a semantic hit
+    tail_size (int): Number of trailing conversation messages that are part of the key
+    get_embedding_function (Callable[[], Embeddings]): Returns the embedding function for queries on the first lookup
+    or store, so that the embedding client is not loaded with the application (see retriever_pool.RetrieverPool)
+
+    """
+
+    def __init__(
+        self,
+        embedding_function=None,
+        ttl=3600,
+        max_entries=1024,
+        similarity_threshold=0.95,
+        tail_size=1,
+        get_embedding_function=None,
+    ):
+        self.embedding_function = embedding_function
+        self.get_embedding_function = get_embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.tail_size = tail_size
+
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+        self.stats = defaultdict(
+            lambda: {"hits": 0, "semantic_hits": 0, "misses": 0, "latency_saved_seconds": 0.0}
+        )
+
+    def _get_key(self, course, query, history):
+        tail = tuple(history or ())[-self.tail_size :] if self.tail_size else ()
+        return (course, normalize_query(query), get_history_digest(tail))
+
+    def _get_embedding_function(self):
+        if self.embedding_function is None and self.get_embedding_function is not None:
+            self.embedding_function = self.get_embedding_function()
+        return self.embedding_function
+
+    def _embed(self, query):
+        embedding_function = self._get_embedding_function()
+        if embedding_function is None:
+            return None
+        # the raw query is embedded so that the vector is shared with retrieval through the embedding cache
+        embedding = np.asarray(embedding_function.embed_query(query))
+        return embedding / np.linalg.norm(embedding)
+
+    def lookup(self, route, course, query, history=()):
+        """
+        lookup returns the cached response for a query, if there is one.
+
+        Args:
+        route (str): Name of the route the response is for (ex. professorResponse)
+        course (str): User's selected course
+        query (str): The question or comment the user poses in the discussion
+        history (Tuple[str]): Previous messages of the conversation
+
+        Returns:
+        str: The cached response, or None on a miss
+
+        Raises:
+        None
+
+        """
+
+        key = self._get_key(course, query, history)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        semantic_hit = False
+        if entry is None and self._get_embedding_function() is not None:
+            entry = self._semantic_lookup(key, query)
+            semantic_hit = entry is not None
+
+        with self._lock:
+            if entry is None:
+                self.stats[route]["misses"] += 1
+                return None
+
+            self.stats[route]["hits"] += 1
+            self.stats[route]["semantic_hits"] += int(semantic_hit)
+            self.stats[route]["latency_saved_seconds"] += entry["seconds"]
+            return entry["response"]
+
+    def _semantic_lookup(self, key, query):
+        course, _, tail_digest = key
+
+        with self._lock:
+            candidates = [
+                entry
+                for (entry_course, _, entry_tail_digest), entry in self._entries.items()
+                if entry_course == course
+                and entry_tail_digest == tail_digest
+                and entry["embedding"] is not None
+            ]
+        if not candidates:
+            return None
+
+        similarities = np.stack([entry["embedding"] for entry in candidates]) @ self._embed(query)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return candidates[best]
+
+    def store(self, course, query, history, response, seconds):
+        """
+        store caches a response.
+
+        Args:
+        course (str): User's selected course
+        query (str): The question or comment the user poses in the discussion
+        history (Tuple[str]): Previous messages of the conversation
+        response (str): The response the model generated
+        seconds (float): Seconds it took to generate the response
+
+        Returns:
+        None
+
+        Raises:
+        None
+
+        """
+
+        entry = {"response": response, "embedding": self._embed(query), "seconds": seconds}
+        with self._lock:
+            self._entries[self._get_key(course, query, history)] = entry
+
+    def get_stats(self):
+        """
+        get_stats reports the hit rate and latency saved of each route.
+
+        Args:
+        None
+
+        Returns:
+        dict: Maps each route to its hits, semantic hits, misses, hit rate, and seconds of latency saved
+
+        Raises:
+        None
+
+        """
+
+        with self._lock:
+            report = {}
+            for route, route_stats in self.stats.items():
+                lookups = route_stats["hits"] + route_stats["misses"]
+                report[route] = {
+                    **route_stats,
+                    "hit_rate": route_stats["hits"] / lookups if lookups else 0.0,
+                }
+            return report
+
+
+def get_response_cache():
+    """
+    get_response_cache returns the response cache of the current Flask application.
+
+    Args:
+    None
+
+    Returns:
+    ResponseCache: The response cache, or None if RESPONSE_CACHE_ENABLED is not set
+
+    Raises:
+    None
+
+    """
+
+    return current_app.extensions.get("response_cache")
+
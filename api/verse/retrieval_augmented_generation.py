@@ -1,41 +1,654 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import current_app, g
+from flask import current_app
 
-from langchain.vectorstores.chroma import Chroma
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.chains import SequentialChain
+from verse.context_packs import DEFAULT_CONTEXT_TOKEN_BUDGET, RETRIEVAL_K
+from verse.courses import (
+    GLOBAL_COLLECTION_NAME,
+    get_course_collection_name,
+    get_course_number,
+)
+from verse.history import format_history, get_history_compactor, get_token_counter
+from verse.lexical_index import reciprocal_rank_fusion
+from verse.metrics import DISCARDED_SEGUES
+from verse.retriever_pool import get_retriever_pool
+from verse.timing import (
+    record_completion_tokens,
+    record_prompt_tokens,
+    record_timing,
+    timed,
+)
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
+SEGUE_MODES = ("sequential", "speculative")
+RETRIEVAL_MODES = ("hybrid", "dense")
+CONTEXT_MODES = ("packs", "raw")
+
+# speculative segues run on a small shared pool so that they overlap with the answer stream of their request
+_segue_executor = None
+_segue_executor_lock = threading.Lock()
+
+# the LLM and its chains live for the life of the process, shared by every request
+_llm_lock = threading.Lock()
+_chains = None
+_chains_lock = threading.Lock()
+
+ANSWER_TEMPLATE = """
+    You are an English literature professor leading a seminar with one student on {course}. Your responses should be engaging, authoritative, yet humble. Omit 
+    responses like – "can I help you with anything else?" – and instead assume the role of an academic mentor.
+    ------------------
+    
+    If the question requires external information, answer the question based on the following context:
+
+    {context}
+
+    ------------------
+        
+    Answer questions in a manner than assumes the user is either starting or in the middle of a dialogue with you. In order to help, use the following previous responses to understand 
+    where in the conversation you are:
+
+    {previous_responses} 
+
+    ------------------
+
+    Now, answer the following question, incorporating a significant amount of the context and previous responses. Here is the query: {query}
+    
+    """
+
+SEGUE_TEMPLATE = """
+    You are a professor of literature teaching {course}. You have just answered a question posed by a student 
+    and would like to segue the discussion via another interesting question or comment. 
+    
+    ------------------
+    
+    For context, you can refer to the original student question: {query} 
+    
+    ------------------
+    
+    You will be given the statement you made here: {statement}
+    
+    ------------------
+    
+    Now, generate the leading question or comment to the student.
+    
+    """
+
+RECOMMENDATION_TEMPLATE = """
+    You are a professor of literature teaching {course}. You have just had a session with a student in a 
+    seminar and want to recommend they read another novel or work of poetry.
+
+    ------------------
+    
+    For context, you can refer to the message history: {messages} 
+    
+    ------------------
+    
+    Now, generate the text you would recommend as well as some reasoning for why. If the student had any particular doubts or interest
+    about something during the session, include this in your reasoning. Make this a short-form response of no more than a few sentences.
+    """
+
+
+SUMMARY_TEMPLATE = """
+    You are keeping notes on a seminar on {course}. Here is your summary of the discussion so far:
+
+    {summary}
+
+    ------------------
+
+    Here are the next messages of the discussion:
+
+    {messages}
+
+    ------------------
+
+    Now, write an updated summary of the whole discussion in no more than {words} words. Keep the texts, authors, and
+    ideas that were discussed, and any doubts or interests the student expressed.
+    """
+
 
 def get_global_llm():
     """
-    get_global_llm generates a new instance of an OpenAI LLM object if it has not been created yet and adds it to the Flask global
-    variable set.
+    get_global_llm returns the OpenAI LLM object of the application, creating it on the first call. It is shared by every
+    request of the process, along with its pool of keep-alive connections to the API.
+
+    Args:
+    None
+
+    Returns:
+    llm (ChatOpenAI): Object representing an LLM. Can be exchanged for another model.
+
+    Raises:
+    None
+    """
+
+    llm = current_app.extensions.get("llm")
+    if llm is None:
+        with _llm_lock:
+            llm = current_app.extensions.get("llm")
+            if llm is None:
+                # the OpenAI client and langchain are imported on first use, so that the server starts without them
+                from verse.llm import create_llm
+
+                llm = current_app.extensions["llm"] = create_llm(current_app.config)
+    return llm
+
+
+class Chains:
+    """
+    Chains holds the answer, segue, summary and recommendation chains of an LLM, each a prompt piped into the LLM and a
+    string parser. The chains keep no state between calls, so they are built once and run by concurrent requests, threads
+    and tasks alike.
+
+    Args:
+    llm (BaseChatModel): The LLM the chains call
+
+    """
+
+    def __init__(self, llm):
+        from langchain.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+
+        self.llm = llm
+        parser = StrOutputParser()
+
+        self.answer = PromptTemplate(
+            template=ANSWER_TEMPLATE,
+            input_variables=["course", "context", "previous_responses", "query"],
+        ) | llm | parser
+        self.segue = PromptTemplate(
+            template=SEGUE_TEMPLATE, input_variables=["course", "statement", "query"]
+        ) | llm | parser
+        self.summary = PromptTemplate(
+            template=SUMMARY_TEMPLATE, input_variables=["course", "summary", "messages", "words"]
+        ) | llm | parser
+        self.recommendation = PromptTemplate(
+            template=RECOMMENDATION_TEMPLATE, input_variables=["course", "messages"]
+        ) | llm | parser
+
+
+def get_chains(llm):
+    """
+    get_chains returns the chains of an LLM, building them on the first call, and again only when they are asked for with
+    another LLM.
+
+    Args:
+    llm (BaseChatModel): The LLM the chains call
+
+    Returns:
+    Chains: The chains of the LLM
+
+    Raises:
+    None
+
+    """
+
+    global _chains
+
+    chains = _chains
+    if chains is None or chains.llm is not llm:
+        with _chains_lock:
+            if _chains is None or _chains.llm is not llm:
+                _chains = Chains(llm)
+            chains = _chains
+    return chains
+
+
+def get_collection_name(course, global_search=False):
+    """
+    get_collection_name picks the Chroma collection to search for a course. Retrieval is scoped to the course's own
+    collection, and falls back to the global collection when asked to, when the course is not known, or when the index
+    was built without per-course collections.
+
+    Args:
+    course (str): User's selected course
+    global_search (bool): Whether to search the transcripts of every course
+
+    Returns:
+    str: Name of the collection to search
+
+    Raises:
+    None
+
+    """
+
+    course_number = get_course_number(course)
+    if global_search or course_number is None:
+        return GLOBAL_COLLECTION_NAME
+
+    collection_name = get_course_collection_name(course_number)
+    if not get_retriever_pool().has_collection(collection_name):
+        return GLOBAL_COLLECTION_NAME
+
+    return collection_name
+
+
+def get_retrieval_mode():
+    """
+    get_retrieval_mode returns how context is retrieved: "dense" searches the query's embedding, while "hybrid" fuses the
+    dense ranking with the BM25 ranking of the lexical index, and skips the embedding for queries that name a work or
+    author.
+
+    Args:
+    None
+
+    Returns:
+    str: Either "hybrid" or "dense"
+
+    Raises:
+    ValueError: If RETRIEVAL_MODE is configured to an unknown mode
+
+    """
+
+    retrieval_mode = current_app.config.get("RETRIEVAL_MODE", "hybrid")
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise ValueError(
+            {"error": "CONFIG_ERROR", "message": f"Unknown RETRIEVAL_MODE {retrieval_mode}."}
+        )
+    return retrieval_mode
+
+
+def get_course_filter(course, collection_name):
+    """
+    get_course_filter returns the course whose chunks are searched in the indexes that hold every course (the BM25 and
+    memory-mapped vector indexes).
+
+    Args:
+    course (str): User's selected course
+    collection_name (str): Name of the collection being searched
+
+    Returns:
+    int: The course number, or None if every course is searched
+
+    Raises:
+    None
+
+    """
+
+    return None if collection_name == GLOBAL_COLLECTION_NAME else get_course_number(course)
+
+
+def search_lexical_index(course_number, query):
+    """
+    search_lexical_index ranks the chunks of the searched course by BM25 in hybrid retrieval.
+
+    Args:
+    course_number (int): Course whose chunks are ranked, or None to rank every chunk
+    query (str): The question or comment the user poses in the discussion
+
+    Returns:
+    LexicalMatches: The best RETRIEVAL_FETCH_K chunks, or None in dense retrieval or if the index has no BM25 index
+
+    Raises:
+    None
+
+    """
+
+    if get_retrieval_mode() != "hybrid":
+        return None
+
+    lexical_index = get_retriever_pool().get_lexical_index()
+    if lexical_index is None:
+        return None
+
+    with timed("lexical_search"):
+        return lexical_index.search(
+            query, k=current_app.config.get("RETRIEVAL_FETCH_K", 20), course=course_number
+        )
+
+
+def get_documents_by_id(vectorstore, chunk_ids):
+    """
+    get_documents_by_id reads chunks from a vector store by ID, without a search.
+
+    Args:
+    vectorstore (Chroma): The vector store
+    chunk_ids (List[str]): IDs of the chunks
+
+    Returns:
+    List[Document]: The chunks, in the order of their IDs
+
+    Raises:
+    None
+
+    """
+
+    documents = _read_documents(vectorstore, chunk_ids)
+    return [documents[chunk_id] for chunk_id in chunk_ids if chunk_id in documents]
+
+
+def _read_documents(vectorstore, chunk_ids):
+    from langchain_core.documents import Document
+
+    if not chunk_ids:
+        return {}
+
+    result = vectorstore._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+    return {
+        chunk_id: Document(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id})
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+    }
+
+
+def search_vectorstore(vectorstore, embedding, course_number=None, lexical_matches=None):
+    """
+    search_vectorstore finds the RETRIEVAL_K chunks nearest to a query embedding, in Chroma or, with the "numpy" vector
+    backend, in the memory-mapped embeddings. In hybrid retrieval, the best RETRIEVAL_FETCH_K chunks by embedding are
+    fused with the BM25 ranking by reciprocal rank.
+
+    Args:
+    vectorstore (Chroma): The vector store of the searched collection
+    embedding (List[float]): Embedding of the query
+    course_number (int): Course of the searched collection, or None for the global collection
+    lexical_matches (LexicalMatches): The BM25 ranking, or None in dense retrieval
+
+    Returns:
+    List[Document]: The chunks, best first
+
+    Raises:
+    None
+
+    """
+
+    fetch_k = RETRIEVAL_K if lexical_matches is None else current_app.config.get("RETRIEVAL_FETCH_K", 20)
+
+    vector_index = get_retriever_pool().get_vector_index()
+    if vector_index is not None:
+        ((chunk_ids, _),) = vector_index.search([embedding], k=fetch_k, course=course_number)
+        documents = {}
+    else:
+        from langchain_core.documents import Document
+
+        result = vectorstore._collection.query(
+            query_embeddings=[embedding], n_results=fetch_k, include=["documents", "metadatas"]
+        )
+        chunk_ids = result["ids"][0]
+        documents = {
+            chunk_id: Document(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id})
+            for chunk_id, text, metadata in zip(chunk_ids, result["documents"][0], result["metadatas"][0])
+        }
+
+    if lexical_matches is not None:
+        chunk_ids = reciprocal_rank_fusion([chunk_ids, lexical_matches.chunk_ids])[:RETRIEVAL_K]
+
+    # chunks found by the memory-mapped search or by BM25 alone are read from Chroma by ID
+    documents.update(
+        _read_documents(vectorstore, [chunk_id for chunk_id in chunk_ids if chunk_id not in documents])
+    )
+    return [documents[chunk_id] for chunk_id in chunk_ids if chunk_id in documents]
+
+
+def get_context_mode():
+    """
+    get_context_mode returns how retrieved chunks become the context of the answer prompt: "raw" joins them as they are,
+    while "packs" puts them back in lecture order without the text consecutive chunks repeat, and introduces them with
+    the summaries of their lectures and courses, within CONTEXT_TOKEN_BUDGET tokens.
+
+    Args:
+    None
+
+    Returns:
+    str: Either "packs" or "raw"
+
+    Raises:
+    ValueError: If CONTEXT_MODE is configured to an unknown mode
+
+    """
+
+    context_mode = current_app.config.get("CONTEXT_MODE", "packs")
+    if context_mode not in CONTEXT_MODES:
+        raise ValueError(
+            {"error": "CONFIG_ERROR", "message": f"Unknown CONTEXT_MODE {context_mode}."}
+        )
+    return context_mode
+
+
+def build_context(documents):
+    """
+    build_context turns retrieved chunks into the context of the answer prompt, with the context packs of the index in
+    the "packs" context mode, and records its number of tokens.
+
+    Args:
+    documents (List[Document]): The retrieved chunks, best first
+
+    Returns:
+    str: The context
+
+    Raises:
+    None
+
+    """
+
+    count_tokens = get_token_counter()
+    context_packs = get_retriever_pool().get_context_packs() if get_context_mode() == "packs" else None
+
+    if context_packs is None:
+        context = "\n".join([doc.page_content for doc in documents])
+    else:
+        with timed("context_packing"):
+            context = context_packs.format(
+                [doc.metadata.get("chunk_id") for doc in documents],
+                [doc.page_content for doc in documents],
+                current_app.config.get("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET),
+                count_tokens,
+            )
+
+    record_prompt_tokens("context", count_tokens(context))
+    return context
+
+
+def retrieve_context(course, query, global_search=False):
+    """
+    retrieve_context retrieves the transcript chunks most relevant to a query and turns them into the context of the
+    answer prompt. In hybrid retrieval, a query that names a work or author is answered from the lexical index alone.
+
+    Args:
+    course (str): User's selected course
+    query (str): The question or comment the user poses in the discussion
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
+
+    Returns:
+    str: The context built from the retrieved chunks
+
+    Raises:
+    None
+
+    """
+
+    with timed("retrieval"):
+        retriever_pool = get_retriever_pool()
+        with timed("open_vectorstore"):
+            collection_name = get_collection_name(course, global_search)
+            vectorstore = retriever_pool.get_vectorstore(collection_name)
+
+        course_number = get_course_filter(course, collection_name)
+        lexical_matches = search_lexical_index(course_number, query)
+        if lexical_matches is not None and lexical_matches.strong:
+            # the query names a work or author, whose chunks BM25 already ranks, so the embedding call is skipped
+            with timed("fetch_documents"):
+                documents = get_documents_by_id(vectorstore, lexical_matches.chunk_ids[:RETRIEVAL_K])
+        else:
+            with timed("embed_query"):
+                embedding = retriever_pool.get_embedding_function().embed_query(query)
+            with timed("vector_search"):
+                documents = search_vectorstore(vectorstore, embedding, course_number, lexical_matches)
+
+    return build_context(documents)
+
+
+def truncate_to_complete_sentence(answer):
+    """
+    truncate_to_complete_sentence defers to the last complete sentence of an answer if the LLM call was cut off. An
+    answer that ends with a question is complete, so that no segue is added to it.
+
+    Args:
+    answer (str): The answer the model generated
+
+    Returns:
+    str: The answer, or the answer up to and including its last period if it was cut off
+
+    Raises:
+    None
+
+    """
+
+    if answer[-1] not in ".?":
+        sentences = answer.split(".")[:-1]
+        return ".".join(sentences) + "."
+    return answer
+
+
+def _record_completion_tokens(chain, text):
+    record_completion_tokens(chain, get_token_counter()(text))
+
+
+def summarize_history(llm, course, summary, turns):
+    """
+    summarize_history folds turns of the conversation into the rolling summary of its earlier turns.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM
+    course (str): User's selected course
+    summary (str): The summary of the turns before these, or an empty string
+    turns (Tuple[str]): The turns to fold into the summary
+
+    Returns:
+    str: The updated summary
+
+    Raises:
+    None
+
+    """
+
+    summary_chain = get_chains(llm).summary
+
+    with timed("summary"):
+        summary = summary_chain.invoke(
+            {
+                "course": course,
+                "summary": summary or "(The discussion has just started.)",
+                "messages": "\n".join(turns),
+                "words": get_history_compactor().summary_token_budget * 3 // 4,
+            }
+        )
+    _record_completion_tokens("summary", summary)
+    return summary
+
+
+def compact_history(llm, course, section, history):
+    """
+    compact_history keeps a section of the prompt's conversation history (previous_responses or messages) within its
+    token budget, and records its number of tokens before and after compaction.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM, used to summarize the earlier turns
+    course (str): User's selected course
+    section (str): Name of the prompt section
+    history (Tuple[str]): The history, oldest turn first
+
+    Returns:
+    CompactedHistory: The compacted history
+
+    Raises:
+    None
+
+    """
+
+    compacted = get_history_compactor().compact(
+        section,
+        course,
+        history,
+        lambda summary, turns: summarize_history(llm, course, summary, turns),
+    )
+    _record_history_tokens(section, compacted)
+    return compacted
+
+
+def _record_history_tokens(section, compacted):
+    record_prompt_tokens(section, compacted.tokens)
+    if compacted.uncompacted_tokens != compacted.tokens:
+        record_prompt_tokens(f"{section}_uncompacted", compacted.uncompacted_tokens)
+
+
+def get_segue_mode():
+    """
+    get_segue_mode returns how the segue is generated: "sequential" starts the segue chain once the answer is complete,
+    while "speculative" starts it from the partial answer as soon as SEGUE_SPECULATION_CHARS characters of complete
+    sentences have been generated, overlapping the two LLM calls. A speculative segue only follows the beginning of the
+    answer, so it cannot refer to what the rest of the answer says; that is the price of not waiting for it.
 
     Args:
     None
 
     Returns:
-    llm (ChatOpenAI): Object representing an LLM. Can be exchanged for another model.
+    str: Either "sequential" or "speculative"
 
     Raises:
-    None
+    ValueError: If SEGUE_MODE is configured to an unknown mode
+
     """
 
-    if "llm" not in g:
-        g.llm = ChatOpenAI(
-            openai_api_key=current_app.config["OPENAI_API_KEY"],
-            model_name="gpt-3.5-turbo-1106",
-            temperature=0.9,
+    segue_mode = current_app.config.get("SEGUE_MODE", "sequential")
+    if segue_mode not in SEGUE_MODES:
+        raise ValueError(
+            {"error": "CONFIG_ERROR", "message": f"Unknown SEGUE_MODE {segue_mode}."}
         )
-    return g.llm
+    return segue_mode
+
+
+def _get_segue_executor():
+    global _segue_executor
+
+    with _segue_executor_lock:
+        if _segue_executor is None:
+            _segue_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("SEGUE_MAX_WORKERS", 8),
+                thread_name_prefix="segue",
+            )
+    return _segue_executor
+
+
+def generate_segue(llm, course, query, statement, cancelled=None):
+    """
+    generate_segue runs the segue chain for a statement the professor made. A thread-pool future cannot be cancelled
+    once it runs, so the segue is streamed and stops at the first token after cancelled is set, closing the request.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM
+    course (str): User's selected course
+    query (str): The question or comment the user posed in the discussion
+    statement (str): The answer (or the beginning of the answer) the professor gave
+    cancelled (threading.Event): Set when the segue is no longer needed, or None if it cannot be cancelled
+
+    Returns:
+    Tuple[str, float]: The segue, stripped of surrounding quotation marks, or None if it was cancelled, and the seconds
+    the chain took
+
+    Raises:
+    None
+
+    """
 
+    segue_chain = get_chains(llm).segue
 
-def get_professor_response(course, query, previous_responses):
+    start = time.perf_counter()
+    segue = ""
+    tokens = segue_chain.stream({"course": course, "statement": statement, "query": query})
+    try:
+        for token in tokens:
+            if cancelled is not None and cancelled.is_set():
+                return None, time.perf_counter() - start
+            segue += token
+    finally:
+        tokens.close()
+    return segue.strip('"'), time.perf_counter() - start
+
+
+def get_professor_response(course, query, previous_responses, global_search=False):
     """get_professor_response takes in the user's course selection, a user query, and a list of previous responses and generates a response that imitates
     the tone and nature of a literature professor.
 
@@ -43,6 +656,7 @@ def get_professor_response(course, query, previous_responses):
     course (str): User's selected course
     query (str): The question or comment the user poses in the discussion
     previous_responses (Tuple[str]): A list of previous responses the model has generated
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
 
     Returns:
     str: The response the model generates
@@ -52,109 +666,174 @@ def get_professor_response(course, query, previous_responses):
 
     """
 
+    # the speculative mode needs the answer as it is generated, so it consumes the streamed response
+    if get_segue_mode() == "speculative":
+        return "".join(
+            text
+            for _, text in stream_professor_response(
+                course, query, previous_responses, global_search
+            )
+        )
+
     llm = get_global_llm()
 
-    prompt_template = """
-    You are an English literature professor leading a seminar with one student on {course}. Your responses should be engaging, authoritative, yet humble. Omit 
-    responses like – "can I help you with anything else?" – and instead assume the role of an academic mentor.
-    ------------------
-    
-    If the question requires external information, answer the question based on the following context:
+    context = retrieve_context(course, query, global_search)
 
-    {context}
+    if previous_responses:
+        previous_responses = format_history(
+            compact_history(llm, course, "previous_responses", previous_responses)
+        )
 
-    ------------------
-        
-    Answer questions in a manner than assumes the user is either starting or in the middle of a dialogue with you. In order to help, use the following previous responses to understand 
-    where in the conversation you are:
+    chains = get_chains(llm)
 
-    {previous_responses} 
+    with timed("answer"):
+        answer = chains.answer.invoke(
+            {
+                "course": course,
+                "context": context,
+                "previous_responses": previous_responses,
+                "query": query,
+            }
+        )
 
-    ------------------
+    _record_completion_tokens("answer", answer)
+
+    # if the result of the LLM call is incomplete, defer to the last complete sentence
+    with timed("truncation"):
+        response_to_user = truncate_to_complete_sentence(answer)
+
+    if response_to_user[-1] != "?":
+        with timed("segue"):
+            segue = chains.segue.invoke(
+                {"course": course, "statement": answer, "query": query}
+            )
+        _record_completion_tokens("segue", segue)
+        response_to_user += "\n\n" + segue.strip('"')
+
+    return response_to_user
+
+
+def stream_professor_response(course, query, previous_responses, global_search=False):
+    """stream_professor_response generates the same response as get_professor_response, but yields the tokens of the answer
+    and then of the segue as the LLM produces them.
+
+    Answer tokens are only released once the sentence they belong to is complete, so that an answer cut off mid-sentence
+    is truncated exactly like get_professor_response truncates it. In the speculative segue mode, the segue is generated
+    in the background from the answer's first complete sentences and is sent in one piece once the answer is done; it is
+    stopped and discarded if the answer ends with a question or the client disconnects.
+
+    Args:
+    course (str): User's selected course
+    query (str): The question or comment the user poses in the discussion
+    previous_responses (Tuple[str]): A list of previous responses the model has generated
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
+
+    Yields:
+    Tuple[str, str]: The part of the response ("answer", "separator" or "segue") and its next piece of text
+
+    Raises:
+    None
 
-    Now, answer the following question, incorporating a significant amount of the context and previous responses. Here is the query: {query}
-    
     """
 
-    chroma_path = os.path.join(BASEDIR, "chroma")
+    llm = get_global_llm()
 
-    chromaDB_retriever = Chroma(
-        persist_directory=chroma_path,
-        collection_name="transcripts",
-        embedding_function=OpenAIEmbeddings(model="text-embedding-3-large"),
-    ).as_retriever()
-    documents = chromaDB_retriever.get_relevant_documents(query)
-    context = "\n".join([doc.page_content for doc in documents])
+    context = retrieve_context(course, query, global_search)
 
     if previous_responses:
-        previous_responses = "\n".join(previous_responses)
+        previous_responses = format_history(
+            compact_history(llm, course, "previous_responses", previous_responses)
+        )
 
-    prompt_template = PromptTemplate(
-        template=prompt_template,
-        input_variables=["course", "context", "previous_responses", "query"],
-    )
-    answer_chain = LLMChain(llm=llm, prompt=prompt_template, output_key="answer")
+    answer_chain = get_chains(llm).answer
 
-    overall_chain = SequentialChain(
-        input_variables=["course", "context", "previous_responses", "query"],
-        output_variables=["answer"],
-        chains=[answer_chain],
-    )
+    speculative = get_segue_mode() == "speculative"
+    speculation_chars = current_app.config.get("SEGUE_SPECULATION_CHARS", 400)
+    segue_future = None
+    segue_cancelled = threading.Event()
 
-    response = overall_chain.invoke(
-        {
-            "course": course,
-            "context": context,
-            "previous_responses": previous_responses,
-            "query": query,
-        }
-    )
+    try:
+        answer = ""
+        released = 0
 
-    # if the result of the LLM call is incomplete, defer to the last complete sentence
-    if response["answer"][-1] != ".":
-        sentences = response["answer"].split(".")[:-1]
-        response_to_user = ".".join(sentences) + "."
-    else:
-        response_to_user = response["answer"]
+        with timed("answer"):
+            for token in answer_chain.stream(
+                {
+                    "course": course,
+                    "context": context,
+                    "previous_responses": previous_responses,
+                    "query": query,
+                }
+            ):
+                answer += token
+                last_period = answer.rfind(".")
+                if last_period + 1 > released:
+                    yield "answer", answer[released : last_period + 1]
+                    released = last_period + 1
 
-    if response_to_user[-1] != "?":
-        segue_template = """
-        You are a professor of literature teaching {course}. You have just answered a question posed by a student 
-        and would like to segue the discussion via another interesting question or comment. 
-    
-        ------------------
-        
-        For context, you can refer to the original student question: {query} 
-        
-        ------------------
-        
-        You will be given the statement you made here: {statement}
-        
-        ------------------
-        
-        Now, generate the leading question or comment to the student.
-        
-        """
+                if speculative and segue_future is None and released >= speculation_chars:
+                    segue_future = _get_segue_executor().submit(
+                        generate_segue, llm, course, query, answer[:released], segue_cancelled
+                    )
 
-        segue_response_template = PromptTemplate(
-            template=segue_template, input_variables=["course", "statement", "query"]
-        )
-        segue_chain = LLMChain(
-            llm=llm, prompt=segue_response_template, output_key="answer"
-        )
+        _record_completion_tokens("answer", answer)
 
-        segue_response_chain = SequentialChain(
-            input_variables=["course", "statement", "query"],
-            output_variables=["answer"],
-            chains=[segue_chain],
-        )
+        with timed("truncation"):
+            response_to_user = truncate_to_complete_sentence(answer)
+        if len(response_to_user) > released:
+            yield "answer", response_to_user[released:]
 
-        segue = segue_response_chain.invoke(
-            {"course": course, "statement": response["answer"], "query": query}
-        )
-        response_to_user += "\n\n" + segue["answer"].strip('"')
+        if response_to_user[-1] == "?":
+            # the answer already ends with a question, so a speculative segue is not needed
+            if segue_future is not None:
+                DISCARDED_SEGUES.inc()
+            return
 
-    return response_to_user
+        yield "separator", "\n\n"
+
+        if speculative:
+            if segue_future is None:
+                segue_future = _get_segue_executor().submit(
+                    generate_segue, llm, course, query, answer, segue_cancelled
+                )
+
+            with timed("segue_wait"):
+                segue, segue_seconds = segue_future.result()
+            record_timing("segue", segue_seconds)
+            _record_completion_tokens("segue", segue)
+
+            if segue:
+                yield "segue", segue
+            return
+    finally:
+        # stops a speculative segue that will not be sent: the answer ended with a question, or the client disconnected
+        # mid-stream and the generator was closed
+        segue_cancelled.set()
+
+    segue_chain = get_chains(llm).segue
+
+    # strip the quotation marks the model sometimes wraps the segue in, holding back trailing quotes until more text arrives
+    pending_quotes = ""
+    started = False
+    segue = ""
+
+    with timed("segue"):
+        for token in segue_chain.stream(
+            {"course": course, "statement": answer, "query": query}
+        ):
+            segue += token
+            if not started:
+                token = token.lstrip('"')
+                if not token:
+                    continue
+                started = True
+
+            text = pending_quotes + token
+            stripped_text = text.rstrip('"')
+            pending_quotes = text[len(stripped_text) :]
+            if stripped_text:
+                yield "segue", stripped_text
+    _record_completion_tokens("segue", segue)
 
 
 def get_professor_recommendation(course, messages):
@@ -175,34 +854,351 @@ def get_professor_recommendation(course, messages):
 
     llm = get_global_llm()
 
-    recommendation_template = """
-    You are a professor of literature teaching {course}. You have just had a session with a student in a 
-    seminar and want to recommend they read another novel or work of poetry.
+    # a long session is summarized; a short one is passed as it is
+    compacted = compact_history(llm, course, "messages", messages)
+    if compacted.summary:
+        messages = format_history(compacted)
 
-    ------------------
-    
-    For context, you can refer to the message history: {messages} 
-    
-    ------------------
-    
-    Now, generate the text you would recommend as well as some reasoning for why. If the student had any particular doubts or interest
-    about something during the session, include this in your reasoning. Make this a short-form response of no more than a few sentences.
+    with timed("recommendation"):
+        recommendation = get_chains(llm).recommendation.invoke(
+            {"course": course, "messages": messages}
+        )
+    _record_completion_tokens("recommendation", recommendation)
+    return recommendation
+
+
+async def aretrieve_context(course, query, global_search=False):
     """
+    aretrieve_context retrieves the same context as retrieve_context, awaiting the query embedding and running the
+    local lexical and vector searches off the event loop.
 
-    recommendation_response_template = PromptTemplate(
-        template=recommendation_template, input_variables=["course", "messages"]
-    )
-    recommendation_chain = LLMChain(
-        llm=llm, prompt=recommendation_response_template, output_key="recommendation"
-    )
+    Args:
+    course (str): User's selected course
+    query (str): The question or comment the user poses in the discussion
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
+
+    Returns:
+    str: The context built from the retrieved chunks
+
+    Raises:
+    None
+
+    """
+
+    with timed("retrieval"):
+        retriever_pool = get_retriever_pool()
+        with timed("open_vectorstore"):
+            collection_name = await asyncio.to_thread(get_collection_name, course, global_search)
+            vectorstore = await asyncio.to_thread(retriever_pool.get_vectorstore, collection_name)
+
+        course_number = get_course_filter(course, collection_name)
+        lexical_matches = await asyncio.to_thread(search_lexical_index, course_number, query)
+        if lexical_matches is not None and lexical_matches.strong:
+            with timed("fetch_documents"):
+                documents = await asyncio.to_thread(
+                    get_documents_by_id, vectorstore, lexical_matches.chunk_ids[:RETRIEVAL_K]
+                )
+        else:
+            with timed("embed_query"):
+                embedding = await retriever_pool.get_embedding_function().aembed_query(query)
+            with timed("vector_search"):
+                documents = await asyncio.to_thread(
+                    search_vectorstore, vectorstore, embedding, course_number, lexical_matches
+                )
+
+    return build_context(documents)
 
-    recommendation_response_chain = SequentialChain(
-        input_variables=["course", "messages"],
-        output_variables=["recommendation"],
-        chains=[recommendation_chain],
-    )
 
-    response = recommendation_response_chain.invoke(
-        {"course": course, "messages": messages}
+async def asummarize_history(llm, course, summary, turns):
+    """
+    asummarize_history folds turns into the rolling summary like summarize_history, awaiting the LLM.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM
+    course (str): User's selected course
+    summary (str): The summary of the turns before these, or an empty string
+    turns (Tuple[str]): The turns to fold into the summary
+
+    Returns:
+    str: The updated summary
+
+    Raises:
+    None
+
+    """
+
+    summary_chain = get_chains(llm).summary
+
+    with timed("summary"):
+        summary = await summary_chain.ainvoke(
+            {
+                "course": course,
+                "summary": summary or "(The discussion has just started.)",
+                "messages": "\n".join(turns),
+                "words": get_history_compactor().summary_token_budget * 3 // 4,
+            }
+        )
+    _record_completion_tokens("summary", summary)
+    return summary
+
+
+async def acompact_history(llm, course, section, history):
+    """
+    acompact_history compacts a section of the conversation history like compact_history, awaiting the summary.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM, used to summarize the earlier turns
+    course (str): User's selected course
+    section (str): Name of the prompt section
+    history (Tuple[str]): The history, oldest turn first
+
+    Returns:
+    CompactedHistory: The compacted history
+
+    Raises:
+    None
+
+    """
+
+    compacted = await get_history_compactor().acompact(
+        section,
+        course,
+        history,
+        lambda summary, turns: asummarize_history(llm, course, summary, turns),
     )
-    return response["recommendation"]
+    _record_history_tokens(section, compacted)
+    return compacted
+
+
+async def agenerate_segue(llm, course, query, statement):
+    """
+    agenerate_segue runs the segue chain like generate_segue, awaiting the LLM.
+
+    Args:
+    llm (ChatOpenAI): Object representing an LLM
+    course (str): User's selected course
+    query (str): The question or comment the user posed in the discussion
+    statement (str): The answer (or the beginning of the answer) the professor gave
+
+    Returns:
+    Tuple[str, float]: The segue, stripped of surrounding quotation marks, and the seconds the chain took
+
+    Raises:
+    None
+
+    """
+
+    segue_chain = get_chains(llm).segue
+
+    start = time.perf_counter()
+    segue = await segue_chain.ainvoke({"course": course, "statement": statement, "query": query})
+    return segue.strip('"'), time.perf_counter() - start
+
+
+async def astream_professor_response(course, query, previous_responses, global_search=False):
+    """astream_professor_response is the async counterpart of stream_professor_response: it yields the same parts of the
+    response, awaiting the LLM instead of blocking a thread on it. In the speculative segue mode the segue runs as a
+    task on the event loop.
+
+    Args:
+    course (str): User's selected course
+    query (str): The question or comment the user poses in the discussion
+    previous_responses (Tuple[str]): A list of previous responses the model has generated
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
+
+    Yields:
+    Tuple[str, str]: The part of the response ("answer", "separator" or "segue") and its next piece of text
+
+    Raises:
+    None
+
+    """
+
+    llm = get_global_llm()
+
+    context = await aretrieve_context(course, query, global_search)
+
+    if previous_responses:
+        previous_responses = format_history(
+            await acompact_history(llm, course, "previous_responses", previous_responses)
+        )
+
+    answer_chain = get_chains(llm).answer
+
+    speculative = get_segue_mode() == "speculative"
+    speculation_chars = current_app.config.get("SEGUE_SPECULATION_CHARS", 400)
+    segue_task = None
+
+    try:
+        answer = ""
+        released = 0
+
+        with timed("answer"):
+            async for token in answer_chain.astream(
+                {
+                    "course": course,
+                    "context": context,
+                    "previous_responses": previous_responses,
+                    "query": query,
+                }
+            ):
+                answer += token
+                last_period = answer.rfind(".")
+                if last_period + 1 > released:
+                    yield "answer", answer[released : last_period + 1]
+                    released = last_period + 1
+
+                if speculative and segue_task is None and released >= speculation_chars:
+                    segue_task = asyncio.create_task(
+                        agenerate_segue(llm, course, query, answer[:released])
+                    )
+
+        _record_completion_tokens("answer", answer)
+
+        with timed("truncation"):
+            response_to_user = truncate_to_complete_sentence(answer)
+        if len(response_to_user) > released:
+            yield "answer", response_to_user[released:]
+
+        if response_to_user[-1] == "?":
+            # the answer already ends with a question, so a speculative segue is not needed
+            if segue_task is not None:
+                DISCARDED_SEGUES.inc()
+            return
+
+        yield "separator", "\n\n"
+
+        if speculative:
+            with timed("segue_wait"):
+                if segue_task is None:
+                    segue, segue_seconds = await agenerate_segue(llm, course, query, answer)
+                else:
+                    segue, segue_seconds = await segue_task
+            record_timing("segue", segue_seconds)
+            _record_completion_tokens("segue", segue)
+
+            if segue:
+                yield "segue", segue
+            return
+    finally:
+        # stops a speculative segue that will not be sent: the answer ended with a question, or the client disconnected
+        # mid-stream and the generator was closed
+        if segue_task is not None:
+            segue_task.cancel()
+
+    segue_chain = get_chains(llm).segue
+
+    # strip the quotation marks the model sometimes wraps the segue in, holding back trailing quotes until more text arrives
+    pending_quotes = ""
+    started = False
+    segue = ""
+
+    with timed("segue"):
+        async for token in segue_chain.astream(
+            {"course": course, "statement": answer, "query": query}
+        ):
+            segue += token
+            if not started:
+                token = token.lstrip('"')
+                if not token:
+                    continue
+                started = True
+
+            text = pending_quotes + token
+            stripped_text = text.rstrip('"')
+            pending_quotes = text[len(stripped_text) :]
+            if stripped_text:
+                yield "segue", stripped_text
+    _record_completion_tokens("segue", segue)
+
+
+async def aget_professor_response(course, query, previous_responses, global_search=False):
+    """aget_professor_response generates the same response as get_professor_response without blocking the event loop.
+
+    Args:
+    course (str): User's selected course
+    query (str): The question or comment the user poses in the discussion
+    previous_responses (Tuple[str]): A list of previous responses the model has generated
+    global_search (bool): Whether to retrieve context from every course instead of only the selected course
+
+    Returns:
+    str: The response the model generates
+
+    Raises:
+    None
+
+    """
+
+    # the speculative mode needs the answer as it is generated, so it consumes the streamed response
+    if get_segue_mode() == "speculative":
+        parts = []
+        async for _, text in astream_professor_response(
+            course, query, previous_responses, global_search
+        ):
+            parts.append(text)
+        return "".join(parts)
+
+    llm = get_global_llm()
+
+    context = await aretrieve_context(course, query, global_search)
+
+    if previous_responses:
+        previous_responses = format_history(
+            await acompact_history(llm, course, "previous_responses", previous_responses)
+        )
+
+    answer_chain = get_chains(llm).answer
+
+    with timed("answer"):
+        answer = await answer_chain.ainvoke(
+            {
+                "course": course,
+                "context": context,
+                "previous_responses": previous_responses,
+                "query": query,
+            }
+        )
+
+    _record_completion_tokens("answer", answer)
+
+    # if the result of the LLM call is incomplete, defer to the last complete sentence
+    with timed("truncation"):
+        response_to_user = truncate_to_complete_sentence(answer)
+
+    if response_to_user[-1] != "?":
+        with timed("segue"):
+            segue, _ = await agenerate_segue(llm, course, query, answer)
+        _record_completion_tokens("segue", segue)
+        response_to_user += "\n\n" + segue
+
+    return response_to_user
+
+
+async def aget_professor_recommendation(course, messages):
+    """aget_professor_recommendation generates the same recommendation as get_professor_recommendation, awaiting the LLM.
+
+    Args:
+    course (str): User's selected course
+    messages (List[str]): List of the queries the user has submitted and the responses the model has provided
+
+    Returns:
+    str: The recommendation the model generates
+
+    Raises:
+    None
+
+    """
+
+    llm = get_global_llm()
+
+    # a long session is summarized; a short one is passed as it is
+    compacted = await acompact_history(llm, course, "messages", messages)
+    if compacted.summary:
+        messages = format_history(compacted)
+
+    recommendation_chain = get_chains(llm).recommendation
+
+    with timed("recommendation"):
+        recommendation = await recommendation_chain.ainvoke({"course": course, "messages": messages})
+    _record_completion_tokens("recommendation", recommendation)
+    return recommendation
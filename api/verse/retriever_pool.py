@@ -0,0 +1,414 @@
+import os
+import threading
+import time
+
+from flask import current_app
+
+from verse.context_packs import CONTEXT_PACKS_DIRNAME, ContextPacks
+from verse.courses import GLOBAL_COLLECTION_NAME
+from verse.embedding_defaults import EMBEDDING_BACKENDS, EMBEDDING_CACHE_PATH, LOCAL_EMBEDDING_MODEL
+from verse.lexical_index import LEXICAL_INDEX_DIRNAME, LexicalIndex
+from verse.vector_index import VECTOR_INDEX_DIRNAME, VectorIndex
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_COLLECTION_NAME = GLOBAL_COLLECTION_NAME
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+
+class RetrieverPool:
+    """
+    RetrieverPool is a process-wide, thread-safe registry of long-lived Chroma vector stores. Vector stores are opened once
+    (optionally at boot) and shared by every request. When the persisted chroma/ directory is rebuilt by vector_database.py,
+    the pool notices the change on the next lookup and reopens its vector stores.
+
+    With the "numpy" vector backend, nearest neighbours are searched in the memory-mapped embeddings written next to the
+    index (see vector_index.py) instead of Chroma's HNSW index, which is then never loaded; Chroma only serves the
+    chunks' text.
+
+    The BM25 index, the memory-mapped embeddings, and the context packs built next to the index are loaded on first use
+    and reloaded with it. An index built with another embedding backend or model than the pool's is refused, since its
+    embeddings cannot be compared with the pool's query embeddings.
+
+    Args:
+    chroma_path (str): Path of the persisted ChromaDB directory
+    embedding_function (Embeddings): Embedding function used to embed queries
+    reload_interval (float): Minimum number of seconds between checks of the chroma/ directory for a rebuild
+    vector_backend (str): "chroma" or "numpy"
+
+    """
+
+    def __init__(self, chroma_path=None, embedding_function=None, reload_interval=5.0, vector_backend="chroma"):
+        self.chroma_path = chroma_path or os.path.join(BASEDIR, "chroma")
+        self.embedding_function = embedding_function
+        self.openai_api_key = None
+        self.embedding_settings = {}
+        self.reload_interval = reload_interval
+        self.vector_backend = vector_backend
+
+        self._lock = threading.RLock()
+        self._vectorstores = {}
+        self._side_indexes = {}
+        self._collection_names = None
+        self._signature = None
+        self._last_checked = 0.0
+
+        self.stats = {"loads": 0, "reloads": 0, "load_seconds": 0.0}
+
+    def init_app(self, app):
+        """
+        init_app configures the pool from the Flask application config and registers it under app.extensions.
+
+        Args:
+        app (Flask): The Flask application
+
+        Returns:
+        None
+
+        Raises:
+        ValueError: If VECTOR_BACKEND or EMBEDDING_BACKEND is configured to an unknown backend
+
+        """
+
+        self.chroma_path = app.config.get("CHROMA_PATH", self.chroma_path)
+        self.reload_interval = app.config.get(
+            "RETRIEVER_RELOAD_INTERVAL", self.reload_interval
+        )
+
+        self.vector_backend = app.config.get("VECTOR_BACKEND", self.vector_backend)
+        if self.vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(
+                {"error": "CONFIG_ERROR", "message": f"Unknown VECTOR_BACKEND {self.vector_backend}."}
+            )
+
+        embedding_backend = app.config.get("EMBEDDING_BACKEND", "openai")
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(
+                {"error": "CONFIG_ERROR", "message": f"Unknown EMBEDDING_BACKEND {embedding_backend}."}
+            )
+
+        self.openai_api_key = app.config.get("OPENAI_API_KEY")
+        self.embedding_settings = {
+            "cache_path": app.config.get("EMBEDDING_CACHE_PATH", EMBEDDING_CACHE_PATH),
+            "memory_cache_size": app.config.get("EMBEDDING_CACHE_MEMORY_SIZE", 1024),
+            "max_disk_entries": app.config.get("EMBEDDING_CACHE_MAX_ENTRIES", 100000),
+            "backend": embedding_backend,
+            "local_model": app.config.get("EMBEDDING_LOCAL_MODEL", LOCAL_EMBEDDING_MODEL),
+            "batch_size": app.config.get("EMBEDDING_LOCAL_BATCH_SIZE", 32),
+            "threads": app.config.get("EMBEDDING_LOCAL_THREADS", 0),
+        }
+
+        app.extensions["retriever_pool"] = self
+
+    def get_embedding_function(self):
+        # the embedding clients (langchain_openai, onnxruntime) are imported on first use
+        from verse.embeddings import get_embedding_function
+
+        with self._lock:
+            if self.embedding_function is None:
+                self.embedding_function = get_embedding_function(
+                    self.openai_api_key, **self.embedding_settings
+                )
+            return self.embedding_function
+
+    def check_embedding_function(self):
+        """
+        check_embedding_function refuses an index built with another embedding backend or model than the one that embeds
+        queries, as recorded in the index's manifest.
+
+        Args:
+        None
+
+        Returns:
+        None
+
+        Raises:
+        ValueError: If the index was built with another embedding backend or model
+
+        """
+
+        from verse.embeddings import get_embedding_signature
+        from verse.vector_database import load_manifest
+
+        manifest = load_manifest(self.chroma_path)
+        if manifest["embedding_model"] is None:
+            return
+
+        signature = get_embedding_signature(self.get_embedding_function())
+        # manifests written before embedding backends only record the model
+        index_signature = {
+            "backend": manifest.get("embedding_backend", signature["backend"]),
+            "model": manifest["embedding_model"],
+        }
+        if index_signature != signature:
+            raise ValueError(
+                {
+                    "error": "EMBEDDING_MISMATCH",
+                    "message": f"The index was built with {index_signature['backend']} embeddings "
+                    f"({index_signature['model']}), but queries are embedded with {signature['backend']} "
+                    f"({signature['model']}). Rebuild the index or change EMBEDDING_BACKEND.",
+                }
+            )
+
+    def index_exists(self):
+        return os.path.isdir(self.chroma_path)
+
+    def _index_signature(self):
+        """
+        _index_signature returns a cheap fingerprint of the persisted index. Rebuilding chroma/ either replaces the directory
+        (new inode) or rewrites its sqlite3 database (new modification time), so both are part of the fingerprint.
+        """
+
+        try:
+            directory_stat = os.stat(self.chroma_path)
+        except FileNotFoundError:
+            return None
+
+        signature = (directory_stat.st_ino, directory_stat.st_mtime_ns)
+
+        sqlite_path = os.path.join(self.chroma_path, "chroma.sqlite3")
+        if os.path.exists(sqlite_path):
+            sqlite_stat = os.stat(sqlite_path)
+            signature += (sqlite_stat.st_ino, sqlite_stat.st_mtime_ns)
+
+        return signature
+
+    def _check_for_rebuild(self):
+        now = time.monotonic()
+        if now - self._last_checked < self.reload_interval:
+            return
+        self._last_checked = now
+
+        signature = self._index_signature()
+        if signature != self._signature and (self._vectorstores or self._side_indexes):
+            self._reset()
+            self.stats["reloads"] += 1
+        self._signature = signature
+
+    def _reset(self):
+        # chromadb caches one client system per persist directory; drop it so a rebuilt index is read from disk again
+        from chromadb.api.client import SharedSystemClient
+
+        self._vectorstores = {}
+        self._side_indexes = {}
+        self._collection_names = None
+        SharedSystemClient.clear_system_cache()
+
+    def get_vectorstore(self, collection_name=DEFAULT_COLLECTION_NAME):
+        """
+        get_vectorstore returns the shared Chroma vector store for collection_name, opening it on first use.
+
+        Args:
+        collection_name (str): Name of the Chroma collection
+
+        Returns:
+        Chroma: The long-lived vector store for the collection
+
+        Raises:
+        FileNotFoundError: If the persisted chroma/ directory has not been generated yet
+        ValueError: If the index was built with another embedding backend or model
+
+        """
+
+        from langchain.vectorstores.chroma import Chroma
+
+        with self._lock:
+            self._check_for_rebuild()
+
+            if collection_name not in self._vectorstores:
+                if not self.index_exists():
+                    raise FileNotFoundError(
+                        f"No ChromaDB found at {self.chroma_path}. Run vector_database.py to generate it."
+                    )
+                if not self._vectorstores:
+                    self.check_embedding_function()
+
+                start = time.perf_counter()
+                self._vectorstores[collection_name] = Chroma(
+                    persist_directory=self.chroma_path,
+                    collection_name=collection_name,
+                    embedding_function=self.get_embedding_function(),
+                )
+                self.stats["loads"] += 1
+                self.stats["load_seconds"] += time.perf_counter() - start
+
+                if self._signature is None:
+                    self._signature = self._index_signature()
+
+            return self._vectorstores[collection_name]
+
+    def get_lexical_index(self):
+        """
+        get_lexical_index returns the BM25 index built next to the persisted index, loading it on first use.
+
+        Args:
+        None
+
+        Returns:
+        LexicalIndex: The BM25 index, or None if the persisted index was built without one
+
+        Raises:
+        None
+
+        """
+
+        return self._get_side_index(LEXICAL_INDEX_DIRNAME, LexicalIndex)
+
+    def get_vector_index(self):
+        """
+        get_vector_index returns the memory-mapped embeddings built next to the persisted index when the vector backend is
+        "numpy", loading them on first use.
+
+        Args:
+        None
+
+        Returns:
+        VectorIndex: The memory-mapped embeddings, or None with the "chroma" backend or if the persisted index was built
+        without them
+
+        Raises:
+        None
+
+        """
+
+        if self.vector_backend != "numpy":
+            return None
+
+        return self._get_side_index(VECTOR_INDEX_DIRNAME, VectorIndex)
+
+    def get_context_packs(self):
+        """
+        get_context_packs returns the context packs built next to the persisted index, loading them on first use.
+
+        Args:
+        None
+
+        Returns:
+        ContextPacks: The context packs, or None if the persisted index was built without them
+
+        Raises:
+        None
+
+        """
+
+        return self._get_side_index(CONTEXT_PACKS_DIRNAME, ContextPacks)
+
+    def _get_side_index(self, dirname, load):
+        with self._lock:
+            self._check_for_rebuild()
+
+            if dirname not in self._side_indexes:
+                path = os.path.join(self.chroma_path, dirname)
+                # an index built before this side index is remembered as False, so that it is not looked up again
+                self._side_indexes[dirname] = load(path) if os.path.isdir(path) else False
+                if self._signature is None:
+                    self._signature = self._index_signature()
+
+            return self._side_indexes[dirname] or None
+
+    def list_collection_names(self):
+        """
+        list_collection_names returns the names of the collections stored in the persisted index.
+
+        Args:
+        None
+
+        Returns:
+        List[str]: Names of the collections, or an empty list if the index has not been generated yet
+
+        Raises:
+        None
+
+        """
+
+        if not self.index_exists():
+            return []
+
+        with self._lock:
+            client = self.get_vectorstore(DEFAULT_COLLECTION_NAME)._client
+            if self._collection_names is None:
+                self._collection_names = [
+                    collection.name for collection in client.list_collections()
+                ]
+            return self._collection_names
+
+    def has_collection(self, collection_name):
+        return collection_name in self.list_collection_names()
+
+    def get_retriever(self, collection_name=DEFAULT_COLLECTION_NAME, **kwargs):
+        """
+        get_retriever returns a retriever backed by the shared vector store for collection_name.
+
+        Args:
+        collection_name (str): Name of the Chroma collection
+        **kwargs: Keyword arguments forwarded to Chroma.as_retriever
+
+        Returns:
+        VectorStoreRetriever: Retriever over the collection
+
+        Raises:
+        FileNotFoundError: If the persisted chroma/ directory has not been generated yet
+
+        """
+
+        return self.get_vectorstore(collection_name).as_retriever(**kwargs)
+
+    def warm_up(self, collection_names=None):
+        """
+        warm_up loads the BM25 index and the context packs, then opens each collection and runs one nearest-neighbour search with a stored
+        embedding, which loads the HNSW index into memory without calling the embedding API. With the "numpy" backend,
+        the memory-mapped embeddings are opened instead and the HNSW indexes are left on disk.
+
+        Args:
+        collection_names (Iterable[str]): Names of the collections to warm up. Defaults to every collection in the index.
+
+        Returns:
+        bool: True if the index exists and was warmed up, False otherwise
+
+        Raises:
+        None
+
+        """
+
+        if not self.index_exists():
+            return False
+
+        if collection_names is None:
+            collection_names = self.list_collection_names()
+
+        self.get_lexical_index()
+        self.get_context_packs()
+        vector_index = self.get_vector_index()
+
+        for collection_name in collection_names:
+            collection = self.get_vectorstore(collection_name)._collection
+            if vector_index is not None:
+                continue
+
+            sample = collection.peek(limit=1)
+            if sample["embeddings"]:
+                collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1)
+
+        return True
+
+
+def get_retriever_pool():
+    """
+    get_retriever_pool returns the RetrieverPool registered on the current Flask application, creating one if the
+    application was built without it.
+
+    Args:
+    None
+
+    Returns:
+    RetrieverPool: The application's retriever pool
+
+    Raises:
+    None
+
+    """
+
+    if "retriever_pool" not in current_app.extensions:
+        RetrieverPool().init_app(current_app)
+    return current_app.extensions["retriever_pool"]
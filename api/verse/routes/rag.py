@@ -1,12 +1,107 @@
+import json
 import re
+import time
 import verse.retrieval_augmented_generation as rag
 
-from flask import Blueprint, jsonify, request
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
 from flask_cors import cross_origin
 
+from verse.recommendations import get_recommendation_store
+from verse.response_cache import get_response_cache
+from verse.sessions import get_session, get_session_store
+from verse.timing import timed
+
 # create blueprint for RAG routes
 bp = Blueprint("rag", __name__, url_prefix="/rag")
 
+DANGEROUS_CHARACTERS_PATTERN = r"[;\'\\=<>/&]"
+
+
+def format_server_sent_event(event, data):
+    """
+    format_server_sent_event formats an event of a text/event-stream response. The data is JSON encoded so that newlines
+    in the text do not end the event.
+
+    Args:
+    event (str): Name of the event (ex. answer)
+    data (dict): Payload of the event
+
+    Returns:
+    str: The encoded event
+
+    Raises:
+    None
+
+    """
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_response_parts(parts, on_done=None):
+    """
+    stream_response_parts streams a professor response as Server-Sent Events. The answer tokens are sent as "answer"
+    events, followed by the segue tokens as "segue" events, each with a "token" field. A final "done" event carries the
+    complete response, which is identical to the non-streaming JSON response.
+
+    Args:
+    parts (Iterable[Tuple[str, str]]): The parts of the response, as yielded by rag.stream_professor_response
+    on_done (Callable[[str], None]): Called with the complete response once it has been streamed
+
+    Returns:
+    Response: The text/event-stream response
+
+    Raises:
+    None
+
+    """
+
+    def generate():
+        response = ""
+        try:
+            for part, text in parts:
+                response += text
+                if part != "separator":
+                    yield format_server_sent_event(part, {"token": text})
+        except Exception:
+            current_app.logger.exception("Error streaming professor response")
+            yield format_server_sent_event(
+                "error",
+                {"error": "RESPONSE_ERROR", "message": "Error obtaining response."},
+            )
+            return
+
+        if on_done is not None:
+            on_done(response)
+        yield format_server_sent_event("done", {"response": response})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def split_cached_response(response):
+    # a cached response is replayed as one answer event and one segue event
+    answer, separator, segue = response.partition("\n\n")
+    yield "answer", answer
+    if separator:
+        yield "separator", separator
+        yield "segue", segue
+
+
+def record_turn(session_id, query, response):
+    # adds a query and its response to the session they were sent with, if any
+    if session_id:
+        get_session_store().append(session_id, messages=(query, response), responses=(response,))
+
 
 @bp.route("/professorResponse", methods=["OPTIONS", "POST"])
 @cross_origin()
@@ -20,10 +115,15 @@ def professor_response():
         course (str): User's selected course
         query (str): The question or comment the user poses in the discussion
         previous_responses (Tuple[str]): A tuple of previous responses the model has generated
+        session_id (str, optional): ID of a session (see /sessions) to read the course and previous responses from
+        instead. The query and the response are added to the session.
+        global_search (bool, optional): Whether to retrieve context from every course instead of only the selected course
+        stream (bool, optional): Whether to stream the response as Server-Sent Events. Streaming is also used when the
+        request only accepts text/event-stream.
 
     Returns:
         If the request is JSON and contains the "course", "query", and "previous_responses" fields,
-        it returns a JSON response with the model's response.
+        it returns a JSON response with the model's response, or a text/event-stream response when streaming.
         Otherwise, it returns a 400 status code response.
 
     Raises:
@@ -40,6 +140,17 @@ def professor_response():
     course = data.get("course")
     query = data.get("query")
     previous_responses = data.get("previous_responses")
+    session_id = data.get("session_id")
+
+    if session_id:
+        session = get_session(session_id, "RESPONSE_ERROR")
+        course = course or session.course
+        previous_responses = session.previous_responses
+
+    global_search = bool(data.get("global_search", False))
+    stream = bool(data.get("stream", False)) or (
+        request.accept_mimetypes.best == "text/event-stream"
+    )
 
     if not course:
         raise ValueError(
@@ -51,17 +162,64 @@ def professor_response():
             {"error": "RESPONSE_ERROR", "message": "Query must be provided."}
         )
 
-    dangerous_characters_pattern = r"[;\'\\=<>/&]"
-    query = re.sub(dangerous_characters_pattern, "", query)
+    original_query = query
+    query = re.sub(DANGEROUS_CHARACTERS_PATTERN, "", query)
 
-    response = rag.get_professor_response(course, query, previous_responses)
+    # global answers are cached separately from answers scoped to the course
+    response_cache = get_response_cache()
+    cache_course = f"{course} (global search)" if global_search else course
 
-    if not response:
-        raise ValueError(
-            {"error": "RESPONSE_ERROR", "message": "Error obtaining response."}
+    if response_cache is not None:
+        with timed("cache_lookup"):
+            cached_response = response_cache.lookup(
+                "professorResponse", cache_course, query, previous_responses
+            )
+
+        if cached_response is not None:
+            record_turn(session_id, original_query, cached_response)
+            if stream:
+                response = stream_response_parts(split_cached_response(cached_response))
+            else:
+                response = jsonify(cached_response)
+            response.headers["X-Cache"] = "HIT"
+            return response, 200
+
+    start = time.perf_counter()
+
+    def finish_response(response):
+        record_turn(session_id, original_query, response)
+        if response_cache is not None:
+            response_cache.store(
+                cache_course,
+                query,
+                previous_responses,
+                response,
+                time.perf_counter() - start,
+            )
+
+    if stream:
+        response = stream_response_parts(
+            rag.stream_professor_response(
+                course, query, previous_responses, global_search
+            ),
+            on_done=finish_response,
+        )
+    else:
+        response_text = rag.get_professor_response(
+            course, query, previous_responses, global_search
         )
 
-    return jsonify(response), 200
+        if not response_text:
+            raise ValueError(
+                {"error": "RESPONSE_ERROR", "message": "Error obtaining response."}
+            )
+
+        finish_response(response_text)
+        response = jsonify(response_text)
+
+    if response_cache is not None:
+        response.headers["X-Cache"] = "MISS"
+    return response, 200
 
 
 @bp.route("/professorRecommendation", methods=["POST"])
@@ -75,9 +233,14 @@ def professor_recommendation():
         Expects JSON formatted data with the following fields:
         course (str): User's selected course
         messages (Tuple[str]): Tuple of the queries the user has submitted and the responses the model has provided
+        session_id (str, optional): ID of a session (see /sessions) to read the course and messages from instead
+        background (bool, optional): Whether to compute the recommendation in the background and return immediately
 
     Returns:
         If the request is JSON and contains the "course" and "messages" fields, it returns a JSON response with the model's response.
+        Recommendations are memoized by course and message history, so an unchanged history is answered without an LLM call.
+        If "background" is set, it returns a 202 status code response right away, and a later request with the same
+        history is answered with the recommendation computed in the background.
         Otherwise, it returns a 400 status code response.
 
     Raises:
@@ -96,6 +259,11 @@ def professor_recommendation():
     course = data.get("course")
     messages = data.get("messages")
 
+    if data.get("session_id"):
+        session = get_session(data["session_id"], "RECOMMENDATION_ERROR")
+        course = course or session.course
+        messages = session.messages
+
     if not course:
         raise ValueError(
             {"error": "RECOMMENDATION_ERROR", "message": "Course must be provided."}
@@ -106,7 +274,19 @@ def professor_recommendation():
             {"error": "RECOMMENDATION_ERROR", "message": "Messages must be provided."}
         )
 
-    recommendation = rag.get_professor_recommendation(course, messages)
+    recommendation_store = get_recommendation_store()
+    app = current_app._get_current_object()
+    messages = tuple(messages)
+
+    def compute_recommendation():
+        with app.app_context():
+            return rag.get_professor_recommendation(course, messages)
+
+    if data.get("background"):
+        recommendation_store.schedule(course, messages, compute_recommendation)
+        return jsonify({"status": "SCHEDULED"}), 202
+
+    recommendation = recommendation_store.get(course, messages, compute_recommendation)
 
     if not recommendation:
         raise ValueError(
@@ -117,3 +297,25 @@ def professor_recommendation():
         )
 
     return jsonify(recommendation), 200
+
+
+@bp.route("/cacheStats", methods=["GET"])
+@cross_origin()
+def cache_stats():
+    """
+    cache_stats reports the hit rate and the LLM latency saved by the response cache and the recommendation store, per route.
+
+    Returns:
+        A JSON response mapping each route to its cache stats. professorResponse is only reported if the response cache
+        is enabled.
+    """
+
+    stats = {}
+
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        stats.update(response_cache.get_stats())
+
+    stats["professorRecommendation"] = get_recommendation_store().get_stats()
+
+    return jsonify(stats), 200
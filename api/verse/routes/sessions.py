@@ -0,0 +1,119 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+
+from verse.sessions import get_session, get_session_store
+
+# create blueprint for session routes
+bp = Blueprint("sessions", __name__, url_prefix="/sessions")
+
+
+def session_to_json(session):
+    return {
+        "session_id": session.session_id,
+        "course": session.course,
+        "messages": list(session.messages),
+        "previous_responses": list(session.previous_responses),
+    }
+
+
+@bp.route("", methods=["POST"])
+@cross_origin()
+def create_session():
+    """
+    create_session starts a session, so that /rag/professorResponse and /rag/professorRecommendation can be sent its ID
+    instead of the conversation history.
+
+    Args:
+        Expects JSON formatted data with the following fields:
+        course (str, optional): User's selected course
+
+    Returns:
+        A JSON response with the new session, and a 201 status code.
+    """
+
+    data = request.get_json(silent=True) or {}
+    session = get_session_store().create(data.get("course"))
+    return jsonify(session_to_json(session)), 201
+
+
+@bp.route("/stats", methods=["GET"])
+@cross_origin()
+def session_stats():
+    """
+    session_stats reports the number of sessions, their memory use, and the sessions created, evicted, and expired.
+
+    Returns:
+        A JSON response with the session store's stats.
+    """
+
+    return jsonify(get_session_store().get_stats()), 200
+
+
+@bp.route("/<session_id>", methods=["GET"])
+@cross_origin()
+def read_session(session_id):
+    """
+    read_session returns the conversation of a session.
+
+    Returns:
+        A JSON response with the session's course, messages and previous responses.
+
+    Raises:
+        ValueError: If the session does not exist or has expired.
+    """
+
+    return jsonify(session_to_json(get_session(session_id, "SESSION_ERROR"))), 200
+
+
+@bp.route("/<session_id>/messages", methods=["POST"])
+@cross_origin()
+def append_messages(session_id):
+    """
+    append_messages adds messages the client showed outside of /rag/professorResponse (ex. a course introduction or a
+    recommendation) to a session. Queries and responses of /rag/professorResponse are added by the server.
+
+    Args:
+        Expects JSON formatted data with the following fields:
+        messages (Tuple[str]): The messages to add, in order
+
+    Returns:
+        A JSON response with the updated session.
+
+    Raises:
+        ValueError: If the request is not JSON formatted, the messages are empty, or the session does not exist or has
+        expired.
+    """
+
+    if not request.is_json:
+        raise ValueError(
+            {"error": "SESSION_ERROR", "message": "Request must be JSON formatted."}
+        )
+
+    messages = request.get_json().get("messages")
+    if not messages:
+        raise ValueError(
+            {"error": "SESSION_ERROR", "message": "Messages must be provided."}
+        )
+
+    session = get_session_store().append(session_id, messages=tuple(messages))
+    if session is None:
+        raise ValueError({"error": "SESSION_ERROR", "message": "Session not found."})
+    return jsonify(session_to_json(session)), 200
+
+
+@bp.route("/<session_id>", methods=["DELETE"])
+@cross_origin()
+def delete_session(session_id):
+    """
+    delete_session ends a session.
+
+    Returns:
+        A 204 status code response.
+
+    Raises:
+        ValueError: If the session does not exist or has expired.
+    """
+
+    if not get_session_store().delete(session_id):
+        raise ValueError({"error": "SESSION_ERROR", "message": "Session not found."})
+    return "", 204
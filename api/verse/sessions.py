@@ -0,0 +1,449 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from cachetools import Cache, TTLCache
+from flask import current_app
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+SESSION_STORE_PATH = os.path.join(BASEDIR, "sessions.sqlite3")
+
+# messages are every message of the conversation (queries, responses and client messages), and previous_responses are
+# the professor's responses among them
+Session = namedtuple("Session", ["session_id", "course", "messages", "previous_responses"])
+
+
+def create_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class SessionStore:
+    """
+    SessionStore keeps the conversation of each session on the server, so that clients send a session ID instead of the
+    whole history with every request. Backends implement create, get, append and delete; a session keeps at most
+    max_messages messages, dropping the oldest.
+
+    Args:
+    max_messages (int): Number of messages kept per session
+
+    """
+
+    def __init__(self, max_messages=500):
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self.stats = {
+            "created": 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def create(self, course=None):
+        """
+        create starts a new session.
+
+        Args:
+        course (str): User's selected course, or None
+
+        Returns:
+        Session: The new, empty session
+
+        Raises:
+        None
+
+        """
+
+        raise NotImplementedError
+
+    def get(self, session_id):
+        """
+        get returns a session.
+
+        Args:
+        session_id (str): ID of the session
+
+        Returns:
+        Session: The session, or None if it does not exist or has expired
+
+        Raises:
+        None
+
+        """
+
+        raise NotImplementedError
+
+    def append(self, session_id, messages=(), responses=()):
+        """
+        append adds messages to a session. Each of responses must also be in messages.
+
+        Args:
+        session_id (str): ID of the session
+        messages (Tuple[str]): Messages to add, in order
+        responses (Tuple[str]): The professor's responses among them
+
+        Returns:
+        Session: The updated session, or None if it does not exist or has expired
+
+        Raises:
+        None
+
+        """
+
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """
+        delete ends a session.
+
+        Args:
+        session_id (str): ID of the session
+
+        Returns:
+        bool: True if the session existed
+
+        Raises:
+        None
+
+        """
+
+        raise NotImplementedError
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+class _SessionCache(TTLCache):
+    # counts the sessions dropped to stay within the memory cap and the sessions that expired
+    def __init__(self, store, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = store
+
+    def popitem(self):
+        item = super().popitem()
+        self.store.stats["evictions"] += 1
+        return item
+
+    def expire(self, time=None):
+        # TTLCache.__len__ expires sessions itself, so the sessions are counted with Cache.__len__
+        sessions = Cache.__len__(self)
+        super().expire(time)
+        self.store.stats["expirations"] += sessions - Cache.__len__(self)
+
+
+def _get_session_size(session):
+    return sum(len(message) for message in session.messages) + 256
+
+
+class MemorySessionStore(SessionStore):
+    """
+    MemorySessionStore keeps sessions in memory, within max_bytes bytes of messages. Sessions expire ttl seconds after
+    they were last written, and the least recently used sessions are evicted once the store is full.
+
+    Args:
+    max_bytes (int): Approximate number of bytes of messages kept in memory
+    ttl (float): Seconds a session is kept after it was last written
+    max_messages (int): Number of messages kept per session
+
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=86400, max_messages=500):
+        super().__init__(max_messages=max_messages)
+        self._sessions = _SessionCache(
+            self, maxsize=max_bytes, ttl=ttl, getsizeof=_get_session_size
+        )
+
+    def create(self, course=None):
+        session = Session(create_session_id(), course, (), ())
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self.stats["created"] += 1
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            self.stats["hits" if session is not None else "misses"] += 1
+        return session
+
+    def append(self, session_id, messages=(), responses=()):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self.stats["misses"] += 1
+                return None
+
+            session = session._replace(
+                messages=(session.messages + tuple(messages))[-self.max_messages :],
+                previous_responses=(session.previous_responses + tuple(responses))[
+                    -self.max_messages :
+                ],
+            )
+            # a single session never takes more than the whole store
+            while len(session.messages) > 1 and _get_session_size(session) > self._sessions.maxsize:
+                session = session._replace(messages=session.messages[1:])
+
+            # the old entry is removed first, so that making room for the new one never evicts the session itself
+            del self._sessions[session_id]
+            self._sessions[session_id] = session
+            self.stats["hits"] += 1
+        return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "sessions": len(self._sessions),
+                "bytes": self._sessions.currsize,
+                "max_bytes": self._sessions.maxsize,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLiteSessionStore keeps sessions in a local sqlite3 file, so that they survive restarts and are shared by every
+    worker process. Sessions expire ttl seconds after they were last written, and once the file holds more than
+    max_sessions sessions, the least recently used ones are evicted.
+
+    Args:
+    path (str): Path of the sqlite3 file
+    ttl (float): Seconds a session is kept after it was last written
+    max_sessions (int): Number of sessions kept
+    max_messages (int): Number of messages kept per session
+
+    """
+
+    def __init__(self, path=SESSION_STORE_PATH, ttl=86400, max_sessions=100000, max_messages=500):
+        super().__init__(max_messages=max_messages)
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._connection = None
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, course TEXT, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)"
+            )
+            with self._connection:
+                self._create_messages_table(self._connection)
+        return self._connection
+
+    def _create_messages_table(self, connection):
+        # messages and responses are kept as separate rows, like the two tuples of a Session, each with its own positions
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(messages)")]
+        if "is_response" in columns:
+            # files written before responses had their own rows tagged the rows of the messages that were responses
+            connection.execute("ALTER TABLE messages RENAME TO messages_tagged")
+
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages (session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, "
+            "role TEXT NOT NULL, position INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (session_id, role, position))"
+        )
+
+        if "is_response" in columns:
+            connection.execute(
+                "INSERT INTO messages (session_id, role, position, text) "
+                "SELECT session_id, 'message', position, text FROM messages_tagged"
+            )
+            connection.execute(
+                "INSERT INTO messages (session_id, role, position, text) "
+                "SELECT session_id, 'response', ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY position) - 1, text "
+                "FROM messages_tagged WHERE is_response"
+            )
+            connection.execute("DROP TABLE messages_tagged")
+
+    def _remove_stale_sessions(self, connection):
+        expired = connection.execute(
+            "DELETE FROM sessions WHERE last_used < ?", (time.time() - self.ttl,)
+        ).rowcount
+        self.stats["expirations"] += expired
+
+        # evict a tenth of the store at a time so that eviction is not paid on every new session
+        (count,) = connection.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        if count > self.max_sessions:
+            evicted = count - self.max_sessions + self.max_sessions // 10
+            connection.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_used LIMIT ?)",
+                (evicted,),
+            )
+            self.stats["evictions"] += evicted
+
+    def _read(self, connection, session_id):
+        row = connection.execute(
+            "SELECT course FROM sessions WHERE id = ? AND last_used >= ?",
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+
+        messages = connection.execute(
+            "SELECT role, text FROM messages WHERE session_id = ? ORDER BY position",
+            (session_id,),
+        ).fetchall()
+        return Session(
+            session_id,
+            row[0],
+            tuple(text for role, text in messages if role == "message"),
+            tuple(text for role, text in messages if role == "response"),
+        )
+
+    def create(self, course=None):
+        session = Session(create_session_id(), course, (), ())
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._remove_stale_sessions(connection)
+                connection.execute(
+                    "INSERT INTO sessions (id, course, last_used) VALUES (?, ?, ?)",
+                    (session.session_id, course, time.time()),
+                )
+            self.stats["created"] += 1
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._read(self._get_connection(), session_id)
+            self.stats["hits" if session is not None else "misses"] += 1
+        return session
+
+    def append(self, session_id, messages=(), responses=()):
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                updated = connection.execute(
+                    "UPDATE sessions SET last_used = ? WHERE id = ? AND last_used >= ?",
+                    (time.time(), session_id, time.time() - self.ttl),
+                ).rowcount
+                if not updated:
+                    self.stats["misses"] += 1
+                    return None
+
+                # messages and responses are tagged by which tuple they were passed in, never by their text, so that a
+                # query repeating an earlier response is not taken for one
+                for role, texts in (("message", messages), ("response", responses)):
+                    (position,) = connection.execute(
+                        "SELECT COALESCE(MAX(position) + 1, 0) FROM messages WHERE session_id = ? AND role = ?",
+                        (session_id, role),
+                    ).fetchone()
+                    connection.executemany(
+                        "INSERT INTO messages (session_id, role, position, text) VALUES (?, ?, ?, ?)",
+                        [(session_id, role, position + offset, text) for offset, text in enumerate(texts)],
+                    )
+                    connection.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND role = ? AND position < ?",
+                        (session_id, role, position + len(texts) - self.max_messages),
+                    )
+
+            self.stats["hits"] += 1
+            return self._read(connection, session_id)
+
+    def delete(self, session_id):
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                return (
+                    connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+                    > 0
+                )
+
+    def get_stats(self):
+        with self._lock:
+            (sessions,) = self._get_connection().execute("SELECT COUNT(*) FROM sessions").fetchone()
+            return {**self.stats, "sessions": sessions, "max_sessions": self.max_sessions}
+
+
+def create_session_store(config):
+    """
+    create_session_store creates the session store selected by an application's configuration.
+
+    Args:
+    config (dict): The application's configuration
+
+    Returns:
+    SessionStore: The session store
+
+    Raises:
+    ValueError: If SESSION_STORE is configured to an unknown backend
+
+    """
+
+    backend = config.get("SESSION_STORE", "memory")
+    ttl = config.get("SESSION_TTL", 86400)
+    max_messages = config.get("SESSION_MAX_MESSAGES", 500)
+
+    if backend == "memory":
+        return MemorySessionStore(
+            max_bytes=config.get("SESSION_MAX_BYTES", 64 * 1024 * 1024),
+            ttl=ttl,
+            max_messages=max_messages,
+        )
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            path=config.get("SESSION_STORE_PATH", SESSION_STORE_PATH),
+            ttl=ttl,
+            max_sessions=config.get("SESSION_MAX_SESSIONS", 100000),
+            max_messages=max_messages,
+        )
+
+    raise ValueError(
+        {"error": "CONFIG_ERROR", "message": f"Unknown SESSION_STORE {backend}."}
+    )
+
+
+def get_session_store():
+    """
+    get_session_store returns the session store of the current Flask application, creating one if the application was
+    built without it.
+
+    Args:
+    None
+
+    Returns:
+    SessionStore: The application's session store
+
+    Raises:
+    None
+
+    """
+
+    if "session_store" not in current_app.extensions:
+        current_app.extensions["session_store"] = create_session_store(current_app.config)
+    return current_app.extensions["session_store"]
+
+
+def get_session(session_id, error):
+    """
+    get_session returns a session for a route, raising the route's error if it does not exist.
+
+    Args:
+    session_id (str): ID of the session
+    error (str): Error code of the route (ex. RESPONSE_ERROR)
+
+    Returns:
+    Session: The session
+
+    Raises:
+    ValueError: If the session does not exist or has expired
+
+    """
+
+    session = get_session_store().get(session_id)
+    if session is None:
+        raise ValueError({"error": error, "message": "Session not found."})
+    return session
@@ -0,0 +1,311 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+from verse.corpus import CORPUS_FILENAME, open_corpus
+from verse.courses import COURSES
+from verse.history import get_token_counter
+
+load_dotenv()
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+PROCESSED_DATA_PATH = os.path.join(BASEDIR, "data/processed")
+SUMMARIES_PATH = os.path.join(BASEDIR, "data/summaries.json")
+
+SUMMARY_MODEL = "gpt-3.5-turbo-1106"
+
+LECTURE_FILENAME_PATTERN = re.compile(r"^lecture(\d+)\.txt$")
+
+LECTURE_SUMMARY_WORDS = 60
+COURSE_SUMMARY_WORDS = 80
+
+SECTION_SUMMARY_TEMPLATE = """
+    You are preparing notes on a lecture of {course}. Here is a part of the lecture's transcript:
+
+    {text}
+
+    ------------------
+
+    Now, summarize this part of the lecture in no more than {words} words. Keep the texts, authors, and ideas it discusses.
+    """
+
+LECTURE_SUMMARY_TEMPLATE = """
+    You are preparing notes on a lecture of {course}. Here are notes on the lecture, in order:
+
+    {text}
+
+    ------------------
+
+    Now, summarize the whole lecture in no more than {words} words. Keep the texts, authors, and ideas it discusses.
+    """
+
+COURSE_SUMMARY_TEMPLATE = """
+    You are preparing notes on the course {course}. Here is a summary of each of its lectures, in order:
+
+    {text}
+
+    ------------------
+
+    Now, summarize what the course covers in no more than {words} words. Keep the main texts, authors, and ideas.
+    """
+
+
+def get_text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_summaries(summaries_path=None):
+    """
+    load_summaries reads the lecture and course summaries written by summarize_courses.
+
+    Args:
+    summaries_path (str): Path of the summaries. Defaults to ./data/summaries.json.
+
+    Returns:
+    dict: The summary and text hash of each lecture (by "<course>/lecture<N>") and each course (by course number), or
+    empty summaries if none have been written
+
+    Raises:
+    None
+
+    """
+
+    summaries_path = summaries_path or SUMMARIES_PATH
+    if not os.path.exists(summaries_path):
+        return {"lectures": {}, "courses": {}}
+
+    with open(summaries_path, "r") as file:
+        return json.load(file)
+
+
+def split_into_sections(text, max_tokens, count_tokens):
+    """
+    split_into_sections splits a transcript into consecutive sections of at most max_tokens tokens, between sentences.
+
+    Args:
+    text (str): The transcript
+    max_tokens (int): Number of tokens per section
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+
+    Returns:
+    List[str]: The sections, in order
+
+    Raises:
+    None
+
+    """
+
+    sections, section, section_tokens = [], [], 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        tokens = count_tokens(sentence)
+        if section and section_tokens + tokens > max_tokens:
+            sections.append(" ".join(section))
+            section, section_tokens = [], 0
+        section.append(sentence)
+        section_tokens += tokens
+    if section:
+        sections.append(" ".join(section))
+    return sections
+
+
+def summarize_lecture(llm, course_title, transcript, section_tokens, count_tokens):
+    """
+    summarize_lecture summarizes a lecture transcript. A transcript longer than section_tokens tokens is summarized
+    section by section first, and the summaries of its sections are then summarized together.
+
+    Args:
+    llm (BaseChatModel): The model that writes the summaries
+    course_title (str): Title of the lecture's course
+    transcript (str): The lecture transcript
+    section_tokens (int): Number of tokens of the transcript summarized at once
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text
+
+    Returns:
+    str: The summary of the lecture
+
+    Raises:
+    None
+
+    """
+
+    section_chain = PromptTemplate.from_template(SECTION_SUMMARY_TEMPLATE) | llm | StrOutputParser()
+    lecture_chain = PromptTemplate.from_template(LECTURE_SUMMARY_TEMPLATE) | llm | StrOutputParser()
+
+    sections = split_into_sections(transcript, section_tokens, count_tokens)
+    if len(sections) > 1:
+        notes = section_chain.batch(
+            [{"course": course_title, "text": section, "words": 2 * LECTURE_SUMMARY_WORDS} for section in sections]
+        )
+    else:
+        notes = sections
+
+    return lecture_chain.invoke(
+        {"course": course_title, "text": "\n\n".join(notes), "words": LECTURE_SUMMARY_WORDS}
+    ).strip()
+
+
+def load_transcripts(processed_data_path, course_numbers=None):
+    """
+    load_transcripts reads the cleaned transcripts of the processed lectures, from the corpus file when
+    data_processing.py wrote one (see corpus.write_corpus), and from the lectures' .txt files otherwise, as
+    vector_database.create_document_chunks does.
+
+    Args:
+    processed_data_path (str): Directory of the cleaned transcripts
+    course_numbers (List[int]): Courses to read. Defaults to every course with processed transcripts.
+
+    Returns:
+    dict: The transcript of each lecture, by course and lecture number
+
+    Raises:
+    None
+
+    """
+
+    corpus_path = os.path.join(processed_data_path, CORPUS_FILENAME)
+    if os.path.exists(corpus_path):
+        columns = open_corpus(corpus_path).select(["course", "lecture", "text"]).to_pydict()
+        return {
+            (course_number, lecture_number): text
+            for course_number, lecture_number, text in zip(columns["course"], columns["lecture"], columns["text"])
+            if course_numbers is None or course_number in course_numbers
+        }
+
+    if course_numbers is None:
+        course_numbers = sorted(
+            int(name) for name in os.listdir(processed_data_path) if name.isdigit()
+        ) if os.path.isdir(processed_data_path) else []
+
+    transcripts = {}
+    for course_number in course_numbers:
+        course_path = os.path.join(processed_data_path, str(course_number))
+        if not os.path.isdir(course_path):
+            continue
+        for filename in os.listdir(course_path):
+            match = LECTURE_FILENAME_PATTERN.match(filename)
+            if match:
+                with open(os.path.join(course_path, filename), "r", encoding="utf-8") as file:
+                    transcripts[(course_number, int(match.group(1)))] = file.read()
+    return transcripts
+
+
+def summarize_courses(
+    course_numbers=None,
+    processed_data_path=None,
+    summaries_path=None,
+    llm=None,
+    workers=4,
+    section_tokens=3000,
+    count_tokens=None,
+):
+    """
+    summarize_courses summarizes every processed lecture transcript (see load_transcripts), and every course from the
+    summaries of its lectures, into summaries_path. vector_database.py stores the summaries with the index, where retrieval uses them to
+    introduce the lectures its context comes from.
+
+    Summaries are kept with a hash of the text they summarize, so that only new or changed lectures (and the courses
+    they belong to) are summarized again.
+
+    Args:
+    course_numbers (List[int]): Courses to summarize. Defaults to every course with processed transcripts.
+    processed_data_path (str): Directory of the cleaned transcripts. Defaults to ./data/processed.
+    summaries_path (str): Path the summaries are written to. Defaults to ./data/summaries.json.
+    llm (BaseChatModel): The model that writes the summaries. Defaults to the ChatOpenAI model of the answers.
+    workers (int): Number of lectures summarized at once
+    section_tokens (int): Number of tokens of a transcript summarized at once
+    count_tokens (Callable[[str], int]): Function that counts the tokens of a text. Defaults to the model's tokenizer.
+
+    Returns:
+    dict: The number of lectures and courses summarized and reused, and the seconds the summaries took
+
+    Raises:
+    None
+
+    """
+
+    start = time.perf_counter()
+    processed_data_path = processed_data_path or PROCESSED_DATA_PATH
+    summaries_path = summaries_path or SUMMARIES_PATH
+    llm = llm or ChatOpenAI(model_name=SUMMARY_MODEL, temperature=0)
+    count_tokens = count_tokens or get_token_counter(SUMMARY_MODEL)
+
+    summaries = load_summaries(summaries_path)
+    stats = {"lectures": 0, "reused_lectures": 0, "courses": 0, "reused_courses": 0}
+
+    transcripts = load_transcripts(processed_data_path, course_numbers)
+
+    def summarize(lecture):
+        summary = summarize_lecture(
+            llm, COURSES[lecture[0]]["title"], transcripts[lecture], section_tokens, count_tokens
+        )
+        return lecture, summary
+
+    stale_lectures = [
+        lecture
+        for lecture, transcript in transcripts.items()
+        if summaries["lectures"].get(f"{lecture[0]}/lecture{lecture[1]}", {}).get("hash")
+        != get_text_hash(transcript)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (course_number, lecture_number), summary in executor.map(summarize, stale_lectures):
+            summaries["lectures"][f"{course_number}/lecture{lecture_number}"] = {
+                "hash": get_text_hash(transcripts[(course_number, lecture_number)]),
+                "summary": summary,
+            }
+    stats["lectures"] = len(stale_lectures)
+    stats["reused_lectures"] = len(transcripts) - len(stale_lectures)
+
+    course_chain = PromptTemplate.from_template(COURSE_SUMMARY_TEMPLATE) | llm | StrOutputParser()
+    for course_number in sorted({course_number for course_number, _ in transcripts}):
+        lecture_summaries = "\n".join(
+            f"Lecture {lecture_number}: {summaries['lectures'][f'{course_number}/lecture{lecture_number}']['summary']}"
+            for _, lecture_number in sorted(lecture for lecture in transcripts if lecture[0] == course_number)
+        )
+        if summaries["courses"].get(str(course_number), {}).get("hash") == get_text_hash(lecture_summaries):
+            stats["reused_courses"] += 1
+            continue
+
+        summary = course_chain.invoke(
+            {"course": COURSES[course_number]["title"], "text": lecture_summaries, "words": COURSE_SUMMARY_WORDS}
+        )
+        summaries["courses"][str(course_number)] = {
+            "hash": get_text_hash(lecture_summaries),
+            "summary": summary.strip(),
+        }
+        stats["courses"] += 1
+
+    temporary_path = f"{summaries_path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(summaries, file, indent=1)
+    os.replace(temporary_path, summaries_path)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the lectures and courses in ./data/processed into ./data/summaries.json."
+    )
+    parser.add_argument("--courses", type=int, nargs="+", default=None)
+    parser.add_argument("--workers", type=int, default=4, help="Number of lectures summarized at once")
+    args = parser.parse_args()
+
+    stats = summarize_courses(args.courses, workers=args.workers)
+    print(
+        f"Summarized {stats['lectures']} lectures ({stats['reused_lectures']} unchanged) and {stats['courses']} courses "
+        f"({stats['reused_courses']} unchanged) in {stats['seconds']:.1f}s."
+    )
+
+
+if __name__ == "__main__":
+    main()
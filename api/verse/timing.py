@@ -0,0 +1,189 @@
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+from verse.tracing import start_span
+
+
+def record_timing(stage, seconds):
+    """
+    record_timing adds the duration of a stage to the timings of the current request. Outside of a Flask application
+    context the timing is dropped.
+
+    Args:
+    stage (str): Name of the stage (ex. retrieval)
+    seconds (float): Duration of the stage in seconds
+
+    Returns:
+    None
+
+    Raises:
+    None
+
+    """
+
+    if has_app_context():
+        timings = g.setdefault("timings", {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """
+    timed is a context manager that records how long its body takes as a stage of the current request. When tracing is
+    enabled, the stage is also a span of the request's trace.
+
+    Args:
+    stage (str): Name of the stage (ex. retrieval)
+
+    """
+
+    start = time.perf_counter()
+    try:
+        with start_span(stage):
+            yield
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+
+
+def get_timings():
+    """
+    get_timings returns the stage timings recorded for the current request.
+
+    Args:
+    None
+
+    Returns:
+    dict[str:float]: Maps each stage name to its duration in seconds
+
+    Raises:
+    None
+
+    """
+
+    if not has_app_context():
+        return {}
+    return g.get("timings", {})
+
+
+def server_timing_header(timings):
+    """
+    server_timing_header formats stage timings as a Server-Timing header value, in milliseconds.
+
+    Args:
+    timings (dict[str:float]): Maps each stage name to its duration in seconds
+
+    Returns:
+    str: The Server-Timing header value (ex. "retrieval;dur=12.5, answer;dur=950.1")
+
+    Raises:
+    None
+
+    """
+
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
+
+
+def record_prompt_tokens(section, tokens):
+    """
+    record_prompt_tokens adds the number of tokens of a prompt section to the prompt token counts of the current request.
+    Outside of a Flask application context the count is dropped.
+
+    Args:
+    section (str): Name of the prompt section (ex. previous_responses)
+    tokens (int): Number of tokens
+
+    Returns:
+    None
+
+    Raises:
+    None
+
+    """
+
+    if has_app_context():
+        counts = g.setdefault("prompt_tokens", {})
+        counts[section] = counts.get(section, 0) + tokens
+
+
+def get_prompt_tokens():
+    """
+    get_prompt_tokens returns the prompt token counts recorded for the current request.
+
+    Args:
+    None
+
+    Returns:
+    dict[str:int]: Maps each prompt section to its number of tokens
+
+    Raises:
+    None
+
+    """
+
+    if not has_app_context():
+        return {}
+    return g.get("prompt_tokens", {})
+
+
+def prompt_tokens_header(counts):
+    """
+    prompt_tokens_header formats prompt token counts as an X-Prompt-Tokens header value.
+
+    Args:
+    counts (dict[str:int]): Maps each prompt section to its number of tokens
+
+    Returns:
+    str: The X-Prompt-Tokens header value (ex. "context=812, previous_responses=640")
+
+    Raises:
+    None
+
+    """
+
+    return ", ".join(f"{section}={tokens}" for section, tokens in counts.items())
+
+
+def record_completion_tokens(chain, tokens):
+    """
+    record_completion_tokens adds the number of tokens an LLM chain generated to the completion token counts of the
+    current request. Outside of a Flask application context the count is dropped.
+
+    Args:
+    chain (str): Name of the chain (ex. answer)
+    tokens (int): Number of tokens
+
+    Returns:
+    None
+
+    Raises:
+    None
+
+    """
+
+    if has_app_context():
+        counts = g.setdefault("completion_tokens", {})
+        counts[chain] = counts.get(chain, 0) + tokens
+
+
+def get_completion_tokens():
+    """
+    get_completion_tokens returns the completion token counts recorded for the current request.
+
+    Args:
+    None
+
+    Returns:
+    dict[str:int]: Maps each chain to the number of tokens it generated
+
+    Raises:
+    None
+
+    """
+
+    if not has_app_context():
+        return {}
+    return g.get("completion_tokens", {})
@@ -0,0 +1,147 @@
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4317"
+
+# span exports started by init_tracing while deferred_span_export is active, see start_deferred_span_exports
+_defer_span_export = False
+_deferred_span_exports = []
+
+
+@contextmanager
+def deferred_span_export():
+    """
+    deferred_span_export is a context manager under which init_tracing does not start exporting spans: the exporter
+    and the thread that sends the batches of spans are created by start_deferred_span_exports instead. A process that
+    creates the application before forking (see prefork.PreforkServer) uses it so that each worker exports its spans
+    from its own thread and connection, as threads do not survive a fork.
+
+    """
+
+    global _defer_span_export
+    _defer_span_export = True
+    try:
+        yield
+    finally:
+        _defer_span_export = False
+
+
+def start_deferred_span_exports():
+    """
+    start_deferred_span_exports starts exporting the spans of the applications created under deferred_span_export.
+
+    Args:
+    None
+
+    Returns:
+    int: The number of exports started
+
+    Raises:
+    None
+
+    """
+
+    started = 0
+    while _deferred_span_exports:
+        _deferred_span_exports.pop(0)()
+        started += 1
+    return started
+
+
+def init_tracing(app, span_exporter=None):
+    """
+    init_tracing exports a trace of every request to OpenTelemetry: one span per request, with a child span for each
+    stage recorded with timing.timed (ex. retrieval, embed_query, answer, segue). Spans are exported in batches to the
+    OTLP/gRPC collector at OTEL_EXPORTER_OTLP_ENDPOINT. The OpenTelemetry SDK is only imported when tracing is enabled. Under
+    deferred_span_export, spans are only exported once start_deferred_span_exports is called.
+
+    Args:
+    app (Flask): The Flask application
+    span_exporter (SpanExporter): Exporter to send spans to instead of the OTLP collector
+
+    Returns:
+    TracerProvider: The tracer provider of the application
+
+    Raises:
+    None
+
+    """
+
+    from opentelemetry import context, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    tracer_provider = TracerProvider(
+        resource=Resource.create({"service.name": app.config.get("OTEL_SERVICE_NAME", "verse")})
+    )
+
+    # the batch span processor starts its export thread, and the OTLP exporter its gRPC channel, when created
+    def start_span_export():
+        exporter = span_exporter
+        if exporter is None:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+            endpoint = app.config.get("OTEL_EXPORTER_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT)
+            exporter = OTLPSpanExporter(endpoint=endpoint, insecure=endpoint.startswith("http://"))
+        tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+
+    if _defer_span_export:
+        _deferred_span_exports.append(start_span_export)
+    else:
+        start_span_export()
+    tracer = tracer_provider.get_tracer("verse")
+
+    app.extensions["tracer_provider"] = tracer_provider
+    app.extensions["tracer"] = tracer
+
+    @app.before_request
+    def start_request_span():
+        route = request.url_rule.rule if request.url_rule else request.path
+        span = tracer.start_span(f"{request.method} {route}", kind=trace.SpanKind.SERVER)
+        span.set_attribute("http.method", request.method)
+        span.set_attribute("http.route", route)
+        g.request_span = span
+        g.request_span_token = context.attach(trace.set_span_in_context(span))
+
+    @app.after_request
+    def record_response_status(response):
+        if "request_span" in g:
+            g.request_span.set_attribute("http.status_code", response.status_code)
+        return response
+
+    # a streamed response is torn down once it has been sent, so its span covers the whole stream
+    @app.teardown_request
+    def end_request_span(error=None):
+        span = g.pop("request_span", None)
+        if span is None:
+            return
+
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        span.end()
+        context.detach(g.pop("request_span_token"))
+
+    return tracer_provider
+
+
+@contextmanager
+def start_span(name):
+    """
+    start_span is a context manager that traces its body as a span of the current request, when the current Flask
+    application has tracing enabled.
+
+    Args:
+    name (str): Name of the span (ex. retrieval)
+
+    """
+
+    tracer = current_app.extensions.get("tracer") if has_app_context() else None
+    if tracer is None:
+        yield None
+        return
+
+    with tracer.start_as_current_span(name) as span:
+        yield span
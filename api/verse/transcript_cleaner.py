@@ -0,0 +1,89 @@
+import re
+
+from verse.courses import COURSES
+
+MONTHS = (
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+)
+
+# page furniture of the Open Courses transcript pages
+BOILERPLATE = ("<< back", "[end of transcript]", "back to top")
+
+# lecture headings (ex. Lecture 12 Transcript)
+LECTURE_HEADING_PATTERN = r"Lecture \d+ Transcript"
+
+LEADING_NON_ALPHABETIC_PATTERN = re.compile(r"^[^a-zA-Z]+")
+
+
+class TranscriptCleaner:
+    """
+    TranscriptCleaner removes dates, page furniture, lecture headings, course titles and professor names from the text
+    of a transcript. All removal rules are compiled into a single regular expression once, so that cleaning a transcript
+    is a single pass over its text. Literal rules are tried longest first, so a rule never cuts a longer one short.
+
+    Args:
+    literals (Iterable[str]): Exact strings to remove
+    patterns (Iterable[str]): Regular expressions to remove
+
+    """
+
+    def __init__(self, literals=(), patterns=()):
+        literals = sorted(set(literals), key=len, reverse=True)
+        alternatives = list(patterns) + [re.escape(literal) for literal in literals]
+        self.removal_pattern = re.compile("|".join(alternatives))
+
+    @classmethod
+    def from_courses(cls, courses):
+        """
+        from_courses builds the cleaner for a course registry: the fixed rules plus the title and professor of every
+        course, so that a new course only needs an entry in the registry.
+
+        Args:
+        courses (dict[int:dict]): Course registry in the format of verse.courses.COURSES
+
+        Returns:
+        TranscriptCleaner: The cleaner
+
+        Raises:
+        None
+
+        """
+
+        literals = list(MONTHS) + list(BOILERPLATE)
+        for course_info in courses.values():
+            literals += [course_info["title"], course_info["professor"]]
+
+        return cls(literals=literals, patterns=[LECTURE_HEADING_PATTERN])
+
+    def clean(self, transcript_text):
+        """
+        clean applies every removal rule in one pass, then trims the non-alphabetic text before the lecture contents.
+
+        Args:
+        transcript_text (str): The text representation of a lecture (i.e., a transcript)
+
+        Returns:
+        str: The cleaned transcript
+
+        Raises:
+        None
+
+        """
+
+        transcript_text = self.removal_pattern.sub("", transcript_text)
+        transcript_text = LEADING_NON_ALPHABETIC_PATTERN.sub("", transcript_text)
+        return transcript_text.strip()
+
+
+DEFAULT_CLEANER = TranscriptCleaner.from_courses(COURSES)
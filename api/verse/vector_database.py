@@ -1,59 +1,158 @@
+import hashlib
+import json
 import os
+import re
 import shutil
+import time
+from collections import defaultdict
 
+import chromadb
+from chromadb.api.client import SharedSystemClient
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from verse.chunking import (
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_TOKENS,
+    get_lecture_metadata,
+    load_document_chunks,
+)
+from verse.context_packs import CONTEXT_PACKS_DIRNAME, build_context_packs
+from verse.corpus import CORPUS_FILENAME, load_corpus_chunks, load_corpus_embeddings
+from verse.courses import (
+    GLOBAL_COLLECTION_NAME,
+    get_course_collection_name,
+)
+from verse.embedding_stage import EmbeddingStage
+from verse.embeddings import (
+    EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_MODEL,
+    get_embedding_function,
+    get_embedding_signature,
+)
+from verse.history import get_token_counter
+from verse.lexical_index import LEXICAL_INDEX_DIRNAME, build_lexical_index
+from verse.summaries import load_summaries
+from verse.vector_index import VECTOR_INDEX_DIRNAME, build_vector_index
 
 load_dotenv()
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
+PROCESSED_DATA_PATH = os.path.join(BASEDIR, "data/processed")
 
+MANIFEST_FILENAME = "manifest.json"
 
-def create_document_chunks():
+EMBEDDING_CHECKPOINT_DIRNAME = ".chroma-embedding-checkpoint"
+
+# builds are named by their creation time in nanoseconds, and an index built before builds were kept is moved aside as
+# "<time>-legacy"; other entries of the builds directory (ex. .DS_Store) are left alone
+BUILD_NAME_PATTERN = re.compile(r"^\d+(-legacy)?$")
+
+
+def create_document_chunks(
+    processed_data_path=None, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, workers=None
+):
     """
-    create_document_chunks iterates through the processed data directory and uses the cleaned .txt files
-    (that represent lecture transcripts) and turns them into langchain Documents that langchain's RecursiveCharacterTextSplitter can
-    recognize. This text splitter recursively creates chunks with different parameters (ex. chunk size, overlap).
+    create_document_chunks reads the cleaned .txt files (that represent lecture transcripts) of the processed data
+    directory and cuts them into chunks of whole sentences of about chunk_tokens tokens of the embedding model, reading
+    and chunking several transcripts at a time (see chunking.py). If the directory holds a corpus file written by
+    data_processing.py --format arrow, the transcripts and their chunk boundaries are read from it instead (see
+    corpus.py).
 
     Args:
-    None
+    processed_data_path (str): Directory of the cleaned transcripts. Defaults to ./data/processed.
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
+    workers (int): Number of threads reading and chunking transcripts, or None for the default
 
     Returns:
-    chunks (List[Document]): This is a list of Documents that represent chunks from text.
+    chunks (List[Document]): This is a list of Documents that represent chunks from text. Each chunk carries the course
+    and lecture it came from in its metadata.
 
     Raises:
     None
 
     """
 
-    processed_data_path = os.path.join(BASEDIR, "data/processed")
+    processed_data_path = processed_data_path or PROCESSED_DATA_PATH
+    count_tokens = get_token_counter(EMBEDDING_MODEL)
 
-    loader = DirectoryLoader(processed_data_path, glob="*.txt", recursive=True)
-    documents = loader.load()
+    corpus_path = os.path.join(processed_data_path, CORPUS_FILENAME)
+    if os.path.exists(corpus_path):
+        return load_corpus_chunks(corpus_path, count_tokens, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100,
-        length_function=len,
-        is_separator_regex=False,
+    return load_document_chunks(
+        processed_data_path,
+        count_tokens,
+        chunk_tokens=chunk_tokens,
+        overlap_tokens=overlap_tokens,
+        workers=workers,
     )
 
-    chunks = text_splitter.split_documents(documents)
 
-    return chunks
+def get_chunk_id(chunk, processed_data_path=None):
+    """
+    get_chunk_id hashes a chunk's source path (relative to the processed data directory) and text into a stable id, so
+    that an unchanged chunk keeps its id across index builds, wherever the processed data directory is.
+
+    Args:
+    chunk (Document): A chunk of a processed transcript
+    processed_data_path (str): Directory the chunk was read from. Defaults to ./data/processed.
+
+    Returns:
+    str: The SHA-256 hex digest of the chunk's source and text
+
+    Raises:
+    None
+
+    """
+
+    source = chunk.metadata.get("source", "")
+    if os.path.isabs(source):
+        source = os.path.relpath(source, processed_data_path or PROCESSED_DATA_PATH)
+
+    return hashlib.sha256(f"{source}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+
+
+def get_chunk_collection_names(chunk):
+    collection_names = [GLOBAL_COLLECTION_NAME]
+    if "course" in chunk.metadata:
+        collection_names.append(get_course_collection_name(chunk.metadata["course"]))
+    return collection_names
 
 
-def create_chromaDB(chunks):
+def load_manifest(chroma_path):
     """
-    create_chromaDB uses chunks created with langchain's RecursiveCharacterTextSplitter and split_documents and creates a
-    new ChromaDB. This ChromaDB can be used as a vector database with Retrieval Augmented Generation and stores vector embeddings.
+    load_manifest reads the manifest of the live index, which records the embedding backend and model and every chunk id
+    the index holds along with the collections it was added to.
 
     Args:
-    chunks (List[Documents]): This is a list of Documents that represent chunks from text.
+    chroma_path (str): Path of the live ChromaDB
+
+    Returns:
+    dict: The manifest, or an empty manifest if the index does not exist or predates manifests
+
+    Raises:
+    None
+
+    """
+
+    manifest_path = os.path.join(chroma_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {"embedding_backend": None, "embedding_model": None, "chunks": {}}
+
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def swap_live_index(build_path, chroma_path):
+    """
+    swap_live_index atomically points the chroma/ path at a finished build. chroma/ is a symlink into the .chroma/ build
+    directory, and replacing a symlink is a single rename, so readers see either the old or the new index. A chroma/
+    directory left by an older, non-incremental build is moved into .chroma/ first.
+
+    Args:
+    build_path (str): Path of the finished build
+    chroma_path (str): Path of the live ChromaDB
 
     Returns:
     None
@@ -62,40 +161,364 @@ def create_chromaDB(chunks):
     None
 
     """
-    chroma_path = os.path.join(BASEDIR, "chroma")
 
-    if os.path.exists(chroma_path):
-        shutil.rmtree(chroma_path)
+    if os.path.isdir(chroma_path) and not os.path.islink(chroma_path):
+        os.rename(
+            chroma_path, os.path.join(os.path.dirname(build_path), f"{time.time_ns()}-legacy")
+        )
 
-    chromaDB = Chroma.from_documents(
-        chunks,
-        OpenAIEmbeddings(model="text-embedding-3-large"),
-        collection_name="transcripts",
-        persist_directory=chroma_path,
+    temporary_link_path = f"{chroma_path}.swap"
+    if os.path.lexists(temporary_link_path):
+        os.remove(temporary_link_path)
+
+    os.symlink(os.path.relpath(build_path, os.path.dirname(chroma_path)), temporary_link_path)
+    os.replace(temporary_link_path, chroma_path)
+
+
+def remove_old_builds(builds_path, live_build_path, keep=2):
+    # the previous build is kept for requests that still have it open
+    builds = sorted(
+        (name for name in os.listdir(builds_path) if BUILD_NAME_PATTERN.match(name)),
+        key=lambda name: int(name.split("-")[0]),
+        reverse=True,
+    )
+    for name in builds[keep:]:
+        build = os.path.join(builds_path, name)
+        if build != live_build_path:
+            shutil.rmtree(build, ignore_errors=True)
+
+
+def read_embeddings(collection, chunk_ids, batch_size):
+    """
+    read_embeddings reads the stored embeddings of chunks from a Chroma collection.
+
+    Args:
+    collection (Collection): The Chroma collection
+    chunk_ids (List[str]): IDs of the chunks
+    batch_size (int): Number of chunks read at a time
+
+    Returns:
+    List[List[float]]: The embedding of each chunk, in the order of their IDs
+
+    Raises:
+    None
+
+    """
+
+    embeddings = {}
+    for start in range(0, len(chunk_ids), batch_size):
+        result = collection.get(ids=chunk_ids[start : start + batch_size], include=["embeddings"])
+        embeddings.update(zip(result["ids"], result["embeddings"]))
+    return [embeddings[chunk_id] for chunk_id in chunk_ids]
+
+
+def create_chromaDB(
+    chunks,
+    chroma_path=None,
+    embedding_function=None,
+    vector_index_dtype="float32",
+    vector_index_dimensions=None,
+    embedding_stage=None,
+    summaries=None,
+    chunk_embeddings=None,
+    processed_data_path=None,
+):
+    """
+    create_chromaDB uses chunks created by create_document_chunks (chunks of whole sentences of at most CHUNK_TOKENS tokens
+    of the embedding model, cut by chunking.chunk_spans from the .txt transcripts or read from the boundaries stored in
+    the corpus file) and creates a new ChromaDB. This ChromaDB can be used as a vector database with Retrieval Augmented
+    Generation and stores vector embeddings.
+
+    Every chunk is embedded once and stored twice: in the global "transcripts" collection and in the collection of its
+    course (ex. "transcripts_310"), so that retrieval for a course only searches that course's index.
+
+    A BM25 index of the same chunks is written next to the Chroma index (see lexical_index.py), for hybrid retrieval,
+    along with a memory-mapped copy of their embeddings (see vector_index.py) for VECTOR_BACKEND=numpy, and the context
+    packs (see context_packs.py) that retrieval turns chunks into compact context with.
+
+    The build is incremental. Each chunk is identified by a hash of its source and text, and a manifest of the ids in the
+    live index is kept next to it. The new build starts from a copy of the live index, embeds only new or changed chunks,
+    deletes stale ones, and is then swapped in atomically. Changing the embedding backend or model rebuilds from scratch. New chunks
+    are embedded in batches by an EmbeddingStage, which checkpoints each batch, so that a build that fails is resumed
+    by the next one without embedding those batches again.
+
+    Args:
+    chunks (List[Documents]): This is a list of Documents that represent chunks from text.
+    chroma_path (str): Path of the live ChromaDB. Defaults to chroma/ next to this file.
+    embedding_function (Embeddings): Embedding function for the chunks. Defaults to OpenAI's text-embedding-3-large behind
+    the persistent embedding cache.
+    vector_index_dtype (str): Type of the memory-mapped embeddings, "float32" or "int8"
+    vector_index_dimensions (int): Number of dimensions of the memory-mapped embeddings, or None to keep every dimension
+    embedding_stage (EmbeddingStage): Batching, parallelism and retries of the embeddings requests. Defaults to an
+    EmbeddingStage with its default settings.
+    summaries (dict): Lecture and course summaries for the context packs, as returned by summaries.load_summaries
+    chunk_embeddings (dict): Embeddings of the chunks stored in a corpus file, as returned by
+    corpus.load_corpus_embeddings. New chunks are not embedded again if these were made by an embedding function with
+    the same signature as embedding_function.
+    processed_data_path (str): Directory the chunks were read from, which their ids are relative to. Defaults to
+    ./data/processed.
+
+    Returns:
+    dict: Build stats with the number of chunks added, removed, and reused (and of those added, how many had their
+    embedding in the corpus file), the size of the BM25 and vector indexes and
+    of the context packs, the throughput of the embedding stage, and the seconds the build took
+
+    Raises:
+    Exception: The error of an embeddings request that failed after its retries
+
+    """
+
+    start_time = time.perf_counter()
+
+    chroma_path = chroma_path or os.path.join(BASEDIR, "chroma")
+    builds_path = os.path.join(os.path.dirname(chroma_path), ".chroma")
+    os.makedirs(builds_path, exist_ok=True)
+
+    if embedding_function is None:
+        embedding_function = get_embedding_function()
+    if embedding_stage is None:
+        embedding_stage = EmbeddingStage()
+    embedding_signature = get_embedding_signature(embedding_function)
+    embedding_model = embedding_signature["model"]
+
+    manifest = load_manifest(chroma_path)
+    if (manifest.get("embedding_backend"), manifest["embedding_model"]) != (
+        embedding_signature["backend"],
+        embedding_model,
+    ):
+        manifest = {"chunks": {}}
+
+    # identical chunks from the same lecture get distinct ids
+    chunks_by_id = {}
+    chunk_indices = {}
+    for index, chunk in enumerate(chunks):
+        chunk_id = get_chunk_id(chunk, processed_data_path)
+        duplicate_number = 1
+        while chunk_id in chunks_by_id:
+            chunk_id = f"{get_chunk_id(chunk, processed_data_path)}-{duplicate_number}"
+            duplicate_number += 1
+        chunks_by_id[chunk_id] = chunk
+        chunk_indices[chunk_id] = index
+
+    removed_ids = [chunk_id for chunk_id in manifest["chunks"] if chunk_id not in chunks_by_id]
+    added_ids = [chunk_id for chunk_id in chunks_by_id if chunk_id not in manifest["chunks"]]
+    reused_count = len(chunks_by_id) - len(added_ids)
+
+    build_path = os.path.join(builds_path, str(time.time_ns()))
+    if manifest["chunks"]:
+        shutil.copytree(os.path.realpath(chroma_path), build_path)
+    else:
+        os.makedirs(build_path)
+
+    client = chromadb.PersistentClient(path=build_path)
+
+    # delete stale chunks from every collection they were added to
+    removed_ids_by_collection = defaultdict(list)
+    for chunk_id in removed_ids:
+        for collection_name in manifest["chunks"][chunk_id]["collections"]:
+            removed_ids_by_collection[collection_name].append(chunk_id)
+
+    for collection_name, ids in removed_ids_by_collection.items():
+        collection = client.get_or_create_collection(collection_name, embedding_function=None)
+        for start in range(0, len(ids), client.max_batch_size):
+            collection.delete(ids=ids[start : start + client.max_batch_size])
+
+    # embed new and changed chunks once, and add them to the global and course collections
+    texts = [chunks_by_id[chunk_id].page_content for chunk_id in added_ids]
+    checkpoint_path = os.path.join(os.path.dirname(chroma_path), EMBEDDING_CHECKPOINT_DIRNAME)
+    embeddings = [None] * len(added_ids)
+    if chunk_embeddings is not None and (chunk_embeddings["backend"], chunk_embeddings["model"]) == (
+        embedding_signature["backend"],
+        embedding_model,
+    ):
+        for index, chunk_id in enumerate(added_ids):
+            embeddings[index] = chunk_embeddings["embeddings"][chunk_indices[chunk_id]].tolist()
+
+    missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        vectors = embedding_stage.embed(embedding_function, [texts[index] for index in missing], checkpoint_path)
+        for index, vector in zip(missing, vectors):
+            embeddings[index] = vector
+
+    added_indices_by_collection = defaultdict(list)
+    for index, chunk_id in enumerate(added_ids):
+        for collection_name in get_chunk_collection_names(chunks_by_id[chunk_id]):
+            added_indices_by_collection[collection_name].append(index)
+
+    for collection_name, indices in added_indices_by_collection.items():
+        collection = client.get_or_create_collection(collection_name, embedding_function=None)
+
+        for start in range(0, len(indices), client.max_batch_size):
+            batch = indices[start : start + client.max_batch_size]
+            collection.add(
+                ids=[added_ids[i] for i in batch],
+                embeddings=[embeddings[i] for i in batch],
+                metadatas=[chunks_by_id[added_ids[i]].metadata for i in batch],
+                documents=[texts[i] for i in batch],
+            )
+
+    manifest = {
+        "embedding_backend": embedding_signature["backend"],
+        "embedding_model": embedding_model,
+        "chunks": {
+            chunk_id: {
+                "source": chunk.metadata.get("source", ""),
+                "collections": get_chunk_collection_names(chunk),
+            }
+            for chunk_id, chunk in chunks_by_id.items()
+        },
+    }
+    with open(os.path.join(build_path, MANIFEST_FILENAME), "w") as file:
+        json.dump(manifest, file)
+
+    # the BM25 index is rebuilt from every chunk, which takes a fraction of the time of embedding them
+    lexical_stats = build_lexical_index(
+        os.path.join(build_path, LEXICAL_INDEX_DIRNAME),
+        list(chunks_by_id),
+        [chunk.page_content for chunk in chunks_by_id.values()],
+        [chunk.metadata.get("course", 0) for chunk in chunks_by_id.values()],
     )
 
-    chromaDB.persist()
+    # reused chunks were embedded by an earlier build, so every embedding is read back from the global collection
+    global_collection = client.get_or_create_collection(GLOBAL_COLLECTION_NAME, embedding_function=None)
+    vector_stats = build_vector_index(
+        os.path.join(build_path, VECTOR_INDEX_DIRNAME),
+        list(chunks_by_id),
+        read_embeddings(global_collection, list(chunks_by_id), client.max_batch_size),
+        [chunk.metadata.get("course", 0) for chunk in chunks_by_id.values()],
+        embedding_model,
+        dtype=vector_index_dtype,
+        dimensions=vector_index_dimensions,
+    )
 
+    context_pack_stats = build_context_packs(
+        os.path.join(build_path, CONTEXT_PACKS_DIRNAME), chunks_by_id, summaries
+    )
 
-def generate_vector_db_from_processed_data():
+    # release the build's sqlite3 database before it goes live
+    del client
+    SharedSystemClient.clear_system_cache()
+
+    swap_live_index(build_path, chroma_path)
+    remove_old_builds(builds_path, build_path)
+    shutil.rmtree(checkpoint_path, ignore_errors=True)
+
+    build_stats = {
+        "added": len(added_ids),
+        "removed": len(removed_ids),
+        "reused": reused_count,
+        "corpus_embeddings": len(added_ids) - len(missing),
+        "lexical_index": lexical_stats,
+        "vector_index": vector_stats,
+        "context_packs": context_pack_stats,
+        "embedding": dict(embedding_stage.stats),
+        "seconds": time.perf_counter() - start_time,
+    }
+    if hasattr(embedding_function, "stats"):
+        build_stats["embedding_cache"] = dict(embedding_function.stats)
+
+    return build_stats
+
+
+def generate_vector_db_from_processed_data(
+    processed_data_path=None,
+    chroma_path=None,
+    embedding_function=None,
+    vector_index_dtype="float32",
+    vector_index_dimensions=None,
+    embedding_stage=None,
+    summaries_path=None,
+    chunk_tokens=CHUNK_TOKENS,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+):
     """
     generate_vector_db_from_processed_data executes the pipeline to create a Chroma vector database from the
-    Retrieval-Augmented-Generation/data/processed directory.
+    Retrieval-Augmented-Generation/data/processed directory. Embeddings stored in its corpus file, if any, are reused.
 
     Args:
-    None
+    processed_data_path (str): Directory of the cleaned transcripts. Defaults to ./data/processed.
+    chroma_path (str): Path of the live ChromaDB. Defaults to chroma/ next to this file.
+    embedding_function (Embeddings): Embedding function for the chunks. Defaults to OpenAI's text-embedding-3-large behind
+    the persistent embedding cache.
+    vector_index_dtype (str): Type of the memory-mapped embeddings, "float32" or "int8"
+    vector_index_dimensions (int): Number of dimensions of the memory-mapped embeddings, or None to keep every dimension
+    embedding_stage (EmbeddingStage): Batching, parallelism and retries of the embeddings requests
+    summaries_path (str): Path of the summaries written by summaries.py. Defaults to ./data/summaries.json.
+    chunk_tokens (int): Number of tokens of a chunk
+    overlap_tokens (int): Number of tokens a chunk can repeat from the chunk before
 
     Returns:
-    None
+    dict: Build stats with the number of chunks added, removed, and reused, the size of the BM25 and vector indexes and
+    of the context packs, the throughput of the embedding stage, and the seconds the build took
 
     Raises:
-    None
+    Exception: The error of an embeddings request that failed after its retries
 
     """
 
-    chunks = create_document_chunks()
-    create_chromaDB(chunks)
+    chunks = create_document_chunks(processed_data_path, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+
+    corpus_path = os.path.join(processed_data_path or PROCESSED_DATA_PATH, CORPUS_FILENAME)
+    chunk_embeddings = None
+    if os.path.exists(corpus_path):
+        chunk_embeddings = load_corpus_embeddings(
+            corpus_path, get_token_counter(EMBEDDING_MODEL), chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens
+        )
+
+    return create_chromaDB(
+        chunks,
+        chroma_path=chroma_path,
+        embedding_function=embedding_function,
+        vector_index_dtype=vector_index_dtype,
+        vector_index_dimensions=vector_index_dimensions,
+        embedding_stage=embedding_stage,
+        summaries=load_summaries(summaries_path),
+        chunk_embeddings=chunk_embeddings,
+        processed_data_path=processed_data_path,
+    )
 
 
 if __name__ == "__main__":
-    generate_vector_db_from_processed_data()
\ No newline at end of file
+    build_stats = generate_vector_db_from_processed_data(
+        embedding_function=get_embedding_function(
+            backend=os.environ.get("EMBEDDING_BACKEND", "openai"),
+            local_model=os.environ.get("EMBEDDING_LOCAL_MODEL", LOCAL_EMBEDDING_MODEL),
+            batch_size=int(os.environ.get("EMBEDDING_LOCAL_BATCH_SIZE", 32)),
+            threads=int(os.environ.get("EMBEDDING_LOCAL_THREADS", 0)),
+        ),
+        vector_index_dtype=os.environ.get("VECTOR_INDEX_DTYPE", "float32"),
+        vector_index_dimensions=int(os.environ.get("VECTOR_INDEX_DIMENSIONS", 0)) or None,
+        chunk_tokens=int(os.environ.get("CHUNK_TOKENS", CHUNK_TOKENS)),
+        overlap_tokens=int(os.environ.get("CHUNK_OVERLAP_TOKENS", CHUNK_OVERLAP_TOKENS)),
+        embedding_stage=EmbeddingStage(
+            batch_size=int(os.environ.get("EMBEDDING_BATCH_SIZE", 256)),
+            max_batch_tokens=int(os.environ.get("EMBEDDING_BATCH_TOKENS", 100000)),
+            workers=int(os.environ.get("EMBEDDING_WORKERS", 4)),
+            max_retries=int(os.environ.get("EMBEDDING_MAX_RETRIES", 8)),
+        ),
+    )
+    print(
+        f"Added {build_stats['added']}, removed {build_stats['removed']}, and reused {build_stats['reused']} chunks "
+        f"in {build_stats['seconds']:.1f}s ({build_stats['corpus_embeddings']} embeddings read from the corpus file)."
+    )
+    print(
+        f"BM25 index: {build_stats['lexical_index']['terms']} terms, "
+        f"{build_stats['lexical_index']['entities']} names of works and authors."
+    )
+    print(
+        f"Vector index: {build_stats['vector_index']['dimensions']} {build_stats['vector_index']['dtype']} dimensions, "
+        f"{build_stats['vector_index']['bytes'] / 1024 / 1024:.1f} MB."
+    )
+    print(
+        f"Context packs: {build_stats['context_packs']['lectures']} lectures, "
+        f"{build_stats['context_packs']['overlap_chars']} repeated characters between chunks, "
+        f"{build_stats['context_packs']['lecture_summaries']} lecture summaries."
+    )
+    print(
+        f"Embedded {build_stats['embedding']['chunks']} chunks at {build_stats['embedding']['chunks_per_second']:.1f} "
+        f"chunks/s and {build_stats['embedding']['tokens_per_second']:.0f} tokens/s "
+        f"({build_stats['embedding']['retries']} retries, {build_stats['embedding']['resumed_chunks']} chunks resumed "
+        f"from a checkpoint)."
+    )
+    if "embedding_cache" in build_stats:
+        print(f"Embedding cache: {build_stats['embedding_cache']}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+VECTOR_INDEX_DIRNAME = "vectors"
+
+VECTOR_INDEX_DTYPES = ("float32", "int8")
+
+# rows multiplied at a time: int8 rows are converted to float32 for a search one block at a time, which stays in the
+# CPU cache (512 rows of 3072 dimensions are 6 MB as float32)
+SEARCH_BLOCK_ROWS = 512
+
+
+def normalize(vectors):
+    """
+    normalize scales vectors to unit length, so that their dot products are cosine similarities.
+
+    Args:
+    vectors (np.ndarray): The vectors, one per row
+
+    Returns:
+    np.ndarray: The unit vectors, as float32
+
+    Raises:
+    None
+
+    """
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def build_vector_index(path, chunk_ids, embeddings, courses, embedding_model, dtype="float32", dimensions=None):
+    """
+    build_vector_index writes embeddings to a directory as a NumPy array that VectorIndex memory-maps, so that every
+    worker process reads the same pages from the page cache instead of holding its own copy of the index.
+
+    Embeddings can be truncated to their first dimensions (text-embedding-3 models are trained so that a prefix of an
+    embedding is itself an embedding) and quantized to int8 with a scale per row, which makes the index 4 times smaller.
+    Rows are sorted by course, so that searching one course only reads its rows.
+
+    Args:
+    path (str): Directory to write the index to; an existing index there is replaced
+    chunk_ids (List[str]): ID of each chunk, as stored in Chroma
+    embeddings (List[List[float]]): Embedding of each chunk
+    courses (List[int]): Course number of each chunk, or 0 if it has none
+    embedding_model (str): Name of the model that embedded the chunks
+    dtype (str): "float32" or "int8"
+    dimensions (int): Number of dimensions to keep, or None to keep every dimension
+
+    Returns:
+    dict: The number of chunks and dimensions of the index, its dtype, and its size in bytes
+
+    Raises:
+    ValueError: If dtype is not "float32" or "int8"
+
+    """
+
+    if dtype not in VECTOR_INDEX_DTYPES:
+        raise ValueError(
+            {"error": "CONFIG_ERROR", "message": f"Unknown vector index dtype {dtype}."}
+        )
+
+    order = np.argsort(np.asarray(courses, dtype=np.int32), kind="stable")
+    courses = np.asarray(courses, dtype=np.int32)[order]
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(chunk_ids), 0)
+    vectors = normalize(vectors[order, :dimensions])
+
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+    else:
+        scales = np.ones(len(vectors), dtype=np.float32)
+
+    course_ranges = {}
+    for course in np.unique(courses):
+        start, end = np.searchsorted(courses, course), np.searchsorted(courses, course, side="right")
+        course_ranges[str(course)] = [int(start), int(end)]
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "scales.npy"), scales.astype(np.float32))
+    with open(os.path.join(path, "index.json"), "w") as file:
+        json.dump(
+            {
+                "embedding_model": embedding_model,
+                "dtype": dtype,
+                "dimensions": int(vectors.shape[1]),
+                "chunk_ids": [chunk_ids[index] for index in order],
+                "course_ranges": course_ranges,
+            },
+            file,
+        )
+
+    return {
+        "chunks": len(vectors),
+        "dimensions": int(vectors.shape[1]),
+        "dtype": dtype,
+        "bytes": int(vectors.nbytes),
+    }
+
+
+class VectorIndex:
+    """
+    VectorIndex searches an index written by build_vector_index by exact cosine similarity. The vectors are
+    memory-mapped, and a batch of queries is searched with one matrix product per block of rows.
+
+    Args:
+    path (str): Directory of the index
+
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json"), "r") as file:
+            metadata = json.load(file)
+
+        self.embedding_model = metadata["embedding_model"]
+        self.dtype = metadata["dtype"]
+        self.dimensions = metadata["dimensions"]
+        self.chunk_ids = metadata["chunk_ids"]
+        self.course_ranges = {int(course): tuple(rows) for course, rows in metadata["course_ranges"].items()}
+
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"))
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def search(self, embeddings, k=4, course=None):
+        """
+        search finds the k chunks nearest to each of a batch of query embeddings.
+
+        Args:
+        embeddings (List[List[float]]): The query embeddings, which are truncated to the dimensions of the index
+        k (int): Number of chunks to return per query
+        course (int): Only search the chunks of this course, or None to search every chunk
+
+        Returns:
+        List[Tuple[List[str], List[float]]]: For each query, the IDs of the nearest chunks and their cosine similarities,
+        nearest first
+
+        Raises:
+        None
+
+        """
+
+        queries = normalize(np.asarray(embeddings, dtype=np.float32)[:, : self.dimensions])
+        start, end = (0, len(self)) if course is None else self.course_ranges.get(course, (0, 0))
+
+        scores = np.empty((end - start, len(queries)), dtype=np.float32)
+        for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+            block_end = min(block_start + SEARCH_BLOCK_ROWS, end)
+            block = np.asarray(self.vectors[block_start:block_end], dtype=np.float32)
+            scores[block_start - start : block_end - start] = (
+                block @ queries.T
+            ) * self.scales[block_start:block_end, None]
+
+        k = min(k, end - start)
+        results = []
+        for query_scores in scores.T:
+            nearest = np.argpartition(-query_scores, k - 1)[:k] if 0 < k < len(query_scores) else np.arange(k)
+            nearest = nearest[np.argsort(-query_scores[nearest], kind="stable")]
+            results.append(
+                ([self.chunk_ids[start + row] for row in nearest], query_scores[nearest].tolist())
+            )
+        return results
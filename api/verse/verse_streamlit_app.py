@@ -1,9 +1,53 @@
+import json
+
 import streamlit as st
 import requests
 
 # Local URLs for default Flask server
 RECOMMENDATION_URL = "http://127.0.0.1:5000/rag/professorRecommendation"
 RESPONSE_URL = "http://127.0.0.1:5000/rag/professorResponse"
+SESSIONS_URL = "http://127.0.0.1:5000/sessions"
+
+
+def stream_response_text(response):
+    """
+    stream_response_text reads the Server-Sent Events of a streamed /rag/professorResponse call and yields the answer
+    tokens, then the segue tokens separated from the answer by a blank line.
+    """
+
+    event = None
+    segue_started = False
+
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: ") :]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: ") :])
+
+            if event == "answer":
+                yield data["token"]
+            elif event == "segue":
+                if not segue_started:
+                    segue_started = True
+                    yield "\n\n"
+                yield data["token"]
+            elif event == "error":
+                yield "\n\nThe application was unable to finish the response."
+                return
+
+
+def get_session_id(course):
+    """
+    get_session_id returns the ID of the API session that keeps this conversation, creating it on first use. If the
+    session cannot be created, it returns None and the whole history is sent with each request instead.
+    """
+
+    if not st.session_state.get("session_id"):
+        response = requests.post(SESSIONS_URL, json={"course": course})
+        if response.status_code == 201:
+            st.session_state.session_id = response.json()["session_id"]
+    return st.session_state.get("session_id")
+
 
 st.title("LLMs and Pedagogical Approaches in English Literature")
 
@@ -36,15 +80,28 @@ default_recommendation = sidebar.markdown(
 if st.session_state.messages:
     default_recommendation.empty()
 
-    previous_messages = [m["content"] for m in st.session_state.messages]
+    previous_messages = tuple(m["content"] for m in st.session_state.messages)
+
+    # only ask for a new recommendation when the course or the messages changed since the last one
+    recommendation_key = (course, previous_messages)
+
+    if st.session_state.get("recommendation_key") != recommendation_key:
+        session_id = get_session_id(course)
+        if session_id:
+            recommendation_data = {"course": course, "session_id": session_id}
+        else:
+            recommendation_data = {"course": course, "messages": previous_messages}
 
-    recommendation_data = {"course": course, "messages": tuple(previous_messages)}
+        recommendation = requests.post(RECOMMENDATION_URL, json=recommendation_data)
 
-    recommendation = requests.post(RECOMMENDATION_URL, json=recommendation_data)
+        if recommendation.status_code == 200:
+            st.session_state.recommendation_text = recommendation.json()
+            st.session_state.recommendation_key = recommendation_key
+        else:
+            st.session_state.recommendation_text = None
 
-    if recommendation.status_code == 200:
-        recommendation_text = recommendation.json()
-        sidebar.markdown(recommendation_text)
+    if st.session_state.get("recommendation_text"):
+        sidebar.markdown(st.session_state.recommendation_text)
     else:
         sidebar.markdown("Error obtaining recommendation")
 
@@ -54,24 +111,43 @@ if query := st.chat_input(
     st.chat_message("user").markdown(query)
     st.session_state.messages.append({"role": "user", "content": query})
 
-    previous_responses_list = [
-        msg["content"] for msg in st.session_state.messages if msg["role"] == "ai"
-    ]
+    # the API session already holds the previous responses
+    session_id = get_session_id(course)
+    if session_id:
+        response_data = {"course": course, "query": query, "session_id": session_id}
+    else:
+        previous_responses_list = [
+            msg["content"] for msg in st.session_state.messages if msg["role"] == "ai"
+        ]
 
-    previous_responses = tuple(previous_responses_list)
+        previous_responses = tuple(previous_responses_list)
 
-    response_data = {
-        "course": course,
-        "query": query,
-        "previous_responses": previous_responses,
-    }
+        response_data = {
+            "course": course,
+            "query": query,
+            "previous_responses": previous_responses,
+        }
 
-    response = requests.post(RESPONSE_URL, json=response_data)
+    response_data["stream"] = True
+    response = requests.post(RESPONSE_URL, json=response_data, stream=True)
 
     with st.chat_message("ai"):
         if response.status_code == 200:
-            response_text = response.json()
-            st.markdown(response_text)
+            if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                response_text = st.write_stream(stream_response_text(response))
+            else:
+                response_text = response.json()
+                st.markdown(response_text)
             st.session_state.messages.append({"role": "ai", "content": response_text})
+
+            # start computing the recommendation for the new messages so the next rerun finds it ready
+            if session_id:
+                prefetch_data = {"course": course, "session_id": session_id}
+            else:
+                prefetch_data = {
+                    "course": course,
+                    "messages": tuple(m["content"] for m in st.session_state.messages),
+                }
+            requests.post(RECOMMENDATION_URL, json={**prefetch_data, "background": True})
         else:
             st.markdown("The application was unable to send your query.")
\ No newline at end of file
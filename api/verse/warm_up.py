@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    WarmUp loads the RAG stack of an application ahead of its first request: it imports langchain and the OpenAI and
+    Chroma clients, opens the retriever pool's vector stores and side indexes, and creates the embedding client, the LLM
+    client and its chains, and the tokenizers of the answer and embedding models. Each of these is otherwise loaded by
+    the first request that needs it. The warm-up runs once, in a background thread, so that the server answers /pulse
+    while it runs; requests that arrive meanwhile load what they need themselves.
+
+    Args:
+    app (Flask): The application to warm up
+
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.state = "pending"
+        self.seconds = None
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run(self):
+        from verse.embedding_defaults import EMBEDDING_MODEL
+        from verse.history import get_token_counter
+        from verse.retrieval_augmented_generation import get_chains, get_global_llm
+
+        self.state = "running"
+        start = time.perf_counter()
+        retriever_pool = self.app.extensions["retriever_pool"]
+        try:
+            with self.app.app_context():
+                try:
+                    retriever_pool.warm_up()
+                except Exception as error:
+                    logger.warning("Retriever warm-up failed: %s", error)
+                retriever_pool.get_embedding_function()
+                get_chains(get_global_llm())
+
+                # tiktoken keeps loaded encodings for the life of the process
+                get_token_counter()
+                get_token_counter(EMBEDDING_MODEL)
+        except Exception as error:
+            logger.warning("Warm-up failed: %s", error)
+            self.state = "failed"
+        else:
+            self.state = "ready"
+        self.seconds = time.perf_counter() - start
+        logger.info("Warm-up %s after %.2fs", self.state, self.seconds)
+
+    def start(self):
+        """
+        start starts the warm-up in a background thread, unless it has already been started.
+
+        Args:
+        None
+
+        Returns:
+        None
+
+        Raises:
+        None
+
+        """
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        wait starts the warm-up if it has not been started, and waits for it to finish.
+
+        Args:
+        timeout (float): Seconds to wait, or None to wait until it finishes
+
+        Returns:
+        bool: True if the warm-up finished, whether or not it failed
+
+        Raises:
+        None
+
+        """
+
+        self.start()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
@@ -1,65 +1,100 @@
 // Adapted from react-chatbox-kit documentation (https://fredrikoseberg.github.io/react-chatbot-kit-docs/docs/)
 
 import React from 'react';
-import { getProfessorResponse, getProfessorRecommendation } from './verseAPI'
+import {
+    appendSessionMessages,
+    createSession,
+    streamProfessorResponse,
+    getProfessorRecommendation,
+    prefetchProfessorRecommendation,
+} from './verseAPI'
 import { separateTextByNewline } from './textHelpers';
 import { createChatBotMessage } from 'react-chatbot-kit';
 
 const ActionProvider = ({ createChatBotMessage, setState, children }) => {
     const [selectedCourse, setSelectedCourse] = React.useState("English Literature");
-    const [messageHistory, setMessageHistory] = React.useState([]);
     const [recommendationCounter, setRecommendationCounter] = React.useState(0);
 
+    // the API keeps the conversation; the session is created when the first message needs it
+    const session = React.useRef(null);
+
+    const getSessionId = () => {
+        if (!session.current) {
+            session.current = createSession(selectedCourse).catch(error => {
+                // a failed session is created again by the next message
+                session.current = null;
+                throw error;
+            });
+        }
+        return session.current;
+    };
+
+    const addToSession = (message) => {
+        getSessionId().then(sessionId => appendSessionMessages(sessionId, [message])).catch(error => {
+            console.log("Error adding to the session: ", error)
+        });
+    };
+
     const handleQuery = (query) => {
-        setMessageHistory(prevMessages => [...prevMessages, query]);
         setRecommendationCounter(prevCount => prevCount + 1);
 
-        getProfessorResponse(query, selectedCourse).then(output => {
-            const response = separateTextByNewline(output);
-            const answer = response[0];
-            const answerMessage = createChatBotMessage(answer);
+        // the answer and segue messages are created on their first token and extended as more tokens arrive
+        const streamedMessages = { answer: null, segue: null };
 
-            // if a segue was not provided, do not overindex
-            if (response.length === 3) {
-                const segue = response[2];
-                const segueMessage = createChatBotMessage(segue);
+        const handleToken = (part) => (token) => {
+            if (!streamedMessages[part]) {
+                const newMessage = createChatBotMessage(token);
+                streamedMessages[part] = newMessage;
 
                 setState((prev) => ({
                     ...prev,
-                    messages: [...prev.messages, answerMessage, segueMessage],
+                    messages: [...prev.messages, newMessage],
                 }));
+            } else {
+                const updatedMessage = { ...streamedMessages[part], message: streamedMessages[part].message + token };
+                streamedMessages[part] = updatedMessage;
 
-                setMessageHistory(prevMessages => [...prevMessages, answer, segue]);
+                setState((prev) => ({
+                    ...prev,
+                    messages: prev.messages.map(message => message.id === updatedMessage.id ? updatedMessage : message),
+                }));
+            }
+        };
 
-                if (recommendationCounter !== 0 && recommendationCounter % 2 === 0) {
-                    const recommendationMessage = createChatBotMessage('Access a real-time recommendation based on our conversation', {
-                        widget: 'recommendation'
-                    });
+        getSessionId().then(sessionId => streamProfessorResponse(
+            query, selectedCourse, sessionId, handleToken('answer'), handleToken('segue')
+        )).then(output => {
+            const response = separateTextByNewline(output);
+            const answer = response[0];
+
+            // if a segue was not provided, do not overindex
+            const segue = response.length === 3 ? response[2] : null;
+
+            // the JSON fallback is not streamed, so the whole response is shown at once
+            if (!streamedMessages.answer) {
+                const responseMessages = segue
+                    ? [createChatBotMessage(answer), createChatBotMessage(segue)]
+                    : [createChatBotMessage(answer)];
 
-                    setState((prev) => ({
-                        ...prev,
-                        messages: [...prev.messages, recommendationMessage],
-                    }));
-                }
-            } else {
                 setState((prev) => ({
                     ...prev,
-                    messages: [...prev.messages, answerMessage],
+                    messages: [...prev.messages, ...responseMessages],
                 }));
+            }
 
-                setMessageHistory(prevMessages => [...prevMessages, answer]);
-
-                if (recommendationCounter !== 0 && recommendationCounter % 2 === 0) {
-                    const recommendationMessage = createChatBotMessage('Access a real-time recommendation based on our conversation', {
-                        widget: 'recommendation'
-                    });
+            if (recommendationCounter !== 0 && recommendationCounter % 2 === 0) {
+                // compute the recommendation while the student reads, so that it is ready when they ask for it; the API
+                // has already added the query and response to the session
+                getSessionId().then(sessionId => prefetchProfessorRecommendation(selectedCourse, sessionId));
 
-                    setState((prev) => ({
-                        ...prev,
-                        messages: [...prev.messages, recommendationMessage],
-                    }));
-                }
+                const recommendationMessage = createChatBotMessage('Access a real-time recommendation based on our conversation', {
+                    widget: 'recommendation'
+                });
 
+                setState((prev) => ({
+                    ...prev,
+                    messages: [...prev.messages, recommendationMessage],
+                }));
             }
         }).catch(error => {
             console.log("Error handling query: ", error)
@@ -76,7 +111,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
             messages: [...prev.messages, message],
         }));
 
-        setMessageHistory(prevMessages => [...prevMessages, "Let's focus on The American Novel Since 1945. What questions do you have?"]);
+        addToSession("Let's focus on The American Novel Since 1945. What questions do you have?");
 
         setSelectedCourse("The American Novel Since 1945");
     };
@@ -89,7 +124,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
             messages: [...prev.messages, message],
         }));
 
-        setMessageHistory(prevMessages => [...prevMessages, "Let's focus on Introduction to Theory of Literature. What questions do you have?"]);
+        addToSession("Let's focus on Introduction to Theory of Literature. What questions do you have?");
 
         setSelectedCourse("Introduction to Theory of Literature");
     };
@@ -102,7 +137,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
             messages: [...prev.messages, message],
         }));
 
-        setMessageHistory(prevMessages => [...prevMessages, "Let's focus on Milton. What questions do you have?"]);
+        addToSession("Let's focus on Milton. What questions do you have?");
 
         setSelectedCourse("Milton");
     };
@@ -115,7 +150,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
             messages: [...prev.messages, message],
         }));
 
-        setMessageHistory(prevMessages => [...prevMessages, "Let's focus on Modern Poetry. What questions do you have?"]);
+        addToSession("Let's focus on Modern Poetry. What questions do you have?");
 
         setSelectedCourse("Modern Poetry");
     };
@@ -123,7 +158,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
     ///////////////
 
     const handleRecommendation = () => {
-        getProfessorRecommendation(selectedCourse, messageHistory).then(recommendation => {
+        getSessionId().then(sessionId => getProfessorRecommendation(selectedCourse, sessionId)).then(recommendation => {
             const recommendationMessage = createChatBotMessage(recommendation);
 
             setState((prev) => ({
@@ -131,7 +166,7 @@ const ActionProvider = ({ createChatBotMessage, setState, children }) => {
                 messages: [...prev.messages, recommendationMessage],
             }));
 
-            setMessageHistory(prevMessages => [...prevMessages, recommendation]);
+            addToSession(recommendation);
         }).catch(error => {
             console.log("Error handling recommendation retrieval: ", error)
         });
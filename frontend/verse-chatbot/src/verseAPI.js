@@ -1,5 +1,54 @@
 const professorResponseEndpoint = 'http://127.0.0.1:5000/rag/professorResponse';
 const professorRecommendationEndpoint = 'http://127.0.0.1:5000/rag/professorRecommendation';
+const sessionsEndpoint = 'http://127.0.0.1:5000/sessions';
+
+// Starts a session on the API, which keeps the conversation so that requests only carry the session ID
+export async function createSession(selectedCourse) {
+    const data = { course: selectedCourse };
+
+    try {
+        const response = await fetch(sessionsEndpoint, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data),
+        });
+
+        if (!response.ok) {
+            throw new Error('Network response failed.');
+        }
+
+        const result = await response.json();
+        return result.session_id;
+    } catch (error) {
+        console.error('Fetch to API (/sessions) errored: ', error);
+        throw error;
+    }
+}
+
+// Adds messages shown outside of a professor response (ex. a course introduction) to the session
+export async function appendSessionMessages(sessionId, messages) {
+    const data = { messages: messages };
+
+    try {
+        const response = await fetch(`${sessionsEndpoint}/${sessionId}/messages`, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data),
+        });
+
+        if (!response.ok) {
+            throw new Error('Network response failed.');
+        }
+    } catch (error) {
+        console.error('Fetch to API (/sessions/messages) errored: ', error);
+    }
+}
 
 export async function getProfessorResponse(query, selectedCourse) {
     const data = { course: selectedCourse, query: query };
@@ -25,8 +74,85 @@ export async function getProfessorResponse(query, selectedCourse) {
     }
 }
 
-export async function getProfessorRecommendation(selectedCourse, messages) {
-    const data = { course: selectedCourse, messages: messages };
+// Parses the "event:" and "data:" lines of one Server-Sent Event
+function parseServerSentEvent(rawEvent) {
+    let event = 'message';
+    let data = '';
+
+    for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) {
+            event = line.slice('event: '.length);
+        } else if (line.startsWith('data: ')) {
+            data += line.slice('data: '.length);
+        }
+    }
+
+    return { event, data: data ? JSON.parse(data) : {} };
+}
+
+// Streams the professor's answer and segue token by token, falling back to the JSON endpoint if streaming is unavailable
+export async function streamProfessorResponse(query, selectedCourse, sessionId, onAnswerToken, onSegueToken) {
+    const data = { course: selectedCourse, query: query, session_id: sessionId, stream: true };
+
+    try {
+        const response = await fetch(professorResponseEndpoint, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify(data),
+        });
+
+        if (!response.ok) {
+            throw new Error('Network response failed.');
+        }
+
+        if (!response.body || !response.headers.get('Content-Type')?.startsWith('text/event-stream')) {
+            return await response.json();
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                const { event, data: payload } = parseServerSentEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (event === 'answer') {
+                    onAnswerToken(payload.token);
+                } else if (event === 'segue') {
+                    onSegueToken(payload.token);
+                } else if (event === 'done') {
+                    return payload.response;
+                } else if (event === 'error') {
+                    throw new Error(payload.message);
+                }
+
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+
+        throw new Error('Stream ended before the response was complete.');
+    } catch (error) {
+        console.error('Stream from API (/professorResponse) errored: ', error);
+        throw error;
+    }
+}
+
+export async function getProfessorRecommendation(selectedCourse, sessionId) {
+    const data = { course: selectedCourse, session_id: sessionId };
 
     try {
         const response = await fetch(professorRecommendationEndpoint, {
@@ -49,3 +175,21 @@ export async function getProfessorRecommendation(selectedCourse, messages) {
         throw error;
     }
 }
+
+// Asks the API to compute the recommendation for the session in the background, so a later request returns at once
+export async function prefetchProfessorRecommendation(selectedCourse, sessionId) {
+    const data = { course: selectedCourse, session_id: sessionId, background: true };
+
+    try {
+        await fetch(professorRecommendationEndpoint, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data),
+        });
+    } catch (error) {
+        console.error('Prefetch from API (/professorRecommendation) errored: ', error);
+    }
+}